@@ -15,21 +15,162 @@
 
 import numpy as np
 import logging
+from scipy.special import lambertw
 
 try:
   import numexpr
 except:
-  #Fake class behaving like the numexpr package
+  #Fake class behaving like the numexpr package (only for what we use here)
   class _numexpr(object):
-    def evaluate(self,expr):
-      return eval(expr)
+    def evaluate(self,expr,optimization=None,local_dict=None,out=None):
+      self._expr = expr
+      result = eval(expr,{'log': np.log, 'where': np.where},local_dict)
+      if out is not None:
+        out[:] = result
+        return out
+      return result
+    
+    def re_evaluate(self,local_dict=None):
+      return eval(self._expr,{'log': np.log, 'where': np.where},local_dict)
+    
+    def set_vml_accuracy_mode(self,mode):
+      return None
+    
+    def set_num_threads(self,nthreads):
+      return 1
+    
+    def set_vml_num_threads(self,nthreads):
+      pass
   
   numexpr = _numexpr()
 
 logging.basicConfig(level=logging.INFO)
 logger                        = logging.getLogger("bayesian_blocks")
 
-__all__ = ['bayesian_blocks']    
+__all__ = ['bayesian_blocks', 'bayesian_blocks_binned', 'BayesianBlocksStream']    
+
+def _get_change_points(last):
+    """
+    Peel off the optimal partition from the array of the last change points
+    (see the algorithm in Scargle et al.)
+    """
+
+    N = last.shape[0]
+
+    # There are at most N + 1 edges (every cell is a block), from N back to 0
+    change_points = np.zeros(N + 1, dtype=int)
+    i_cp = N + 1
+    ind = N
+
+    while True:
+
+        i_cp -= 1
+
+        change_points[i_cp] = ind
+
+        if ind == 0:
+
+            break
+
+        ind = last[ind - 1]
+
+    return change_points[i_cp:]
+
+
+def _interval_where_better(a, b, C):
+    """
+    Return the interval of lambda where C + a log(lambda) - b lambda > 0, for a >= 0 and b > 0
+    (the interval is empty, i.e. lo >= hi, if the function is never positive)
+    """
+
+    lo = np.zeros(a.shape[0]) + np.inf
+    hi = np.zeros(a.shape[0])
+
+    # The maximum is C + a log(a / b) - a, which is positive if log(-z) < -1
+    log_mz = np.log(b / a) - C / a
+
+    has_interval = (log_mz < -1) & (a > 0)
+
+    # The function is zero for lambda = -(a / b) W(z), with the two real branches
+    # of the Lambert W function
+    z = -np.exp(log_mz[has_interval])
+    scale = -a[has_interval] / b[has_interval]
+
+    lo[has_interval] = scale * lambertw(z, 0).real
+    hi[has_interval] = scale * lambertw(z, -1).real
+
+    # W_-1(0) is -inf, which gives nan for the upper end
+    hi[np.isnan(hi)] = np.inf
+
+    # No events between the two candidates
+    no_events = (a == 0) & (C > 0)
+
+    lo[no_events] = 0.0
+    hi[no_events] = C[no_events] / b[no_events]
+
+    return lo, hi
+
+
+def _prune_candidates(j, n_cand, cand_count, cand_edge, cand_best, cand_lo, cand_hi, tolerance, arrays):
+    """
+    Update the intervals of the candidates using candidate j, and remove the candidates
+    with an empty interval (see bayesian_blocks). Return the new number of candidates.
+    Must be called with floating point errors ignored.
+    """
+
+    lo = cand_lo[:n_cand]
+    hi = cand_hi[:n_cand]
+
+    # V_r(lambda) - V_j(lambda) = C + a log(lambda) - b lambda
+    a = cand_count[j] - cand_count[:n_cand]
+    b = cand_edge[j] - cand_edge[:n_cand]
+    C = cand_best[:n_cand] - cand_best[j] + a + tolerance
+
+    # Earlier candidates: r is better than j only inside an interval, which must be intersected
+    # with the one of r. This is concave, so if it is positive at both ends of the current
+    # interval of r the interval does not change
+    earlier = ((C + a * np.log(lo) - b * lo > 0) & (C + a * np.log(hi) - b * hi > 0))
+    earlier = (~earlier & (b > 0)).nonzero()[0]
+
+    if earlier.shape[0] > 0:
+
+        new_lo, new_hi = _interval_where_better(a[earlier], b[earlier], C[earlier])
+
+        lo[earlier] = np.maximum(lo[earlier], new_lo * (1 - 1e-9))
+        hi[earlier] = np.minimum(hi[earlier], new_hi * (1 + 1e-9))
+
+    # Later candidates: r is better than j only outside the interval where j is better than r.
+    # If this covers one end of the interval of r, we can shrink it (otherwise we keep it as it is,
+    # which is conservative)
+    later = (b < 0).nonzero()[0]
+
+    if later.shape[0] > 0:
+
+        jlo, jhi = _interval_where_better(-a[later], -b[later], -C[later])
+
+        jlo *= (1 + 1e-9)
+        jhi *= (1 - 1e-9)
+
+        covers_lo = (jlo <= lo[later]) & (jhi > lo[later])
+        covers_hi = (jlo < hi[later]) & (jhi >= hi[later])
+
+        lo[later] = np.where(covers_lo, jhi, lo[later])
+        hi[later] = np.where(covers_hi, jlo, hi[later])
+
+    keep = lo < hi
+
+    if keep.all():
+
+        return n_cand
+
+    n_kept = np.count_nonzero(keep)
+
+    for array in arrays:
+
+        array[:n_kept] = array[:n_cand][keep]
+
+    return n_kept
+
 
 def bayesian_blocks(tt, ttstart, ttstop, p0, bkg_integral_distribution=None):
     """
@@ -38,6 +179,611 @@ def bayesian_blocks(tt, ttstart, ttstop, p0, bkg_integral_distribution=None):
     is given, divide the series in blocks where the difference with respect to
     the background is perceptibly constant.
 
+    This gives the same result as bayesian_blocks_legacy, but it uses a pruned dynamic program:
+    a candidate change point which cannot be optimal anymore is never evaluated again, and the
+    state of the candidates is kept in preallocated arrays.
+
+    :param tt: arrival times of the events
+    :param ttstart: the start of the interval
+    :param ttstop: the stop of the interval
+    :param p0: the false positive probability. This is used to decide the penalization on the likelihood, so this
+    parameter affects the number of blocks
+    :param bkg_integral_distribution: (default: None) If given, the algorithm account for the presence of the background and
+    finds changes in rate with respect to the background
+    :return: the np.array containing the edges of the blocks
+    """
+
+    # Verify that the input array is one-dimensional
+    tt = np.asarray(tt, dtype=float)
+
+    assert tt.ndim == 1
+
+    if bkg_integral_distribution is not None:
+
+        # Transforming the inhomogeneous Poisson process into an homogeneous one with rate 1,
+        # by changing the time axis according to the background rate
+        logger.debug("Transforming the inhomogeneous Poisson process to a homogeneous one with rate 1...")
+        t = np.array(bkg_integral_distribution(tt))
+        logger.debug("done")
+
+        # Now compute the start and stop time in the new system
+        tstart = bkg_integral_distribution(ttstart)
+        tstop = bkg_integral_distribution(ttstop)
+
+    else:
+
+        t = tt
+        tstart = ttstart
+        tstop = ttstop
+
+    # Create initial cell edges (Voronoi tessellation)
+    edges = np.concatenate([[t[0]],
+                            0.5 * (t[1:] + t[:-1]),
+                            [t[-1]]])
+
+    # The last block length is 0 by definition
+    block_length = tstop - edges
+
+    if np.sum((block_length <= 0)) > 1:
+
+        raise RuntimeError("Events appears to be out of order! Check for order, or duplicated events.")
+
+    N = t.shape[0]
+
+    # arrays to store the best configuration
+    best = np.zeros(N, dtype=float)
+    last = np.zeros(N, dtype=int)
+
+    # eq. 21 from Scargle 2012
+    prior = 4 - np.log(73.53 * p0 * (N**-0.478))
+
+    logger.debug("Finding blocks...")
+
+    # Pruning of the candidate change points.
+    #
+    # Up to a constant (the total number of events), the fitness of a block is
+    # max_lambda(N log(lambda) - lambda T) + N, thus the value of the last block starting at
+    # cell r, as a function of the rate lambda of the last block, is:
+    #
+    #   V_r(lambda) = best[r - 1] - prior + N_r log(lambda) - lambda T_r + N_r
+    #
+    # New events add the same term to V_r for all r, so the difference between two
+    # candidates r < s never changes, and r can be better than s only for lambda inside
+    # an interval, which can be computed analytically with the Lambert W function.
+    # For each candidate we keep an interval of lambda outside of which some other
+    # candidate is always better: if it becomes empty r will never be optimal again, and
+    # we drop it (functional pruning, see Maidstone et al. 2017. This is much more effective
+    # than the PELT pruning by Killick et al. 2012, which only uses the maximum of V_r - V_s).
+    # The tolerance makes the intervals slightly larger, so that rounding errors can
+    # never make us drop the optimal candidate, and the result is the same as
+    # bayesian_blocks_legacy.
+    #
+    # For each candidate we keep its index r, its edge, block_length[r], best[r-1] and its
+    # interval in preallocated buffers, so that no other array is created in the loop
+    cand_r = np.zeros(N, dtype=int)
+    cand_edge = np.zeros(N, dtype=float)
+    cand_length = np.zeros(N, dtype=float)
+    cand_best = np.zeros(N, dtype=float)
+    cand_lo = np.zeros(N, dtype=float)
+    cand_hi = np.zeros(N, dtype=float)
+    n_cand = 0
+
+    prune_every = 32
+
+    # Buffers to compact when candidates are dropped
+    arrays = [cand_r, cand_edge, cand_length, cand_best, cand_lo, cand_hi]
+
+    # Set numexpr precision to low (more than enough for us), which is
+    # faster than high
+    oldaccuracy = numexpr.set_vml_accuracy_mode('low')
+    numexpr.set_num_threads(1)
+    numexpr.set_vml_num_threads(1)
+
+    numexpr_evaluate = numexpr.evaluate
+    numexpr_re_evaluate = numexpr.re_evaluate
+
+    # Avoid the overhead of changing the error handling at every step (infinite and nan
+    # values are handled in _prune_candidates)
+    old_settings = np.seterr(divide='ignore', over='ignore', invalid='ignore')
+
+    for R in range(N):
+
+        # Add the new candidate
+        cand_r[n_cand] = R
+        cand_edge[n_cand] = edges[R]
+        cand_length[n_cand] = block_length[R]
+        cand_best[n_cand] = best[R - 1] if R > 0 else 0.0
+        cand_lo[n_cand] = 0.0
+        cand_hi[n_cand] = np.inf
+        n_cand += 1
+
+        local_dict = {'r': cand_r[:n_cand], 'block_length': cand_length[:n_cand],
+                      'best': cand_best[:n_cand], 'R1': R + 1, 'br': block_length[R + 1],
+                      'prior': prior}
+
+        # Same fitness as in bayesian_blocks_legacy, where N_k = R + 1 - r and
+        # T_k = block_length[r] - block_length[R + 1]
+
+        if R == 0:
+
+            A_R = numexpr_evaluate('''(R1 - r) * log((R1 - r) / (block_length - br)) - prior + best''',
+                                   optimization='aggressive', local_dict=local_dict)
+
+        else:
+
+            A_R = numexpr_re_evaluate(local_dict=local_dict)
+
+        i_max = A_R.argmax()
+
+        last[R] = cand_r[i_max]
+        best[R] = A_R[i_max]
+
+        # Any subset of the other candidates gives a valid pruning, so to reduce the overhead
+        # we use only the current best candidate and the newest one, every few steps
+        if R % prune_every == 0:
+
+            tolerance = 1e-8 * (abs(best[R]) + 1.0)
+
+            n_cand = _prune_candidates(i_max, n_cand, cand_r, cand_edge, cand_best, cand_lo, cand_hi,
+                                       tolerance, arrays)
+
+            n_cand = _prune_candidates(n_cand - 1, n_cand, cand_r, cand_edge, cand_best, cand_lo, cand_hi,
+                                       tolerance, arrays)
+
+    np.seterr(**old_settings)
+
+    numexpr.set_vml_accuracy_mode(oldaccuracy)
+
+    logger.debug("Done\n")
+
+    change_points = _get_change_points(last)
+
+    # Take the edges directly in the original time system (no need to transform
+    # them back if the background integral distribution was used)
+    edges_ = np.concatenate([[tt[0]],
+                             0.5 * (tt[1:] + tt[:-1]),
+                             [tt[-1]]])
+
+    final_edges = edges_[change_points]
+
+    # Now fix the first and last edge so that they are tstart and tstop
+    final_edges[0] = ttstart
+    final_edges[-1] = ttstop
+
+    return np.asarray(final_edges)
+
+
+def bayesian_blocks_binned(bin_start, bin_stop, counts, exposure, p0, quality=None):
+    """
+    Divide a binned light curve (for example the SPECTRUM extension of a CSPEC, CTIME or
+    LLE PHA2 file, summed over the channels) in blocks of perceptibly constant count rate.
+    The cells are the bins, thus each step costs O(number of bins) instead of O(number of events).
+
+    :param bin_start: start time of each bin
+    :param bin_stop: stop time of each bin
+    :param counts: counts in each bin
+    :param exposure: exposure of each bin. Rates are counts / exposure, so if this is
+    the livetime the blocks are found using the deadtime-corrected rates
+    :param p0: the false positive probability. This is used to decide the penalization on the likelihood, so this
+    parameter affects the number of blocks
+    :param quality: (default: None) OGIP quality flag of each bin. Bins with quality different from
+    0 (good) are ignored, as well as bins with no exposure
+    :return: the np.array containing the edges of the blocks
+    """
+
+    bin_start = np.asarray(bin_start, dtype=float)
+    bin_stop = np.asarray(bin_stop, dtype=float)
+    counts = np.asarray(counts, dtype=float)
+    exposure = np.asarray(exposure, dtype=float)
+
+    assert bin_start.ndim == 1
+    assert bin_start.shape == bin_stop.shape == counts.shape == exposure.shape
+
+    good = (exposure > 0)
+
+    if quality is not None:
+
+        good &= (np.asarray(quality) == 0)
+
+    bin_start = bin_start[good]
+    bin_stop = bin_stop[good]
+    counts = counts[good]
+    exposure = exposure[good]
+
+    N = counts.shape[0]
+
+    if N == 0:
+
+        raise RuntimeError("No good bins in the light curve")
+
+    if np.any(np.diff(bin_start) < 0):
+
+        raise RuntimeError("Bins appears to be out of order! Check for order.")
+
+    # Cumulative counts and exposure before each bin, so that the counts and the exposure
+    # in bins r..R are cum_counts[R + 1] - cum_counts[r] and cum_exposure[R + 1] - cum_exposure[r]
+    cum_counts = np.concatenate([[0], np.cumsum(counts)])
+    cum_exposure = np.concatenate([[0], np.cumsum(exposure)])
+
+    # arrays to store the best configuration
+    best = np.zeros(N, dtype=float)
+    last = np.zeros(N, dtype=int)
+
+    # eq. 21 from Scargle 2012
+    prior = 4 - np.log(73.53 * p0 * (N**-0.478))
+
+    logger.debug("Finding blocks...")
+
+    # Same dynamic program and pruning as bayesian_blocks, where the number of events and
+    # the length of the blocks are replaced by the counts and the exposure
+    cand_r = np.zeros(N, dtype=int)
+    cand_counts = np.zeros(N, dtype=float)
+    cand_exposure = np.zeros(N, dtype=float)
+    cand_best = np.zeros(N, dtype=float)
+    cand_lo = np.zeros(N, dtype=float)
+    cand_hi = np.zeros(N, dtype=float)
+    n_cand = 0
+
+    prune_every = 32
+
+    # Buffers to compact when candidates are dropped
+    arrays = [cand_r, cand_counts, cand_exposure, cand_best, cand_lo, cand_hi]
+
+    oldaccuracy = numexpr.set_vml_accuracy_mode('low')
+    numexpr.set_num_threads(1)
+    numexpr.set_vml_num_threads(1)
+
+    numexpr_evaluate = numexpr.evaluate
+    numexpr_re_evaluate = numexpr.re_evaluate
+
+    old_settings = np.seterr(divide='ignore', over='ignore', invalid='ignore')
+
+    for R in range(N):
+
+        # Add the new candidate
+        cand_r[n_cand] = R
+        cand_counts[n_cand] = cum_counts[R]
+        cand_exposure[n_cand] = cum_exposure[R]
+        cand_best[n_cand] = best[R - 1] if R > 0 else 0.0
+        cand_lo[n_cand] = 0.0
+        cand_hi[n_cand] = np.inf
+        n_cand += 1
+
+        local_dict = {'cand_counts': cand_counts[:n_cand], 'cand_exposure': cand_exposure[:n_cand],
+                      'best': cand_best[:n_cand], 'counts_R': cum_counts[R + 1],
+                      'exposure_R': cum_exposure[R + 1], 'prior': prior}
+
+        # Fitness N_k * log(N_k / T_k), which is zero for blocks without counts
+
+        if R == 0:
+
+            A_R = numexpr_evaluate('''where(counts_R - cand_counts > 0,
+                                           (counts_R - cand_counts) * log((counts_R - cand_counts) / (exposure_R - cand_exposure)),
+                                           0) - prior + best''',
+                                   optimization='aggressive', local_dict=local_dict)
+
+        else:
+
+            A_R = numexpr_re_evaluate(local_dict=local_dict)
+
+        i_max = A_R.argmax()
+
+        last[R] = cand_r[i_max]
+        best[R] = A_R[i_max]
+
+        if R % prune_every == 0:
+
+            tolerance = 1e-8 * (abs(best[R]) + 1.0)
+
+            n_cand = _prune_candidates(i_max, n_cand, cand_counts, cand_exposure, cand_best, cand_lo, cand_hi,
+                                       tolerance, arrays)
+
+            n_cand = _prune_candidates(n_cand - 1, n_cand, cand_counts, cand_exposure, cand_best, cand_lo, cand_hi,
+                                       tolerance, arrays)
+
+    np.seterr(**old_settings)
+
+    numexpr.set_vml_accuracy_mode(oldaccuracy)
+
+    logger.debug("Done\n")
+
+    change_points = _get_change_points(last)
+
+    # Each block starts at the beginning of its first bin, and the last one
+    # ends at the end of the last bin
+    final_edges = np.append(bin_start, bin_stop[-1])[change_points]
+
+    return final_edges
+
+
+class BayesianBlocksStream(object):
+    """
+    Incremental version of bayesian_blocks, for events which arrive in batches (for example
+    during the follow-up of a trigger). The dynamic program for a cell depends only on the
+    cells before it, so each new batch only needs the steps for the new events, and the
+    state is kept in preallocated buffers which are grown when needed.
+
+    The prior of eq. 21 in Scargle 2012 depends on the total number of events, which is not
+    known while the events are arriving, so it has to be given explicitly. Replaying a file
+    with n_events equal to the number of events in it gives the same edges as bayesian_blocks.
+
+    Usage:
+
+        stream = BayesianBlocksStream(tstart, p0, n_events)
+        edges = stream.add(new_times)
+        ...
+        edges = stream.get_edges(tstop)
+    """
+
+    def __init__(self, tstart, p0, n_events, initial_capacity=16384):
+        """
+        :param tstart: the start of the interval
+        :param p0: the false positive probability (see bayesian_blocks)
+        :param n_events: number of events used to compute the prior (eq. 21 from Scargle 2012)
+        :param initial_capacity: (default: 16384) initial size of the buffers
+        """
+
+        self._tstart = float(tstart)
+
+        # eq. 21 from Scargle 2012
+        self._prior = 4 - np.log(73.53 * p0 * (n_events**-0.478))
+
+        # Number of events received and number of cells for which the dynamic program
+        # is done. The step for the last event needs the next one (the edge of its cell is
+        # the midpoint between the two), so it is computed only provisionally in get_edges
+        self._n = 0
+        self._n_done = 0
+        self._n_cand = 0
+
+        self._capacity = 0
+        self._grow(max(int(initial_capacity), 2))
+
+    @property
+    def n_events(self):
+        """
+        Number of events received so far
+        """
+
+        return self._n
+
+    @property
+    def prior(self):
+        """
+        The penalization for each new block
+        """
+
+        return self._prior
+
+    def _grow(self, n_needed):
+        """
+        Make sure that the buffers can contain n_needed events (plus one temporary candidate)
+        """
+
+        if n_needed + 1 <= self._capacity:
+
+            return
+
+        new_capacity = max(2 * self._capacity, n_needed + 1)
+
+        def grown(array, dtype):
+
+            new_array = np.zeros(new_capacity, dtype=dtype)
+
+            if array is not None:
+
+                new_array[:array.shape[0]] = array
+
+            return new_array
+
+        if self._capacity == 0:
+
+            self._t = self._best = self._last = None
+            self._cand_r = self._cand_edge = self._cand_best = self._cand_lo = self._cand_hi = None
+
+        self._t = grown(self._t, float)
+        self._best = grown(self._best, float)
+        self._last = grown(self._last, int)
+
+        self._cand_r = grown(self._cand_r, int)
+        self._cand_edge = grown(self._cand_edge, float)
+        self._cand_best = grown(self._cand_best, float)
+        self._cand_lo = grown(self._cand_lo, float)
+        self._cand_hi = grown(self._cand_hi, float)
+
+        # Buffers to compact when candidates are dropped
+        self._arrays = [self._cand_r, self._cand_edge, self._cand_best, self._cand_lo, self._cand_hi]
+
+        self._capacity = new_capacity
+
+    def _edge(self, i):
+        """
+        Left edge of the cell of event i (the Voronoi tessellation of bayesian_blocks)
+        """
+
+        if i == 0:
+
+            return self._t[0]
+
+        else:
+
+            return 0.5 * (self._t[i - 1] + self._t[i])
+
+    def _push_candidate(self, R, slot):
+        """
+        Write the candidate for a block starting at cell R in the given slot of the buffers
+        """
+
+        self._cand_r[slot] = R
+        self._cand_edge[slot] = self._edge(R)
+        self._cand_best[slot] = self._best[R - 1] if R > 0 else 0.0
+        self._cand_lo[slot] = 0.0
+        self._cand_hi[slot] = np.inf
+
+    def _evaluate(self, R, n_cand, edge_R1, compiled):
+        """
+        Same fitness as in bayesian_blocks, for the last block ending at edge_R1 and
+        starting at one of the first n_cand candidates
+        """
+
+        local_dict = {'r': self._cand_r[:n_cand], 'edge': self._cand_edge[:n_cand],
+                      'best': self._cand_best[:n_cand], 'R1': R + 1, 'edge_R1': edge_R1,
+                      'prior': self._prior}
+
+        if compiled:
+
+            return numexpr.re_evaluate(local_dict=local_dict)
+
+        else:
+
+            return numexpr.evaluate('''(R1 - r) * log((R1 - r) / (edge_R1 - edge)) - prior + best''',
+                                    optimization='aggressive', local_dict=local_dict)
+
+    def add(self, times):
+        """
+        Add a batch of events and return the current edges of the blocks (the last one is
+        the time of the last event received)
+
+        :param times: arrival times of the new events, which must be ordered and after the
+        events already received
+        :return: the np.array containing the edges of the blocks
+        """
+
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+
+        assert times.ndim == 1
+
+        if times.shape[0] == 0:
+
+            return self.get_edges()
+
+        previous = np.concatenate([self._t[self._n - 1:self._n], times])
+
+        if np.any(np.diff(previous) <= 0):
+
+            raise RuntimeError("Events appears to be out of order! Check for order, or duplicated events.")
+
+        self._grow(self._n + times.shape[0])
+
+        self._t[self._n:self._n + times.shape[0]] = times
+        self._n += times.shape[0]
+
+        # Numexpr keeps only the last compiled expression, which might have been changed
+        # by somebody else since the last batch, so compile it again for each batch
+        oldaccuracy = numexpr.set_vml_accuracy_mode('low')
+        numexpr.set_num_threads(1)
+        numexpr.set_vml_num_threads(1)
+
+        old_settings = np.seterr(divide='ignore', over='ignore', invalid='ignore')
+
+        prune_every = 32
+        compiled = False
+
+        # Same loop as in bayesian_blocks, for all the cells which now have the next event
+        for R in range(self._n_done, self._n - 1):
+
+            self._push_candidate(R, self._n_cand)
+            self._n_cand += 1
+
+            A_R = self._evaluate(R, self._n_cand, self._edge(R + 1), compiled)
+            compiled = True
+
+            i_max = A_R.argmax()
+
+            self._last[R] = self._cand_r[i_max]
+            self._best[R] = A_R[i_max]
+
+            if R % prune_every == 0:
+
+                tolerance = 1e-8 * (abs(self._best[R]) + 1.0)
+
+                self._n_cand = _prune_candidates(i_max, self._n_cand, self._cand_r, self._cand_edge,
+                                                 self._cand_best, self._cand_lo, self._cand_hi,
+                                                 tolerance, self._arrays)
+
+                self._n_cand = _prune_candidates(self._n_cand - 1, self._n_cand, self._cand_r, self._cand_edge,
+                                                 self._cand_best, self._cand_lo, self._cand_hi,
+                                                 tolerance, self._arrays)
+
+        self._n_done = max(self._n - 1, 0)
+
+        np.seterr(**old_settings)
+
+        numexpr.set_vml_accuracy_mode(oldaccuracy)
+
+        return self.get_edges()
+
+    def get_edges(self, tstop=None):
+        """
+        Return the current edges of the blocks
+
+        :param tstop: (default: None) the stop of the interval. If None, the time of the
+        last event received is used
+        :return: the np.array containing the edges of the blocks
+        """
+
+        n = self._n
+
+        if n == 0:
+
+            return np.array([])
+
+        last_event = self._t[n - 1]
+
+        if tstop is None:
+
+            tstop = last_event
+
+        # The last step of the dynamic program, where the last cell ends at the last event.
+        # The temporary candidate goes in the first free slot, without changing the state
+        R = n - 1
+
+        self._push_candidate(R, self._n_cand)
+
+        oldaccuracy = numexpr.set_vml_accuracy_mode('low')
+
+        old_settings = np.seterr(divide='ignore', over='ignore', invalid='ignore')
+
+        A_R = self._evaluate(R, self._n_cand + 1, last_event, False)
+
+        np.seterr(**old_settings)
+
+        numexpr.set_vml_accuracy_mode(oldaccuracy)
+
+        # Peel off the change points, following only the links of the optimal partition
+        change_points = [n]
+        ind = self._cand_r[A_R.argmax()]
+
+        while ind > 0:
+
+            change_points.append(ind)
+
+            ind = self._last[ind - 1]
+
+        change_points.append(0)
+
+        change_points = np.array(change_points[::-1])
+
+        # The edges are the boundaries of the cells, apart from the first and the last
+        # which are tstart and tstop
+        final_edges = 0.5 * (self._t[np.maximum(change_points - 1, 0)] + self._t[np.minimum(change_points, n - 1)])
+
+        final_edges[0] = self._tstart
+        final_edges[-1] = tstop
+
+        return final_edges
+
+
+def bayesian_blocks_legacy(tt, ttstart, ttstop, p0, bkg_integral_distribution=None):
+    """
+    Reference implementation of bayesian_blocks, which evaluates all the possible
+    change points at each step. It is kept to validate the faster engine (see the
+    benchmark at the end of this module).
+
+    Divide a series of events characterized by their arrival time in blocks
+    of perceptibly constant count rate. If the background integral distribution
+    is given, divide the series in blocks where the difference with respect to
+    the background is perceptibly constant.
+
     :param tt: arrival times of the events
     :param ttstart: the start of the interval
     :param ttstop: the stop of the interval
@@ -207,8 +953,57 @@ def bayesian_blocks(tt, ttstart, ttstop, p0, bkg_integral_distribution=None):
 
     return np.asarray(final_edges)
 
-#To be run with a profiler
+#Benchmark of the pruned engine against the reference implementation.
+#Can also be run with a profiler.
+#Usage: python BayesianBlocks.py [max. number of events] [max. number of events for the reference]
+#(the reference implementation takes hours for 10^6 events, so by default it is run only up to 10^5)
 if __name__=="__main__":
-    tt                        = np.random.uniform(0,1000,30000)
-    tt.sort()
-    res                       = bayesian_blocks(tt,1e-3,None)
+    import sys
+    import time
+
+    logger.setLevel(logging.WARNING)
+
+    max_events                = int(float(sys.argv[1])) if len(sys.argv) > 1 else 1000000
+    max_reference             = int(float(sys.argv[2])) if len(sys.argv) > 2 else 100000
+
+    for n_events in [10000, 100000, 1000000]:
+
+        if n_events > max_events:
+
+            break
+
+        # A constant background with a burst in the middle
+        tt                    = np.concatenate([np.random.uniform(0, 1000, n_events - n_events // 10),
+                                                np.random.normal(500, 5, n_events // 10)])
+        tt.sort()
+
+        start                 = time.time()
+        res                   = bayesian_blocks(tt, 0, 1000, 1e-3)
+        fast_time             = time.time() - start
+
+        if n_events <= max_reference:
+
+            start             = time.time()
+            reference         = bayesian_blocks_legacy(tt, 0, 1000, 1e-3)
+            reference_time    = time.time() - start
+
+            print("%8i events: %4i blocks, %8.2f s (reference: %8.2f s), identical edges: %s" %
+                  (n_events, res.shape[0] - 1, fast_time, reference_time, np.array_equal(res, reference)))
+
+        else:
+
+            print("%8i events: %4i blocks, %8.2f s (reference: skipped)" % (n_events, res.shape[0] - 1, fast_time))
+
+        # Replay the same events in batches of 1000 through the incremental engine
+        start                 = time.time()
+        stream                = BayesianBlocksStream(0, 1e-3, n_events)
+
+        for i in range(0, n_events, 1000):
+
+            stream.add(tt[i:i + 1000])
+
+        streamed              = stream.get_edges(1000)
+        stream_time           = time.time() - start
+
+        print("%8i events: streamed in batches of 1000 in %8.2f s, identical edges: %s" %
+              (n_events, stream_time, np.array_equal(res, streamed)))
@@ -63,7 +63,8 @@ class CommandPipeline(object):
              parname=="clobber" or 
              parname=="verbose" or
              parname=="figure" or
-             parname=="tkwindow"):
+             parname=="tkwindow" or
+             parname=="workdir"):
             continue
           pass
           if(parameter.possibleValues!=[]):
@@ -5,6 +5,7 @@ from GtBurst.my_fits_io import pyfits
 import time, numpy
 from GtBurst import dataHandling
 from GtBurst import IRFS
+from GtBurst.eventFile import EventFile
 import matplotlib.colors as col
 import matplotlib.cm as cm
 
@@ -14,8 +15,9 @@ cpool                         = [ '#a6cee3','#1f78b4','#b2df8a','#33a02c','#fb9a
 class InteractiveFt1Display(object):
   def __init__(self,ft1file,skyimage,figure,obj_ra=None,obj_dec=None):
     self.skyimage             = skyimage
-    ft1                       = pyfits.open(ft1file)
-    self.events               = ft1['EVENTS'].data
+    #Columns are views on the memory-mapped file
+    ft1                       = EventFile(ft1file)
+    self.events               = ft1.getData()
     self.empty                = False
     if(len(self.events)==0):
       print("No events in FT1 file %s" %(ft1file))
@@ -28,26 +30,25 @@ class InteractiveFt1Display(object):
     
     #Read in the different classes of events
     self.trigtime             = dataHandling.getTriggerTime(ft1file)
-    time                      = self.events.field("TIME")
-    energy                    = self.events.field("ENERGY")
     if(not self.empty):
-      self.tmin                 = min(time)-self.trigtime
-      self.tmax                 = max(time)-self.trigtime
-      self.energyMin            = min(energy)
-      self.energyMax            = max(energy)
+      time,energy             = ft1.getColumns("TIME","ENERGY")
+      self.tmin                 = time.min()-self.trigtime
+      self.tmax                 = time.max()-self.trigtime
+      self.energyMin            = energy.min()
+      self.energyMax            = energy.max()
     else:
-      self.tmin               = float(ft1['EVENTS'].header['TSTART'])
-      self.tmax               = float(ft1['EVENTS'].header['TSTOP'])
+      self.tmin               = float(ft1.header['TSTART'])
+      self.tmax               = float(ft1.header['TSTOP'])
       self.energyMin          = 100
       self.energyMax          = 1e7
     pass
     
     #Get the reprocessing
-    self.reprocVer            = str(ft1[0].header['PROC_VER'])
+    self.reprocVer            = str(ft1.primaryHeader['PROC_VER'])
     self.generateColorMap()
     
     #Print a summary
-    irfs                      = numpy.array(map(lambda x:IRFS.fromEvclassToIRF(self.reprocVer,x),self.events.field("EVENT_CLASS")))
+    irfs                      = numpy.array(map(lambda x:IRFS.fromEvclassToIRF(self.reprocVer,x),ft1.getColumn("EVENT_CLASS")))
     print("")
     for irf in IRFS.PROCS[self.reprocVer]:
       try:
@@ -74,7 +75,6 @@ class InteractiveFt1Display(object):
     self.displayEvents()
     self.figure.canvas.draw()
     self.connectEvents()
-    ft1.close()
   pass
   
   def generateColorMap(self):    
@@ -148,14 +148,9 @@ class InteractiveFt1Display(object):
     #Transform in pixel coordinates then check if ra,dec is contained
     #in the provided rectangular region
     tr                        = self.image._ax1._wcs.wcs_sky2pix
+    #(works with arrays as well, returning a boolean mask)
     x,y                       = tr(ra,dec,1)
-    if((x>=xmin and x<=xmax) and
-       (y>=ymin and y<=ymax)):
-       #Contained
-       return True
-    else:
-       return False
-    pass
+    return (x>=xmin) & (x<=xmax) & (y>=ymin) & (y<=ymax)
   pass
   
   def mapEventClassesColors(self,classes):
@@ -164,8 +159,8 @@ class InteractiveFt1Display(object):
   
   def displayEvents(self,xmin=-1,xmax=1e9,ymin=-1,ymax=1e9):
     #Filter data
-    idx                       = numpy.array(map(lambda x:self.inRegion(x.field("RA"),x.field("DEC"),xmin,xmax,ymin,ymax),
-                                                self.events),'bool')
+    idx                       = numpy.array(self.inRegion(self.events.field("RA"),self.events.field("DEC"),
+                                                xmin,xmax,ymin,ymax),'bool')
     
     events                    = self.events[idx]
     
@@ -1,11 +1,10 @@
 from GtBurst.my_fits_io import pyfits
 
-import sys
-import os, glob
-import shlex, subprocess, shutil
+import os
 import numpy
 
 from GtBurst.dataHandling import create_from_columns
+from GtBurst.eventFile import EventFile
 
 #The RSP2 matrix for the GBM are computed by interpolating a grid of
 #responses containing Montecarlo-generated rsp for different position of
@@ -14,14 +13,10 @@ from GtBurst.dataHandling import create_from_columns
 #We want to weight every applying matrix for every desired time interval
 #by the number of total counts contained in that interval
 
-def _callSubprocess(cmdline):
-    args                           = shlex.split(cmdline)
-    #p = subprocess.check_call(args,stdout=None,stderr=None)
-    output, error                  = subprocess.Popen(args,stdout = subprocess.PIPE, stderr= subprocess.PIPE).communicate()
-    return output, error
-pass
-
 class EventsCounter(object):
+  #Count the events between two times. The counts are looked up in an index built once
+  #(sorted arrival times for TTE files, cumulative counts for CSPEC files), so that each
+  #count costs O(log N) instead of a pass over all the events
   def __init__(self,**kwargs):
     
     eventfile                 = os.path.abspath(os.path.expanduser(os.path.expandvars(kwargs['eventfile'])))
@@ -35,73 +30,119 @@ class EventsCounter(object):
   pass
   
   def initWithTTE(self,tte):
-    f                         = pyfits.open(tte)
     self.inputFile            = 'TTE'
-    self.data                 = f["EVENTS",1].data.copy()
-    self.eventTimes           = numpy.array(list(self.data.field('TIME')))
-    f.close()
+    #View on the memory-mapped file (a sorted copy only if the file is not time-ordered)
+    self.eventTimes           = EventFile(tte).getColumn('TIME',sort=True)
+    
+    self.tmin                 = self.eventTimes[0]
+    self.tmax                 = self.eventTimes[-1]
   pass
   
   def initWithCSPEC(self,cspec):
     f                         = pyfits.open(cspec)
     self.inputFile            = 'cspec'
-    self.data                 = f["SPECTRUM",1].data.copy()
-    cspectstarts              = self.data.field("TIME")
-    cspectstops               = self.data.field("ENDTIME")
+    data                      = f["SPECTRUM",1].data
+    cspectstarts              = numpy.array(data.field("TIME"),dtype=float)
+    cspectstops               = numpy.array(data.field("ENDTIME"),dtype=float)
     cspectelapse              = cspectstops-cspectstarts
     #Counts or rates?
     try:
-      cspeccounts             = self.data.field("COUNTS")
+      cspeccounts             = numpy.array(data.field("COUNTS"),dtype=float)
     except:
-      rates                   = self.data.field("RATE")
-      cspeccounts              = map(lambda x:x[0]*x[1],zip(rates,cspectelapse))
-    pass  
-    self.tstarts              = numpy.array(cspectstarts)
-    self.tstops               = numpy.array(cspectstops)
-    self.counts               = numpy.array(map(lambda x:numpy.sum(x),cspeccounts))
+      rates                   = numpy.array(data.field("RATE"),dtype=float)
+      cspeccounts             = rates * cspectelapse.reshape((-1,) + (1,) * (rates.ndim - 1))
+    pass
+    
+    counts                    = cspeccounts.reshape(cspeccounts.shape[0],-1).sum(axis=1)
+    
     #Place zeros where QUALITY is > 0 (bad data)
-    self.goodDataMask         = (f["SPECTRUM"].data.field('QUALITY')==0)
-    self.counts[~self.goodDataMask]  = 0 
+    goodDataMask              = (numpy.array(data.field('QUALITY'))==0)
+    counts[~goodDataMask]     = 0
     f.close()
+    
+    order                     = numpy.argsort(cspectstarts,kind='mergesort')
+    self.tstarts              = cspectstarts[order]
+    self.tstops               = cspectstops[order]
+    self.counts               = counts[order]
+    self.goodDataMask         = goodDataMask[order]
+    
+    self.tmin                 = self.tstarts.min()
+    self.tmax                 = self.tstops.max()
+    
+    #Cumulative counts at the start of each bin. With overlapping bins the count at a given
+    #time cannot be obtained from them, and the counts are computed bin by bin
+    self.cumulativeCounts     = numpy.concatenate([[0],numpy.cumsum(self.counts)])
+    self.overlapping          = bool(numpy.any(self.tstarts[1:] < self.tstops[:-1]))
+  pass
+  
+  def _getFractions(self,t,tstarts,tstops):
+    #Fraction of each bin before the time t (assuming the counts uniformly distributed
+    #within the bin)
+    elapse                    = tstops-tstarts
+    
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+      fractions               = numpy.where(elapse > 0,(t-tstarts)/elapse,(t >= tstarts).astype(float))
+    
+    return numpy.clip(fractions,0,1)
+  pass
+  
+  def _getCumulativeCounts(self,t):
+    #Number of counts before each time in t
+    
+    #Index of the bin containing (or preceding) each time
+    idx                       = numpy.clip(numpy.searchsorted(self.tstarts,t,'right')-1,0,self.counts.shape[0]-1)
+    
+    fractions                 = self._getFractions(t,self.tstarts[idx],self.tstops[idx])
+    
+    return self.cumulativeCounts[idx] + fractions * self.counts[idx]
   pass
   
   def getNevents(self,tstart,tstop):
-    #Return the number of events between tstart and tstop
-    #what is the subinterval of the current interval
+    #Return the number of events between tstart and tstop. They can be also arrays,
+    #in which case an array with the number of events in each interval is returned
+    isScalar                  = numpy.isscalar(tstart) and numpy.isscalar(tstop)
+    tstart                    = numpy.asarray(tstart,dtype=float)
+    tstop                     = numpy.asarray(tstop,dtype=float)
+    
+    if(numpy.any(tstart < self.tmin) or numpy.any(tstop > self.tmax)):
+      raise RuntimeError("Tstart and tstop out of boundaries")
+    
     if(self.inputFile=="TTE"):
       
-      if((tstart < min(self.eventTimes)) or (tstop > max(self.eventTimes))):
-        raise RuntimeError("Tstart and tstop out of boundaries")
+      nEvents                 = (numpy.searchsorted(self.eventTimes,tstop,'right') - 
+                                 numpy.searchsorted(self.eventTimes,tstart,'left'))
       
-      thisMask                = (self.eventTimes >= tstart) & (self.eventTimes <= tstop)
-      nEvents                 = len(thisMask.nonzero()[0])
+      #No events if tstop < tstart
+      nEvents                 = numpy.maximum(nEvents,0)
     
     elif(self.inputFile=="cspec"):
       
-      if((tstart < min(self.tstarts)) or (tstop > max(self.tstops))):
-        raise RuntimeError("Tstart and tstop out of boundaries")
-      
-      #Select all interesting intervals
-      thisMask                = (self.tstops >= tstart) & (self.tstarts <= tstop) & self.goodDataMask
+      #The counts in the bins completely contained between tstart and tstop, plus a fraction
+      #of the counts of the first and last bin, assuming that they are distributed uniformly
+      #within the bin
+      if(self.overlapping):
+        
+        nEvents               = numpy.array([numpy.sum(self.counts * 
+                                                       (self._getFractions(t2,self.tstarts,self.tstops) - 
+                                                        self._getFractions(t1,self.tstarts,self.tstops)))
+                                             for t1,t2 in zip(numpy.ravel(tstart),numpy.ravel(tstop))])
+        nEvents               = nEvents.reshape(numpy.broadcast(tstart,tstop).shape)
       
-      #Compute the weight for each interval: the weight will be 1 for intervals
-      #completely contained between tstart and tstop, and < 1 for the first and
-      #last interval. The weighted sum of the counts give the total counts between
-      #tstart and tstop, assuming that they are distributed uniformly within the
-      #first and last bin
-      weight                  = []
-      for i in thisMask.nonzero()[0]:
-        weight.append((min(tstop,self.tstops[i])-max(tstart,self.tstarts[i]))/(self.tstops[i]-self.tstarts[i]))
+      else:
+        
+        nEvents               = self._getCumulativeCounts(tstop) - self._getCumulativeCounts(tstart)
       
-      if(len(weight)==0):
-        nEvents               = 0
-      else:  
-        weight                  = numpy.array(weight)
-        nEvents                 = numpy.sum(weight*self.counts[thisMask])
       pass
+      
+      nEvents                 = numpy.maximum(nEvents,0)
+    
     else:
       raise RuntimeError("Should not get here! this is a bug.")
-    return nEvents
+    
+    if(isScalar):
+      return nEvents.item()
+    else:
+      return nEvents
   pass
   
 pass
@@ -116,431 +157,529 @@ class TimeIntervals(object):
     self.tstops               = []
     self.counts               = []
     
-    eventsCounter                     = EventsCounter(eventfile=_fixPath(kwargs['eventfile']))
+    self.eventsCounter                = EventsCounter(eventfile=_fixPath(kwargs['eventfile']))
     
     timeBinsFile                      = pyfits.open(_fixPath(kwargs['timeBinsFile']))
-    for rowID in range(timeBinsFile["TIMEBINS"].data.shape[0]):
-      curTstart                       = timeBinsFile["TIMEBINS"].data[rowID][0]
-      curTstop                        = timeBinsFile["TIMEBINS"].data[rowID][1]
-      self.tstarts.append(curTstart)
-      self.tstops.append(curTstop)
-      #Count how many events are contained in the TTE file between tstart and tstop
-      self.counts.append(eventsCounter.getNevents(curTstart,curTstop))
+    timeBins                          = timeBinsFile["TIMEBINS"].data
+    for rowID in range(timeBins.shape[0]):
+      self.tstarts.append(timeBins[rowID][0])
+      self.tstops.append(timeBins[rowID][1])
     pass
     timeBinsFile.close()
+    
+    #Count how many events are contained in the TTE file between tstart and tstop,
+    #for all the intervals at once
+    self.counts                       = list(self.eventsCounter.getNevents(numpy.array(self.tstarts,dtype=float),
+                                                                           numpy.array(self.tstops,dtype=float)))
   pass
 pass
 
-def RSPweight(**kwargs):    
-    '''
-  Weight the response matrices contained in the rsp file.
-  Usage:
+def _getRows(column,counts):
+  #Return the concatenation of the first counts[i] elements of each row of the column,
+  #which can be a column of scalars, of fixed-length arrays or of variable-length arrays
+  counts                      = numpy.asarray(counts,dtype=int)
+  
+  if(column.dtype==object):
+    #Variable-length arrays
+    rows                      = [numpy.asarray(row).ravel()[:n] for row,n in zip(column,counts)]
+    if(len(rows)==0):
+      return numpy.zeros(0)
+    return numpy.concatenate(rows)
+  pass
+  
+  column                      = numpy.asarray(column)
+  column                      = column.reshape(column.shape[0],-1)
+  
+  mask                        = numpy.arange(column.shape[1])[None,:] < counts[:,None]
+  
+  if(numpy.any(counts > column.shape[1])):
+    raise RuntimeError("Invalid response matrix: not enough elements in the rows")
+  
+  return column[mask]
+pass
+
+def _getRowLengths(column):
+  #Number of elements in each row of the column
+  if(column.dtype==object):
+    return numpy.array([numpy.asarray(row).size for row in column],dtype=int)
+  else:
+    column                    = numpy.asarray(column)
+    return numpy.zeros(column.shape[0],dtype=int) + int(numpy.prod(column.shape[1:]))
+pass
+
+def getChannelOffset(matrixHDU):
+  #Number of the first channel (TLMIN keyword of the F_CHAN column, 1 if not present)
+  fChanColumn                 = matrixHDU.columns.names.index('F_CHAN')+1
+  return int(matrixHDU.header.get("TLMIN%s" %(fChanColumn),1))
+pass
+
+class ResponseMatrix(object):
+  #A response matrix (energies x channels) kept in the sparse form used in the OGIP files:
+  #for each row the number of groups of contiguous channels (nGroups), for each group the
+  #first channel (counted from 0) and the number of channels (firstChannels, nChannelsInGroup),
+  #and the values of all the groups one after the other (values).
+  #The matrix is expanded to a dense array only when needed (toDense())
+  def __init__(self,nGroups,firstChannels,nChannelsInGroup,values,nChannels):
     
-    RSPweight(eventfile=eventfile,timeBinsFile=timeBinsFile,rsp2file=rsp2file,
-              outfile=outfile,triggerTime=triggerTime)
+    self.nGroups              = numpy.asarray(nGroups,dtype=numpy.int32)
+    self.firstChannels        = numpy.asarray(firstChannels,dtype=numpy.int32)
+    self.nChannelsInGroup     = numpy.asarray(nChannelsInGroup,dtype=numpy.int32)
+    self.values               = numpy.asarray(values)
+    self.nChannels            = int(nChannels)
+    self.nRows                = self.nGroups.shape[0]
     
-    where eventfile can be either a TTE/FT1 file or a CSPEC file.
-    '''    
-    timeIntervals                    = TimeIntervals(**kwargs)
+    if(self.firstChannels.shape[0]!=self.nGroups.sum() or 
+       self.values.shape[0]!=self.nChannelsInGroup.sum()):
+      raise RuntimeError("Invalid response matrix: inconsistent group structure")
     
-    rsp2                             = _fixPath(kwargs['rsp2file'])
-    out                              = _fixPath(kwargs['outfile'])
-    #The trigger time is only for printing purposes: if specified,
-    #all the messages from the program will contain time intervals referred
-    #to the trigger time, otherwise they will be in MET
-    if('triggerTime' in kwargs.keys()):
-      trigger                        = kwargs['triggerTime']
-    else:
-      trigger                        = 0
-    #name for the output
-    outrsp                           = out
+    if(numpy.any(self.firstChannels < 0) or
+       numpy.any(self.firstChannels+self.nChannelsInGroup > self.nChannels)):
+      raise RuntimeError("Invalid response matrix: channels out of range")
+  pass
+  
+  @classmethod
+  def fromHDU(cls,matrixHDU,nChannels,channelOffset=None,fixGBM=False):
+    #Read the matrix from a SPECRESP MATRIX extension.
+    #
+    #fixGBM: fix the rows of the GBM matrices with F_CHAN = 128 and N_CHAN = 1 but with only
+    #the first element, which are actually F_CHAN = 1, N_CHAN = 1 (the channels are then
+    #numbered from 1, whatever the TLMIN keyword says)
+    data                      = matrixHDU.data
+    nRows                     = data.shape[0]
+    
+    if(channelOffset is None):
+      channelOffset           = 1 if fixGBM else getChannelOffset(matrixHDU)
+    pass
     
-    #Open files
-    rsp2File                          = pyfits.open(rsp2)
+    nGroups                   = numpy.array(data.field('N_GRP'),dtype=int).reshape(nRows)
+    firstChannels             = numpy.array(_getRows(data.field('F_CHAN'),nGroups),dtype=int)
+    nChannelsInGroup          = numpy.array(_getRows(data.field('N_CHAN'),nGroups),dtype=int)
+    
+    rowOfGroup                = numpy.repeat(numpy.arange(nRows),nGroups)
+    
+    if(fixGBM):
+      wrong                   = ((firstChannels==128) & (nChannelsInGroup==1) & 
+                                 (_getRowLengths(data.field('MATRIX'))[rowOfGroup] < 128))
+      firstChannels[wrong]    = 1
+    pass
+    
+    valuesInRow               = numpy.bincount(rowOfGroup,nChannelsInGroup,minlength=nRows).astype(int)
+    values                    = _getRows(data.field('MATRIX'),valuesInRow)
+    
+    return cls(nGroups,firstChannels-channelOffset,nChannelsInGroup,values,nChannels)
+  pass
+  
+  @classmethod
+  def fromElements(cls,rows,channels,values,nRows,nChannels):
+    #Build the matrix from its non-null elements, merging contiguous channels in groups
+    rows                      = numpy.asarray(rows,dtype=int)
+    channels                  = numpy.asarray(channels,dtype=int)
+    values                    = numpy.asarray(values)
+    
+    order                     = numpy.lexsort((channels,rows))
+    rows                      = rows[order]
+    channels                  = channels[order]
+    values                    = values[order]
+    
+    #A new group starts when the row changes or the channels are not contiguous
+    newGroup                  = numpy.ones(rows.shape[0],dtype=bool)
+    newGroup[1:]              = (rows[1:]!=rows[:-1]) | (channels[1:]!=channels[:-1]+1)
+    groupStarts               = numpy.flatnonzero(newGroup)
+    
+    nChannelsInGroup          = numpy.diff(numpy.append(groupStarts,rows.shape[0]))
+    nGroups                   = numpy.bincount(rows[groupStarts],minlength=nRows)
+    
+    return cls(nGroups,channels[groupStarts],nChannelsInGroup,values,nChannels)
+  pass
+  
+  def getElements(self):
+    #Return row, channel and value of each element in the groups
+    rowOfGroup                = numpy.repeat(numpy.arange(self.nRows),self.nGroups)
+    groupStart                = numpy.cumsum(self.nChannelsInGroup)-self.nChannelsInGroup
+    channels                  = (numpy.repeat(self.firstChannels-groupStart,self.nChannelsInGroup) + 
+                                 numpy.arange(self.values.shape[0]))
+    rows                      = numpy.repeat(rowOfGroup,self.nChannelsInGroup)
+    return rows, channels, self.values
+  pass
+  
+  def hasSameStructure(self,other):
+    return (self.nChannels==other.nChannels and
+            numpy.array_equal(self.nGroups,other.nGroups) and
+            numpy.array_equal(self.firstChannels,other.firstChannels) and
+            numpy.array_equal(self.nChannelsInGroup,other.nChannelsInGroup))
+  pass
+  
+  @classmethod
+  def weightedSum(cls,weights,matrices):
+    #Return the sum of the matrices multiplied by the weights (matrices with weight
+    #zero are ignored)
+    pairs                     = [(w,m) for w,m in zip(weights,matrices) if w!=0]
+    
+    if(len(pairs)==0):
+      return cls(numpy.zeros(matrices[0].nRows),[],[],numpy.zeros(0),matrices[0].nChannels)
+    
+    first                     = pairs[0][1]
+    
+    if(all(first.hasSameStructure(m) for w,m in pairs[1:])):
+      #Same groups in all the matrices: just sum the values
+      values                  = numpy.sum([w*numpy.asarray(m.values,dtype=float) for w,m in pairs],axis=0)
+      return cls(first.nGroups,first.firstChannels,first.nChannelsInGroup,values,first.nChannels)
+    pass
+    
+    #Different groups: sum the values of the elements with the same row and channel
+    elements                  = [m.getElements() for w,m in pairs]
+    keys                      = numpy.concatenate([r*first.nChannels+c for r,c,v in elements])
+    values                    = numpy.concatenate([w*numpy.asarray(v,dtype=float) for (w,m),(r,c,v) in zip(pairs,elements)])
+    
+    uniqueKeys,inverse        = numpy.unique(keys,return_inverse=True)
+    values                    = numpy.bincount(inverse,values,minlength=uniqueKeys.shape[0])
+    
+    return cls.fromElements(uniqueKeys // first.nChannels,uniqueKeys % first.nChannels,values,
+                            first.nRows,first.nChannels)
+  pass
+  
+  def dot(self,spectrum):
+    #Return the counts in each channel for the given spectrum (one value for each
+    #row, i.e., for each energy bin)
+    rows,channels,values      = self.getElements()
+    spectrum                  = numpy.asarray(spectrum,dtype=float)
+    return numpy.bincount(channels,values*spectrum[rows],minlength=self.nChannels)
+  pass
+  
+  def toDense(self):
+    #Return the matrix as a (energies x channels) array
+    rows,channels,values      = self.getElements()
+    matrix                    = numpy.zeros((self.nRows,self.nChannels))
+    matrix[rows,channels]     = values
+    return matrix
+  pass
+  
+  @property
+  def nbytes(self):
+    #Memory used by the matrix, in bytes
+    return (self.nGroups.nbytes+self.firstChannels.nbytes+
+            self.nChannelsInGroup.nbytes+self.values.nbytes)
+  pass
+  
+  @property
+  def denseNbytes(self):
+    #Memory needed by the matrix as a dense array of float64, in bytes
+    return self.nRows*self.nChannels*numpy.dtype(float).itemsize
+  pass
+pass
+
+def densifyMatrix(matrixHDU,nChannels,channelOffset=None,fixGBM=False):
+  #Return the response matrix in a SPECRESP MATRIX extension as a dense (energies x channels)
+  #array (see ResponseMatrix.fromHDU)
+  return ResponseMatrix.fromHDU(matrixHDU,nChannels,channelOffset,fixGBM).toDense()
+pass
+
+class ResponseWeighter(object):
+  #Weight the matrices of a RSP2 file by the counts in the time covered by each of them.
+  #The file is read once: the time covered by each matrix is kept in a table, so that
+  #the weights for all the intervals are computed with array operations, and the matrices
+  #are kept in their sparse form (see ResponseMatrix) until the weighted ones are written
+  def __init__(self,rsp2file,instrument="UNKN-INSTRUME"):
+    
+    self.rsp2file             = rsp2file
+    self.instrument           = instrument
+    self.fixGBM               = (instrument.find("GBM")>=0)
+    
+    rsp2File                  = pyfits.open(rsp2file)
     
-    #Get instrument name
     try:
-      instrument                        = pyfits.getval(_fixPath(kwargs['eventfile']),"INSTRUME",extname="EVENTS",extver=1)
-    except:
-      try:
-        instrument                        = pyfits.getval(_fixPath(kwargs['eventfile']),"INSTRUME",extname="SPECTRUM",extver=1)
-      except:
-        instrument                        = "UNKN-INSTRUME"
-    #For every interval contained in the time bins file
-    #find the applying matrices and compute the weight (if necessary)
-    nIntervals                        = len(timeIntervals.tstarts)
-    nMatrix                           = len(rsp2File)
-    createdRspNames                   = []
-    eventsCounter                     = EventsCounter(**kwargs)
-    for tstart,tstop,nEvents,intervalNumber in zip(timeIntervals.tstarts,
-                                                   timeIntervals.tstops,
-                                                   timeIntervals.counts,
-                                                   range(nIntervals)):
-      print("\nInterval: %s - %s" % (tstart-trigger,tstop-trigger))
       
-      #find the RSP matrices falling in the current tstart-tstop interval
-      rspList                         = []
-      rspStarts                       = []
-      rspStops                        = []
-      firstResponse                   = True
-      for extNumber in range(nMatrix):
+      self.primaryHeader      = rsp2File[0].header.copy()
+      self.ebounds            = rsp2File['EBOUNDS'].copy()
+      nChannels               = self.ebounds.data.shape[0]
       
-        if(rsp2File[extNumber].name=="SPECRESP MATRIX" or 
-           rsp2File[extNumber].name=="MATRIX"):                    
-                     
-          curHeader                           = rsp2File[extNumber].header
-          
-          #Check that the instrument is the same of the TTE file
-          instrument2                         = curHeader["INSTRUME"]
-          if(instrument2!=instrument):
-            print("WARNING: the Events file %s and the response matrix file %s refers to different instruments" % (instrument,instrument2))
-          pass
-          
-          #Find the start and stop time of the interval covered 
-          #by this response matrix
-          headerStart                         = curHeader["TSTART"]
-          headerStop                          = curHeader["TSTOP"]
-
-          #The matrix cover the period going from the middle point between its start
-          #time and the start time of the previous matrix (or its start time if it is the
-          #first matrix of the file), and the middle point between its start time and its
-          #stop time (that is equal to the start time of the next one):
-          #
-          #           tstart                             tstop
-          #             |==================================|
-          # |--------------x---------------|-----------x-----------|----------x--..
-          #rspStart1    rspStop1=    headerStart2  rspStop2= headerStart3  rspStop3
-          #             rspStart2                  rspStart3
-          #           
-          #covered by: |m1 |           m2             | m3|
-          #
-          
-          if(firstResponse):
-            #This is the first matrix
-            if(extNumber==len(rsp2File)-1):
-              #This is both the first both the last matrix
-              rspStart                          = headerStart
-              rspStop                           = headerStop 
-            else:
-              rspStart                          = headerStart
-              rspStop                           = (headerStart+headerStop)/2.0
-              firstResponse                     = False
-            pass
-          elif(extNumber==len(rsp2File)-1):
-            #This is the last matrix
-            rspStart                          = prevRspStop
-            rspStop                           = headerStop            
-          else:
-            rspStart                          = prevRspStop
-            rspStop                           = (headerStart+headerStop)/2.0    
-          pass
-          
-          #Save the stop time for the next iteration of the loop
-          prevRspStop                         = rspStop
-                
-          #Check if the current matrix covers at least a portion of the 
-          #start-stop time interval
-          if( rspStop >= tstart and rspStart <= tstop):
-            #Found a matrix covering a part of the interval:
-            #adding it to the list:
-            rspList.append(fixMatrixHDU(rsp2File[extNumber]))
-            
-            #Get the "true" start time of the time sub-interval covered by this matrix
-            trueRspStart                       = max(rspStart,tstart)
-            
-            #Get the "true" stop time of the time sub-interval covered by this matrix
-            if(extNumber==len(rsp2File)-1):
-              #Since there are no matrices after this one, this has to cover until the end of the interval
-              if(tstop > rspStop):
-                print("\nWARNING: RSPweight: The RSP file does not cover the required time interval.")
-                print("    The last response should cover from %s to %s, but we'll use it" % (trueRspStart, rspStop))
-                print("    to cover until the end of the time interval (%s)." % (tstop))
-                trueRspStop                      = tstop
-              else:
-                trueRspStop                      = tstop 
-            else:
-              trueRspStop                      = min(rspStop,tstop)
-            pass
-            
-            #Save the true start and stop
-            rspStarts.append(trueRspStart)
-            rspStops.append(trueRspStop)
-            
-            print("  Matr. in ext #%s covers %s - %s" % (extNumber,trueRspStart-trigger,trueRspStop-trigger))
-            if(rspStop >= tstop):
-              #This matrix cover after the tstop,
-              #no reason to analize the other matrices
-              #pass
-              break
-            pass
-          pass
-        
-        pass
+      extensions              = [i for i,hdu in enumerate(rsp2File) 
+                                 if hdu.name=="SPECRESP MATRIX" or hdu.name=="MATRIX"]
       
-      pass
+      if(len(extensions)==0):
+        raise RuntimeError("No response matrices in %s" %(rsp2file))
       
-      weight                            = []
-    
-      if(len(rspList) > 1):
-        #We want to weight matrices by number of counts
-        #so we need the number of events falling in the current
-        #time interval
-        
-        #Number of total events contained in the interval
-        nThisTotalEvt                   = nEvents
-
-        print("\n  Total counts for this interval:        %s" %(nThisTotalEvt))
-
-        if(nThisTotalEvt <= 0): 
-          print("  Counts is zero: no signal here. Weight will be exposure-based.")
-          #Weight according to the exposure
-          if(sum(weight)==0):
-            for index,rsp in enumerate(rspList):
-              thisWeight                      = (rspStops[index]-rspStarts[index])/(tstop-tstart)
-              weight.append(thisWeight)
-              print("  Weight for response %s - %s:           %s" % (rspStarts[index]-trigger,rspStops[index]-trigger,thisWeight))
-            pass
-          pass
-        else:
-          #Weight according to the counts
-          #now look upon the selected events, searching for events
-          #falling in the interval covered by each
-          #response matrix
-          for index,rsp in enumerate(rspList):
-            rspStart                          = rspStarts[index]
-            rspStop                           = rspStops[index]
-            
-            #how many events of the time interval contained here?
-            nThisRspEvt                       = eventsCounter.getNevents(rspStart,rspStop)
-
-            #Compute the weight
-            if(nThisRspEvt > 0):
-              thisWeight                      = float(nThisRspEvt)/float(nThisTotalEvt)
-            else:
-              thisWeight                      = 0
-            pass
-            
-            #Append the weight to the list of weights
-            weight.append(thisWeight)
-            
-            #Print information
-            print("  Weight for response %s - %s:           %s" % (rspStart-trigger,rspStop-trigger,thisWeight))
-            print("  Counts in time covered by this rsp:  %s" % nThisRspEvt)      
-          pass
-        pass
-        
-        #Now, if the sum of the weight is not 1, redistribuite the lacking weight 
-        #according to the exposure. This can happen due to precision problems
-        if(sum(weight)!=1):
-          lackingWeight                     = 1.0-sum(weight)
-          for index,rsp in enumerate(rspList):
-            thisExposureWeight              = (rspStops[index]-rspStarts[index])/(tstop-tstart)
-            weight[index]                  += (thisExposureWeight*lackingWeight)
-          pass
+      self.extensions         = numpy.array(extensions)
+      self.headers            = [rsp2File[i].header.copy() for i in extensions]
+      
+      for header in self.headers:
+        instrument2           = header["INSTRUME"]
+        if(instrument2!=instrument):
+          print("WARNING: the Events file %s and the response matrix file %s refers to different instruments" % (instrument,instrument2))
         pass
-        
-        print("\nTotal weight ---> %s" %(sum(weight)))
-        
-      else:        
-        #There is only one matrix...
-        weight                              = [1]
-      pass 
+      pass
       
-      print("\n")
+      self.channelOffset      = 1 if self.fixGBM else getChannelOffset(rsp2File[extensions[0]])
       
-      #Use addrmf to add and weight the response matrix
-      #We don't use directly pyFits because dealing with response matrices
-      #can be dangerous due to the variable lenght column,
-      #and other features, so we leave the work to a specialized tool
+      first                   = rsp2File[extensions[0]].data
+      self.energyLow          = numpy.array(first.field('ENERG_LO'))
+      self.energyHigh         = numpy.array(first.field('ENERG_HI'))
       
-      #we need to create a file for every matrix, and an ascii file
-      #containing the list of those files and the weights to be applied
-      asciiFilename                           = "__rspweight_rspList.ascii"
-      asciiFile                               = open(asciiFilename,'w')
-      asciiFile.write('')
+      self.matrices           = []
       
-      #Loop on the matrices and sum them
-      names                                   = []
-      for rsp_i in range(len(rspList)):
-        #Decide a temporary filename
-        name                                  = "__rspweight_matrix"+str(rsp_i)+".rsp"
-        names.append(name)
-        
-        primaryHDU                            = rsp2File[0].copy()
-        eboundsHDU                            = rsp2File['EBOUNDS'].copy()
-        responseHDU                           = rspList[rsp_i].copy()
-        HDUlist                               = pyfits.HDUList([primaryHDU,eboundsHDU,responseHDU])
-        HDUlist.writeto(name,output_verify='fix',clobber=True)
-                        
-        if(instrument.find("GBM")>=0):
-          # FIX the wrong GBM matrices
-          data                                  = pyfits.open(name,'update')
-          #EBOUNDS:
-          #Find what is the tlminColumn column                  
-          columns                               = data['EBOUNDS'].data.names          
-          tlminID                               = columns.index('CHANNEL')+1           
-        
-          #Find the number of channels (usually 128)
-          nChannels                             = data['EBOUNDS'].data.size
-        
-          #Fix the CHANNEL column, and TLMIN/TLMAX keywords
-          data['EBOUNDS'].data.field('CHANNEL')[:]=numpy.array(range(1,nChannels+1))
-          data['EBOUNDS'].header.set("TLMIN%s" %(tlminID),1)
-          data['EBOUNDS'].header.set("TLMAX%s" %(tlminID),nChannels)
-          #SPECRESP MATRIX
-          #Now we have to correct the rows whith wrong F_CHAN and N_CHAN values:
-          #There are rows where F_CHAN = 128, and N_CHAN = 1, but the only element not null
-          #in the row is the first, thus it should be: F_CHAN = 1, N_CHAN = 1
+      for ext in extensions:
         
-          for row in range(nChannels):
-            if(data['SPECRESP MATRIX'].data.field('F_CHAN')[row]==128 and
-               data['SPECRESP MATRIX'].data.field('N_CHAN')[row]==1):
-            
-              #We have a possibly wrong row
-              #Try to access the channel 128 of the matrix
-              try:
-                data['SPECRESP MATRIX'].data.field('MATRIX')[row][127]
-              except:
-                #Impossible to access it, thus the values are wrong. Fix them
-                data['SPECRESP MATRIX'].data.field('F_CHAN')[row] = numpy.array([1])
-                data['SPECRESP MATRIX'].data.field('N_CHAN')[row] = numpy.array([1]) 
-              pass
-            pass   
-          pass
-          #Find what is the tlminColumn column                  
-          columns                                            = data['SPECRESP MATRIX'].data.names          
-          tlminID                                            = columns.index('F_CHAN')+1 
-          data['SPECRESP MATRIX'].header.set("TLMIN%s" %(tlminID),1)
-          data['SPECRESP MATRIX'].header.set("TLMAX%s" %(tlminID),nChannels)
-          data.close()
-        pass        
+        if(not numpy.allclose(rsp2File[ext].data.field('ENERG_LO'),self.energyLow)):
+          raise RuntimeError("The matrices in %s have different energy binning" %(rsp2file))
         
-        asciiFile.write(name+" "+str(weight[rsp_i])+"\n")
+        self.matrices.append(ResponseMatrix.fromHDU(rsp2File[ext],nChannels,self.channelOffset,self.fixGBM))
+      
       pass
-      asciiFile.close()
       
-      #Decide a name for the output matrix for this interval
-      thisRspName                          = "__rspweight_interval"+str(intervalNumber)+".rsp"
-      createdRspNames.append(thisRspName)
+      self._setCoverage(len(rsp2File))
+    
+    finally:
       
-      if(len(names)==1):
-        #Only one matrix. No need to weight
-        shutil.copy(names[0],thisRspName)
-      else:
-        #Run addrmf and weight the relevant matrices
-        cmdline                              = "addrmf @%s rmffile=%s clobber=yes" % (asciiFilename,thisRspName)
-        print("\n %s \n" %(cmdline))
-        
-        out, err                             = _callSubprocess(cmdline)
-        
-        print out
-        print err
-      pass
-      #clean up
-      os.remove(asciiFilename)
+      rsp2File.close()
+    
+    pass
+  pass
+  
+  def _setCoverage(self,nHDUs):
+    #The matrix cover the period going from the middle point between its start
+    #time and the start time of the previous matrix (or its start time if it is the
+    #first matrix of the file), and the middle point between its start time and its
+    #stop time (that is equal to the start time of the next one):
+    #
+    #           tstart                             tstop
+    #             |==================================|
+    # |--------------x---------------|-----------x-----------|----------x--..
+    #rspStart1    rspStop1=    headerStart2  rspStop2= headerStart3  rspStop3
+    #             rspStart2                  rspStart3
+    #           
+    #covered by: |m1 |           m2             | m3|
+    #
+    headerStarts              = numpy.array([header["TSTART"] for header in self.headers],dtype=float)
+    headerStops               = numpy.array([header["TSTOP"] for header in self.headers],dtype=float)
+    
+    #The last matrix covers until its TSTOP (and, if needed, until the end of the intervals),
+    #if it is the last extension of the file
+    self.isLast               = (self.extensions==nHDUs-1)
+    
+    self.rspStops             = numpy.where(self.isLast,headerStops,(headerStarts+headerStops)/2.0)
+    self.rspStarts            = numpy.concatenate([headerStarts[:1],self.rspStops[:-1]])
+  pass
+  
+  def getWeights(self,tstarts,tstops,eventsCounter,counts=None):
+    #Return the weight of each matrix for each interval, as a (intervals x matrices) array,
+    #the mask of the matrices used for each interval, and the start and stop of the part
+    #of each interval covered by each of them.
+    #
+    #The matrices covering more than one interval are weighted by the counts in the time
+    #covered by each of them, or by the time if there are no counts. The weights for the
+    #matrices not covering an interval are zero.
+    tstarts                   = numpy.asarray(tstarts,dtype=float)[:,None]
+    tstops                    = numpy.asarray(tstops,dtype=float)[:,None]
+    
+    if(counts is None):
+      counts                  = eventsCounter.getNevents(tstarts[:,0],tstops[:,0])
+    pass
+    
+    counts                    = numpy.asarray(counts,dtype=float)
+    
+    nMatrices                 = self.rspStarts.shape[0]
+    
+    #Matrices covering at least a part of each interval, up to the first one covering
+    #until the end of the interval
+    covering                  = (self.rspStops[None,:] >= tstarts) & (self.rspStarts[None,:] <= tstops)
+    coveringTheEnd            = covering & (self.rspStops[None,:] >= tstops)
+    lastMatrix                = numpy.where(coveringTheEnd.any(axis=1),
+                                            numpy.argmax(coveringTheEnd,axis=1),nMatrices-1)
+    selected                  = covering & (numpy.arange(nMatrices)[None,:] <= lastMatrix[:,None])
+    
+    if(not numpy.all(selected.any(axis=1))):
+      raise RuntimeError("The RSP file does not cover some of the time intervals")
+    
+    #Part of the interval covered by each matrix. Since there are no matrices after the
+    #last one, it covers until the end of the interval
+    trueStarts                = numpy.maximum(self.rspStarts[None,:],tstarts)
+    trueStops                 = numpy.where(self.isLast[None,:],tstops,numpy.minimum(self.rspStops[None,:],tstops))
+    trueStarts                = numpy.where(selected,trueStarts,0)
+    trueStops                 = numpy.where(selected,trueStops,0)
+    
+    stretched                 = selected & self.isLast[None,:] & (tstops > self.rspStops[None,:])
+    
+    for i,j in zip(*numpy.nonzero(stretched)):
+      print("\nWARNING: RSPweight: The RSP file does not cover the required time interval.")
+      print("    The last response should cover from %s to %s, but we'll use it" % (trueStarts[i,j], self.rspStops[j]))
+      print("    to cover until the end of the time interval (%s)." % (tstops[i,0]))
     pass
     
-    #now append all the produced matrix in one RSP2 file
-    #Take the PRIMARY extension from the input RSP2 file
-    primary                          = rsp2File[0].copy()
+    exposureWeights           = numpy.where(selected,(trueStops-trueStarts)/(tstops-tstarts),0)
+    
+    nSelected                 = selected.sum(axis=1)
+    multiple                  = (nSelected > 1)
+    
+    #Counts in the part of each interval covered by each matrix
+    matrixCounts              = numpy.zeros(selected.shape)
+    toCount                   = selected & multiple[:,None] & (counts[:,None] > 0)
+    matrixCounts[toCount]     = eventsCounter.getNevents(trueStarts[toCount],trueStops[toCount])
+    
+    with numpy.errstate(divide='ignore',invalid='ignore'):
+      weights                 = numpy.where(matrixCounts > 0,matrixCounts/counts[:,None],0)
+    
+    #No counts: weight by the time
+    noCounts                  = multiple & (counts <= 0)
+    weights[noCounts]         = exposureWeights[noCounts]
+    
+    #If the sum of the weights is not 1, redistribute the lacking weight according to
+    #the time. This can happen due to precision problems
+    lackingWeight             = numpy.where(multiple,1.0-weights.sum(axis=1),0)
+    weights                  += exposureWeights * lackingWeight[:,None]
+    
+    #Only one matrix
+    weights[~multiple]        = selected[~multiple]
+    
+    return weights, selected, trueStarts, trueStops
+  pass
+  
+  def getWeightedMatrices(self,weights):
+    #Return the weighted sum of the matrices for each interval, as a list of ResponseMatrix
+    return [ResponseMatrix.weightedSum(w,self.matrices) for w in weights]
+  pass
+  
+  def getMemoryUsage(self):
+    #Return the memory used by the matrices, and the memory they would need as dense arrays
+    return (sum(m.nbytes for m in self.matrices),
+            sum(m.denseNbytes for m in self.matrices))
+  pass
+  
+  def writeWeighted(self,tstarts,tstops,weights,outfile):
+    #Write the RSP2 file with one matrix for each interval
+    nIntervals                = len(tstarts)
+    nChannels                 = self.matrices[0].nChannels
+    
+    primary                   = pyfits.PrimaryHDU(header=self.primaryHeader.copy())
     primary.header.set("DRM_NUM",nIntervals)
-    primary.header.set("TSTART",timeIntervals.tstarts[0])
-    primary.header.set("TSTOP",timeIntervals.tstops[-1])
-    primary.writeto(outrsp,clobber='True')
+    primary.header.set("TSTART",tstarts[0])
+    primary.header.set("TSTOP",tstops[-1])
+    
+    ebounds                   = self.ebounds.copy()
     
-    #Get the EBOUNDS extension from the first matrix
-    firstRsp                    = pyfits.open(createdRspNames[0])
-    ebounds                     = firstRsp['EBOUNDS'].copy()
-    firstRsp.close()
+    if(self.fixGBM):
+      #Fix the CHANNEL column, and TLMIN/TLMAX keywords
+      tlminID                 = ebounds.data.names.index('CHANNEL')+1
+      ebounds.data.field('CHANNEL')[:] = numpy.arange(1,nChannels+1)
+      ebounds.header.set("TLMIN%s" %(tlminID),1)
+      ebounds.header.set("TLMAX%s" %(tlminID),nChannels)
+    pass
     
-    #Reopen the file just created
-    outRsp2                           = pyfits.open(outrsp,'update')
-    outRsp2.append(ebounds)
+    hdus                      = [primary,ebounds]
     
-    #now write an extension for each interval
     for i in range(nIntervals):
-      thisRsp                   = pyfits.open(createdRspNames[i])
       
-      try:
-        curM                    = fixMatrixHDU(thisRsp["SPECRESP MATRIX"]).copy()
-        name                    = "SPECRESP MATRIX"
-      except:
-        try:
-          curM                  = fixMatrixHDU(thisRsp["SPECRESP MATRIX"]).copy()
-          name                  = "MATRIX"
-        except:
-          raise RuntimeError("Something gone wrong. Invalid file produced by the weighting algorithm.")
-      pass
+      matrix                  = ResponseMatrix.weightedSum(weights[i],self.matrices).toDense()
       
-      thisRsp.close()
+      #The header comes from the first matrix used for this interval
+      header                  = _getNonStructuralKeywords(self.headers[numpy.flatnonzero(weights[i])[0]
+                                                                        if numpy.any(weights[i]) else 0])
       
-      curHeader               = curM.header
-      curData                 = curM.data
+      #Each row is stored as one group with all the channels
+      nRows                   = matrix.shape[0]
+      columns                 = [pyfits.Column(name='ENERG_LO',format='E',unit='keV',array=self.energyLow),
+                                 pyfits.Column(name='ENERG_HI',format='E',unit='keV',array=self.energyHigh),
+                                 pyfits.Column(name='N_GRP',format='I',array=numpy.ones(nRows,dtype=int)),
+                                 pyfits.Column(name='F_CHAN',format='I',array=numpy.zeros(nRows,dtype=int)+self.channelOffset),
+                                 pyfits.Column(name='N_CHAN',format='I',array=numpy.zeros(nRows,dtype=int)+nChannels),
+                                 pyfits.Column(name='MATRIX',format='%sE' %(nChannels),array=matrix)]
       
-      #Update TSTART and TSTOP
-      curHeader.set("TSTART",timeIntervals.tstarts[intervalNumber])
-      curHeader.set("TSTOP",timeIntervals.tstops[intervalNumber])
+      hdu                     = create_from_columns(columns,header=header)
+      hdu.header.set("TLMIN4",self.channelOffset)
+      hdu.header.set("TLMAX4",self.channelOffset+nChannels-1)
+      hdu.header.set("TSTART",tstarts[i])
+      hdu.header.set("TSTOP",tstops[i])
+      hdu.header.set("RSP_NUM",i+1)
+      hdu.header.set("EXTVER",i+1)
+      hdu.header.add_history("This is a matrix computed by weighting applying matrices contained in "+self.rsp2file)
       
-      #Update RSP_NUM keyword
-      curHeader.set("RSP_NUM",i+1)
-      
-      #update EXTVER keyword
-      curHeader.set("EXTVER",i+1)
-      
-      #Add history
-      history="This is a matrix computed by weighting applying matrices contained in "+rsp2
-      curHeader.add_history(history)
-      print("Appending matrix number %s..." %(i+1))
-      #Write this as an extension in the output file      
-      outRsp2.append(curM)
+      hdus.append(hdu)
+    
     pass
-    #Closing everything
-    outRsp2.close()
-       
-    #Close files
-    rsp2File.close()
-    #Cleanup
-    print("Cleaning up...")
-    fileToDelete              = glob.glob("__rspweight*")
-    for f in fileToDelete:
-      os.remove(f)
+    
+    pyfits.HDUList(hdus).writeto(outfile,clobber=True)
+  pass
 pass
 
-def fixMatrixHDU(matrixHDU):
-  #This creates a copy of the input matrix with all variable-length arrays converted to fixed length,
-  #of the smallest possible size.
-  #This is needed because pyfits makes all sort of fuckups with variable-length arrays
+#Keywords describing the structure of a table, which are recomputed when writing it
+_structuralKeywords           = ['XTENSION','BITPIX','NAXIS','NAXIS1','NAXIS2','PCOUNT','GCOUNT','TFIELDS','THEAP']
+_structuralPrefixes           = ['TTYPE','TFORM','TUNIT','TLMIN','TLMAX','TDIM','TNULL','TSCAL','TZERO','TDISP']
 
-  newcols = []
+def _getNonStructuralKeywords(header):
+  header                      = header.copy()
   
-  for col in matrixHDU.columns:
-    if(col.format.find("P")==0):
-      #Variable-length
-      newMatrix               = variableToMatrix(matrixHDU.data.field(col.name))
-      length                  = len(newMatrix[0])
-      coltype                 = col.format.split("(")[0].replace("P","")
-      newFormat               = '%s%s' %(length,coltype)
-      newcols.append(pyfits.Column(col.name,newFormat,col.unit,col.null,col.bscale,col.bzero,col.disp,
-                                 col.start,col.dim,newMatrix))
-    else:
-      newcols.append(pyfits.Column(col.name,col.format,col.unit,col.null,col.bscale,col.bzero,col.disp,
-                                 col.start,col.dim,matrixHDU.data.field(col.name)))
+  for key in list(header.keys()):
+    if(key in _structuralKeywords or 
+       any(key.startswith(prefix) and key[len(prefix):].isdigit() for prefix in _structuralPrefixes)):
+      del header[key]
+    pass
   pass
-
-  newtable                    = create_from_columns(newcols,header=matrixHDU.header)
-  return newtable
+  
+  return header
 pass
 
-def variableToMatrix(variableLengthMatrix):
-  '''This take a variable length array and return it in a properly formed constant length array'''
-  nrows                          = len(variableLengthMatrix)
-  ncolumns                       = max([len(elem) for elem in variableLengthMatrix])
-  matrix                         = numpy.zeros([nrows,ncolumns])
-  for i in range(nrows):
-    for j in range(ncolumns):
+def RSPweight(**kwargs):    
+    '''
+  Weight the response matrices contained in the rsp file.
+  Usage:
+    
+    RSPweight(eventfile=eventfile,timeBinsFile=timeBinsFile,rsp2file=rsp2file,
+              outfile=outfile,triggerTime=triggerTime)
+    
+    where eventfile can be either a TTE/FT1 file or a CSPEC file.
+    '''    
+    timeIntervals                    = TimeIntervals(**kwargs)
+    
+    rsp2                             = _fixPath(kwargs['rsp2file'])
+    out                              = _fixPath(kwargs['outfile'])
+    #The trigger time is only for printing purposes: if specified,
+    #all the messages from the program will contain time intervals referred
+    #to the trigger time, otherwise they will be in MET
+    if('triggerTime' in kwargs.keys()):
+      trigger                        = kwargs['triggerTime']
+    else:
+      trigger                        = 0
+    
+    #Get instrument name
+    try:
+      instrument                        = pyfits.getval(_fixPath(kwargs['eventfile']),"INSTRUME",extname="EVENTS",extver=1)
+    except:
       try:
-        matrix[i,j]                = variableLengthMatrix[i][j]
+        instrument                        = pyfits.getval(_fixPath(kwargs['eventfile']),"INSTRUME",extname="SPECTRUM",extver=1)
       except:
+        instrument                        = "UNKN-INSTRUME"
+    
+    weighter                          = ResponseWeighter(rsp2,instrument)
+    
+    sparseSize, denseSize             = weighter.getMemoryUsage()
+    print("\nResponse matrices: %s in memory (%.1f MB, %.1f MB as dense arrays)" %(len(weighter.matrices),
+                                                                                  sparseSize/1048576.0,
+                                                                                  denseSize/1048576.0))
+    
+    #For every interval contained in the time bins file
+    #find the applying matrices and compute the weights
+    weights, selected, trueStarts, trueStops = weighter.getWeights(timeIntervals.tstarts,timeIntervals.tstops,
+                                                                   timeIntervals.eventsCounter,timeIntervals.counts)
+    
+    for i,(tstart,tstop,nEvents) in enumerate(zip(timeIntervals.tstarts,timeIntervals.tstops,timeIntervals.counts)):
+      print("\nInterval: %s - %s" % (tstart-trigger,tstop-trigger))
+      
+      used                            = numpy.flatnonzero(selected[i])
+      
+      for j in used:
+        print("  Matr. in ext #%s covers %s - %s" % (weighter.extensions[j],trueStarts[i,j]-trigger,trueStops[i,j]-trigger))
+      pass
+      
+      if(len(used) > 1):
+        print("\n  Total counts for this interval:        %s" %(nEvents))
+        
+        for j in used:
+          print("  Weight for response %s - %s:           %s" % (trueStarts[i,j]-trigger,trueStops[i,j]-trigger,weights[i,j]))
         pass
-  return matrix
+        
+        print("\nTotal weight ---> %s" %(weights[i].sum()))
+      pass
+    pass
+    
+    print("\nWriting %s..." %(out))
+    weighter.writeWeighted(timeIntervals.tstarts,timeIntervals.tstops,weights,out)
 pass
@@ -1,4 +1,5 @@
 import collections
+import contextlib
 import textwrap
 import os
 from GtBurst.version import getVersion,getPackageName
@@ -13,6 +14,37 @@ PYTHONONLY                    = 00000
 HIDDEN                        = 22222
 INDEF                         = -99999
 
+@contextlib.contextmanager
+def workingDirectory(path):
+  '''
+  Run the body of the with statement in the directory path (created if needed),
+  going back to the current directory at the end, even in case of errors.
+  With path=None (or empty) nothing is changed.
+  
+  The commands write their output files in the current directory, so their run()
+  wraps the actual work in this, with the 'workdir' argument (if given).
+  '''
+  if(not path):
+    yield
+    return
+  pass
+  
+  path                        = os.path.abspath(os.path.expanduser(path))
+  
+  if(not os.path.isdir(path)):
+    os.makedirs(path)
+  pass
+  
+  previousDirectory           = os.getcwd()
+  os.chdir(path)
+  
+  try:
+    yield
+  finally:
+    os.chdir(previousDirectory)
+  pass
+pass
+
 class UserError(RuntimeError):
    def __init__(self, message):
       self.message = message
@@ -54,6 +54,7 @@ thisCommand.addParameter("ft2file","Spacecraft file (FT2)",commandDefiner.OPTION
 thisCommand.addParameter("xmlmodel","Name for the output file for the XML model",commandDefiner.MANDATORY,partype=commandDefiner.OUTPUTFILE,extension="xml")
 thisCommand.addParameter("clobber","Overwrite output file? (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("verbose","Verbose output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
+thisCommand.addParameter("workdir","Directory where the output files are written (default: current directory)",commandDefiner.OPTIONAL,None,partype=commandDefiner.PYTHONONLY)
 
 GUIdescription                = "You have to choose which model include in the likelihood analysis."
 GUIdescription               += " See http://fermi.gsfc.nasa.gov/ssc/data/analysis/scitools/source_models.html for the list"
@@ -93,6 +94,11 @@ def gtbuildxmlmodel(**kwargs):
 pass
 
 def run(**kwargs):
+  with commandDefiner.workingDirectory(kwargs.get('workdir')):
+    return _run(**kwargs)
+pass
+
+def _run(**kwargs):
   if(len(kwargs.keys())==0):
     #Nothing specified, the user needs just help!
     thisCommand.getHelp()
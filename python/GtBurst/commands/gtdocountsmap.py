@@ -35,9 +35,11 @@ thisCommand.addParameter("skymap","Name for the output file for the sky map",com
 thisCommand.addParameter("thetamax","Maximum theta angle for the source",commandDefiner.OPTIONAL,180.0)
 thisCommand.addParameter("clobber","Overwrite output file? (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("strategy","Strategy for Zenith cut. (possible values: 'time' or 'events')",commandDefiner.OPTIONAL,"time",possibleValues=["time","events"])
+thisCommand.addParameter("selection","How to select the events (gtselect, or native to select them without the Science Tools, reading the files only once for all intervals)",commandDefiner.OPTIONAL,"gtselect",possiblevalues=['gtselect','native'])
 thisCommand.addParameter("allowEmpty","Allow empty output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,'no',partype=commandDefiner.HIDDEN)
 thisCommand.addParameter("verbose","Verbose output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("figure","Matplotlib figure for the interactive mode",commandDefiner.OPTIONAL,None,partype=commandDefiner.PYTHONONLY)
+thisCommand.addParameter("workdir","Directory where the output files are written (default: current directory)",commandDefiner.OPTIONAL,None,partype=commandDefiner.PYTHONONLY)
 
 GUIdescription                = "Here you apply cuts on the data."
 GUIdescription               += "TIP For intervals shorter than 100 s it is usually best to use TRANSIENT class, while for longer"
@@ -79,6 +81,11 @@ pass
 lastDisplay                   = None
 
 def run(**kwargs):
+  with commandDefiner.workingDirectory(kwargs.get('workdir')):
+    return _run(**kwargs)
+pass
+
+def _run(**kwargs):
   if(len(kwargs.keys())==0):
     #Nothing specified, the user needs just help!
     thisCommand.getHelp()
@@ -103,6 +110,7 @@ def run(**kwargs):
     skybinsize                  = thisCommand.getParValue('skybinsize')    
     outfile                     = thisCommand.getParValue('skymap')
     strategy                    = thisCommand.getParValue('strategy')
+    selection                   = thisCommand.getParValue('selection')
     thetamax                    = float(thisCommand.getParValue('thetamax'))
     allowEmpty                  = _yesOrNoToBool(thisCommand.getParValue('allowEmpty'))
     clobber                     = _yesOrNoToBool(thisCommand.getParValue('clobber'))
@@ -123,10 +131,10 @@ def run(**kwargs):
   
   if(strategy.lower()=="time"):
     #gtmktime cut
-    filteredFile,nEvents      = LATdata.performStandardCut(ra,dec,rad,irf,tstart,tstop,emin,emax,zmax,thetamax,True,strategy='time')
+    filteredFile,nEvents      = LATdata.performStandardCut(ra,dec,rad,irf,tstart,tstop,emin,emax,zmax,thetamax,True,strategy='time',selection=selection)
   elif(strategy.lower()=="events"):
     #no gtmktime cut, Zenith cut applied directly to the events
-    filteredFile,nEvents      = LATdata.performStandardCut(ra,dec,rad,irf,tstart,tstop,emin,emax,zmax,thetamax,True,strategy='events')
+    filteredFile,nEvents      = LATdata.performStandardCut(ra,dec,rad,irf,tstart,tstop,emin,emax,zmax,thetamax,True,strategy='events',selection=selection)
   pass
   
   LATdata.doSkyMap(outfile,skybinsize)
@@ -23,6 +23,7 @@ thisCommand.addParameter("rspfile","LAT response (RSP file)",commandDefiner.MAND
 thisCommand.addParameter("ft2file","Spacecraft file (FT2)",commandDefiner.MANDATORY,partype=commandDefiner.DATASETFILE,extension="fits")
 thisCommand.addParameter("expomap","pre-computed exposure map",commandDefiner.OPTIONAL,partype=commandDefiner.DATASETFILE,extension="fits")
 thisCommand.addParameter("ltcube","pre-computed livetime cube",commandDefiner.OPTIONAL,partype=commandDefiner.DATASETFILE,extension="fits")
+thisCommand.addParameter("ltcubemode","How to make the livetime cube, if not provided (gtltcube, native to compute it without gtltcube, or incremental to reuse the FT2 rows among intervals)",commandDefiner.OPTIONAL,"gtltcube",possiblevalues=['gtltcube','native','incremental'])
 thisCommand.addParameter("xmlmodel","XML model",commandDefiner.MANDATORY,partype=commandDefiner.DATASETFILE,extension="fits")
 thisCommand.addParameter("skymap","Name for the sky map (needed only if you want to plot your results)",commandDefiner.OPTIONAL,partype=commandDefiner.INPUTFILE,extension="fit")
 thisCommand.addParameter("tsmin","Minimum TS to consider a source detected",commandDefiner.OPTIONAL,20)
@@ -35,6 +36,7 @@ thisCommand.addParameter("clul","Upper bound confidence level", commandDefiner.O
 thisCommand.addParameter("clobber","Overwrite output file? (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("verbose","Verbose output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("figure","Matplotlib figure for the interactive mode",commandDefiner.OPTIONAL,None,partype=commandDefiner.PYTHONONLY)
+thisCommand.addParameter("workdir","Directory where the output files are written (default: current directory)",commandDefiner.OPTIONAL,None,partype=commandDefiner.PYTHONONLY)
 thisCommand.addParameter("flemin","Lower bound energy for flux or upper limit computation", commandDefiner.OPTIONAL,100,partype=commandDefiner.PYTHONONLY)
 thisCommand.addParameter("flemax","Upper bount energy for flux or upper limit computation", commandDefiner.OPTIONAL,1000,partype=commandDefiner.PYTHONONLY)
 
@@ -71,6 +73,11 @@ def gtdolike(**kwargs):
 pass
 
 def run(**kwargs):
+  with commandDefiner.workingDirectory(kwargs.get('workdir')):
+    return _run(**kwargs)
+pass
+
+def _run(**kwargs):
   if(len(kwargs.keys())==0):
     #Nothing specified, the user needs just help!
     thisCommand.getHelp()
@@ -85,6 +92,7 @@ def run(**kwargs):
     ft2file                     = thisCommand.getParValue('ft2file')
     expomap                     = thisCommand.getParValue('expomap')
     ltcube                      = thisCommand.getParValue('ltcube')
+    ltcubemode                  = thisCommand.getParValue('ltcubemode')
     xmlmodel                    = thisCommand.getParValue('xmlmodel')
     showmodelimage              = thisCommand.getParValue('showmodelimage')
     optimize                    = thisCommand.getParValue('optimizeposition')
@@ -115,7 +123,7 @@ def run(**kwargs):
   LATdata                     = dataHandling.LATData(eventfile,rspfile,ft2file)
   try:
     if(liketype=='unbinned'):
-      outfilelike, sources        = LATdata.doUnbinnedLikelihoodAnalysis(xmlmodel,tsmin,expomap=expomap,ltcube=ltcube,emin=flemin,emax=flemax, clul=clul)
+      outfilelike, sources        = LATdata.doUnbinnedLikelihoodAnalysis(xmlmodel,tsmin,expomap=expomap,ltcube=ltcube,ltcubemode=ltcubemode,emin=flemin,emax=flemax, clul=clul)
     else:
       #Generation of spectral files and optimization of the position is
       #not supported yet for binned analysis
@@ -130,7 +138,7 @@ def run(**kwargs):
         print("\nWARNING: you specified optimize=yes, but position optimization is not supported for binned analysis\n") 
         optimize                    = 'no'
       
-      outfilelike, sources        = LATdata.doBinnedLikelihoodAnalysis(xmlmodel,tsmin,expomap=expomap,ltcube=ltcube,emin=flemin,emax=flemax, clul=clul)
+      outfilelike, sources        = LATdata.doBinnedLikelihoodAnalysis(xmlmodel,tsmin,expomap=expomap,ltcube=ltcube,ltcubemode=ltcubemode,emin=flemin,emax=flemax, clul=clul)
   except GtBurstException as gt:
     raise gt
   except:
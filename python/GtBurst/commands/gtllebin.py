@@ -23,6 +23,7 @@ thisCommand.addParameter("dt","Time bin size (in seconds)",commandDefiner.OPTION
 thisCommand.addParameter("tstart","Start time for the output file (seconds from trigger or MET)",commandDefiner.OPTIONAL)
 thisCommand.addParameter("tstop","Stop time for the output file (seconds from trigger or MET)",commandDefiner.OPTIONAL)
 thisCommand.addParameter("cspecfile","Name for the output CSPEC file",commandDefiner.MANDATORY,partype=commandDefiner.OUTPUTFILE,extension="pha")
+thisCommand.addParameter("binning","How to bin the events (gtbin, or native to bin them without the Science Tools)",commandDefiner.OPTIONAL,"gtbin",possiblevalues=['gtbin','native'])
 thisCommand.addParameter("clobber","Overwrite output file? (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("verbose","Verbose output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 
@@ -74,6 +75,7 @@ def run(**kwargs):
     tstart                      = thisCommand.getParValue('tstart')
     tstop                       = thisCommand.getParValue('tstop')
     outfile                     = thisCommand.getParValue('cspecfile')
+    binning                     = thisCommand.getParValue('binning')
     clobber                     = _yesOrNoToBool(thisCommand.getParValue('clobber'))
     verbose                     = _yesOrNoToBool(thisCommand.getParValue('verbose'))
   except KeyError as err:
@@ -92,7 +94,7 @@ def run(**kwargs):
   #Load LLE data
   message(" *  Get energy binning from the response matrix...")
     
-  lleData                     = dataHandling.LLEData(eventfile,rspfile,ft2file)
+  lleData                     = dataHandling.LLEData(eventfile,rspfile,ft2file,binning=binning)
   
   message("\n    done.")
   
@@ -110,17 +112,25 @@ def run(**kwargs):
     _SPECTRUM=tmpFile['SPECTRUM'].data
     _TIME    =_SPECTRUM.field('TIME')
     _ENDTIME =_SPECTRUM.field('ENDTIME')
-    tempTimeBinFile="__tmpBinFileFromCSPEC.txt"
-    txt=''
-    for i in range(len(_TIME)): txt+='%s\t%s\n' %( _TIME[i],_ENDTIME[i])
-    file(tempTimeBinFile,'w').writelines(txt)
     tempTimeBinFile_fits="__tmpBinFileFromCSPEC.fits"
     
-
-    lleData.gtbindef['bintype']='T'
-    lleData.gtbindef['binfile']=tempTimeBinFile
-    lleData.gtbindef['outfile']=tempTimeBinFile_fits
-    lleData.gtbindef.run()    
+    if(binning=='native'):
+      #Write the TIMEBINS extension directly
+      timeBins=dataHandling.create_from_columns(pyfits.ColDefs([pyfits.Column(name='START',format='D',unit='s',array=_TIME),
+                                                                pyfits.Column(name='STOP',format='D',unit='s',array=_ENDTIME)]))
+      timeBins.header.set('EXTNAME','TIMEBINS')
+      pyfits.HDUList([pyfits.PrimaryHDU(),timeBins]).writeto(tempTimeBinFile_fits,clobber=True)
+    else:
+      tempTimeBinFile="__tmpBinFileFromCSPEC.txt"
+      txt=''
+      for i in range(len(_TIME)): txt+='%s\t%s\n' %( _TIME[i],_ENDTIME[i])
+      file(tempTimeBinFile,'w').writelines(txt)
+
+      lleData.gtbindef['bintype']='T'
+      lleData.gtbindef['binfile']=tempTimeBinFile
+      lleData.gtbindef['outfile']=tempTimeBinFile_fits
+      lleData.gtbindef.run()    
+    pass
 
     lleData.binByEnergyAndTime(tempTimeBinFile_fits,tempPHA2filename)
   else: lleData.binByEnergyAndTime(tstart,tstop,dt,tempPHA2filename)
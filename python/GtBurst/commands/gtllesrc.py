@@ -18,6 +18,7 @@ thisCommand.addParameter("ft2file","Spacecraft file (FT2)",commandDefiner.OPTION
 thisCommand.addParameter("srcintervals","FITS file defining source time intervals",commandDefiner.MANDATORY,partype=commandDefiner.INPUTFILE,extension="fits")
 thisCommand.addParameter("srcspectra","Name for the output PHA file",commandDefiner.MANDATORY,partype=commandDefiner.OUTPUTFILE,extension="pha")
 thisCommand.addParameter("weightedrsp","Name for the output RSP file",commandDefiner.MANDATORY,partype=commandDefiner.OUTPUTFILE,extension="rsp")
+thisCommand.addParameter("binning","How to bin the events (gtbin, or native to bin them without the Science Tools)",commandDefiner.OPTIONAL,"gtbin",possiblevalues=['gtbin','native'])
 thisCommand.addParameter("clobber","Overwrite output file? (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 thisCommand.addParameter("verbose","Verbose output (possible values: 'yes' or 'no')",commandDefiner.OPTIONAL,"yes")
 
@@ -70,6 +71,7 @@ def run(**kwargs):
     srcintervals                = thisCommand.getParValue('srcintervals')
     outfile                     = thisCommand.getParValue('srcspectra')
     weightedrsp                 = thisCommand.getParValue('weightedrsp')
+    binning                     = thisCommand.getParValue('binning')
     clobber                     = _yesOrNoToBool(thisCommand.getParValue('clobber'))
     verbose                     = _yesOrNoToBool(thisCommand.getParValue('verbose'))
   except KeyError as err:
@@ -88,7 +90,7 @@ def run(**kwargs):
   #Load LLE data
   message(" *  Get energy binning from the response matrix...")
   
-  lleData                     = dataHandling.LLEData(eventfile,rspfile,ft2file)
+  lleData                     = dataHandling.LLEData(eventfile,rspfile,ft2file,binning=binning)
   
   message("\n    done.")
   
@@ -7,14 +7,12 @@ from GtBurst.my_fits_io import pyfits
 
 
 from GtBurst.GtBurstException import GtBurstException
-import ftplib, socket
-import time
 try:
   from Tkinter import *
 except:
   #Silently accept when tkinter import fail (no X server?)
   pass
-from GtBurst import downloadCallback
+from GtBurst import ftpDownloader
 try:
   from GtBurst.lleProgressBar import Meter
 except:
@@ -65,41 +63,22 @@ class dataCollector(object):
     print("Local data repository (destination): %s (%s)" %(self.localRepository,message))    
   pass
   
-  def downloadDirectoryWithFTP(self,address,filenames=None,namefilter=None):
+  def downloadDirectoryWithFTP(self,address,filenames=None,namefilter=None,nConnections=ftpDownloader.defaultConnections):
     #Connect to the server
-    if(address.find("ftp://")==0):
-      serverAddress           = address.split("/")[2]
-      directory               = "/"+"/".join(address.split("/")[3:])
-    else:
-      serverAddress           = address.split("/")[0]
-      directory               = "/"+"/".join(address.split("/")[1:])
-    pass
-
-    #Open FTP session
-    try:
-      ftp                       = ftplib.FTP(serverAddress,"anonymous",'','',timeout=60)
-    except socket.error as socketerror:
-      raise GtBurstException(11,"Error when connecting: %s" % os.strerror(socketerror.errno))
+    serverAddress,port,directory = ftpDownloader.parseAddress(address)
+    downloader                = ftpDownloader.FTPDownloader(serverAddress,directory,port,nConnections)
     
+    #Open FTP session
     print("Loggin in to %s..." % serverAddress),
-    try:
-      ftp.login()
-    except:
-      #Maybe we are already logged in
-      try:
-        ftp.cwd('/')
-      except:
-        #nope! don't know what is happening
-        raise
-      pass
-    pass
-          
+    ftp                       = downloader.login()
     print("done")
+    
     self.makeLocalDir()
     try:
       ftp.cwd(directory)
     except:
       #Remove the empty directory just created
+      ftpDownloader.closeSession(ftp)
       try:
         os.rmdir(self.localRepository)
       except:
@@ -112,37 +91,12 @@ class dataCollector(object):
       ftp.retrlines('NLST', filenames.append)
     pass
     
-    maxTrials                 = 10
-    
-    #Build the window for the progress
-    if(self.parent is None):
-      #Do not use any graphical output
-      root                 = None
-      m1                   = None
-    else:
-      #make a transient window
-      root                 = Toplevel()
-      root.transient(self.parent)
-      root.grab_set()        
-      l                    = Label(root,text='Downloading...')
-      l.grid(row=0,column=0)
-      m1                    = Meter(root, 500,20,'grey','blue',0,None,None,'white',relief='ridge', bd=3)
-      m1.grid(row=1,column=0)
-      m1.set(0.0,'Download started...')
-      l2                    = Label(root,text='Total progress:')
-      l2.grid(row=2,column=0)
-      m2                    = Meter(root, 500,20,'grey','blue',0,None,None,'white',relief='ridge', bd=3)
-      m2.grid(row=3,column=0)
-      m2.set(0.0,'Download started...')
-    pass
-    
-    for i,filename in enumerate(filenames):
+    toDownload                = []
+    for filename in filenames:
       if(namefilter is not None and filename.find(namefilter)<0):
         #Filename does not match, do not download it
         continue
       
-      if(root is not None):
-        m2.set((float(i))/len(filenames))
       skip                    = False
       if(not self.getCSPEC):
         if(filename.find("cspec")>=0):
@@ -161,60 +115,52 @@ class dataCollector(object):
       #  skip                  = (not self.minimal)
       if(skip):
         print("Skipping %s ..." %(filename))   
-        continue
       else:
-        print("Retrieving %s ..." %(filename)),
+        toDownload.append(filename)
+      pass
+    pass
+    
+    #Build the window for the progress
+    if(self.parent is None):
+      #Do not use any graphical output
+      root                 = None
+      progressCallback     = None
+    else:
+      #make a transient window
+      root                 = Toplevel()
+      root.transient(self.parent)
+      root.grab_set()        
+      l                    = Label(root,text='Downloading %s files...' %(len(toDownload)))
+      l.grid(row=0,column=0)
+      m1                    = Meter(root, 500,20,'grey','blue',0,None,None,'white',relief='ridge', bd=3)
+      m1.grid(row=1,column=0)
+      m1.set(0.0,'Download started...')
+      l2                    = Label(root,text='Total progress:')
+      l2.grid(row=2,column=0)
+      m2                    = Meter(root, 500,20,'grey','blue',0,None,None,'white',relief='ridge', bd=3)
+      m2.grid(row=3,column=0)
+      m2.set(0.0,'Download started...')
       
+      def progressCallback(bytesDone,bytesTotal,filesDone,filesTotal):
+        #Called by this thread (not by the threads doing the download), so we can
+        #update the widgets from here
+        if(bytesTotal > 0):
+          m1.set(float(bytesDone)/bytesTotal,"%.1f of %.1f MB" %(bytesDone/1048576.0,bytesTotal/1048576.0))
+        if(filesTotal > 0):
+          m2.set(float(filesDone)/filesTotal,"%s of %s files" %(filesDone,filesTotal))
+      pass
+    pass
+    
+    print("Retrieving %s files with %s connections..." %(len(toDownload),min(nConnections,max(len(toDownload),1))))
+    try:
+      downloader.download(toDownload,self.localRepository,progressCallback,ftp)
+    finally:
       if(root is not None):
-        l['text']               = "Downloading %s..." % filename
-      
-      done                      = False
-      local_filename          = os.path.join(self.localRepository,filename)
-      
-      while(done==False):        
-        try:
-          f                       = open(local_filename, 'wb')
-        except:
-          raise IOError("Could not open file %s for writing. Do you have write permission on %s?" %(local_filename,self.localRepository))
-        
-        g                         = downloadCallback.get_size()
-        try:
-          ftp.dir(filename,g)
-          totalsize                 = g.size#*1024
-          printer                   = downloadCallback.Callback(totalsize, f,m1)
-          ftp.retrbinary('RETR '+ filename, printer)
-          localSize                 = f.tell()
-          f.close()
-          if(localSize!=totalsize):
-            #This will be catched by the next "except", which will retry
-            raise
-          done                = True
-        except:
-          print("\nConnection lost! Trying to reconnect...")
-          #Reconnect
-          f.close()
-          try:
-            ftp.close()
-          except:
-            pass
-          ftp                 = ftplib.FTP(serverAddress,"anonymous",'','',timeout=60)
-          try:
-            ftp.login()
-          except:
-            pass
-          ftp.cwd(directory)
-          done                = False
-          continue
-        pass  
-      print(" done")
+        root.destroy()
+      pass
     pass
     
-    ftp.close()
     print("\nDownload files done!")
-    if(root is not None):
-      m2.set(1.0)
-      root.destroy()
-    pass
   pass
   
   def getFTP(self,errorCode=None,namefilter=None):
@@ -17,6 +17,7 @@ import BinnedAnalysis
 import UnbinnedAnalysis
 from GtBurst.wcs_wrap import pywcs
 import scipy.optimize
+import scipy.sparse
 
 from GtBurst.my_fits_io import pyfits
 
@@ -24,9 +25,15 @@ from GtBurst.my_fits_io import pyfits
 from GtBurst import IRFS
 from GtBurst import LikelihoodComponent
 from GtBurst import angularDistance
+from GtBurst import eventBinning
+from GtBurst import eventFile
+from GtBurst import eventSelection
+from GtBurst import livetimeCube
 from GtBurst import version
 from GtBurst.Configuration import Configuration
 from GtBurst.GtBurstException import GtBurstException
+from GtBurst.productCache import ProductCache
+from GtBurst.spacecraftFile import SpacecraftFile
 from GtBurst.commands.gtllebin import gtllebin
 from GtBurst.statMethods import *
 
@@ -210,31 +217,10 @@ def getLATdataFromDirectory(directory):
 
 
 def getPointing(triggertime, ft2, bothAxes=False):
-    f = pyfits.open(ft2)
-    data = f['SC_DATA'].data
-    # Find first element after trigger time in FT2 file
-    idx_after = numpy.searchsorted(numpy.sort(data.START), triggertime)
-    idx_before = idx_after - 1
-
-    if (idx_after == len(data) or idx_before < 0):
-        raise RuntimeError("Provided FT2 file do not cover enough time")
-    f.close()
-
-    # Now interpolate linearly between the position of the z-axis before and after the trigger time,
+    # The position of the z-axis is interpolated linearly between the rows before and after the trigger time,
     # which is needed if we are using 30 s FT2 file (otherwise the position could be off by degrees)
-    ra_scz = numpy.interp(0, [data.START[idx_before] - triggertime, data.START[idx_after] - triggertime],
-                          [data.RA_SCZ[idx_before], data.RA_SCZ[idx_after]])
-    dec_scz = numpy.interp(0, [data.START[idx_before] - triggertime, data.START[idx_after] - triggertime],
-                           [data.DEC_SCZ[idx_before], data.DEC_SCZ[idx_after]])
-
-    if (bothAxes):
-        ra_scx = numpy.interp(0, [data.START[idx_before] - triggertime, data.START[idx_after] - triggertime],
-                              [data.RA_SCX[idx_before], data.RA_SCX[idx_after]])
-        dec_scx = numpy.interp(0, [data.START[idx_before] - triggertime, data.START[idx_after] - triggertime],
-                               [data.DEC_SCX[idx_before], data.DEC_SCX[idx_after]])
-        return ra_scz, dec_scz, ra_scx, dec_scx
-    else:
-        return ra_scz, dec_scz
+    with SpacecraftFile(ft2) as spacecraft:
+        return spacecraft.getPointing(triggertime, bothAxes)
 
 
 pass
@@ -768,8 +754,61 @@ def getTriggerTime(ff):
 pass
 
 
+def getOverlapWeights(starts, stops, tstarts, tstops):
+    '''
+  Return a sparse (intervals x bins) matrix with, for each time interval (tstarts, tstops), the
+  fraction of each bin (starts, stops) contained in it (1 for bins completely contained, < 1 for
+  the bins at the edges). The bins overlapping each interval are found with a binary search,
+  so the cost is proportional to the number of overlaps and not to intervals x bins.
+  '''
+
+    starts = numpy.asarray(starts, dtype=float)
+    stops = numpy.asarray(stops, dtype=float)
+    tstarts = numpy.asarray(tstarts, dtype=float)
+    tstops = numpy.asarray(tstops, dtype=float)
+
+    # Bins in order of start time. The running maximum of the stop times is sorted even
+    # if the bins overlap, so it can be used to find the first bin which might overlap
+    order = numpy.argsort(starts, kind='mergesort')
+    sortedStarts = starts[order]
+    maxStops = numpy.maximum.accumulate(stops[order])
+
+    first = numpy.searchsorted(maxStops, tstarts, 'left')
+    last = numpy.maximum(numpy.searchsorted(sortedStarts, tstops, 'right'), first)
+    nBins = last - first
+
+    # All the (interval, bin) pairs to check
+    intervalIndex = numpy.repeat(numpy.arange(tstarts.shape[0]), nBins)
+    binIndex = order[numpy.repeat(first - (numpy.cumsum(nBins) - nBins), nBins) + numpy.arange(nBins.sum())]
+
+    binStarts = starts[binIndex]
+    binStops = stops[binIndex]
+    intervalStarts = tstarts[intervalIndex]
+    intervalStops = tstops[intervalIndex]
+
+    overlap = (binStops >= intervalStarts) & (binStarts <= intervalStops)
+
+    weights = ((numpy.minimum(intervalStops, binStops) - numpy.maximum(intervalStarts, binStarts)) /
+               (binStops - binStarts))
+
+    return scipy.sparse.csr_matrix((weights[overlap], (intervalIndex[overlap], binIndex[overlap])),
+                                   shape=(tstarts.shape[0], starts.shape[0]))
+
+
+pass
+
+
 class LLEData(object):
-    def __init__(self, eventFile, rspFile, ft2File, root=None):
+    def __init__(self, eventFile, rspFile, ft2File, root=None, binning='gtbin'):
+        '''
+        binning                  'gtbin' (default) bins the events running gtbindef and gtbin,
+                                 'native' bins them directly (see eventBinning)
+        '''
+        if (binning not in ['gtbin', 'native']):
+            raise ValueError("Binning must be either 'gtbin' or 'native'")
+
+        self.binning = binning
+
         # Avoid the unicode problem by casting it to integer
         eventFile = str(eventFile)
         rspFile = str(rspFile)
@@ -878,23 +917,37 @@ class LLEData(object):
 
     pass
 
-    def _writeEnergyBinFile(self, outfile):
+    def _getEnergyBins(self):
         # Take the energy binning from the response matrix,
         # to ensure combatibility
         rsp = pyfits.open(self.rspFile)
         ebounds = rsp[eboundsExtName].data
+        emin = numpy.array(ebounds.field(emin_column), dtype=float)
+        emax = numpy.array(ebounds.field(emax_column), dtype=float)
+        rsp.close()
 
+        return emin, emax
+
+    pass
+
+    def _getEventBinner(self):
+        if (self.isGBM):
+            return eventBinning.EventBinner(self.eventFile)
+        else:
+            return eventBinning.EventBinner(self.eventFile, self.ft2File)
+
+    pass
+
+    def _writeEnergyBinFile(self, outfile):
         asciiFilename = "__ebins.txt"
         asciiFile = open(asciiFilename, "w+")
 
-        for emin, emax in zip(ebounds.field(emin_column), ebounds.field(emax_column)):
+        for emin, emax in zip(*self._getEnergyBins()):
             asciiFile.write("%20.10f %20.10f\n" % (emin, emax))
         pass
 
         asciiFile.close()
 
-        rsp.close()
-
         self.gtbindef['bintype'] = "E"
         self.gtbindef['binfile'] = asciiFilename
         self.gtbindef['outfile'] = outfile
@@ -921,6 +974,12 @@ class LLEData(object):
             raise ValueError("t2 is not a valid starting time")
         pass
 
+        if (self.binning == 'native'):
+            emin, emax = self._getEnergyBins()
+            self._getEventBinner().writePHA1(t1, t2, emin, emax, outfile)
+            return
+        pass
+
         tempfile = "__dhselEvt.fits"
         self._selectByTime(t1, t2, tempfile)
 
@@ -966,6 +1025,17 @@ class LLEData(object):
             raise ValueError("t2 is not a valid stop time")
         pass
 
+        if (self.binning == 'native'):
+            # Same bins as gtbin with tbinalg=LIN (the last one ends at t2)
+            nBins = int(numpy.ceil((t2 - t1) / float(binsize) - 1e-9))
+            tstarts = t1 + numpy.arange(nBins) * float(binsize)
+            tstops = numpy.minimum(tstarts + float(binsize), t2)
+
+            emin, emax = self._getEnergyBins()
+            self._getEventBinner().writePHA2(tstarts, tstops, emin, emax, outfile)
+            return
+        pass
+
         # Write energy bin file
         energyBinsFile = "__energyBins.fits"
         self._writeEnergyBinFile(energyBinsFile)
@@ -989,7 +1059,16 @@ class LLEData(object):
     pass
 
     def _binByEnergyAndTimeFile(self, timeBinsFile, outfile):
-        if (self.isTTE):
+        if (self.isTTE and self.binning == 'native'):
+            timeBins = pyfits.open(timeBinsFile)
+            tstarts = numpy.array(timeBins['TIMEBINS'].data.field("START"), dtype=float)
+            tstops = numpy.array(timeBins['TIMEBINS'].data.field("STOP"), dtype=float)
+            timeBins.close()
+
+            emin, emax = self._getEnergyBins()
+            self._getEventBinner().writePHA2(tstarts, tstops, emin, emax, outfile)
+            return
+        elif (self.isTTE):
             # Write energy bin file
             energyBinsFile = "__energyBins.fits"
             self._writeEnergyBinFile(energyBinsFile)
@@ -1014,67 +1093,58 @@ class LLEData(object):
 
             # Open the CSPEC
             cspec = pyfits.open(self.eventFile)
-            channelsEmin = cspec["EBOUNDS"].data.field("E_MIN")
-            channelsEmax = cspec["EBOUNDS"].data.field("E_MAX")
             spectra = cspec[cspecExtName].data
-            spectraStart = spectra.field("TIME")
-            spectraStop = spectra.field("ENDTIME")
-            spectraExposure = spectra.field("EXPOSURE")
+
+            # Only the spectra with a positive exposure are used
+            good = (spectra.field("EXPOSURE") > 0)
+            spectraStart = spectra.field("TIME")[good]
+            spectraStop = spectra.field("ENDTIME")[good]
+            spectraExposure = numpy.array(spectra.field("EXPOSURE")[good], dtype=float)
+            spectraCounts = numpy.array(spectra.field("COUNTS")[good], dtype=float)
 
             timeIntervals = TimeIntervalFitsFile(timeBinsFile)
-            newPHA2 = Spectra()
+            intervals = timeIntervals.getIntervals()
+            tstarts = numpy.array(map(lambda x: x.tstart, intervals))
+            tstops = numpy.array(map(lambda x: x.tstop, intervals))
+
+            # Compute the weight for each spectrum and each interval: the weight will be 1 for
+            # spectra completely contained between tstart and tstop, and < 1 for the first and
+            # last one. The weighted sum of the counts give the channel counts between
+            # tstart and tstop, assuming that they are distributed uniformly within the
+            # first and last bin
+            weights = getOverlapWeights(spectraStart, spectraStop, tstarts, tstops)
+
+            partial = (weights.data >= 1E-4) & (weights.data <= 1 - 1E-4)
+            intervalOfWeight = numpy.repeat(numpy.arange(len(intervals)), numpy.diff(weights.indptr))
+
+            for i in numpy.unique(intervalOfWeight[partial]):
+                sys.stderr.write(
+                    "\n\nWARNING: time interval %s-%s is not covered exactly by the provided CSPEC file. The resulting spectra might be not accurate.\n\n" % (
+                    tstarts[i], tstops[i]))
+            pass
 
-            for interval in timeIntervals.getIntervals():
-                # Find all spectra between start and stop
-                mask = (spectraStop >= interval.tstart) & (spectraStart <= interval.tstop) & (spectraExposure > 0)
-
-                # Compute the weight for each interval: the weight will be 1 for intervals
-                # completely contained between tstart and tstop, and < 1 for the first and
-                # last interval. The weighted sum of the counts give the channel counts between
-                # tstart and tstop, assuming that they are distributed uniformly within the
-                # first and last bin
-                weight = []
-                for i in mask.nonzero()[0]:
-                    weight.append((min(interval.tstop, spectraStop[i]) - max(interval.tstart, spectraStart[i])) /
-                                  (spectraStop[i] - spectraStart[i]))
-                weight = numpy.array(weight)
-
-                if (len(((weight >= 1E-4) & (weight <= 1 - 1E-4)).nonzero()[0]) != 0):
-                    sys.stderr.write(
-                        "\n\nWARNING: time interval %s-%s is not covered exactly by the provided CSPEC file. The resulting spectra might be not accurate.\n\n" % (
-                        interval.tstart, interval.tstop))
-                print(weight)
-                # Sum channel by channel all counts
-                countsToSum = spectra[mask].field("COUNTS")
-                nChan = len(countsToSum[0, :])
-                exposure = numpy.sum(spectra[mask].field("EXPOSURE") * weight)
-                thisSpectrum = Spectrum(interval.tstart, interval.tstop, exposure,
-                                        telescope=self.telescope, instrument=self.instrument, poisserr=True,
-                                        spectrumtype="TOTAL")
-                for chan in range(nChan):
-                    totalCounts = numpy.sum(countsToSum[:, chan] * weight)
-                    error = numpy.sqrt(totalCounts)
-                    thisSpectrum.addChannel(chan, channelsEmin[chan], channelsEmax[chan], totalCounts / exposure,
-                                            error / exposure)
-                pass
+            # Counts and exposure for all the intervals at once
+            totalCounts = weights.dot(spectraCounts)
+            exposures = weights.dot(spectraExposure)
 
-                newPHA2.addSpectrum(thisSpectrum)
+            if (numpy.any(exposures <= 0)):
+                raise RuntimeError("Some of the time intervals are not covered by the CSPEC file %s" % (self.eventFile))
             pass
-            newPHA2.write(outfile, format="PHA2", clobber=True)
 
-            # Now add EBOUNDS and GTI to the new file
-            ebounds = cspec["EBOUNDS"].copy()
-            gti = cspec["GTI"].copy()
-            f = pyfits.open(outfile)
-            primary = f[0].copy()
-            spectrum = f['SPECTRUM'].copy()
-            f.close()
+            rates = totalCounts / exposures[:, numpy.newaxis]
+            errors = numpy.sqrt(totalCounts) / exposures[:, numpy.newaxis]
+
+            newPHA2 = Spectra()
+            newPHA2.addSpectra(tstarts, tstops, exposures, numpy.arange(spectraCounts.shape[1]), rates, errors,
+                               telescope=self.telescope, instrument=self.instrument, poisserr=True,
+                               spectrumtype="TOTAL")
+
+            # Write the PHA2 file with the EBOUNDS and GTI extensions of the CSPEC
+            newPHA2.addEboundsExtension(cspec["EBOUNDS"])
+            newPHA2.addGtiExtension(cspec["GTI"])
             cspec.close()
 
-            hdulist = pyfits.HDUList([primary, spectrum, ebounds, gti])
-            hdulist.writeto("temp.pha__")
-            os.remove(outfile)
-            os.rename("temp.pha__", outfile)
+            newPHA2.write(outfile, format="PHA2", clobber=True)
         pass
 
 
@@ -1136,35 +1206,32 @@ class my_gtltcube(multiprocessScienceTools):
     pass
 
     def multiproc_run(self):
-        return self.singleproc_run()
+        # Get the amount of good time
+        with pyfits.open(self['evfile']) as f:
+            nEvents = f['EVENTS'].header.get('NAXIS2')
+            goodTime = numpy.sum(f['GTI'].data.field("STOP") - f['GTI'].data.field("START"))
+        pass
 
-        # Get the length of the time interval
-        data = pyfits.getdata(self['evfile'], 'EVENTS')
-        if (data.shape[0] == 0 or (data.field("TIME").max() - data.field("TIME").min() <= 1000.0)):
+        if (nEvents == 0 or goodTime <= 1000.0):
             # Use the single processor version (there is no gain in splitting)
             return self.singleproc_run()
         else:
             pass
 
-        exepath = os.path.join(os.path.dirname(__file__), 'gtapps_mp', 'gtltcube_mp.py')
-        cmdline = "%s %s %s %s %s" % (exepath, self.ncpus,
-                                      self['scfile'],
-                                      self['evfile'],
-                                      self['outfile'])
-        print cmdline
-        process = subprocess.Popen(cmdline.split(),
-                                   shell=False, stdout=subprocess.PIPE,
-                                   stderr=subprocess.STDOUT)
+        from GtBurst.gtapps_mp.gtltcube_mp import gtltcube_mp
 
-        while True:
-            out = process.stdout.readline()
-            if out == '' and process.poll() is not None:
-                break
-            print out
-        # gtltcube_mp(self.ncpus,
-        #            self['scfile'],
-        #            self['evfile'],
-        #            self['outfile'], False, 180)
+        # Run gtltcube on slices of the FT2 file in parallel, with the same
+        # parameters as the single processor version, and sum the results
+        ltcubePars = {}
+        for k, v in self.iteritems():
+            if (k not in ['evfile', 'scfile', 'outfile', 'zmax']):
+                ltcubePars[k] = v
+        pass
+
+        gtltcube_mp(self.ncpus,
+                    self['scfile'],
+                    self['evfile'],
+                    self['outfile'], False, self['zmax'], ltcubePars)
         print("\n")
 
     pass
@@ -1236,20 +1303,11 @@ class my_gttsmap(multiprocessScienceTools):
         pars['optimizer'] = self['optimizer']
         pars['ftol'] = self['ftol']
         pars['toltype'] = 1
-        pars['jobs'] = self.ncpus
-        exepath = os.path.join(os.path.dirname(__file__), 'gtapps_mp', 'gttsmap_mp.py')
-        cmdline = exepath + " %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s %s" % tuple([pars[k] for k in
-                                                                                              'nxpix nypix jobs evfile scfile expmap expcube srcmdl irfs optimizer ftol toltype binsz coordsys xref yref proj outfile'.split()])
-        print cmdline
-        process = subprocess.Popen(cmdline.split(),
-                                   shell=False, stdout=subprocess.PIPE,
-                                   stderr=subprocess.STDOUT)
+        # Run the TS map in this process (the worker processes are forked
+        # from it), so the results come back directly as an image
+        from GtBurst.gtapps_mp.gttsmap_mp import gttsmap_mp
 
-        while True:
-            out = process.stdout.readline()
-            if out == '' and process.poll() is not None:
-                break
-            print out
+        gttsmap_mp(pars, num_queues=self.ncpus, savetmp=False)
         print("\n")
 
     pass
@@ -1337,6 +1395,37 @@ class LATData(LLEData):
         self.gtrspgen = GtApp('gtrspgen')
         self.gtbkg = GtApp('gtbkg')
 
+        # Cache for the products of the tools (disabled unless GTBURSTPRODUCTCACHE is set)
+        self.productCache = ProductCache()
+
+    pass
+
+    def _getGtmktimeFilter(self, ra, dec, rad, zenithCut, thetaCut):
+        '''
+        Return the filter expression for gtmktime, according to the strategy
+        '''
+
+        filt = "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T && LIVETIME>0"
+
+        if (self.strategy == "time"):
+
+            if (zenithCut < 180):
+
+                filt += " && (ANGSEP(RA_ZENITH,DEC_ZENITH,%s,%s)<=(%s-%s))" % (ra, dec, zenithCut, rad)
+
+            else:
+
+                print("\nNo Zenith cut used\n")
+
+        elif (self.strategy != "events"):
+            raise RuntimeError("Strategy must be either 'time' or 'events'")
+
+        if (thetaCut != 180.0):
+            filt += " && (ANGSEP(RA_SCZ,DEC_SCZ,%s,%s)<=%s - %s)" % (ra, dec, thetaCut, rad)
+        pass
+
+        return filt
+
     pass
 
     def performStandardCut(self, ra, dec, rad, irf, tstart, tstop,
@@ -1345,6 +1434,7 @@ class LATData(LLEData):
                            roicut=True, **kwargs):
 
         self.strategy = 'time'
+        self.selection = 'gtselect'
 
         # Use the evtype
         if (irf.lower().find("p8") >= 0):
@@ -1360,8 +1450,13 @@ class LATData(LLEData):
                 self.strategy = kwargs[key]
             elif (key == "evtype"):
                 self.evtype = int(kwargs[key])
+            elif (key == "selection"):
+                self.selection = kwargs[key]
         pass
 
+        if (self.selection not in ['gtselect', 'native']):
+            raise ValueError("Selection must be either 'gtselect' or 'native'")
+
         # Get tstart and tstop always in MET
         tstart = float(tstart) + int(float(tstart) < 231292801.000) * self.trigTime
         tstop = float(tstop) + int(float(tstop) < 231292801.000) * self.trigTime
@@ -1372,10 +1467,8 @@ class LATData(LLEData):
         zenithCut = float(zenithCut)
 
         # Check that the FT2 file covers the time interval requested
-        f = pyfits.open(self.ft2File)
-        ft2max = max(f['SC_DATA'].data.STOP)
-        ft2min = min(f['SC_DATA'].data.START)
-        f.close()
+        with SpacecraftFile(self.ft2File) as spacecraft:
+            ft2min, ft2max = spacecraft.getCoverage()
         ft2max = float(ft2max) + int(float(ft2max) < 231292801.000) * self.trigTime
         ft2min = float(ft2min) + int(float(ft2min) < 231292801.000) * self.trigTime
 
@@ -1400,30 +1493,15 @@ class LATData(LLEData):
         if (not self.eventFile):
             raise RuntimeError("You cannot select by time if you don't provide a FT1 file.")
 
-        if (gtmktime):
-            self.gtmktime['scfile'] = self.ft2File
-            if (self.strategy == "time"):
-                filt = "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T && LIVETIME>0"
-
-                if (zenithCut < 180):
-
-                    filt += " && (ANGSEP(RA_ZENITH,DEC_ZENITH,%s,%s)<=(%s-%s))" % (ra, dec, zenithCut, rad)
-
-                else:
+        filt = None
 
-                    print("\nNo Zenith cut used\n")
-
-                self.gtmktime['roicut'] = "no"
-            elif (self.strategy == "events"):
-                filt = "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T && LIVETIME>0"
-                self.gtmktime['roicut'] = "no"
-            else:
-                raise RuntimeError("Strategy must be either 'time' or 'events'")
-
-            if (thetaCut != 180.0):
-                filt += " && (ANGSEP(RA_SCZ,DEC_SCZ,%s,%s)<=%s - %s)" % (ra, dec, thetaCut, rad)
-            pass
+        if (gtmktime):
+            filt = self._getGtmktimeFilter(ra, dec, rad, zenithCut, thetaCut)
+        pass
 
+        if (gtmktime and self.selection == 'gtselect'):
+            self.gtmktime['scfile'] = self.ft2File
+            self.gtmktime['roicut'] = "no"
             self.gtmktime['filter'] = filt
             self.gtmktime['evfile'] = self.originalEventFile
             outfilemk = "%s_mkt.fit" % (self.rootName)
@@ -1435,7 +1513,7 @@ class LATData(LLEData):
             self.gtmktime['tstop'] = float(tstop)
             self.gtmktime['clobber'] = 'yes'
             try:
-                self.gtmktime.run()
+                self.productCache.run(self.gtmktime, 'gtmktime', ['outfile'], copy=True)
             except BaseException as e:
                 raise GtBurstException(22, "gtmktime failed: %s" % str(e))
         else:
@@ -1494,10 +1572,28 @@ class LATData(LLEData):
         self.gtselect['clobber'] = "yes"
         outfileselect = "%s_filt.fit" % (self.rootName)
         self.gtselect['outfile'] = outfileselect
-        try:
-            self.gtselect.run()
-        except BaseException as e:
-            raise GtBurstException(23, "gtselect failed for unknown reason: %s " % str(e))
+
+        if (self.selection == 'native'):
+
+            # Same cuts as gtmktime and gtselect, but the files are read only once for all
+            # the intervals
+            try:
+                selector = eventSelection.getEventSelector(self.originalEventFile, self.ft2File, filt)
+                selector.setCuts(self.gtselect['ra'], self.gtselect['dec'], self.gtselect['rad'],
+                                 emin, emax, zenithCut, irf.evclass, self.evtype, irf.name.split("_")[0])
+                selector.select(tmin, tmax, outfileselect)
+            except BaseException as e:
+                raise GtBurstException(23, "Event selection failed: %s " % str(e))
+
+        else:
+
+            try:
+                # The header of the output is updated below, so it must be a copy
+                self.productCache.run(self.gtselect, 'gtselect', ['outfile'], copy=True)
+            except BaseException as e:
+                raise GtBurstException(23, "gtselect failed for unknown reason: %s " % str(e))
+
+        pass
 
         # Now write a keyword which will be used by other methods to recover ra,dec,rad,emin,emax,zcut
         f = pyfits.open(outfileselect, 'update')
@@ -1582,7 +1678,7 @@ class LATData(LLEData):
         self.gtbin['decfield'] = 'DEC'
         self.gtbin['proj'] = projection
         try:
-            self.gtbin.run()
+            self.productCache.run(self.gtbin, 'gtbin', ['outfile'])
         except BaseException as e:
             raise GtBurstException(24, "gtbin failed for unknown reason while producing the sky map: %s" % (str(e)))
 
@@ -1626,21 +1722,53 @@ class LATData(LLEData):
 
     pass
 
-    def makeLivetimeCube(self):
+    def makeLivetimeCube(self, mode='gtltcube'):
+        '''
+        mode: 'gtltcube' to run gtltcube, 'native' to compute the cube in this process
+              (much faster for short intervals), or 'incremental' to assemble the cube from
+              the contributions of the single FT2 rows, which are computed only once for all
+              the intervals analyzed in this process. In the incremental mode gtltcube is
+              run for the first interval, to get the format of the cube and to verify the
+              result (if it does not match, gtltcube is used for all intervals)
+        '''
+
         self.getCuts()
 
+        outfilecube = "%s_ltcube.fit" % (self.rootName)
+
+        # The zenith cut is applied in the livetime cube only with the 'events' strategy
+        zmax = self.zmax if self.strategy == "events" else 180
+
+        if (mode == 'native'):
+
+            # Same binning as gtltcube below
+            livetimeCube.LivetimeCube(self.ft2File, zmax, binsz=1, dcostheta=0.025, tstart=self.tmin,
+                                      tstop=self.tmax, phibins=1).writeCube(self.eventFile, outfilecube)
+            self.livetimeCube = outfilecube
+            return
+
+        elif (mode == 'incremental'):
+
+            incrementalCube = livetimeCube.getIncrementalCube(self.ft2File, zmax)
+
+            if (incrementalCube.makeCube(self.eventFile, outfilecube)):
+                print("\nLivetime cube assembled from the FT2 rows: %s\n" % (outfilecube))
+                self.livetimeCube = outfilecube
+                return
+            pass
+
+        elif (mode != 'gtltcube'):
+
+            raise ValueError("Livetime cube mode must be 'gtltcube', 'native' or 'incremental'")
+
+        pass
+
         # Cut the FT2 (otherwise gtltcube is SUPER slow)
-        shutil.copy(self.ft2File, "__ft2temp.fits")
-        f = pyfits.open("__ft2temp.fits", "update")
-        idx = (f['SC_DATA'].data.START > self.tmin - 300) & (f['SC_DATA'].data.STOP < self.tmax + 300)
-        f['SC_DATA'].data = f['SC_DATA'].data[idx]
-        f['SC_DATA'].header.set("TSTART", self.tmin - 300)
-        f['SC_DATA'].header.set("TSTOP", self.tmax + 300)
-        f.close()
+        with SpacecraftFile(self.ft2File) as spacecraft:
+            spacecraft.writeSlice(self.tmin - 300, self.tmax + 300, "__ft2temp.fits")
 
         self.gtltcube['evfile'] = self.eventFile
         self.gtltcube['scfile'] = "__ft2temp.fits"
-        outfilecube = "%s_ltcube.fit" % (self.rootName)
         self.gtltcube['outfile'] = outfilecube
         self.gtltcube['dcostheta'] = 0.025
         self.gtltcube['binsz'] = 1
@@ -1653,12 +1781,16 @@ class LATData(LLEData):
             self.gtltcube['zmax'] = 180
 
         try:
-            self.gtltcube.run()
+            self.productCache.run(self.gtltcube, 'gtltcube', ['outfile'])
         except BaseException as e:
             raise GtBurstException(26, "gtltcube failed in an unexpected way: %s" % str(e))
         self.livetimeCube = outfilecube
         os.remove("__ft2temp.fits")
 
+        if (mode == 'incremental' and incrementalCube.enabled and not incrementalCube.hasTemplate()):
+            incrementalCube.setTemplate(outfilecube, self.eventFile)
+        pass
+
     pass
 
     def makeExposureMap(self, binsz=1.0):
@@ -1684,7 +1816,7 @@ class LATData(LLEData):
         self.gtexpmap['nenergies'] = 20
         self.gtexpmap['clobber'] = 'yes'
         try:
-            self.gtexpmap.run()
+            self.productCache.run(self.gtexpmap, 'gtexpmap', ['outfile'])
         except BaseException as e:
             raise GtBurstException(27, "gtexpmap failed in an unexpected way: %s" % str(e))
         self.exposureMap = outfileexpo
@@ -1727,7 +1859,7 @@ class LATData(LLEData):
         self.gtexpcube2['clobber'] = 'yes'
         # All other parameters will be taken from the livetime cube
         try:
-            self.gtexpcube2.run()
+            self.productCache.run(self.gtexpcube2, 'gtexpcube2', ['outfile'])
         except:
             raise GtBurstException(28, "gtexpcube2 failed in an unexpected way")
 
@@ -1758,7 +1890,7 @@ class LATData(LLEData):
         self.gtsrcmaps['emapbnds'] = 'no'
         self.gtsrcmaps['ptsrc'] = 'yes'
         try:
-            self.gtsrcmaps.run()
+            self.productCache.run(self.gtsrcmaps, 'gtsrcmaps', ['outfile'])
         except:
             raise GtBurstException(29, "gtsrcmaps failed in an unexpected way")
         self.sourceMaps = outfilesrcmap
@@ -1822,7 +1954,7 @@ class LATData(LLEData):
 
         self.gtdiffrsp['clobber'] = 'yes'
         try:
-            self.gtdiffrsp.run()
+            self.productCache.run(self.gtdiffrsp, 'gtdiffrsp', [], updated=['evfile'], copy=True)
         except:
             raise GtBurstException(202, "gtdiffrsp failed in an unexpected way")
 
@@ -2008,6 +2140,7 @@ class LATData(LLEData):
 
         expomap = None
         ltcube = None
+        ltcubemode = 'gtltcube'
         emin = None
         emax = None
         clul = 0.95
@@ -2017,6 +2150,8 @@ class LATData(LLEData):
                 expomap = v
             elif (k == 'ltcube'):
                 ltcube = v
+            elif (k == 'ltcubemode' and v is not None):
+                ltcubemode = v
             elif (k == 'emin' and v is not None):
                 emin = float(v)
             elif (k == 'emax' and v is not None):
@@ -2026,7 +2161,7 @@ class LATData(LLEData):
         pass
         self.getCuts()
         if (ltcube is None or ltcube == ''):
-            self.makeLivetimeCube()
+            self.makeLivetimeCube(ltcubemode)
         else:
             if (os.path.exists(ltcube)):
                 self.livetimeCube = ltcube
@@ -2070,6 +2205,7 @@ class LATData(LLEData):
 
         expomap = None
         ltcube = None
+        ltcubemode = 'gtltcube'
         dogtdiffrsp = True
         emin = None
         emax = None
@@ -2080,6 +2216,8 @@ class LATData(LLEData):
                 expomap = v
             elif (k == 'ltcube'):
                 ltcube = v
+            elif (k == 'ltcubemode' and v is not None):
+                ltcubemode = v
             elif (k == 'dogtdiffrsp'):
                 dogtdiffrsp = bool(v)
             elif (k == 'emin' and v is not None):
@@ -2091,7 +2229,7 @@ class LATData(LLEData):
         pass
         self.getCuts()
         if (ltcube is None or ltcube == ''):
-            self.makeLivetimeCube()
+            self.makeLivetimeCube(ltcubemode)
         else:
             if (os.path.exists(ltcube)):
                 self.livetimeCube = ltcube
@@ -2612,8 +2750,26 @@ class TimeIntervalFitsFile(object):
 pass
 
 
+def _polyfitChannel(args):
+    # Module-level wrapper around CspecBackground._polyfit, so that it can be
+    # sent to the worker processes of a multiprocessing.Pool
+    return CspecBackground._polyfit(*args)
+
+
 class CspecBackground(object):
-    def __init__(self, cspecFile, rspFile):
+    def __init__(self, cspecFile, rspFile, fitMethod='batch', progressCallback=None, ncpus=None):
+        '''
+        Fit the background of a CSPEC file with a polynomial for each channel.
+
+        fitMethod                'batch' (default) fits all the channels at once,
+                                 'channel' fits one channel at the time, using
+                                 up to ncpus processes (default: maxNumberOfCPUs
+                                 from the configuration)
+        progressCallback         function called as callback(chanNumber, nChannels,
+                                 polynomial, logLikelihood, dof) after each channel
+                                 has been fitted, in channel order (default: print
+                                 the results)
+        '''
         # Check that the file exists
         if (not _fileExists(cspecFile)):
             raise IOError("File %s does not exist!" % (cspecFile))
@@ -2636,6 +2792,18 @@ class CspecBackground(object):
         self.gtselect = GtApp('gtselect')
         self.gtbindef = GtApp('gtbindef')
 
+        if (fitMethod not in ['batch', 'channel']):
+            raise ValueError("fitMethod must be either 'batch' or 'channel'")
+        pass
+        self.fitMethod = fitMethod
+
+        if (progressCallback is None):
+            progressCallback = self._printChannelFit
+        pass
+        self.progressCallback = progressCallback
+
+        self.ncpus = ncpus
+
     pass
 
     def __readChannels(self):
@@ -2714,6 +2882,8 @@ class CspecBackground(object):
         # Instanciate the container for the spectra
         spectraContainer = Spectra()
 
+        chanNumbers = map(lambda x: x.chanNumber, self.channels)
+
         # Get the spectra and fill the container
         for interval in srcTimeIntervals:
 
@@ -2721,23 +2891,17 @@ class CspecBackground(object):
             # the exposure for the background spectrum is equal to the duration
             # of the interval (deadtime = 0)
             duration = interval.getDuration()
-            thisSpectrum = Spectrum(interval.tstart, interval.tstop, duration,
-                                    telescope=self.telescop, instrument=self.instrume,
-                                    backfile='none', respfile='none', ancrfile='none',
-                                    spectrumType="BKG", chanType=self.chanType,
-                                    poisserr=False)
 
-            for channel, polynomial in zip(self.channels, polynomials):
-                rate = polynomial.integral(interval.tstart, interval.tstop) / duration
-                stat_err = polynomial.integralError(interval.tstart, interval.tstop) / duration
-                sys_err = BACK_SYS_ERROR
-                quality = 0  # Good
+            rates = map(lambda x: x.integral(interval.tstart, interval.tstop) / duration, polynomials)
+            stat_errs = map(lambda x: x.integralError(interval.tstart, interval.tstop) / duration, polynomials)
 
-                thisSpectrum.addChannel(channel.chanNumber, channel.emin, channel.emax,
-                                        rate, stat_err, quality, sys_err)
-
-            pass
-            spectraContainer.addSpectrum(thisSpectrum)
+            # Quality: 0 (good) for all channels
+            spectraContainer.addSpectra([interval.tstart], [interval.tstop], [duration],
+                                        chanNumbers, rates, stat_errs, BACK_SYS_ERROR, 0,
+                                        telescope=self.telescop, instrument=self.instrume,
+                                        backfile='none', respfile='none', ancrfile='none',
+                                        spectrumType="BKG", chanType=self.chanType,
+                                        poisserr=False)
         pass
 
         # Add the EBOUNDS extension, which is not required by the OGIP PHA standard
@@ -2758,10 +2922,10 @@ class CspecBackground(object):
         timeIntervals = _getIterable(timeIntervals)
         self.timeIntervals = timeIntervals
 
-        cspec = pyfits.open(self.cspecFile)
-        data = cspec["SPECTRUM"].data
-        time = data.field("TIME") - self.trigTime
-        endtime = data.field("ENDTIME") - self.trigTime
+        # Only the selected rows are copied out of the (memory-mapped) file
+        spectrum = eventFile.EventFile(self.cspecFile, "SPECTRUM")
+        time = spectrum.getColumn("TIME") - self.trigTime
+        endtime = spectrum.getColumn("ENDTIME") - self.trigTime
 
         # Select data to keep for the fit
         mask = None
@@ -2772,7 +2936,7 @@ class CspecBackground(object):
             else:
                 mask = (mask | thisMask)
         pass
-        filteredData = data[mask]
+        filteredData = spectrum.getData()[mask]
 
         if (len(filteredData) == 0):
             raise ValueError(
@@ -2781,22 +2945,85 @@ class CspecBackground(object):
         # Fit the sum of counts to get the optimal polynomial grade
         optimalPolGrade = self._fitGlobalAndDetermineOptimumGrade(filteredData)
 
-        # Compute the number of channels
-        nChannels = len(filteredData.field("COUNTS")[0])
+        if (self.fitMethod == 'batch'):
+            polynomials = self._fitAllChannelsAtOnce(filteredData, optimalPolGrade)
+        else:
+            polynomials = self._fitChannelByChannel(filteredData, optimalPolGrade)
+        pass
+
+        self.polynomials = polynomials
+        return polynomials
+
+    pass
+
+    def _fitAllChannelsAtOnce(self, data, polGrade):
+        # Fit all the channels at once, using the (channels x bins) matrix of counts
+        x = numpy.array((data.field("TIME") + data.field("ENDTIME")) / 2.0)
+        x -= self.trigTime
+        counts = numpy.array(data.field("COUNTS"), dtype=float).T
+        exposure = numpy.array(data.field("EXPOSURE"))
+
+        fitter = PolynomialBatchFitter(x, counts, exposure)
+        polynomials, cstats = fitter.fit(polGrade)
+
+        nChannels = len(polynomials)
+        for chanNumber, (thisPolynomial, cstat) in enumerate(zip(polynomials, cstats)):
+            self.progressCallback(chanNumber, nChannels, thisPolynomial, cstat, len(data) - polGrade)
+        pass
+
+        return polynomials
+
+    pass
+
+    def _fitChannelByChannel(self, data, polGrade):
+        # Fit one channel at the time, possibly distributing the channels
+        # among several processes. The results are collected in channel order,
+        # and each fit does not depend on the others, so the output does not
+        # depend on the number of processes
+        nChannels = len(data.field("COUNTS")[0])
+
+        ncpus = self.ncpus
+        if (ncpus is None):
+            ncpus = int(float(Configuration().get('maxNumberOfCPUs')))
+        pass
+        ncpus = max(1, min(ncpus, multiprocessing.cpu_count(), nChannels))
+
+        if (ncpus > 1):
+            arguments = [self._getChannelData(chanNumber, data) + (polGrade,) for chanNumber in range(nChannels)]
+            pool = multiprocessing.Pool(ncpus)
+            try:
+                results = pool.imap(_polyfitChannel, arguments, max(1, nChannels // (4 * ncpus)))
+                polynomials = self._collectChannelFits(results, nChannels, len(data) - polGrade)
+            finally:
+                pool.close()
+                pool.join()
+            pass
+        else:
+            results = (self._fitChannel(chanNumber, data, polGrade) for chanNumber in range(nChannels))
+            polynomials = self._collectChannelFits(results, nChannels, len(data) - polGrade)
+        pass
+
+        return polynomials
+
+    pass
+
+    def _collectChannelFits(self, results, nChannels, dof):
         polynomials = []
-        for chanNumber in range(nChannels):
-            print("\nChannel %s: " % (chanNumber))
-            thisPolynomial, cstat = self._fitChannel(chanNumber, filteredData, optimalPolGrade)
-            print(thisPolynomial)
-            print '{0:>20} {1:>6.2f} for {2:<5} d.o.f.'.format("logLikelihood = ", cstat,
-                                                               len(filteredData) - optimalPolGrade)
+        for chanNumber, (thisPolynomial, cstat) in enumerate(results):
+            self.progressCallback(chanNumber, nChannels, thisPolynomial, cstat, dof)
             polynomials.append(thisPolynomial)
         pass
-        self.polynomials = polynomials
         return polynomials
 
     pass
 
+    def _printChannelFit(self, chanNumber, nChannels, polynomial, cstat, dof):
+        print("\nChannel %s: " % (chanNumber))
+        print(polynomial)
+        print '{0:>20} {1:>6.2f} for {2:<5} d.o.f.'.format("logLikelihood = ", cstat, dof)
+
+    pass
+
     def makeLightCurveWithResiduals(self, **kwargs):
         print("\nComputing residuals...\n")
         lcFigure = None
@@ -2818,14 +3045,13 @@ class CspecBackground(object):
         ylabel = "Counts"
         subfigures = []
         trigTime = getTriggerTime(self.cspecFile)
-        f = pyfits.open(self.cspecFile)
-        s = f['SPECTRUM']
+        spectrum = eventFile.EventFile(self.cspecFile, "SPECTRUM")
+        quality, times, exposures = spectrum.getColumns("QUALITY", "TIME", "EXPOSURE")
 
         tstart = self.timeIntervals[0].tstart + self.trigTime
         tstop = self.timeIntervals[-1].tstop + self.trigTime
-        mask = (s.data.field('QUALITY') == 0) & (s.data.field("TIME") >= tstart) & (s.data.field("TIME") <= tstop) & (
-        s.data.field("EXPOSURE") > 0)
-        d = s.data[mask]
+        mask = (quality == 0) & (times >= tstart) & (times <= tstop) & (exposures > 0)
+        d = spectrum.getData()[mask]
         counts = d.field('COUNTS')
         t = d.field('TIME') - self.trigTime
         exposure = d.field('EXPOSURE')
@@ -2833,7 +3059,6 @@ class CspecBackground(object):
         LC = N * [0]
         for j in range(N):
             LC[j] = counts[j].sum()
-        f.close()
 
         subfigures.append(lcFigure.add_subplot(2, 1, 1, xlabel=xlabel, ylabel=ylabel))
         subfigures[-1].step(t, map(lambda x: x[0] / x[1], zip(LC, exposure)), where='post')
@@ -2906,7 +3131,8 @@ class CspecBackground(object):
 
     pass
 
-    def _polyfit(self, x, y, exposure, polGrade):
+    @staticmethod
+    def _polyfit(x, y, exposure, polGrade):
 
         # Check that we have enough counts to perform the fit, otherwise
         # return a "zero polynomial"
@@ -3015,10 +3241,11 @@ class CspecBackground(object):
         # Fit all the polynomials
         minGrade = 0
         maxGrade = 4
+        fitter = PolynomialBatchFitter(x, y, exposure)
         logLikelihoods = []
         for grade in range(minGrade, maxGrade + 1):
-            polynomial, logLike = self._polyfit(x, y, exposure, grade)
-            logLikelihoods.append(logLike)
+            polynomials, logLikes = fitter.fit(grade)
+            logLikelihoods.append(logLikes[0])
         pass
         # Found the best one
         deltaLoglike = numpy.array(map(lambda x: 2 * (x[0] - x[1]), zip(logLikelihoods[:-1], logLikelihoods[1:])))
@@ -3046,6 +3273,16 @@ class CspecBackground(object):
 
     def _fitChannel(self, chanNumber, data, polGrade):
 
+        x, y, exposure = self._getChannelData(chanNumber, data)
+
+        polynomial, minLogLike = self._polyfit(x, y, exposure, polGrade)
+
+        return polynomial, minLogLike
+
+    pass
+
+    def _getChannelData(self, chanNumber, data):
+
         Nintervals = len(data)
 
         # Put data to fit in an x vector and y vector
@@ -3061,9 +3298,7 @@ class CspecBackground(object):
 
         exposure = numpy.array(data.field("EXPOSURE"))
 
-        polynomial, minLogLike = self._polyfit(x, y, exposure, polGrade)
-
-        return polynomial, minLogLike
+        return x, y, exposure
 
     pass
 
@@ -3083,21 +3318,32 @@ class Channel(object):
 pass
 
 
+# Keywords accepted by Spectrum and Spectra.addSpectra, and the corresponding attributes
+_spectrumKeywords = {'telescope': 'telescope',
+                     'instrument': 'instrument',
+                     'filter': 'filter',
+                     'backfile': 'backfile',
+                     'respfile': 'respfile',
+                     'ancrfile': 'ancrfile',
+                     'spectrumtype': 'spectrumType',
+                     'chantype': 'chanType',
+                     'poisserr': 'poisserr'}
+
+
 class Spectrum(object):
     '''
   Implements a single spectrum ("PHA type I")
   '''
 
+    # Quantities stored for each channel
+    _channelFields = ['emin', 'emax', 'rate', 'stat_err', 'sys_err', 'quality', 'grouping']
+
     def __init__(self, tstart, tstop, exposure, **kwargs):
 
         self.tstart = tstart
         self.tstop = tstop
         self.exposure = exposure
 
-        # This dictionary will store the channels, having the chanNumber as
-        # key and a Channel class as value
-        self.channels = {}
-
         # This channelOffset will be added to the channel numbers,
         # thus the first channel will be numbered channelOffset,
         # the second channelOffset+1 etc. Default: 1 (as Xspec expects)
@@ -3125,30 +3371,17 @@ class Spectrum(object):
 
         # Update default values with keywords content, if specified
         for key in kwargs.keys():
-            if (key.lower() == "telescope"):
-                self.telescope = kwargs[key]
-            elif (key.lower() == "instrument"):
-                self.instrument = kwargs[key]
-            elif (key.lower() == "filter"):
-                self.filter = kwargs[key]
-            elif (key.lower() == "backfile"):
-                self.backfile = kwargs[key]
-            elif (key.lower() == "respfile"):
-                self.respfile = kwargs[key]
-            elif (key.lower() == "ancrfile"):
-                self.ancrfile = kwargs[key]
-            elif (key.lower() == "spectrumtype"):
-                self.spectrumType = kwargs[key]
-            elif (key.lower() == "chantype"):
-                self.chanType = kwargs[key]
-            elif (key.lower() == "poisserr"):
-                self.poisserr = kwargs[key]
-        pass
-
-        # The following dictionary will have channels as keys, and
-        # counts as values
-        self.spectrum = {}
-        self.sortedChannelNumbers = []
+            if (key.lower() in _spectrumKeywords):
+                setattr(self, _spectrumKeywords[key.lower()], kwargs[key])
+        pass
+
+        # The channels are stored in arrays sorted by channel number. The channels
+        # added one by one with addChannel are kept in a dictionary (which avoids
+        # duplicated channels, and allow to insert channels out of order) and
+        # moved to the arrays only when needed
+        self._chanNumbers = numpy.zeros(0, dtype=int)
+        self._values = numpy.zeros((0, len(self._channelFields)))
+        self._newChannels = {}
 
     pass
 
@@ -3170,43 +3403,103 @@ class Spectrum(object):
      See http://heasarc.gsfc.nasa.gov/docs/heasarc/ofwg/docs/spectra/ogip_92_007/node7.html .
     '''
 
-        thisChannel = Channel(chanNumber, emin, emax)
+        self._newChannels[chanNumber] = (emin, emax, rate, stat_err, sys_err, quality, grouping)
+
+    pass
+
+    def addChannels(self, chanNumbers, emin, emax, rates, stat_errs, quality=0, sys_err=0, grouping=1):
+        '''
+     Add many channels at once. The parameters are the same as addChannel, but
+     they are arrays with one element for each channel (quality, sys_err and grouping
+     can also be scalars, which are then used for all the channels).
+    '''
+
+        self._sortChannels()
+
+        chanNumbers = numpy.array(chanNumbers, dtype=int).reshape(-1)
+
+        values = numpy.zeros((chanNumbers.shape[0], len(self._channelFields)))
+        for i, value in enumerate([emin, emax, rates, stat_errs, sys_err, quality, grouping]):
+            values[:, i] = numpy.array(value, dtype=float)
+        pass
+
+        self._merge(chanNumbers, values)
+
+    pass
+
+    def _merge(self, chanNumbers, values):
+        # Merge new channels with the ones already stored (new values replace the old ones
+        # for the same channel)
+        keep = ~numpy.in1d(self._chanNumbers, chanNumbers)
+
+        # For channels repeated in the input, the last one wins
+        chanNumbers, lastIndex = numpy.unique(chanNumbers[::-1], return_index=True)
+        values = values[::-1][lastIndex]
+
+        allChanNumbers = numpy.concatenate([self._chanNumbers[keep], chanNumbers])
+        allValues = numpy.concatenate([self._values[keep], values])
 
-        # Store thisChannel as value of the channels dictionary (so we can retrieve it by
-        # using the chanNumber), and as key of the spectrum dictionary
-        # Note: both the first and the second dictionary here will store just a
-        # reference to the class thisChannel, thus using it twice does not mean it will
-        # be stored twice.
-        # It seems to be an unnecessary complication, but it will avoid duplicated channels
-        # and it allow to insert channels out of order
-        self.channels[chanNumber] = thisChannel
-        self.spectrum[thisChannel] = (rate, stat_err, sys_err, quality, grouping)
-        self.sortedChanellNumbers = sorted(self.channels.keys())
+        order = numpy.argsort(allChanNumbers, kind='mergesort')
+        self._chanNumbers = allChanNumbers[order]
+        self._values = allValues[order]
+
+    pass
+
+    def _sortChannels(self):
+        # Move the channels added by addChannel to the arrays (sorting them only once)
+        if (len(self._newChannels) > 0):
+            chanNumbers = numpy.array(self._newChannels.keys(), dtype=int)
+            values = numpy.array(self._newChannels.values(), dtype=float).reshape(chanNumbers.shape[0], -1)
+            self._newChannels = {}
+            self._merge(chanNumbers, values)
+        pass
+
+    pass
+
+    def _getField(self, name, dtype=float):
+        self._sortChannels()
+        return numpy.array(self._values[:, self._channelFields.index(name)], dtype=dtype)
+
+    pass
+
+    @property
+    def channels(self):
+        # Dictionary with the channel numbers as keys and instances of Channel as values
+        emin = self._getField('emin')
+        emax = self._getField('emax')
+        return dict(map(lambda i: (self._chanNumbers[i], Channel(self._chanNumbers[i], emin[i], emax[i])),
+                        range(self._chanNumbers.shape[0])))
+
+    pass
+
+    def getChannelNumbers(self):
+        self._sortChannels()
+        return self._chanNumbers.copy()
 
     pass
 
     def getRates(self):
-        return map(lambda key: self.spectrum[self.channels[key]][0], self.sortedChanellNumbers)
+        return self._getField('rate')
 
     pass
 
     def getStat_err(self):
-        return map(lambda key: self.spectrum[self.channels[key]][1], self.sortedChanellNumbers)
+        return self._getField('stat_err')
 
     pass
 
     def getSys_err(self):
-        return map(lambda key: self.spectrum[self.channels[key]][2], self.sortedChanellNumbers)
+        return self._getField('sys_err')
 
     pass
 
     def getQuality(self):
-        return map(lambda key: self.spectrum[self.channels[key]][3], self.sortedChanellNumbers)
+        return self._getField('quality', int)
 
     pass
 
     def getGrouping(self):
-        return map(lambda key: self.spectrum[self.channels[key]][4], self.sortedChanellNumbers)
+        return self._getField('grouping', int)
 
     pass
 
@@ -3220,7 +3513,86 @@ class Spectrum(object):
 pass
 
 
+def _writeTableInChunks(filename, primary, columns, arrays, keywords,
+                        extensionsBefore=[], extensionsAfter=[], chunkSize=1000):
+    '''
+  Write a FITS file with the primary HDU, the extensions in extensionsBefore, a binary table
+  and the extensions in extensionsAfter. The table has the given columns (instances of
+  pyfits.Column without data), with values taken from arrays (one for each column, with
+  one row for each row of the table), and the keywords contained in the header keywords.
+  The rows are converted to the FITS format and written chunkSize at the time, so that the
+  table is never copied in memory all at once.
+  '''
+
+    nRows = len(arrays[0])
+
+    # Get the header and the binary format of the rows from an empty table
+    emptyTable = pyfits.BinTableHDU.from_columns(pyfits.ColDefs(columns), nrows=0)
+
+    header = emptyTable.header
+    for card in keywords.cards:
+        header.set(card.keyword, card.value, card.comment)
+    pass
+    header.set("NAXIS2", nRows)
+
+    rowFormat = numpy.dtype(emptyTable.columns.dtype.descr).newbyteorder('>')
+
+    pyfits.HDUList([primary] + list(extensionsBefore)).writeto(filename, clobber=True)
+
+    with open(filename, 'ab') as f:
+
+        f.write(header.tostring())
+
+        for start in range(0, nRows, chunkSize):
+            stop = min(start + chunkSize, nRows)
+
+            rows = numpy.zeros(stop - start, dtype=rowFormat)
+
+            for column, array in zip(columns, arrays):
+                values = numpy.asarray(array[start:stop])
+
+                if (column.bzero is not None):
+                    values = values - column.bzero
+                pass
+
+                rows[column.name] = values.reshape(rows[column.name].shape)
+            pass
+
+            f.write(rows.tostring())
+        pass
+
+        # Pad the data to a multiple of the FITS block size
+        f.write('\0' * ((-nRows * rowFormat.itemsize) % 2880))
+
+    pass
+
+    for extension in extensionsAfter:
+        pyfits.append(filename, extension.data, header=extension.header)
+    pass
+
+
+pass
+
+
+def _spectraArray(name):
+    # Property returning the filled part of one of the arrays of Spectra
+    return property(lambda self: self._arrays[name][:self.nSpectra])
+
+
+pass
+
+
 class Spectra(object):
+    # Initial number of rows of the arrays holding the spectra. When they are full,
+    # their size is doubled
+    _initialSize = 16
+
+    # Quantities stored for each spectrum (1 value) and for each channel of each
+    # spectrum (nChannels values), with their types
+    _spectrumFields = [('tstart', float), ('tstop', float), ('exposure', float)]
+    _channelFields = [('channel', int), ('rate', float), ('stat_err', float), ('sys_err', float),
+                      ('quality', numpy.int16), ('grouping', numpy.int16)]
+
     def __init__(self, *args):
 
         # If no argument is passed, use default constructor,
@@ -3233,38 +3605,37 @@ class Spectra(object):
     pass
 
     def _normalConstructor(self):
-        # This list will contain all the instances of the class Spectrum
-        self.spectra = []
-
-        # The following lists corresponds to the different columns in the PHA/CSPEC
-        # formats, and they will be filled up by addSpectrum()
-        self.tstart = []
-        self.tstop = []
-        self.channel = []
-        self.rate = []
-        self.stat_err = []
-        self.sys_err = []
-        self.quality = []
-        self.grouping = []
-        self.exposure = []
+        # The spectra are stored in arrays, with one row for each spectrum, corresponding
+        # to the different columns in the PHA/CSPEC formats. They will be filled up by
+        # addSpectra() and addSpectrum(), and accessed through the properties
+        # tstart, tstop, exposure, channel, rate, stat_err, sys_err, quality and grouping
+        self.nSpectra = 0
+        self.nChannels = None
+        self._arrays = {}
+
         self.backfile = []
         self.respfile = []
         self.ancrfile = []
 
-        # These two lists store the maximum length of the filenames for background
-        # ancillary and response files, we will need them when writing the PHA2/CSPEC file
-        self.maxlengthbackfile = 0
-        self.maxlengthrespfile = 0
-        self.maxlengthancrfile = 0
+        # These are taken from the first spectrum added
+        self.telescope = "UNKN-TELESCOPE"
+        self.instrument = "UNKN-INSTRUME"
+        self.filter = "UNKN-FILTER"
+        self.spectrumType = "BKG"
+        self.chanType = "PHA"
 
         # This is to indicate if all the spectra have poisson errors
-        self.poisser = False
+        self.poisserr = False
+        self._firstPoisserr = False
 
         # The EBOUNDS extension is not required by the PHA 2 standard,
         # but IT IS required in the CSPEC file for it to be readable by Rmfit.
         # It can be added before writing to file using the method addEboundsExtension()
         self.ebounds = None
 
+        # Optional GTI extension, added with addGtiExtension()
+        self.gti = None
+
         # These dictionaries will contain user-supplied keyword for the
         # primary and SPECTRUM extension of PHAII and/or CSPEC files
         self.spectrumHeader = {}
@@ -3272,6 +3643,55 @@ class Spectra(object):
 
     pass
 
+    def __len__(self):
+        return self.nSpectra
+
+    pass
+
+    tstart = _spectraArray('tstart')
+    tstop = _spectraArray('tstop')
+    exposure = _spectraArray('exposure')
+    channel = _spectraArray('channel')
+    rate = _spectraArray('rate')
+    stat_err = _spectraArray('stat_err')
+    sys_err = _spectraArray('sys_err')
+    quality = _spectraArray('quality')
+    grouping = _spectraArray('grouping')
+
+    def _reserve(self, nSpectra, nChannels):
+        # Make room for nSpectra more spectra
+
+        if (self.nChannels is None):
+            self.nChannels = nChannels
+
+            for name, dtype in self._spectrumFields:
+                self._arrays[name] = numpy.zeros(0, dtype=dtype)
+            pass
+
+            for name, dtype in self._channelFields:
+                self._arrays[name] = numpy.zeros((0, nChannels), dtype=dtype)
+            pass
+
+        elif (nChannels != self.nChannels):
+            raise ValueError("All the spectra must have the same number of channels (%s)" % (self.nChannels))
+        pass
+
+        size = self._arrays['tstart'].shape[0]
+        needed = self.nSpectra + nSpectra
+
+        if (needed > size):
+            newSize = max(needed, 2 * size, self._initialSize)
+
+            for name in self._arrays.keys():
+                array = self._arrays[name]
+                newArray = numpy.zeros((newSize,) + array.shape[1:], dtype=array.dtype)
+                newArray[:self.nSpectra] = array[:self.nSpectra]
+                self._arrays[name] = newArray
+            pass
+        pass
+
+    pass
+
     def _getColOrKeyword(self, data, header, name):
         try:
             q = numpy.array(data.field(name))
@@ -3285,10 +3705,10 @@ class Spectra(object):
 
     def _getRate(self, data):
         try:
-            rate = data.field("RATE")
+            rate = numpy.array(data.field("RATE"))
         except:
-            counts = data.field("COUNTS")
-            rate = numpy.array(map(lambda x: x[0] / x[1], zip(counts, (data.field("TELAPSE")))))
+            counts = numpy.array(data.field("COUNTS"), dtype=float)
+            rate = counts / numpy.array(data.field("TELAPSE"))[:, numpy.newaxis]
         pass
         return rate
 
@@ -3301,10 +3721,10 @@ class Spectra(object):
             if (q.ndim == 1):
                 # q has one value for spectrum, while we need N values for each i-th spectrum, where
                 # N is len(channel[i]). Copy the value to generate an array for each spectrum
-                q = numpy.array(map(lambda x: numpy.zeros(len(x)) + q, channels))
+                q = numpy.zeros(channels.shape) + q[:, numpy.newaxis]
             pass
         except:
-            q = numpy.array(map(lambda x: numpy.zeros(len(x)) + defaultValue, channels))
+            q = numpy.zeros(channels.shape) + defaultValue
         pass
 
         return q
@@ -3320,16 +3740,6 @@ class Spectra(object):
 
         header = f["SPECTRUM"].header
         spectrumExtData = f["SPECTRUM"].data
-        eboundsExtData = f["EBOUNDS"].data
-        emin = eboundsExtData.field("E_MIN")
-        emax = eboundsExtData.field("E_MAX")
-        channels = eboundsExtData.field("CHANNEL")
-        ebounds = {}
-        for i in range(len(eboundsExtData)):
-            ebounds[channels[i]] = Channel(channels[i], emin[i], emax[i])
-        pass
-
-        Nspectra = len(spectrumExtData)
 
         # Get some infos from the header
         telescope = header["TELESCOP"]
@@ -3342,32 +3752,24 @@ class Spectra(object):
             poisserr = True
         pass
 
-        tstarts = spectrumExtData.field("TSTART")
-        telapses = spectrumExtData.field("TELAPSE")
+        tstarts = numpy.array(spectrumExtData.field("TSTART"))
+        telapses = numpy.array(spectrumExtData.field("TELAPSE"))
         tstops = tstarts + telapses
-        exposures = spectrumExtData.field("EXPOSURE")
-        channels = spectrumExtData.field("CHANNEL")
+        exposures = numpy.array(spectrumExtData.field("EXPOSURE"))
+        channels = numpy.array(spectrumExtData.field("CHANNEL")).reshape(len(spectrumExtData), -1)
         rates = self._getRate(spectrumExtData)
 
         if (poisserr == True):
             stat_err = None
+            sys_err = None
         else:
-            stat_err = spectrumExtData.field("STAT_ERR")
+            stat_err = numpy.array(spectrumExtData.field("STAT_ERR"))
+            sys_err = self._getColOrKeywordOrZeros(spectrumExtData, header, channels, "SYS_ERR")
         pass
 
-        sys_err = self._getColOrKeywordOrZeros(spectrumExtData, header, channels, "SYS_ERR")
         quality = self._getColOrKeywordOrZeros(spectrumExtData, header, channels, "QUALITY")
         grouping = self._getColOrKeywordOrZeros(spectrumExtData, header, channels, "GROUPING")
 
-        # Fix the grouping column (if all the grouping value for a given spectrum are 1, then subsitute the
-        # array of 1s with just one
-        for i, group in enumerate(grouping):
-            mask = (group == 0)
-            if (len(mask.nonzero()[0]) == len(group)):
-                grouping[i] = 0
-            pass
-        pass
-
         backfiles = self._getColOrKeyword(spectrumExtData, header, "BACKFILE")
         respfiles = self._getColOrKeyword(spectrumExtData, header, "RESPFILE")
         ancrfiles = self._getColOrKeyword(spectrumExtData, header, "ANCRFILE")
@@ -3375,27 +3777,10 @@ class Spectra(object):
         self._normalConstructor()
 
         # add all the spectra contained in this PHA2
-        for i in range(Nspectra):
-            thisSpectrum = Spectrum(tstarts[i], tstops[i], exposures[i],
-                                    telescope=telescope, instrument=instrument,
-                                    backfile=backfiles[i], respfile=respfiles[i], ancrfile=ancrfiles[i],
-                                    spectrumType=spectrumType, chanType=chanType,
-                                    poisserr=poisserr)
-            for j, chan in enumerate(channels[i]):
-                if (stat_err  is not None):
-                    thisStatErr = stat_err[i][j]
-                    thisSysErr = sys_err[i][j]
-                else:
-                    thisStatErr = None
-                    thisSysErr = None
-                pass
-
-                thisSpectrum.addChannel(chan, ebounds[chan].emin, ebounds[chan].emax,
-                                        rates[i][j], thisStatErr, quality[i][j], thisSysErr, grouping[i][j])
-            pass
-
-            self.addSpectrum(thisSpectrum)
-        pass
+        self.addSpectra(tstarts, tstops, exposures, channels, rates, stat_err, sys_err, quality, grouping,
+                        backfile=backfiles, respfile=respfiles, ancrfile=ancrfiles,
+                        telescope=telescope, instrument=instrument,
+                        spectrumType=spectrumType, chanType=chanType, poisserr=poisserr)
 
         # Now load the EBOUNDS extension, if any
         try:
@@ -3403,8 +3788,6 @@ class Spectra(object):
         except:
             pass
 
-        self.setPoisson()
-
         f.close()
 
     pass
@@ -3416,46 +3799,97 @@ class Spectra(object):
     '''
         if (value is None):
             # Use the value for the first spectrum
-            self.poisserr = self.spectra[0].poisserr
+            self.poisserr = self._firstPoisserr
         else:
             self.poisserr = bool(value)
         pass
 
     pass
 
-    def addSpectrum(self, spectrum):
-        self.spectra.append(spectrum)
-
-        # Fill all the lists
-        self.tstart.append(spectrum.tstart)
-        self.tstop.append(spectrum.tstop)
-        self.channel.append(spectrum.channels.keys())
-        self.rate.append(spectrum.getRates())
-        self.stat_err.append(spectrum.getStat_err())
-        self.sys_err.append(spectrum.getSys_err())
-        self.quality.append(spectrum.getQuality())
-        self.grouping.append(spectrum.getGrouping())
-        self.exposure.append(spectrum.exposure)
-        self.backfile.append(spectrum.backfile)
-        self.respfile.append(spectrum.respfile)
-        self.ancrfile.append(spectrum.ancrfile)
-
-        # This is to store the maximum length of the strings describing background,
-        # response and ancillary files, which is needed to write the columns in the correct
-        # FITS format
-        self.maxlengthbackfile = max(map(lambda x: len(x), self.backfile))
-        self.maxlengthrespfile = max(map(lambda x: len(x), self.respfile))
-        self.maxlengthancrfile = max(map(lambda x: len(x), self.ancrfile))
+    def addSpectra(self, tstarts, tstops, exposures, channels, rates, stat_errs=None, sys_errs=0,
+                   qualities=0, groupings=1, **kwargs):
+        '''
+    Add many spectra at once. tstarts, tstops and exposures have one element for each spectrum,
+    while channels, rates, stat_errs, sys_errs, qualities and groupings are (nSpectra x nChannels)
+    arrays, or arrays with one element for each channel, or scalars, which are then used for all
+    the spectra (and channels). The other keywords are the same accepted by Spectrum (backfile,
+    respfile and ancrfile can also be lists with one element for each spectrum). The
+    keywords describing the instrument are taken from the first spectra added.
+    '''
+
+        tstarts = numpy.array(tstarts, dtype=float).reshape(-1)
+        nSpectra = tstarts.shape[0]
+
+        rates = numpy.array(rates, dtype=float).reshape(nSpectra, -1)
+
+        self._reserve(nSpectra, rates.shape[1])
+
+        first = self.nSpectra
+        last = first + nSpectra
+
+        if (stat_errs is None):
+            stat_errs = numpy.nan
+        if (sys_errs is None):
+            sys_errs = numpy.nan
+
+        for name, values in [('tstart', tstarts), ('tstop', tstops), ('exposure', exposures),
+                             ('channel', channels), ('rate', rates), ('stat_err', stat_errs),
+                             ('sys_err', sys_errs), ('quality', qualities), ('grouping', groupings)]:
+            self._arrays[name][first:last] = values
+        pass
+
+        keywords = {}
+        for key in kwargs.keys():
+            if (key.lower() in _spectrumKeywords):
+                keywords[_spectrumKeywords[key.lower()]] = kwargs[key]
+        pass
+
+        for name in ['backfile', 'respfile', 'ancrfile']:
+            values = keywords.pop(name, 'none')
+            if (isinstance(values, basestring)):
+                values = [values] * nSpectra
+            pass
+            getattr(self, name).extend(map(str, values))
+        pass
+
+        if (first == 0):
+            for name, value in keywords.iteritems():
+                if (name == 'poisserr'):
+                    self._firstPoisserr = value
+                else:
+                    setattr(self, name, value)
+                pass
+            pass
+        pass
+
+        self.nSpectra = last
 
         self.setPoisson()
 
     pass
 
+    def addSpectrum(self, spectrum):
+
+        self.addSpectra([spectrum.tstart], [spectrum.tstop], [spectrum.exposure],
+                        spectrum.getChannelNumbers(), spectrum.getRates(), spectrum.getStat_err(),
+                        spectrum.getSys_err(), spectrum.getQuality(), spectrum.getGrouping(),
+                        backfile=spectrum.backfile, respfile=spectrum.respfile, ancrfile=spectrum.ancrfile,
+                        telescope=spectrum.telescope, instrument=spectrum.instrument,
+                        filter=spectrum.filter, spectrumType=spectrum.spectrumType,
+                        chanType=spectrum.chanType, poisserr=spectrum.poisserr)
+
+    pass
+
     def addEboundsExtension(self, ebounds):
         self.ebounds = ebounds.copy()
 
     pass
 
+    def addGtiExtension(self, gti):
+        self.gti = gti.copy()
+
+    pass
+
     def addKeywordtoSpectrum(self, keyword, value):
         self.spectrumHeader[keyword] = value
 
@@ -3497,126 +3931,96 @@ class Spectra(object):
 
     pass
 
+    def _getMaxLength(self, strings):
+        # Maximum length of the strings describing background, response and ancillary files,
+        # which is needed to write the columns in the correct FITS format
+        return max(map(lambda x: len(x), strings))
+
+    pass
+
     def _writePHA2(self, filename, **kwargs):
 
         trigTime = None
-        clobber = False
         for key in kwargs.keys():
             if (key.lower() == "trigtime"):
                 trigTime = kwargs[key]
-            elif (key.lower() == "clobber"):
-                clobber = bool(kwargs[key])
         pass
 
-        Nchan = len(self.rate[0])
+        Nchan = self.nChannels
         vectFormatD = "%sD" % (Nchan)
         vectFormatI = "%sI" % (Nchan)
 
-        if (trigTime  is not None):
+        if (trigTime is not None):
             # use trigTime as reference for TSTART
-            tstartCol = pyfits.Column(name='TSTART', format='D',
-                                      array=numpy.array(self.tstart), unit="s", bzero=trigTime)
+            tstartCol = pyfits.Column(name='TSTART', format='D', unit="s", bzero=trigTime)
         else:
-            tstartCol = pyfits.Column(name='TSTART', format='D',
-                                      array=numpy.array(self.tstart), unit="s")
+            tstartCol = pyfits.Column(name='TSTART', format='D', unit="s")
         pass
 
-        telapseCol = pyfits.Column(name='TELAPSE', format='D',
-                                   array=(numpy.array(self.tstop) - numpy.array(self.tstart)), unit="s")
-
-        spec_numCol = pyfits.Column(name='SPEC_NUM', format='I',
-                                    array=range(1, len(self.spectra) + 1))
-
-        channelCol = pyfits.Column(name='CHANNEL', format=vectFormatI,
-                                   array=numpy.array(self.channel))
-
-        ratesCol = pyfits.Column(name='RATE', format=vectFormatD,
-                                 array=numpy.array(self.rate), unit="Counts/s")
+        columns = [(tstartCol, self.tstart),
+                   (pyfits.Column(name='TELAPSE', format='D', unit="s"), self.tstop - self.tstart),
+                   (pyfits.Column(name='SPEC_NUM', format='I'), numpy.arange(1, self.nSpectra + 1)),
+                   (pyfits.Column(name='CHANNEL', format=vectFormatI), self.channel),
+                   (pyfits.Column(name='RATE', format=vectFormatD, unit="Counts/s"), self.rate)]
 
         if (self.poisserr == False):
-            stat_errCol = pyfits.Column(name='STAT_ERR', format=vectFormatD,
-                                        array=numpy.array(self.stat_err))
-
-            sys_errCol = pyfits.Column(name='SYS_ERR', format=vectFormatD,
-                                       array=numpy.array(self.sys_err))
+            columns += [(pyfits.Column(name='STAT_ERR', format=vectFormatD), self.stat_err),
+                        (pyfits.Column(name='SYS_ERR', format=vectFormatD), self.sys_err)]
         pass
+        # (If POISSERR=True there is no need for stat_err and sys_err)
 
-        qualityCol = pyfits.Column(name='QUALITY', format=vectFormatI,
-                                   array=numpy.array(self.quality))
-
-        groupingCol = pyfits.Column(name='GROUPING', format=vectFormatI,
-                                    array=numpy.array(self.grouping))
-
-        exposureCol = pyfits.Column(name='EXPOSURE', format='D',
-                                    array=numpy.array(self.exposure), unit="s")
+        columns += [(pyfits.Column(name='QUALITY', format=vectFormatI), self.quality),
+                    (pyfits.Column(name='GROUPING', format=vectFormatI), self.grouping),
+                    (pyfits.Column(name='EXPOSURE', format='D', unit="s"), self.exposure)]
 
-        backfileCol = pyfits.Column(name='BACKFILE', format='%iA' % (self.maxlengthbackfile + 2),
-                                    array=numpy.array(self.backfile))
-
-        respfileCol = pyfits.Column(name='RESPFILE', format='%iA' % (self.maxlengthrespfile + 2),
-                                    array=numpy.array(self.respfile))
-
-        ancrfileCol = pyfits.Column(name='ANCRFILE', format='%iA' % (self.maxlengthancrfile + 2),
-                                    array=numpy.array(self.ancrfile))
-
-        if (self.poisserr == False):
-            coldefs = pyfits.ColDefs([tstartCol, telapseCol, spec_numCol, channelCol,
-                                      ratesCol, stat_errCol, sys_errCol,
-                                      qualityCol, groupingCol, exposureCol,
-                                      backfileCol, respfileCol, ancrfileCol])
-        else:
-            # If POISSERR=True there is no need for stat_err and sys_err
-            coldefs = pyfits.ColDefs([tstartCol, telapseCol, spec_numCol, channelCol,
-                                      ratesCol,
-                                      qualityCol, groupingCol, exposureCol,
-                                      backfileCol, respfileCol, ancrfileCol])
+        for name in ['BACKFILE', 'RESPFILE', 'ANCRFILE']:
+            strings = getattr(self, name.lower())
+            columns.append((pyfits.Column(name=name, format='%iA' % (self._getMaxLength(strings) + 2)),
+                            numpy.array(strings)))
         pass
 
-        newTable = create_from_columns(coldefs)
-
         # Add the keywords required by the OGIP standard:
         # Set POISSERR=F because our errors are NOT poissonian!
         # (anyway, neither Rmfit neither XSPEC actually uses the errors
         # on the background spectrum, BUT rmfit ignores channel with STAT_ERR=0)
-        newTable.header.set('EXTNAME', 'SPECTRUM')
-        newTable.header.set('CORRSCAL', 1.0)
-        newTable.header.set('AREASCAL', 1.0)
-        newTable.header.set('BACKSCAL', 1.0)
-        newTable.header.set('HDUCLASS', 'OGIP')
-        newTable.header.set('HDUCLAS1', 'SPECTRUM')
-        newTable.header.set('HDUCLAS2', self.spectra[0].spectrumType)
-        newTable.header.set('HDUCLAS3', 'RATE')
-        newTable.header.set('HDUCLAS4', 'TYPE:II')
-        newTable.header.set('HDUVERS', '1.2.0')
-        newTable.header.set('TELESCOP', self.spectra[0].telescope)
-        newTable.header.set('INSTRUME', self.spectra[0].instrument)
-
-        if (self.spectra[0].filter != 'unknown'):
-            newTable.header.set('FILTER', self.spectra[0].filter)
-
-        newTable.header.set('CHANTYPE', self.spectra[0].chanType)
-        newTable.header.set('POISSERR', self.poisserr)
-        newTable.header.set('DETCHANS', len(self.channel[0]))
-        newTable.header.set('CREATOR', "dataHandling.py v.%s" % (moduleVersion),
-                            "(G.Vianello, giacomov@slac.stanford.edu)")
+        header = pyfits.Header()
+        header.set('EXTNAME', 'SPECTRUM')
+        header.set('CORRSCAL', 1.0)
+        header.set('AREASCAL', 1.0)
+        header.set('BACKSCAL', 1.0)
+        header.set('HDUCLASS', 'OGIP')
+        header.set('HDUCLAS1', 'SPECTRUM')
+        header.set('HDUCLAS2', self.spectrumType)
+        header.set('HDUCLAS3', 'RATE')
+        header.set('HDUCLAS4', 'TYPE:II')
+        header.set('HDUVERS', '1.2.0')
+        header.set('TELESCOP', self.telescope)
+        header.set('INSTRUME', self.instrument)
+
+        if (self.filter != 'unknown'):
+            header.set('FILTER', self.filter)
+
+        header.set('CHANTYPE', self.chanType)
+        header.set('POISSERR', self.poisserr)
+        header.set('DETCHANS', Nchan)
+        header.set('CREATOR', "dataHandling.py v.%s" % (moduleVersion),
+                   "(G.Vianello, giacomov@slac.stanford.edu)")
 
         for key, value in self.spectrumHeader.iteritems():
-            newTable.header.set(key, value)
+            header.set(key, value)
         pass
 
-        # Write to the required filename
-        newTable.writeto(filename, clobber=clobber)
-
-        # Reopen the file and add the primary keywords, if any
-        f = pyfits.open(filename, "update")
+        # Add the primary keywords, if any
+        primary = pyfits.PrimaryHDU()
         for key, value in self.primaryHeader.iteritems():
-            f[0].header.set(key, value)
+            primary.header.set(key, value)
         pass
-        f.close()
 
-        if (self.ebounds  is not None):
-            pyfits.append(filename, self.ebounds.data, header=self.ebounds.header)
-        pass
+        extensions = filter(lambda x: x is not None, [self.ebounds, self.gti])
+
+        # Write to the required filename
+        _writeTableInChunks(filename, primary, map(lambda x: x[0], columns), map(lambda x: x[1], columns),
+                            header, extensionsAfter=extensions)
 
     pass
 
@@ -3631,87 +4035,61 @@ class Spectra(object):
         # CSPEC file need a TRIGTIME keyword, if it is not provided use the beginning
         # of the first spectrum as default value
         trigTime = min(self.tstart)
-        clobber = False
         for key in kwargs.keys():
             if (key.lower() == "trigtime"):
                 trigTime = kwargs[key]
-            elif (key.lower() == "clobber"):
-                clobber = bool(kwargs[key])
         pass
 
-        Nchan = len(self.rate[0])
+        Nchan = self.nChannels
         vectFormatD = "%sD" % (Nchan)
         vectFormatI = "%sJ" % (Nchan)
 
-        dt = numpy.array(self.tstop) - numpy.array(self.tstart)
+        dt = (self.tstop - self.tstart)[:, numpy.newaxis]
 
-        counts = map(lambda x: x[0] * x[1], zip(numpy.array(self.rate), dt))
+        columns = [(pyfits.Column(name='COUNTS', format=vectFormatI, unit="Counts"), self.rate * dt)]
 
-        countsCol = pyfits.Column(name='COUNTS', format=vectFormatI,
-                                  array=numpy.array(counts),
-                                  unit="Counts")
         if (self.poisserr == False):
-            stat_err = map(lambda x: x[0] * x[1], zip(numpy.array(self.stat_err), dt))
-            stat_errCol = pyfits.Column(name='STAT_ERR', format=vectFormatD,
-                                        array=numpy.array(stat_err))
-            sys_err = map(lambda x: x[0] * x[1], zip(numpy.array(self.sys_err), dt))
-            sys_errCol = pyfits.Column(name='SYS_ERR', format=vectFormatD,
-                                       array=numpy.array(sys_err))
+            columns += [(pyfits.Column(name='STAT_ERR', format=vectFormatD), self.stat_err * dt),
+                        (pyfits.Column(name='SYS_ERR', format=vectFormatD), self.sys_err * dt)]
         pass
-
-        exposureCol = pyfits.Column(name='EXPOSURE', format='D',
-                                    array=numpy.array(self.exposure), unit="s")
+        # (If POISSERR=True there is no need for stat_err and sys_err)
 
         # If there is even just one bad channel in a given spectrum, set its quality as bad
-        qualityCol = pyfits.Column(name='QUALITY', format="I",
-                                   array=numpy.array(map(lambda x: max(x), self.quality)))
-
-        timeCol = pyfits.Column(name='TIME', format='D',
-                                array=numpy.array(self.tstart), unit="s", bzero=trigTime)
-
-        endtimeCol = pyfits.Column(name='ENDTIME', format='D',
-                                   array=numpy.array(self.tstop), unit="s", bzero=trigTime)
-
-        if (self.poisserr == False):
-            coldefs = pyfits.ColDefs([countsCol, stat_errCol, sys_errCol,
-                                      exposureCol, qualityCol, timeCol, endtimeCol])
-        else:
-            # If POISSERR=True there is no need for stat_err and sys_err
-            coldefs = pyfits.ColDefs([countsCol,
-                                      exposureCol, qualityCol, timeCol, endtimeCol])
-        pass
-
-        newTable = create_from_columns(coldefs)
+        columns += [(pyfits.Column(name='EXPOSURE', format='D', unit="s"), self.exposure),
+                    (pyfits.Column(name='QUALITY', format="I"), self.quality.max(axis=1)),
+                    (pyfits.Column(name='TIME', format='D', unit="s", bzero=trigTime), self.tstart),
+                    (pyfits.Column(name='ENDTIME', format='D', unit="s", bzero=trigTime), self.tstop)]
 
         # Add the keywords required by the OGIP standard:
         # Set POISSERR=F because our errors are NOT poissonian!
         # (anyway, neither Rmfit neither XSPEC actually uses the errors
         # on the background spectrum, BUT rmfit ignores channel with STAT_ERR=0)
-        newTable.header.set('EXTNAME', 'SPECTRUM')
-        newTable.header.set('CORRSCAL', 1.0)
-        newTable.header.set('AREASCAL', 1.0)
-        newTable.header.set('BACKSCAL', 1.0)
-        newTable.header.set('HDUCLASS', 'OGIP')
-        newTable.header.set('HDUCLAS1', 'SPECTRUM')
-        newTable.header.set('HDUCLAS2', self.spectra[0].spectrumType)
-        newTable.header.set('HDUCLAS3', 'COUNT')
-        newTable.header.set('HDUCLAS4', 'TYPE:II')
-        newTable.header.set('HDUVERS', '1.0.0')
-        newTable.header.set('TELESCOP', self.spectra[0].telescope)
-        newTable.header.set('INSTRUME', self.spectra[0].instrument)
-
-        if (self.spectra[0].filter != 'unknown'):
-            newTable.header.set('FILTER', self.spectra[0].filter)
-
-        newTable.header.set('CHANTYPE', self.spectra[0].chanType)
-        newTable.header.set('POISSERR', self.poisserr)
-        newTable.header.set('DETCHANS', len(self.channel[0]))
-        newTable.header.set('TRIGTIME', trigTime)
-        newTable.header.set('CREATOR', "dataHandling.py v.%s" % (moduleVersion),
-                            "(G.Vianello, giacomov@slac.stanford.edu)")
+        header = pyfits.Header()
+        header.set('EXTNAME', 'SPECTRUM')
+        header.set('CORRSCAL', 1.0)
+        header.set('AREASCAL', 1.0)
+        header.set('BACKSCAL', 1.0)
+        header.set('HDUCLASS', 'OGIP')
+        header.set('HDUCLAS1', 'SPECTRUM')
+        header.set('HDUCLAS2', self.spectrumType)
+        header.set('HDUCLAS3', 'COUNT')
+        header.set('HDUCLAS4', 'TYPE:II')
+        header.set('HDUVERS', '1.0.0')
+        header.set('TELESCOP', self.telescope)
+        header.set('INSTRUME', self.instrument)
+
+        if (self.filter != 'unknown'):
+            header.set('FILTER', self.filter)
+
+        header.set('CHANTYPE', self.chanType)
+        header.set('POISSERR', self.poisserr)
+        header.set('DETCHANS', Nchan)
+        header.set('TRIGTIME', trigTime)
+        header.set('CREATOR', "dataHandling.py v.%s" % (moduleVersion),
+                   "(G.Vianello, giacomov@slac.stanford.edu)")
 
         for key, value in self.spectrumHeader.iteritems():
-            newTable.header.set(key, value)
+            header.set(key, value)
         pass
 
         # Write to the required filename
@@ -3726,14 +4104,14 @@ class Spectra(object):
             primaryExt.header.set(key, value)
         pass
 
-        if (self.ebounds  is not None):
-            hduList = pyfits.HDUList([primaryExt, self.ebounds, newTable])
-            # pyfits.append(filename,self.ebounds.data,header=self.ebounds.header)
+        if (self.ebounds is not None):
+            extensions = [self.ebounds]
         else:
-            hduList = pyfits.HDUList([primaryExt, newTable])
+            extensions = []
         pass
 
-        hduList.writeto(filename, clobber=clobber)
+        _writeTableInChunks(filename, primaryExt, map(lambda x: x[0], columns), map(lambda x: x[1], columns),
+                            header, extensionsBefore=extensions)
 
     pass
 
@@ -0,0 +1,379 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Binning of events (LLE, TTE or FT1 files) in energy and time, as gtbin does with
+# the PHA1 and PHA2 algorithms, without running it.
+#
+# With gtbin, every call means writing the energy bins with gtbindef, selecting
+# the events with gtselect (for PHA1) and then running gtbin, which reads the whole
+# event file again. Here the arrival times and energies are read once, events are
+# assigned to channels and time bins with a binary search and counted with
+# numpy.bincount, and the exposure of each bin (time in the GTIs, times the livetime
+# fraction in the FT2 file if given) is computed from cumulative sums, so a light
+# curve with many bins costs about as much as one with a single bin.
+
+import numpy
+
+from GtBurst.eventSelection import mergeIntervals, intersectIntervals
+from GtBurst.my_fits_io import pyfits
+from GtBurst.spacecraftFile import SpacecraftFile
+
+# Conversion factors from the unit of the ENERGY column to keV
+_energyUnits = {'kev': 1.0, 'mev': 1e3, 'gev': 1e6}
+
+# Keywords copied from the header of the EVENTS extension to the output files
+_keywordsToCopy = ['TELESCOP', 'INSTRUME', 'EQUINOX', 'RADECSYS', 'DATE-OBS', 'DATE-END',
+                   'TIMEUNIT', 'TIMEZERO', 'TIMESYS', 'TIMEREF', 'CLOCKAPP', 'GPS_OUT',
+                   'MJDREFI', 'MJDREFF', 'OBSERVER', 'OBJECT', 'RA_OBJ', 'DEC_OBJ', 'TRIGTIME']
+
+
+class EventBinner(object):
+    def __init__(self, eventFile, ft2File=None):
+        '''
+        Read arrival times, energies (or PHA channels) and GTIs from the event file.
+        If ft2File is given, the exposure is corrected for the deadtime using the
+        LIVETIME column of the FT2 file, as gtbin does.
+        '''
+
+        with pyfits.open(eventFile, memmap=True) as f:
+
+            events = f['EVENTS']
+            self.header = events.header.copy()
+
+            times = numpy.array(events.data.field("TIME"), dtype=float)
+
+            if ('ENERGY' in events.columns.names):
+
+                unit = events.columns['ENERGY'].unit or 'MeV'
+                self.energies = numpy.array(events.data.field("ENERGY"), dtype=float) * _energyUnits[unit.lower()]
+                self.phaChannels = None
+
+            else:
+
+                # GBM TTE files have the PHA channel instead of the energy
+                column = events.columns.names.index('PHA') + 1
+                firstChannel = int(events.header.get('TLMIN%s' % column, 0))
+                self.phaChannels = numpy.array(events.data.field("PHA"), dtype=int) - firstChannel
+                self.energies = None
+
+            pass
+
+            try:
+                gtiStarts = numpy.array(f['GTI'].data.field("START"), dtype=float)
+                gtiStops = numpy.array(f['GTI'].data.field("STOP"), dtype=float)
+            except KeyError:
+                gtiStarts = numpy.array([self.header['TSTART']], dtype=float)
+                gtiStops = numpy.array([self.header['TSTOP']], dtype=float)
+            pass
+
+        pass
+
+        # Sort the events by time (they usually already are)
+        if (numpy.any(numpy.diff(times) < 0)):
+            order = numpy.argsort(times, kind='mergesort')
+            times = times[order]
+
+            if (self.energies is not None):
+                self.energies = self.energies[order]
+            else:
+                self.phaChannels = self.phaChannels[order]
+            pass
+        pass
+
+        self.times = times
+
+        order = numpy.argsort(gtiStarts, kind='mergesort')
+        self.gtiStarts, self.gtiStops = mergeIntervals(gtiStarts[order], gtiStops[order])
+
+        # GTI time before the start of each GTI
+        self._gtiCumulative = numpy.concatenate([[0], numpy.cumsum(self.gtiStops - self.gtiStarts)])
+
+        if (ft2File is not None):
+            self._readLivetime(ft2File)
+        else:
+            self._rowStarts = None
+        pass
+
+    pass
+
+    def _readLivetime(self, ft2File):
+
+        with SpacecraftFile(ft2File) as ft2:
+
+            rows = ft2.getSlice(self.gtiStarts[0], self.gtiStops[-1])
+
+            self._rowStarts = numpy.array(rows.field("START"), dtype=float)
+            self._rowStops = numpy.array(rows.field("STOP"), dtype=float)
+            livetime = numpy.array(rows.field("LIVETIME"), dtype=float)
+
+        pass
+
+        # Fraction of the time of each FT2 row when the instrument was live
+        durations = self._rowStops - self._rowStarts
+        self._liveFraction = numpy.where(durations > 0, livetime / numpy.where(durations > 0, durations, 1), 0)
+
+        # Livetime within the GTIs before the start of each row
+        rowLivetime = self._liveFraction * (self._getOntimeBefore(self._rowStops) -
+                                            self._getOntimeBefore(self._rowStarts))
+        self._rowCumulative = numpy.concatenate([[0], numpy.cumsum(rowLivetime)])
+
+    pass
+
+    def _getOntimeBefore(self, t):
+        # Time within the GTIs before t
+
+        t = numpy.asarray(t, dtype=float)
+
+        idx = numpy.searchsorted(self.gtiStarts, t, 'right') - 1
+        inRange = (idx >= 0)
+        idx = numpy.maximum(idx, 0)
+
+        partial = numpy.clip(t - self.gtiStarts[idx], 0, self.gtiStops[idx] - self.gtiStarts[idx])
+
+        return numpy.where(inRange, self._gtiCumulative[idx] + partial, 0)
+
+    pass
+
+    def _getLivetimeBefore(self, t):
+        # Livetime within the GTIs before t
+
+        t = numpy.asarray(t, dtype=float)
+
+        idx = numpy.searchsorted(self._rowStarts, t, 'right') - 1
+        inRange = (idx >= 0)
+        idx = numpy.maximum(idx, 0)
+
+        partial = self._liveFraction[idx] * (self._getOntimeBefore(numpy.minimum(t, self._rowStops[idx])) -
+                                             self._getOntimeBefore(self._rowStarts[idx]))
+
+        return numpy.where(inRange, self._rowCumulative[idx] + partial, 0)
+
+    pass
+
+    def getExposure(self, tstarts, tstops):
+        '''
+        Return the exposure for each time bin: the time within the GTIs, corrected for the
+        deadtime if the FT2 file was given
+        '''
+
+        if (self._rowStarts is None):
+            return self._getOntimeBefore(tstops) - self._getOntimeBefore(tstarts)
+        else:
+            return self._getLivetimeBefore(tstops) - self._getLivetimeBefore(tstarts)
+
+    pass
+
+    def getCounts(self, tstarts, tstops, emin, emax):
+        '''
+        Return a (time bins x channels) array with the number of events in the GTIs in each time
+        bin [tstart, tstop) and in each energy channel [emin, emax) (in keV). The time bins must
+        not overlap (as for gtbin), but they do not need to be sorted
+        '''
+
+        tstarts = numpy.array(tstarts, dtype=float).reshape(-1)
+        tstops = numpy.array(tstops, dtype=float).reshape(-1)
+        emin = numpy.asarray(emin, dtype=float)
+        emax = numpy.asarray(emax, dtype=float)
+
+        nBins = tstarts.shape[0]
+        nChannels = emin.shape[0]
+
+        # Only the events between the first start and the last stop
+        first, last = numpy.searchsorted(self.times, [tstarts.min(), tstops.max()])
+        times = self.times[first:last]
+
+        # Energy channel of each event
+        if (self.energies is not None):
+            energies = self.energies[first:last]
+            channels = numpy.searchsorted(emin, energies, 'right') - 1
+            good = (channels >= 0)
+            good[good] = (energies[good] < emax[channels[good]])
+        else:
+            channels = self.phaChannels[first:last]
+            good = (channels >= 0) & (channels < nChannels)
+        pass
+
+        # Only the events within the GTIs
+        gti = numpy.searchsorted(self.gtiStarts, times, 'right') - 1
+        good &= (gti >= 0)
+        good[good] = (times[good] < self.gtiStops[gti[good]])
+
+        # Time bin of each event
+        order = numpy.argsort(tstarts, kind='mergesort')
+        sortedStarts = tstarts[order]
+        sortedStops = tstops[order]
+
+        if (numpy.any(sortedStarts[1:] < sortedStops[:-1])):
+            raise ValueError("The time bins overlap")
+        pass
+
+        bins = numpy.searchsorted(sortedStarts, times, 'right') - 1
+        good &= (bins >= 0)
+        good[good] = (times[good] < sortedStops[bins[good]])
+
+        index = order[bins[good]] * nChannels + channels[good]
+
+        return numpy.bincount(index, minlength=nBins * nChannels).reshape(nBins, nChannels)
+
+    pass
+
+    def _getGTIExtension(self, tstart, tstop):
+
+        # Imported here to avoid a circular import
+        from GtBurst.dataHandling import create_from_columns
+
+        starts, stops = intersectIntervals(self.gtiStarts, self.gtiStops, [tstart], [tstop])
+
+        columns = pyfits.ColDefs([pyfits.Column(name="START", format="D", unit="s", array=starts),
+                                  pyfits.Column(name="STOP", format="D", unit="s", array=stops)])
+        gti = create_from_columns(columns)
+        gti.header.set("EXTNAME", "GTI")
+        gti.header.set("HDUCLASS", "OGIP")
+        gti.header.set("HDUCLAS1", "GTI")
+        gti.header.set("HDUCLAS2", "STANDARD")
+        gti.header.set("TSTART", tstart)
+        gti.header.set("TSTOP", tstop)
+        self._copyKeywords(gti.header)
+
+        return gti
+
+    pass
+
+    def _getEboundsExtension(self, emin, emax):
+
+        from GtBurst.dataHandling import create_from_columns
+
+        nChannels = len(emin)
+
+        columns = pyfits.ColDefs([pyfits.Column(name="CHANNEL", format="J", array=numpy.arange(1, nChannels + 1)),
+                                  pyfits.Column(name="E_MIN", format="E", unit="keV", array=emin),
+                                  pyfits.Column(name="E_MAX", format="E", unit="keV", array=emax)])
+        ebounds = create_from_columns(columns)
+        ebounds.header.set("EXTNAME", "EBOUNDS")
+        ebounds.header.set("TLMIN1", 1)
+        ebounds.header.set("TLMAX1", nChannels)
+        ebounds.header.set("HDUCLASS", "OGIP")
+        ebounds.header.set("HDUCLAS1", "RESPONSE")
+        ebounds.header.set("HDUCLAS2", "EBOUNDS")
+        ebounds.header.set("HDUVERS", "1.2.0")
+        ebounds.header.set("CHANTYPE", "PI")
+        ebounds.header.set("DETCHANS", nChannels)
+        self._copyKeywords(ebounds.header)
+
+        return ebounds
+
+    pass
+
+    def _copyKeywords(self, header):
+
+        for key in _keywordsToCopy:
+            if (key in self.header):
+                header.set(key, self.header[key])
+            pass
+        pass
+
+    pass
+
+    def _setSpectrumKeywords(self, header, nChannels, tstart, tstop, spectrumClass):
+
+        header.set("EXTNAME", "SPECTRUM")
+        header.set("HDUCLASS", "OGIP")
+        header.set("HDUCLAS1", "SPECTRUM")
+        header.set("HDUCLAS2", "TOTAL")
+        header.set("HDUCLAS3", "COUNT")
+        header.set("HDUCLAS4", spectrumClass)
+        header.set("HDUVERS", "1.2.1")
+        header.set("CHANTYPE", "PI")
+        header.set("DETCHANS", nChannels)
+        header.set("POISSERR", True)
+        header.set("AREASCAL", 1.0)
+        header.set("BACKSCAL", 1.0)
+        header.set("CORRSCAL", 1.0)
+        header.set("BACKFILE", "none")
+        header.set("CORRFILE", "none")
+        header.set("RESPFILE", "none")
+        header.set("ANCRFILE", "none")
+        header.set("TSTART", tstart)
+        header.set("TSTOP", tstop)
+        self._copyKeywords(header)
+
+    pass
+
+    def _write(self, spectrum, tstart, tstop, emin, emax, outfile):
+
+        primary = pyfits.PrimaryHDU()
+        self._copyKeywords(primary.header)
+        primary.header.set("TSTART", tstart)
+        primary.header.set("TSTOP", tstop)
+
+        hdulist = pyfits.HDUList([primary, spectrum,
+                                  self._getEboundsExtension(emin, emax),
+                                  self._getGTIExtension(tstart, tstop)])
+        hdulist.writeto(outfile, clobber=True)
+
+    pass
+
+    def writePHA1(self, tstart, tstop, emin, emax, outfile):
+        '''
+        Write a PHA1 file with the counts between tstart and tstop in each energy channel
+        [emin, emax) (in keV)
+        '''
+
+        from GtBurst.dataHandling import create_from_columns
+
+        counts = self.getCounts([tstart], [tstop], emin, emax)[0]
+        exposure = float(self.getExposure(tstart, tstop))
+
+        nChannels = counts.shape[0]
+
+        columns = pyfits.ColDefs([pyfits.Column(name="CHANNEL", format="J", array=numpy.arange(1, nChannels + 1)),
+                                  pyfits.Column(name="COUNTS", format="J", unit="count", array=counts)])
+        spectrum = create_from_columns(columns)
+        spectrum.header.set("TLMIN1", 1)
+        spectrum.header.set("TLMAX1", nChannels)
+        self._setSpectrumKeywords(spectrum.header, nChannels, tstart, tstop, "TYPE:I")
+        spectrum.header.set("EXPOSURE", exposure)
+        spectrum.header.set("TELAPSE", tstop - tstart)
+
+        self._write(spectrum, tstart, tstop, emin, emax, outfile)
+
+    pass
+
+    def writePHA2(self, tstarts, tstops, emin, emax, outfile):
+        '''
+        Write a PHA2 file with one spectrum for each time bin [tstart, tstop), with the counts in
+        each energy channel [emin, emax) (in keV)
+        '''
+
+        from GtBurst.dataHandling import create_from_columns
+
+        tstarts = numpy.array(tstarts, dtype=float).reshape(-1)
+        tstops = numpy.array(tstops, dtype=float).reshape(-1)
+
+        counts = self.getCounts(tstarts, tstops, emin, emax)
+        exposures = self.getExposure(tstarts, tstops)
+
+        nBins, nChannels = counts.shape
+
+        vectorFormat = "%sJ" % (nChannels)
+
+        channels = numpy.zeros((nBins, nChannels), dtype=int) + numpy.arange(1, nChannels + 1)
+
+        columns = pyfits.ColDefs([pyfits.Column(name="SPEC_NUM", format="J", array=numpy.arange(1, nBins + 1)),
+                                  pyfits.Column(name="CHANNEL", format=vectorFormat, array=channels),
+                                  pyfits.Column(name="COUNTS", format=vectorFormat, unit="count", array=counts),
+                                  pyfits.Column(name="EXPOSURE", format="D", unit="s", array=exposures),
+                                  pyfits.Column(name="TSTART", format="D", unit="s", array=tstarts),
+                                  pyfits.Column(name="TSTOP", format="D", unit="s", array=tstops),
+                                  pyfits.Column(name="TELAPSE", format="D", unit="s", array=tstops - tstarts)])
+        spectrum = create_from_columns(columns)
+        spectrum.header.set("TLMIN2", 1)
+        spectrum.header.set("TLMAX2", nChannels)
+        self._setSpectrumKeywords(spectrum.header, nChannels, tstarts.min(), tstops.max(), "TYPE:II")
+
+        self._write(spectrum, tstarts.min(), tstops.max(), emin, emax, outfile)
+
+    pass
+
+
+pass
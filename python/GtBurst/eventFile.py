@@ -0,0 +1,209 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Column-wise access to event files (FT1, LLE, TTE).
+#
+# Event files can be several GB large (extended FT1 files, long TTE files). Opening
+# them with pyfits and then copying whole tables (or sorting columns in place, which
+# with a memory-mapped file means touching and copying every page) makes the memory
+# usage grow with the size of the file. Here files are opened with memmap=True and
+# each column is returned as a view on the mapped file, so only the pages actually
+# read are loaded and the operating system can drop them when needed. Open files are
+# kept in a small per-process cache, so that asking for several columns of the same
+# file does not open it again every time.
+
+import collections
+import os
+
+import numpy
+
+from GtBurst.my_fits_io import pyfits
+
+# Maximum number of files kept open at the same time by each process
+maxOpenFiles = 8
+
+# Number of elements checked at a time when looking whether a column is sorted
+_chunkSize = 1000000
+
+# Open files, from the least to the most recently used, keyed on
+# (absolute path, modification time, size) so that a file rewritten on disk
+# is opened again
+_openFiles = collections.OrderedDict()
+
+# Process owning the open files (a child created with fork must not
+# use the handles of its parent)
+_owner = [os.getpid()]
+
+
+def _getKey(filename):
+    path = os.path.abspath(os.path.expanduser(filename))
+    stat = os.stat(path)
+    return (path, stat.st_mtime, stat.st_size)
+
+
+pass
+
+
+def openFile(filename):
+    '''
+    Return the (memory-mapped) HDU list of the given file, opening it only if it is
+    not already in the cache. The least recently used file is closed when more than
+    maxOpenFiles files are open. Do not close the returned HDU list.
+    '''
+
+    if (os.getpid() != _owner[0]):
+        # We are in a new process: forget the handles of the parent without
+        # closing them
+        _openFiles.clear()
+        _owner[0] = os.getpid()
+    pass
+
+    key = _getKey(filename)
+
+    if (key in _openFiles):
+
+        hdulist = _openFiles.pop(key)
+
+    else:
+
+        # Close older versions of the same file, if any
+        for oldKey in [k for k in _openFiles.keys() if k[0] == key[0]]:
+            _openFiles.pop(oldKey).close()
+        pass
+
+        hdulist = pyfits.open(key[0], memmap=True)
+
+    pass
+
+    _openFiles[key] = hdulist
+
+    while (len(_openFiles) > maxOpenFiles):
+        _, oldest = _openFiles.popitem(last=False)
+        oldest.close()
+    pass
+
+    return hdulist
+
+
+pass
+
+
+def closeAll():
+    '''
+    Close all the files in the cache. Columns already returned stay valid.
+    '''
+
+    while (len(_openFiles) > 0):
+        _, hdulist = _openFiles.popitem()
+        hdulist.close()
+    pass
+
+
+pass
+
+
+def isSorted(array):
+    '''
+    Return True if the array is sorted in ascending order. The check is made in
+    chunks, so it does not need a temporary array as large as the input.
+    '''
+
+    for i in range(0, array.shape[0], _chunkSize):
+        chunk = array[i:i + _chunkSize + 1]
+        if (numpy.any(chunk[1:] < chunk[:-1])):
+            return False
+        pass
+    pass
+
+    return True
+
+
+pass
+
+
+class EventFile(object):
+    def __init__(self, filename, extension='EVENTS'):
+        '''
+        Access to the columns of one extension (by default EVENTS) of an event file.
+        Only the header is read here, columns are read when asked for.
+        '''
+
+        self.filename = filename
+        self.extension = extension
+
+        hdulist = openFile(filename)
+
+        self.primaryHeader = hdulist[0].header
+        self.header = hdulist[extension].header
+        self.nRows = int(self.header['NAXIS2'])
+        self.columnNames = [column.name for column in hdulist[extension].columns]
+
+    pass
+
+    def __len__(self):
+        return self.nRows
+
+    pass
+
+    def _getHDU(self, extension=None):
+        if (extension is None):
+            extension = self.extension
+        pass
+
+        return openFile(self.filename)[extension]
+
+    pass
+
+    def getData(self):
+        '''
+        Return the whole table (a view on the mapped file, not a copy).
+        '''
+
+        return self._getHDU().data
+
+    pass
+
+    def getColumn(self, name, sort=False):
+        '''
+        Return the column as a view on the mapped file. Do not modify it in place.
+        Columns with TSCAL/TZERO are converted and then copied by pyfits.
+
+        If sort is True and the column is not already sorted, return a sorted copy.
+        '''
+
+        if (self.nRows == 0):
+            return numpy.array([])
+        pass
+
+        column = self._getHDU().data.field(name)
+
+        if (sort and not isSorted(column)):
+            column = numpy.sort(column)
+        pass
+
+        return column
+
+    pass
+
+    def getColumns(self, *names):
+        '''
+        Return a list with the requested columns (see getColumn).
+        '''
+
+        return [self.getColumn(name) for name in names]
+
+    pass
+
+    def getGTIs(self, extension='GTI'):
+        '''
+        Return the START and STOP columns of the GTI extension.
+        '''
+
+        data = self._getHDU(extension).data
+
+        return data.field('START'), data.field('STOP')
+
+    pass
+
+
+pass
@@ -0,0 +1,565 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Selection of events for many time intervals in one pass over the FT1 file.
+#
+# In a time-resolved analysis gtmktime and gtselect are run once per interval,
+# and every time they read the whole FT1 and FT2 files and recompute the same
+# cuts. Here the FT1 file is memory-mapped and read once, the cuts which do not
+# depend on the interval (ROI, energy, zenith angle, event class and type) are
+# computed once, as well as the Good Time Intervals defined by the gtmktime
+# filter expression on the FT2 file. Each interval then costs only a binary search
+# in the (sorted) arrival times and the writing of the output file, which has the
+# same structure and data subspace (DSS) keywords as the one from gtselect.
+
+import collections
+import os
+import re
+
+import numpy
+
+from GtBurst.angularDistance import getAngularDistance
+from GtBurst.my_fits_io import pyfits
+from GtBurst.spacecraftFile import SpacecraftFile
+
+# Maximum number of EventSelector kept by each process (each one keeps its FT1 file
+# open, and the masks of the cuts)
+maxSelectors = 2
+
+# Maximum number of sets of cuts whose masks are kept by each EventSelector
+maxMasks = 4
+
+# Selectors already set up, by (event file, FT2 file, gtmktime filter), from the least
+# to the most recently used
+_selectors = collections.OrderedDict()
+
+
+def getEventSelector(eventFile, ft2File=None, gtiFilter=None):
+    '''
+    Return the EventSelector for this event file, FT2 file and gtmktime filter, creating it
+    the first time. The files are read only once in this process, no matter how many
+    intervals are selected. The least recently used selector is closed when more than
+    maxSelectors are set up.
+    '''
+
+    key = (os.path.abspath(eventFile),
+           os.path.abspath(ft2File) if ft2File is not None else None,
+           gtiFilter)
+
+    if (key in _selectors):
+        selector = _selectors.pop(key)
+    else:
+        selector = EventSelector(eventFile, ft2File, gtiFilter)
+    pass
+
+    _selectors[key] = selector
+
+    while (len(_selectors) > maxSelectors):
+        _, oldest = _selectors.popitem(last=False)
+        oldest.close()
+    pass
+
+    return selector
+
+
+pass
+
+
+def _angsep(ra1, dec1, ra2, dec2):
+    return getAngularDistance(ra1, dec1, ra2, dec2)
+
+
+pass
+
+
+class _Columns(dict):
+    '''
+    Namespace for the evaluation of a filter expression: the names are read from the
+    columns of the table the first time they are used
+    '''
+
+    def __init__(self, data):
+        dict.__init__(self, T=True, F=False, ANGSEP=_angsep)
+        self.data = data
+
+    pass
+
+    def __missing__(self, name):
+        self[name] = numpy.array(self.data.field(name))
+        return self[name]
+
+    pass
+
+
+pass
+
+
+def evaluateFilter(expression, data):
+    '''
+    Evaluate a filter expression in the syntax of gtmktime (for example
+    "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T") on the rows of the
+    table data, returning a boolean array
+    '''
+
+    # && and || have a lower precedence than the comparisons, while & and | in Python
+    # have a higher one. Add enough parentheses to keep the meaning of the original
+    # expression (&& binding more than ||, as in C)
+    translated = expression.replace("&&", "\0and\0").replace("||", "\0or\0")
+    translated = translated.replace("(", "(((").replace(")", ")))").replace(",", ")),((")
+    translated = translated.replace("\0and\0", ") & (").replace("\0or\0", ")) | ((")
+    translated = re.sub(r"!(?!=)", "~", translated)
+
+    result = eval("((%s))" % translated, {'__builtins__': {}}, _Columns(data))
+
+    return numpy.broadcast_to(numpy.asarray(result, dtype=bool), (data.shape[0],))
+
+
+pass
+
+
+def mergeIntervals(starts, stops):
+    '''
+    Merge the contiguous (or overlapping) intervals in the sorted lists starts, stops
+    '''
+
+    if (len(starts) == 0):
+        return numpy.array(starts, dtype=float), numpy.array(stops, dtype=float)
+
+    starts = numpy.asarray(starts, dtype=float)
+    stops = numpy.maximum.accumulate(numpy.asarray(stops, dtype=float))
+
+    # A new interval begins where the start is after the end of all the previous ones
+    newInterval = numpy.concatenate([[True], starts[1:] > stops[:-1]])
+    lastOfInterval = numpy.concatenate([newInterval[1:], [True]])
+
+    return starts[newInterval], stops[lastOfInterval]
+
+
+pass
+
+
+def intersectIntervals(starts1, stops1, starts2, stops2):
+    '''
+    Return the intersection of two lists of sorted, non-overlapping intervals
+    '''
+
+    starts = []
+    stops = []
+
+    for start, stop in zip(starts2, stops2):
+        first = numpy.searchsorted(stops1, start, 'right')
+        last = numpy.searchsorted(starts1, stop, 'left')
+
+        thisStarts = numpy.maximum(starts1[first:last], start)
+        thisStops = numpy.minimum(stops1[first:last], stop)
+
+        good = thisStops > thisStarts
+
+        starts.append(thisStarts[good])
+        stops.append(thisStops[good])
+    pass
+
+    if (len(starts) == 0):
+        return numpy.zeros(0), numpy.zeros(0)
+
+    starts = numpy.concatenate(starts)
+    stops = numpy.concatenate(stops)
+
+    order = numpy.argsort(starts, kind='mergesort')
+
+    return starts[order], stops[order]
+
+
+pass
+
+
+def _bitMask(data, column):
+    '''
+    Return the content of a bit-mask column as unsigned integers. In Pass 8 files the bit
+    masks are bit arrays (format 32X), read by pyfits as arrays of booleans with the most
+    significant bit first
+    '''
+
+    values = numpy.asarray(data.field(column))
+
+    if (values.dtype == bool):
+        values = numpy.packbits(values.reshape(values.shape[0], -1), axis=1)
+        values = numpy.concatenate([numpy.zeros((values.shape[0], 4 - values.shape[1]), dtype=numpy.uint8),
+                                    values], axis=1)
+        return values.view('>u4').ravel().astype(numpy.uint32)
+    else:
+        return values.astype(numpy.uint32)
+    pass
+
+
+pass
+
+
+class EventSelector(object):
+    def __init__(self, eventFile, ft2File=None, gtiFilter=None):
+        '''
+        eventFile: the FT1 file
+        ft2File: the spacecraft file (needed only if gtiFilter is given)
+        gtiFilter: filter expression of gtmktime. If None, the Good Time Intervals are the ones
+                   in the FT1 file
+        '''
+
+        self.eventFile = os.path.abspath(eventFile)
+
+        self._fits = pyfits.open(self.eventFile, memmap=True)
+
+        self.events = self._fits['EVENTS']
+        self.gtiIndex = self._fits.index_of('GTI')
+
+        gti = self._fits[self.gtiIndex].data
+        gtiStart, gtiStop = mergeIntervals(*self._sortIntervals(gti.field("START"), gti.field("STOP")))
+
+        if (gtiFilter is not None and gtiStart.shape[0] > 0):
+
+            with SpacecraftFile(ft2File) as spacecraft:
+
+                rows = spacecraft.getSlice(gtiStart[0], gtiStop[-1])
+
+                good = evaluateFilter(gtiFilter, rows)
+
+                ft2Start, ft2Stop = mergeIntervals(numpy.array(rows.field("START"), dtype=float)[good],
+                                                   numpy.array(rows.field("STOP"), dtype=float)[good])
+
+            pass
+
+            gtiStart, gtiStop = intersectIntervals(ft2Start, ft2Stop, gtiStart, gtiStop)
+
+        pass
+
+        self.gtiStart = gtiStart
+        self.gtiStop = gtiStop
+
+        # Arrival times in increasing order
+        self.time = numpy.array(self.events.data.field("TIME"), dtype=float)
+
+        if (numpy.all(numpy.diff(self.time) >= 0)):
+            self.order = None
+        else:
+            self.order = numpy.argsort(self.time, kind='mergesort')
+            self.time = self.time[self.order]
+        pass
+
+        # Cuts already computed, by their parameters, from the least to the most recently used
+        self._masks = collections.OrderedDict()
+
+    pass
+
+    def close(self):
+        '''
+        Close the FT1 file and forget the cuts. The selector cannot be used anymore
+        '''
+
+        self._fits.close()
+        self._masks.clear()
+
+    pass
+
+    @staticmethod
+    def _sortIntervals(starts, stops):
+
+        starts = numpy.array(starts, dtype=float)
+        stops = numpy.array(stops, dtype=float)
+
+        order = numpy.argsort(starts, kind='mergesort')
+
+        return starts[order], stops[order]
+
+    pass
+
+    def setCuts(self, ra, dec, rad, emin, emax, zmax, evclass=None, evtype='INDEF', passTag=None):
+        '''
+        Set the cuts which do not depend on the time interval
+
+        ra, dec, rad: Region Of Interest (INDEF for no cut)
+        emin, emax: energy range (MeV)
+        zmax: maximum zenith angle (180 for no cut)
+        evclass: event class, as for gtselect (bit index for Pass 7, bit mask for Pass 8).
+                 None for no cut
+        evtype: event type (bit mask), or INDEF for no cut
+        passTag: tag of the event class selection in the data subspace keywords (like P8R2).
+                 Pass 8 data only
+        '''
+
+        roi = None if 'INDEF' in map(str, [ra, dec, rad]) else (float(ra), float(dec), float(rad))
+        evtype = None if str(evtype) == 'INDEF' else int(evtype)
+
+        self.cuts = {'roi': roi, 'emin': float(emin), 'emax': float(emax), 'zmax': float(zmax),
+                     'evclass': evclass, 'evtype': evtype, 'passTag': passTag}
+
+        key = (roi, float(emin), float(emax), float(zmax), evclass, evtype)
+
+        if (key in self._masks):
+            self.mask = self._masks.pop(key)
+        else:
+            self.mask = self._computeMask()
+        pass
+
+        self._masks[key] = self.mask
+
+        while (len(self._masks) > maxMasks):
+            self._masks.popitem(last=False)
+        pass
+
+    pass
+
+    def _computeMask(self):
+
+        data = self.events.data
+
+        energy = numpy.asarray(data.field("ENERGY"))
+        mask = (energy >= self.cuts['emin']) & (energy <= self.cuts['emax'])
+
+        if (self.cuts['zmax'] < 180):
+            mask &= numpy.asarray(data.field("ZENITH_ANGLE")) <= self.cuts['zmax']
+        pass
+
+        if (self.cuts['roi'] is not None):
+            ra, dec, rad = self.cuts['roi']
+
+            candidates = numpy.flatnonzero(mask)
+
+            distance = getAngularDistance(ra, dec,
+                                          numpy.asarray(data.field("RA"))[candidates],
+                                          numpy.asarray(data.field("DEC"))[candidates])
+
+            mask[candidates[distance > rad]] = False
+        pass
+
+        if (self.cuts['evclass'] is not None):
+
+            evclass = int(self.cuts['evclass'])
+
+            if (self._isBitArray("EVENT_CLASS")):
+                # Pass 8: evclass is the bit mask
+                bitmask = evclass
+            else:
+                # Pass 7: evclass is the index of the bit
+                bitmask = 1 << evclass
+            pass
+
+            mask &= (_bitMask(data, "EVENT_CLASS") & bitmask) != 0
+
+        pass
+
+        if (self.cuts['evtype'] is not None):
+            mask &= (_bitMask(data, "EVENT_TYPE") & self.cuts['evtype']) != 0
+        pass
+
+        if (self.order is not None):
+            mask = mask[self.order]
+        pass
+
+        return mask
+
+    pass
+
+    def _isBitArray(self, column):
+
+        return self.events.columns[column].format.upper().endswith('X')
+
+    pass
+
+    def select(self, tmin, tmax, outfile):
+        '''
+        Write in outfile the events passing the cuts and arrived in [tmin, tmax] during the
+        Good Time Intervals. Returns the number of events selected.
+        '''
+
+        tmin = float(tmin)
+        tmax = float(tmax)
+
+        gtiStart, gtiStop = intersectIntervals(self.gtiStart, self.gtiStop,
+                                               numpy.array([tmin]), numpy.array([tmax]))
+
+        first = numpy.searchsorted(self.time, tmin, 'left')
+        last = numpy.searchsorted(self.time, tmax, 'right')
+
+        times = self.time[first:last]
+
+        # Index of the GTI containing each event (if any)
+        gtiIdx = numpy.searchsorted(gtiStart, times, 'right') - 1
+
+        inGTI = (gtiIdx >= 0)
+        inGTI[inGTI] = times[inGTI] <= gtiStop[gtiIdx[inGTI]]
+
+        selected = numpy.flatnonzero(self.mask[first:last] & inGTI) + first
+
+        if (self.order is not None):
+            # Keep the order of the input file
+            selected = numpy.sort(self.order[selected])
+        pass
+
+        self._write(selected, gtiStart, gtiStop, tmin, tmax, outfile)
+
+        return selected.shape[0]
+
+    pass
+
+    def selectIntervals(self, intervals, outfiles):
+        '''
+        Select the events for each (tmin, tmax) in intervals, writing them in the corresponding
+        file of outfiles. Returns the list of the number of events selected.
+        '''
+
+        return [self.select(tmin, tmax, outfile) for (tmin, tmax), outfile in zip(intervals, outfiles)]
+
+    pass
+
+    def _write(self, rows, gtiStart, gtiStop, tmin, tmax, outfile):
+
+        # Imported here to avoid a circular import
+        from GtBurst.dataHandling import create_from_columns
+
+        hdulist = pyfits.HDUList()
+
+        for i, hdu in enumerate(self._fits):
+
+            if (hdu is self.events):
+
+                newHdu = pyfits.BinTableHDU(hdu.data[rows], header=hdu.header.copy())
+                self._updateDataSubspace(newHdu.header)
+
+            elif (i == self.gtiIndex):
+
+                columns = pyfits.ColDefs([pyfits.Column(name="START", format="D", unit="s", array=gtiStart),
+                                          pyfits.Column(name="STOP", format="D", unit="s", array=gtiStop)])
+                newHdu = create_from_columns(columns, header=hdu.header.copy())
+
+            else:
+
+                newHdu = hdu.copy()
+
+            pass
+
+            if ('TSTART' in newHdu.header):
+                newHdu.header.set("TSTART", tmin)
+                newHdu.header.set("TSTOP", tmax)
+            pass
+
+            for keyword in ['CHECKSUM', 'DATASUM']:
+                if (keyword in newHdu.header):
+                    del newHdu.header[keyword]
+                pass
+            pass
+
+            hdulist.append(newHdu)
+
+        pass
+
+        hdulist.writeto(outfile, clobber=True)
+
+    pass
+
+    def _updateDataSubspace(self, header):
+        '''
+        Update the data subspace keywords with the cuts applied, as gtselect does
+        '''
+
+        nKeys = int(header.get('NDSKEYS', 0))
+
+        cuts = []
+
+        for i in range(1, nKeys + 1):
+            cuts.append([header.get('DSTYP%i' % i), header.get('DSUNI%i' % i),
+                         header.get('DSVAL%i' % i), header.get('DSREF%i' % i)])
+
+            for prefix in ['DSTYP', 'DSUNI', 'DSVAL', 'DSREF']:
+                if ('%s%i' % (prefix, i) in header):
+                    del header['%s%i' % (prefix, i)]
+                pass
+            pass
+        pass
+
+        def setCut(dstype, unit, value, ref=None):
+
+            for cut in cuts:
+                if (cut[0] == dstype):
+                    cut[1:] = [unit, value, ref]
+                    return
+            pass
+
+            cuts.append([dstype, unit, value, ref])
+
+        pass
+
+        def setRange(dstype, unit, low, high):
+
+            # Intersect with the range already there, if any
+            for cut in cuts:
+                if (cut[0] == dstype and cut[2] is not None and ':' in cut[2]):
+                    oldLow, oldHigh = cut[2].split(':')
+                    low = max(low, float(oldLow)) if oldLow.strip() != '' else low
+                    high = min(high, float(oldHigh)) if oldHigh.strip() != '' else high
+                pass
+            pass
+
+            setCut(dstype, unit, "%s:%s" % (low, high))
+
+        pass
+
+        def setBitMask(column, value):
+
+            # Replace any previous mask on the same column
+            tag = self.cuts['passTag']
+
+            for cut in cuts:
+                if (cut[0] is not None and cut[0].startswith("BIT_MASK(%s," % column)):
+                    if (tag is None and len(cut[0].split(",")) == 3):
+                        tag = cut[0].split(",")[2].rstrip(")")
+                    pass
+                    cut[0] = None
+                pass
+            pass
+
+            if (self._isBitArray(column) and tag is not None):
+                dstype = "BIT_MASK(%s,%i,%s)" % (column, value, tag)
+            else:
+                dstype = "BIT_MASK(%s,%i)" % (column, value)
+            pass
+
+            cuts.append([dstype, "DIMENSIONLESS", "1:1", None])
+
+        pass
+
+        if (self.cuts['roi'] is not None):
+            setCut("POS(RA,DEC)", "deg", "CIRCLE(%s,%s,%s)" % self.cuts['roi'])
+        pass
+
+        setCut("TIME", "s", "TABLE", ":GTI")
+        setRange("ENERGY", "MeV", self.cuts['emin'], self.cuts['emax'])
+
+        if (self.cuts['zmax'] < 180):
+            setRange("ZENITH_ANGLE", "deg", 0, self.cuts['zmax'])
+        pass
+
+        if (self.cuts['evclass'] is not None):
+            setBitMask("EVENT_CLASS", int(self.cuts['evclass']))
+        pass
+
+        if (self.cuts['evtype'] is not None):
+            setBitMask("EVENT_TYPE", self.cuts['evtype'])
+        pass
+
+        cuts = filter(lambda cut: cut[0] is not None, cuts)
+
+        header.set('NDSKEYS', len(cuts))
+
+        for i, (dstype, unit, value, ref) in enumerate(cuts):
+            header.set('DSTYP%i' % (i + 1), dstype)
+            header.set('DSUNI%i' % (i + 1), unit)
+            header.set('DSVAL%i' % (i + 1), value)
+
+            if (ref is not None):
+                header.set('DSREF%i' % (i + 1), ref)
+            pass
+        pass
+
+    pass
+
+
+pass
@@ -4,17 +4,119 @@ import pyLikelihood
 
 from astropy.coordinates.angle_utilities import angular_separation
 import numpy as np
+import multiprocessing
+import tempfile
+import os
+import time
+import scipy.stats
+
+from GtBurst.Configuration import Configuration
+
+# Worker-local FastTSMap instance, used by the processes of the parallel mode
+_worker_ts_map = None
+
+
+def _init_ts_map_worker(spec):
+    """
+    Build the likelihood object of this worker process from the files and the null hypothesis
+    contained in spec (see FastTSMap._get_worker_spec)
+    """
+
+    global _worker_ts_map
+
+    obs = UnbinnedObs(spec['eventFiles'], spec['scFiles'],
+                      expMap=spec['expMap'], expCube=spec['expCube'], irfs=spec['irfs'])
+
+    like = UnbinnedAnalysis(obs, spec['xmlModel'], spec['optimizer'])
+
+    _worker_ts_map = FastTSMap(like, target=spec['target'],
+                               null_hypothesis=(spec['logLike0'], spec['nullhypParameters']))
+
+
+def _ts_map_worker(args):
+    """
+    Compute the TS for a list of (index, ra, dec) in this worker process (see FastTSMap._fit_points)
+
+    :param args: a tuple (points, warm_start)
+    :return: a list of (index, TS, fit time, warm started)
+    """
+
+    points, warm_start = args
+
+    return _worker_ts_map._fit_points(points, warm_start)
+
+
+def _hilbert_order(n_side):
+    """
+    Return the pixels (i, j) of a n_side x n_side grid in the order of the Hilbert curve, if n_side
+    is a power of 2, or in serpentine order (one row left to right, the next one right to left) otherwise.
+    In both cases consecutive pixels are adjacent.
+
+    :return: two arrays (ii, jj)
+    """
+
+    if n_side & (n_side - 1) != 0:
+
+        jj = np.repeat(np.arange(n_side), n_side)
+        ii = np.tile(np.arange(n_side), n_side)
+
+        odd_rows = (jj % 2 == 1)
+        ii[odd_rows] = n_side - 1 - ii[odd_rows]
+
+        return ii, jj
+
+    # Convert the distance along the curve to the coordinates, for all the pixels at once
+    # (standard algorithm, rotating the quadrants at each scale)
+    d = np.arange(n_side * n_side)
+
+    ii = np.zeros_like(d)
+    jj = np.zeros_like(d)
+
+    scale = 1
+
+    while scale < n_side:
+
+        rx = 1 & (d // 2)
+        ry = 1 & (d ^ rx)
+
+        # Rotate
+        flip = (ry == 0) & (rx == 1)
+        ii[flip] = scale - 1 - ii[flip]
+        jj[flip] = scale - 1 - jj[flip]
+
+        swap = (ry == 0)
+        ii[swap], jj[swap] = jj[swap], ii[swap].copy()
+
+        ii += scale * rx
+        jj += scale * ry
+
+        d //= 4
+        scale *= 2
+
+    return ii, jj
 
 
 class FastTSMap(object):
 
-    def __init__(self, pylike_object, target="GRB"):
+    def __init__(self, pylike_object, target="GRB", null_hypothesis=None):
         """
 
         :param pylike_object: a UnbinnedAnalysis.UnbinnedAnalysis object containing a source in the center
+        :param target: name of the source in the center
+        :param null_hypothesis: (logLike0, free parameter values) for the model without the target, if it has
+        been already fitted (this is used by the worker processes of the parallel mode, to avoid fitting again)
         """
 
         self._pylike_object = pylike_object
+        self._target = target
+
+        # Cache of the TS already computed, by (ra, dec), and time spent in the fit
+        # of each point (with a flag telling if it was warm started)
+        self._ts_cache = {}
+        self._fit_cost = {}
+
+        # Free parameters of the first fit with the test source, used when a warm started fit fails
+        self._cold_start_param = None
 
         logLike = self._pylike_object.logLike
 
@@ -29,6 +131,17 @@ class FastTSMap(object):
         self._test_source.setSpectrum(self._target_source.spectrum())
         self._test_source.setName("_test_source")
 
+        if null_hypothesis is not None:
+
+            logLike0, parameters = null_hypothesis
+
+            self._logLike0 = float(logLike0)
+
+            self._nullhyp_best_fit_param = pyLikelihood.DoubleVector(list(parameters))
+            logLike.setFreeParamValues(self._nullhyp_best_fit_param)
+
+            return
+
         # compute the value for the likelihood without the point source
         logLike0 = logLike.value()
 
@@ -44,85 +157,536 @@ class FastTSMap(object):
         # This is a C++ call-by-reference, so self._nullhyp_best_fit_param will be changed
         logLike.getFreeParamValues(self._nullhyp_best_fit_param)
 
-    def search_for_maximum(self, ra_center, dec_center, half_side_deg, n_side, proj_name='AIT', verbose=False):
+    @staticmethod
+    def _get_grid_wcs(ra_center, dec_center, half_side_deg, n_side, proj_name='AIT'):
         """
-
-        :param ra_center: R.A. of the center of the map
-        :param dec_center: Dec of the center of the map
-        :param half_size_deg: half size of the side of the TS map ("radius", even though it is a square)
-        :param n_side: number of points on one side. So n_side = 5 means that a 5x5 map will be computed
-        :param stepsize: size of the step, i.e., distance between two adiancent points in the RA or Dec direction
-        :param proj_name: name for the projection (default: AIT). All projections supported by astropy.wcs can be used
-        :return: (max_ts_position, max_ts): returns a tuple of (RA, Dec) and the maximum TS found
+        Create the WCS object of the grid (see search_for_maximum for the parameters)
         """
 
         # Figure out step size
         stepsize = half_side_deg / (n_side / 2.0)
 
-        # Create WCS object which will allow us to make the grid
-
         wcs = pywcs.WCS(naxis=2)
         wcs.wcs.crpix = [n_side / 2. + 0.5, n_side / 2. + 0.5]
         wcs.wcs.cdelt = [-stepsize, stepsize]
         wcs.wcs.crval = [float(ra_center), float(dec_center)]
         wcs.wcs.ctype = ["RA---%s" % proj_name, "DEC--%s" % proj_name]
 
-        # Compute all TSs
+        return wcs
+
+    def search_for_maximum(self, ra_center, dec_center, half_side_deg, n_side, proj_name='AIT', verbose=False,
+                           ncpus=1):
+        """
+
+        :param ra_center: R.A. of the center of the map
+        :param dec_center: Dec of the center of the map
+        :param half_size_deg: half size of the side of the TS map ("radius", even though it is a square)
+        :param n_side: number of points on one side. So n_side = 5 means that a 5x5 map will be computed
+        :param stepsize: size of the step, i.e., distance between two adiancent points in the RA or Dec direction
+        :param proj_name: name for the projection (default: AIT). All projections supported by astropy.wcs can be used
+        :param ncpus: number of processes to use (default: 1). See compute_ts_map
+        :return: (max_ts_position, max_ts): returns a tuple of (RA, Dec) and the maximum TS found
+        """
+
+        ts_map, wcs = self.compute_ts_map(ra_center, dec_center, half_side_deg, n_side, proj_name, verbose, ncpus)
 
         # These two will hold maximum and position of the maximum
         # Init them with worse case scenario
         max_ts = 0.0
         max_ts_position = (ra_center, dec_center)
-        ang_sep = []
 
         for i in range(n_side):
 
             for j in range(n_side):
 
-                this_ra, this_dec = wcs.wcs_pix2world(i, j, 0)
+                if ts_map[j, i] >= max_ts:
+
+                    # New maximum
+                    max_ts = ts_map[j, i]
+                    max_ts_position = tuple(wcs.wcs_pix2world(i, j, 0))
+
+        # Find maximum and its position
+        return max_ts_position, max_ts
+
+    def compute_ts_map(self, ra_center, dec_center, half_side_deg, n_side, proj_name='AIT', verbose=False,
+                       ncpus=1, warm_start=False):
+        """
+        Compute the TS on all the points of the grid (see search_for_maximum for the other parameters).
+
+        If ncpus > 1 the points are distributed among ncpus processes. Each process builds its own
+        UnbinnedAnalysis object from the files of this one and the null hypothesis fit done in the
+        constructor. The fit of each point starts from the spectrum of the test source found in the
+        previous point computed by the same process, so the TS can change slightly (within the
+        tolerance of the fit) with the number of processes. Points already computed by this object
+        are not computed again.
+
+        With warm_start=True the pixels are visited along a Hilbert curve (or in serpentine order, if
+        n_side is not a power of 2), and the fit of each pixel starts from the best fit parameters of the
+        previous one instead of the null hypothesis, which is much closer to the minimum. If a fit fails,
+        it is done again starting from the null hypothesis. The time spent in each fit can be obtained
+        with get_fit_cost_map.
+
+        :param ncpus: number of processes to use (default: 1, None for maxNumberOfCPUs from the configuration)
+        :param warm_start: whether to start each fit from the previous pixel (default: False)
+        :return: (ts_map, wcs): a n_side x n_side array with the TS (ts_map[j, i] is the TS for the
+        pixel (i, j), as in a FITS image) and the astropy.wcs.WCS object of the grid
+        """
 
-                this_TS = self._calc_one_TS(float(this_ra), float(this_dec))
+        wcs = self._get_grid_wcs(ra_center, dec_center, half_side_deg, n_side, proj_name)
 
-                if this_TS >= max_ts:
+        # All the points of the grid, row by row
+        ii, jj = [x.flatten() for x in np.meshgrid(np.arange(n_side), np.arange(n_side))]
 
-                    # New maximum
-                    max_ts = this_TS
-                    max_ts_position = (this_ra, this_dec)
+        if warm_start:
+
+            # Visit the pixels so that consecutive ones are adjacent
+            ii, jj = _hilbert_order(n_side)
+
+        ras, decs = wcs.wcs_pix2world(ii, jj, 0)
 
-                if verbose:
+        pool, ncpus, spec = self._open_pool(ncpus, n_side * n_side)
 
-                    ang_sep.append(np.rad2deg(angular_separation(*np.deg2rad([ra_center, dec_center,
-                                                                              this_ra, this_dec]))))
+        try:
 
-                    print("(%.3f, %.3f) -> %.2f (%.3f deg away from center)" % (this_ra, this_dec,
-                                                                                this_TS, ang_sep[-1]))
+            ts_image = np.zeros((n_side, n_side))
+
+            ts_image[jj, ii] = self._evaluate_points(ras, decs, pool, ncpus, warm_start)
+
+        finally:
+
+            self._close_pool(pool, spec)
 
         if verbose:
+
+            ts = ts_image[jj, ii]
+
+            ang_sep = np.rad2deg(angular_separation(*np.deg2rad([ra_center, dec_center, ras, decs])))
+
+            for k in range(n_side * n_side):
+
+                print("(%.3f, %.3f) -> %.2f (%.3f deg away from center)" % (ras[k], decs[k],
+                                                                            ts[k], ang_sep[k]))
+
             print("Total number of points: %i" % len(ang_sep))
             print("Minimum ang. dist: %s deg" % min(ang_sep))
             print("Maximum ang. dist: %s deg" % max(ang_sep))
 
-        # Find maximum and its position
-        return max_ts_position, max_ts
+        return ts_image, wcs
+
+    def get_fit_cost_map(self, ra_center, dec_center, half_side_deg, n_side, proj_name='AIT'):
+        """
+        Return the time spent in the fit of each pixel of a grid already computed with compute_ts_map
+        (see search_for_maximum for the parameters). The optimizers of pyLikelihood do not expose the number
+        of iterations, so the time spent in find_min_only is used to measure the amount of work.
+
+        :return: (fit_time, warm_started, wcs): two n_side x n_side arrays with the time spent in the fit (s)
+        and a flag telling whether the fit was warm started (nan and False for pixels not computed), and the
+        astropy.wcs.WCS object of the grid
+        """
+
+        wcs = self._get_grid_wcs(ra_center, dec_center, half_side_deg, n_side, proj_name)
+
+        ii, jj = [x.flatten() for x in np.meshgrid(np.arange(n_side), np.arange(n_side))]
+        ras, decs = wcs.wcs_pix2world(ii, jj, 0)
+
+        costs = [self._fit_cost.get(self._get_cache_key(ra, dec), (np.nan, False)) for ra, dec in zip(ras, decs)]
+
+        fit_time = np.array([c[0] for c in costs], dtype=float).reshape((n_side, n_side))
+        warm_started = np.array([c[1] for c in costs], dtype=bool).reshape((n_side, n_side))
+
+        return fit_time, warm_started, wcs
+
+    def localize(self, ra_center, dec_center, half_side_deg, resolution_deg, n_coarse=8, delta_ts=9.21,
+                 proj_name='AIT', ncpus=1):
+        """
+        Find the position of the maximum TS with a coarse-to-fine adaptive grid. The TS is first
+        computed on a n_coarse x n_coarse grid, then the pixels with TS within delta_ts of the
+        maximum found so far are divided in 2 x 2, and so on until the size of the pixels is at most
+        resolution_deg. The points are the same as in a uniform grid with that resolution (which is
+        returned as the last element), but only the ones close to the maximum are computed.
+
+        :param ra_center: R.A. of the center of the map
+        :param dec_center: Dec of the center of the map
+        :param half_side_deg: half size of the side of the region to search
+        :param resolution_deg: the maximum size of the pixels of the final grid
+        :param n_coarse: number of points on one side of the initial grid (default: 8)
+        :param delta_ts: pixels with a TS lower than the maximum by more than this are not refined
+        (default: 9.21, i.e., the 99% c.l. for 2 parameters, so that the 68% and 90% contours are resolved)
+        :param proj_name: name for the projection (default: AIT)
+        :param ncpus: number of processes to use (default: 1, None for maxNumberOfCPUs from the configuration)
+        :return: (max_ts_position, max_ts, samples, contours, wcs): the (RA, Dec) and the value of the maximum
+        TS, a (n, 3) array with (RA, Dec, TS) for all the points computed, a dictionary with the 68% and 90%
+        error contours (as (m, 2) arrays of (RA, Dec), keys 0.68 and 0.90) and the WCS of the final grid
+        """
+
+        # Number of times the grid is refined, and uniform grid with the final resolution
+        n_levels = max(0, int(np.ceil(np.log2(2.0 * half_side_deg / (n_coarse * resolution_deg)))))
+        n_side = n_coarse * 2**n_levels
+
+        wcs = self._get_grid_wcs(ra_center, dec_center, half_side_deg, n_side, proj_name)
+
+        # The points of each level are the pixels of the final grid at a distance of stride pixels,
+        # and the ones of the next level are the 3 x 3 around each refined point, at half the stride
+        stride = 2**n_levels
+
+        coarse = np.arange(n_coarse) * stride + stride // 2
+        candidates = set((i, j) for i in coarse for j in coarse)
+
+        ts_image = np.zeros((n_side, n_side)) + np.nan
+
+        pool, ncpus, spec = self._open_pool(ncpus, len(candidates))
+
+        try:
+
+            while True:
+
+                ii, jj = np.array(sorted(candidates)).T
+
+                ras, decs = wcs.wcs_pix2world(ii, jj, 0)
+
+                ts_image[jj, ii] = self._evaluate_points(ras, decs, pool, ncpus)
+
+                if stride == 1:
+
+                    break
+
+                max_ts = np.nanmax(ts_image)
+
+                to_refine = (ts_image[jj, ii] >= max_ts - delta_ts)
+
+                stride //= 2
+
+                candidates = set()
+
+                for i, j in zip(ii[to_refine], jj[to_refine]):
+
+                    for di in (-stride, 0, stride):
+
+                        for dj in (-stride, 0, stride):
+
+                            if 0 <= i + di < n_side and 0 <= j + dj < n_side:
+
+                                candidates.add((i + di, j + dj))
+
+        finally:
+
+            self._close_pool(pool, spec)
+
+        computed_j, computed_i = np.nonzero(np.isfinite(ts_image))
+
+        ras, decs = wcs.wcs_pix2world(computed_i, computed_j, 0)
+        samples = np.vstack([ras, decs, ts_image[computed_j, computed_i]]).T
+
+        best_j, best_i = np.unravel_index(np.nanargmax(ts_image), ts_image.shape)
+
+        max_ts = ts_image[best_j, best_i]
+        max_ts_position = tuple(wcs.wcs_pix2world(best_i, best_j, 0))
+
+        contours = {}
+
+        for cl in [0.68, 0.90]:
+
+            contours[cl] = self._get_contour(ts_image, wcs, best_i, best_j, scipy.stats.chi2.ppf(cl, 2))
+
+        return max_ts_position, max_ts, samples, contours, wcs
+
+    @staticmethod
+    def _get_contour(ts_image, wcs, best_i, best_j, delta_ts):
+        """
+        Return the boundary of the region with TS within delta_ts of the maximum (in pixel
+        (best_i, best_j)), as a (m, 2) array of (RA, Dec) sorted by position angle
+        """
+
+        # Pixels never computed are outside of the region by construction
+        max_ts = ts_image[best_j, best_i]
+        inside = np.isfinite(ts_image)
+        inside[inside] = ts_image[inside] >= max_ts - delta_ts
+
+        padded = np.pad(inside, 1, 'constant', constant_values=False)
+
+        boundary = inside & ~(padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:])
+
+        jj, ii = np.nonzero(boundary)
+
+        order = np.argsort(np.arctan2(jj - best_j, ii - best_i))
+
+        ras, decs = wcs.wcs_pix2world(ii[order], jj[order], 0)
+
+        return np.vstack([ras, decs]).T
+
+    @staticmethod
+    def _get_cache_key(ra, dec):
+
+        return round(float(ra), 8), round(float(dec), 8)
+
+    def _evaluate_points(self, ras, decs, pool=None, ncpus=1, warm_start=False):
+        """
+        Compute the TS in the given positions, using the cache for the ones already computed
+
+        :param pool: pool of ncpus processes returned by _open_pool (None to compute the TS in this process)
+        :param warm_start: start each fit from the previous point (see _fit_points)
+        :return: an array with the TS
+        """
+
+        keys = [self._get_cache_key(ra, dec) for ra, dec in zip(ras, decs)]
+
+        points = [(k, float(ras[k]), float(decs[k])) for k in range(len(keys)) if keys[k] not in self._ts_cache]
+
+        if pool is not None and len(points) > 1:
+
+            n_chunks = min(4 * ncpus, len(points))
+
+            if warm_start:
+
+                # Consecutive points in each chunk, so that each worker can start from the previous one
+                bounds = np.linspace(0, len(points), n_chunks + 1).astype(int)
+                chunks = [points[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+            else:
+
+                # Interleave the points among the chunks, so that the points close to the source
+                # (which take longer to fit) are spread among the workers
+                chunks = [points[c::n_chunks] for c in range(n_chunks)]
+
+            results = pool.imap_unordered(_ts_map_worker, [(chunk, warm_start) for chunk in chunks])
+
+        else:
+
+            results = [self._fit_points(points, warm_start)]
+
+        for chunk_results in results:
+
+            for k, this_TS, fit_time, warm_started in chunk_results:
+
+                self._ts_cache[keys[k]] = this_TS
+                self._fit_cost[keys[k]] = (fit_time, warm_started)
+
+        return np.array([self._ts_cache[key] for key in keys])
+
+    def _fit_points(self, points, warm_start=False):
+        """
+        Compute the TS for a list of (index, ra, dec). If warm_start is True, the fit of each point starts
+        from the best fit parameters of the previous one
+
+        :return: a list of (index, TS, fit time, warm started)
+        """
+
+        results = []
+        parameters = None
+
+        for k, ra, dec in points:
+
+            this_TS, this_parameters, fit_time, warm_started = self._fit_one_point(ra, dec, parameters)
+
+            if warm_start:
+
+                parameters = this_parameters
+
+            results.append((k, this_TS, fit_time, warm_started))
+
+        return results
+
+    def _open_pool(self, ncpus, n_points):
+        """
+        Start the pool of worker processes, if ncpus (None for maxNumberOfCPUs from the configuration)
+        is larger than one. Each process builds its own UnbinnedAnalysis object from the files of this
+        one and the null hypothesis fit done in the constructor.
+
+        :return: (pool, ncpus, spec). pool and spec must be given to _close_pool. pool is None if only
+        this process is used
+        """
+
+        if ncpus is None:
+
+            ncpus = int(float(Configuration().get('maxNumberOfCPUs')))
+
+        ncpus = max(1, min(ncpus, multiprocessing.cpu_count(), n_points))
+
+        if ncpus == 1:
+
+            return None, 1, None
+
+        spec = self._get_worker_spec()
+
+        try:
+
+            pool = multiprocessing.Pool(ncpus, _init_ts_map_worker, (spec,))
+
+        except:
+
+            os.remove(spec['xmlModel'])
+
+            raise
+
+        return pool, ncpus, spec
+
+    @staticmethod
+    def _close_pool(pool, spec):
+
+        if pool is not None:
+
+            try:
+
+                pool.close()
+                pool.join()
+
+            finally:
+
+                os.remove(spec['xmlModel'])
+
+    def _get_worker_spec(self):
+        """
+        Return what the worker processes need to build their own copy of the likelihood (the
+        pyLikelihood objects cannot be pickled). The model, including the target, is saved to a
+        temporary XML file (in the system temporary directory) which must be removed by the caller
+        """
+
+        logLike = self._pylike_object.logLike
+        observation = self._pylike_object.observation
+
+        xml_handle, xml_model = tempfile.mkstemp(suffix='_fast_ts_map.xml')
+        os.close(xml_handle)
+
+        # Save the model with the target and the best fit parameters of the null hypothesis for the
+        # other sources
+        logLike.addSource(self._target_source)
+        self._pylike_object.writeXml(xml_model)
+        logLike.deleteSource(self._target)
+
+        logLike.setFreeParamValues(self._nullhyp_best_fit_param)
+
+        spec = {'eventFiles': list(observation.eventFiles),
+                'scFiles': list(observation.scFiles),
+                'expMap': observation.expMap,
+                'expCube': observation.expCube,
+                'irfs': observation.irfs,
+                'xmlModel': os.path.abspath(xml_model),
+                'optimizer': self._pylike_object.optimizer,
+                'target': self._target,
+                'logLike0': self._logLike0,
+                'nullhypParameters': list(self._nullhyp_best_fit_param)}
+
+        return spec
 
     def _calc_one_TS(self, ra, dec):
 
+        return self._fit_one_point(ra, dec)[0]
+
+    def _fit_one_point(self, ra, dec, start_parameters=None):
+        """
+        Compute the TS for a test source in (ra, dec)
+
+        :param start_parameters: (default: None) free parameters (including the ones of the test source) to start
+        the fit from. If None, or if the fit does not converge, the fit starts from the null hypothesis
+        :return: (TS, best fit free parameters, time spent in the fit, whether the fit was warm started)
+        """
+
         logLike = self._pylike_object.logLike
 
         # The first False says not to recompute the exposure, the second one avoid verbosity
         self._test_source.setDir(ra, dec, False, False)
         logLike.addSource(self._test_source)
 
-        # This is the fastest way to minimize -logL if we don't care about errors
+        if self._cold_start_param is None:
+
+            self._cold_start_param = pyLikelihood.DoubleVector()
+            logLike.getFreeParamValues(self._cold_start_param)
+
+        start = time.time()
+
+        warm_started = start_parameters is not None
+
+        if warm_started:
+
+            logLike.setFreeParamValues(pyLikelihood.DoubleVector(list(start_parameters)))
+
+            try:
+
+                self._pylike_object.optObject.find_min_only(0, 1e-5)
+
+                TS = 2.0 * (logLike.value() - self._logLike0)
 
-        self._pylike_object.optObject.find_min_only(0, 1e-5)
+            except RuntimeError:
+
+                TS = np.nan
+
+            # A fit ending worse than the null hypothesis (where the test source has no flux) has
+            # diverged, start again from the null hypothesis
+            if not np.isfinite(TS) or TS < -0.01:
+
+                warm_started = False
+
+                logLike.setFreeParamValues(self._cold_start_param)
+
+        if not warm_started:
+
+            # This is the fastest way to minimize -logL if we don't care about errors
+
+            self._pylike_object.optObject.find_min_only(0, 1e-5)
+
+            TS = 2.0 * (logLike.value() - self._logLike0)
+
+        fit_time = time.time() - start
+
+        parameters = pyLikelihood.DoubleVector()
+        logLike.getFreeParamValues(parameters)
 
-        logLike1 = logLike.value()
-        TS = 2.0 * (logLike1 - self._logLike0)
         logLike.deleteSource("_test_source")
 
         # Restore the parameters of the model without the source to their best fit
         # values
         logLike.setFreeParamValues(self._nullhyp_best_fit_param)
 
-        return TS
+        return TS, list(parameters), fit_time, warm_started
+
+
+if __name__ == "__main__":
+
+    import time
+
+    class _SyntheticTSMap(FastTSMap):
+        """
+        A FastTSMap with a gaussian TS surface instead of the likelihood, to count the number of fits
+        """
+
+        def __init__(self, ra, dec, sigma, peak_ts):
+
+            self._ts_cache = {}
+            self._fit_cost = {}
+            self._peak = (ra, dec, sigma, peak_ts)
+            self.n_calls = 0
+
+        def _fit_one_point(self, ra, dec, start_parameters=None):
+
+            self.n_calls += 1
+
+            ra0, dec0, sigma, peak_ts = self._peak
+
+            distance = np.rad2deg(angular_separation(*np.deg2rad([ra0, dec0, ra, dec])))
+
+            return peak_ts * np.exp(-0.5 * (distance / sigma)**2), None, 0.0, False
+
+    # A source 0.3 deg away from the center of a 2 deg x 2 deg region, localized at 0.01 deg
+    half_side = 1.0
+    resolution = 0.01
+
+    adaptive = _SyntheticTSMap(150.3, 20.2, 0.15, 80.0)
+
+    start = time.time()
+    position, max_ts, samples, contours, wcs = adaptive.localize(150.0, 20.0, half_side, resolution, ncpus=1)
+    adaptive_time = time.time() - start
+
+    # Same final grid as the adaptive one (crpix is n_side / 2 + 0.5)
+    n_side = int(round(2 * wcs.wcs.crpix[0] - 1))
+
+    uniform = _SyntheticTSMap(150.3, 20.2, 0.15, 80.0)
+
+    start = time.time()
+    uniform_position, uniform_max_ts = uniform.search_for_maximum(150.0, 20.0, half_side, n_side, ncpus=1)
+    uniform_time = time.time() - start
+
+    print("Uniform grid %i x %i: %6i fits (%.2f s), maximum TS %.2f at (%.3f, %.3f)" %
+          (n_side, n_side, uniform.n_calls, uniform_time, uniform_max_ts, uniform_position[0], uniform_position[1]))
+    print("Adaptive grid:         %6i fits (%.2f s), maximum TS %.2f at (%.3f, %.3f)" %
+          (adaptive.n_calls, adaptive_time, max_ts, position[0], position[1]))
+    print("Number of points in the 68%% and 90%% contours: %i, %i" % (len(contours[0.68]), len(contours[0.90])))
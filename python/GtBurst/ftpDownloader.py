@@ -0,0 +1,342 @@
+#Download of many files from a FTP server, with parallel connections and resume
+#Author: giacomov@slac.stanford.edu
+#
+#Files are downloaded by a small pool of threads, each one with its own FTP session.
+#Each file is written to a .part file, and it is renamed to its final name only after
+#its size has been checked against the size on the server. When the connection drops,
+#the thread reconnects (waiting longer and longer between trials, up to maxTrials) and
+#restarts the transfer where it stopped (REST), instead of from the beginning.
+#Files already present in the destination directory with the right size are not
+#downloaded again.
+#The threads never touch the GUI: the progress is collected here and given to the
+#callback by the thread which called download(), so Tk widgets can be updated from it.
+
+import os
+import threading
+import time
+import ftplib
+import Queue
+
+from GtBurst import downloadCallback
+from GtBurst.GtBurstException import GtBurstException
+
+#Default number of simultaneous connections to the server
+defaultConnections            = 4
+
+def parseAddress(address):
+  #Split addresses like ftp://server[:port]/path/to/dir (or server[:port]/path/to/dir)
+  #in server, port and directory
+  if(address.find("ftp://")==0):
+    address                   = address[len("ftp://"):]
+  pass
+
+  serverAddress               = address.split("/")[0]
+  directory                   = "/"+"/".join(address.split("/")[1:])
+
+  if(serverAddress.find(":")>=0):
+    serverAddress,port        = serverAddress.split(":")
+    port                      = int(port)
+  else:
+    port                      = ftplib.FTP_PORT
+  pass
+
+  return serverAddress,port,directory
+pass
+
+class FTPDownloader(object):
+  def __init__(self,serverAddress,directory,port=ftplib.FTP_PORT,nConnections=defaultConnections,
+                    maxTrials=10,timeout=60,backoff=1.0,maxBackoff=60.0,refreshTime=0.2):
+    self.serverAddress        = serverAddress
+    self.directory            = directory
+    self.port                 = port
+    self.nConnections         = max(1,int(nConnections))
+    self.maxTrials            = max(1,int(maxTrials))
+    self.timeout              = timeout
+    #Waiting time before the n-th trial is backoff * 2^(n-1), but at most maxBackoff
+    self.backoff              = backoff
+    self.maxBackoff           = maxBackoff
+    #Interval between calls to the progress callback
+    self.refreshTime          = refreshTime
+
+    self.lock                 = threading.Lock()
+  pass
+
+  def login(self):
+    #Open a new session, without changing directory
+    ftp                       = ftplib.FTP()
+    try:
+      ftp.connect(self.serverAddress,self.port,self.timeout)
+      ftp.login("anonymous",'')
+    except ftplib.all_errors as error:
+      closeSession(ftp)
+      raise GtBurstException(11,"Error when connecting: %s" %(_describe(error)))
+    pass
+
+    return ftp
+  pass
+
+  def connect(self):
+    #Open a new session in the remote directory
+    ftp                       = self.login()
+    ftp.cwd(self.directory)
+    return ftp
+  pass
+
+  def getRemoteSize(self,ftp,filename):
+    #Size in bytes of the remote file, or None if the server does not tell
+    try:
+      ftp.voidcmd("TYPE I")
+      size                    = ftp.size(filename)
+      if(size is not None):
+        return int(size)
+    except ftplib.error_perm:
+      #SIZE not supported, use the listing
+      pass
+    pass
+
+    g                         = downloadCallback.get_size()
+    try:
+      ftp.dir(filename,g)
+      return int(g.size)
+    except (ftplib.error_perm,AttributeError,IndexError,ValueError):
+      return None
+    pass
+  pass
+
+  def download(self,filenames,localDirectory,progressCallback=None,session=None):
+    '''
+    Download the files in the remote directory to localDirectory, and return the list of
+    local files. The progress is given to progressCallback(bytesDone,bytesTotal,filesDone,filesTotal).
+    If session is given, it must be an open session in the remote directory (it will be closed).
+    '''
+    if(session is None):
+      session                 = self.connect()
+    pass
+
+    #Remote sizes, used for the progress, for the check of the downloaded files,
+    #and to skip files already downloaded. Threads will retry if we fail here
+    self._sizes               = {}
+    for filename in filenames:
+      try:
+        self._sizes[filename] = self.getRemoteSize(session,filename)
+      except ftplib.all_errors:
+        self._sizes[filename] = None
+        closeSession(session)
+        session               = None
+        break
+      pass
+    pass
+
+    self._progress            = {}
+    self._completed           = []
+    self._errors              = []
+    self._abort               = threading.Event()
+
+    jobs                      = Queue.Queue()
+    localFilenames            = []
+    nSkipped                  = 0
+
+    for filename in filenames:
+      localFilename           = os.path.join(localDirectory,filename)
+      localFilenames.append(localFilename)
+      size                    = self._sizes.get(filename)
+
+      if(size is not None and os.path.exists(localFilename) and os.path.getsize(localFilename)==size):
+        print("%s is already complete, skipping it" %(filename))
+        self._progress[filename] = size
+        nSkipped             += 1
+      else:
+        jobs.put(filename)
+      pass
+    pass
+
+    nWorkers                  = min(self.nConnections,jobs.qsize())
+    workers                   = []
+    for i in range(nWorkers):
+      #The first thread reuses the session we already have
+      thisSession             = session if i==0 else None
+      workers.append(threading.Thread(target=self._worker,args=(jobs,localDirectory,thisSession)))
+      workers[-1].daemon      = True
+      workers[-1].start()
+    pass
+
+    if(nWorkers==0):
+      closeSession(session)
+    pass
+
+    nReported                 = 0
+    while(True):
+      alive                   = [w for w in workers if w.is_alive()]
+
+      with self.lock:
+        newlyCompleted        = self._completed[nReported:]
+        nReported             = len(self._completed)
+        bytesDone             = sum(self._progress.values())
+        bytesTotal            = sum(filter(lambda x:x is not None,self._sizes.values()))
+      pass
+
+      for filename in newlyCompleted:
+        print("Retrieved %s" %(filename))
+      pass
+
+      if(progressCallback is not None):
+        progressCallback(bytesDone,max(bytesTotal,bytesDone),nSkipped+nReported,len(filenames))
+      pass
+
+      if(len(alive)==0):
+        break
+      pass
+
+      time.sleep(self.refreshTime)
+    pass
+
+    if(len(self._errors)>0):
+      filename,error          = self._errors[0]
+      raise error
+    pass
+
+    return localFilenames
+  pass
+
+  def _worker(self,jobs,localDirectory,ftp):
+    while(not self._abort.is_set()):
+      try:
+        filename              = jobs.get_nowait()
+      except Queue.Empty:
+        break
+      pass
+
+      try:
+        ftp                   = self._downloadFile(ftp,filename,localDirectory)
+      except Exception as error:
+        with self.lock:
+          self._errors.append((filename,error))
+        pass
+        #Stop the other threads after their current file
+        self._abort.set()
+        break
+      pass
+
+      with self.lock:
+        self._completed.append(filename)
+      pass
+    pass
+
+    closeSession(ftp)
+  pass
+
+  def _downloadFile(self,ftp,filename,localDirectory):
+    #Download one file, resuming the transfer after errors. Return the session
+    #(which might be a new one)
+    localFilename             = os.path.join(localDirectory,filename)
+    partFilename              = localFilename+".part"
+    size                      = self._sizes.get(filename)
+
+    for trial in range(self.maxTrials):
+      if(trial > 0):
+        waitTime              = min(self.backoff * 2**(trial-1),self.maxBackoff)
+        print("\nConnection lost while downloading %s! Trying to reconnect in %s s..." %(filename,waitTime))
+        time.sleep(waitTime)
+      pass
+
+      offset                  = 0
+      if(os.path.exists(partFilename)):
+        offset                = os.path.getsize(partFilename)
+      pass
+
+      if(size is not None and offset > size):
+        #Something went wrong in a previous download: start again
+        offset                = 0
+      pass
+
+      try:
+        f                     = open(partFilename,'ab' if offset > 0 else 'wb')
+      except:
+        raise IOError("Could not open file %s for writing. Do you have write permission on %s?" %(partFilename,localDirectory))
+      pass
+
+      with self.lock:
+        self._progress[filename] = offset
+      pass
+
+      def writer(data):
+        f.write(data)
+        with self.lock:
+          self._progress[filename] += len(data)
+        pass
+      pass
+
+      try:
+        if(ftp is None):
+          ftp                 = self.connect()
+        pass
+
+        if(size is None):
+          size                = self.getRemoteSize(ftp,filename)
+          with self.lock:
+            self._sizes[filename] = size
+          pass
+        pass
+
+        ftp.retrbinary('RETR %s' %(filename),writer,rest=(offset if offset > 0 else None))
+        f.close()
+
+        localSize             = os.path.getsize(partFilename)
+        if(size is not None and localSize!=size):
+          if(localSize > size):
+            os.remove(partFilename)
+          pass
+          raise IOError("%s: downloaded %s bytes instead of %s" %(filename,localSize,size))
+        pass
+
+        if(os.path.exists(localFilename)):
+          os.remove(localFilename)
+        pass
+        os.rename(partFilename,localFilename)
+
+        return ftp
+
+      except ftplib.error_perm as error:
+        f.close()
+        closeSession(ftp)
+        ftp                   = None
+        if(offset==0):
+          #Permanent error (file not found, permission denied...)
+          raise error
+        pass
+        #Maybe the server does not support REST: start again from the beginning
+        os.remove(partFilename)
+
+      except (GtBurstException,)+ftplib.all_errors as error:
+        #Connection lost, or incomplete file
+        f.close()
+        closeSession(ftp)
+        ftp                   = None
+      pass
+    pass
+
+    raise GtBurstException(11,"Could not download %s after %s trials (%s). Check your internet connection, then retry" %(filename,self.maxTrials,_describe(error)))
+  pass
+pass
+
+def _describe(error):
+  #Some errors (for example EOFError when the connection drops) have no message
+  return str(error) or error.__class__.__name__
+pass
+
+def closeSession(ftp):
+  #Close a session, if open, ignoring errors (the connection might be already lost)
+  if(ftp is None):
+    return
+  pass
+
+  try:
+    ftp.quit()
+  except:
+    try:
+      ftp.close()
+    except:
+      pass
+    pass
+  pass
+pass
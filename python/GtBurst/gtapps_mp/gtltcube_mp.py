@@ -7,8 +7,8 @@ from GtBurst.my_fits_io import pyfits
 
 import tempfile
 import os
+import shutil
 import subprocess
-import sys
 
 from gt_apps import filter,expCube
 
@@ -17,10 +17,11 @@ def ltcube(times):
     '''This is the atomic function that actually runs in the seperate
     threads.  It takes a list as input where the first element is
     tmin, second is tmax, third is spacecraft file, fourth is the
-    event file and fifth is the zmax parameter.  It first uses
-    gtselect with wide open cuts to divide up the event file then it
-    runs gtltcube on that event file.  The temporary event file is
-    deleted automatically.  The function returns the name of the
+    event file, fifth is the zmax parameter and sixth is a dictionary
+    with the other gtltcube parameters (or None for the defaults).  It
+    first uses gtselect with wide open cuts to divide up the event file
+    then it runs gtltcube on that event file.  The temporary event file
+    is deleted automatically.  The function returns the name of the
     created ltcube file which can be combined with other files and/or
     deleted later.'''
 
@@ -44,14 +45,23 @@ def ltcube(times):
     filter.run(print_command=True)
 
     osfilehandle,outfilename = tempfile.mkstemp(suffix=".fits")
+    os.close(osfilehandle)
+
+    if times[5] is not None:
+        #Same parameters as the single process run
+        for key, value in times[5].items():
+            expCube[key] = value
+    else:
+        expCube['dcostheta'] = 0.025
+        expCube['binsz'] = 1
+        expCube['phibins'] = 0
+    
     expCube['evfile'] = evfile.name
     expCube['scfile'] =  times[2]
     expCube['outfile'] = outfilename
-    expCube['dcostheta'] = 0.025
-    expCube['binsz'] = 1
-    expCube['phibins'] = 0
     expCube['zmax'] = times[4]
     expCube['chatter'] = 0
+    expCube['clobber'] = 'yes'
     expCube.run(print_command=True)
     print "Completed calculation on interval {} to {}".format(times[0],times[1])
     return outfilename
@@ -66,15 +76,16 @@ def ltsum(filenames, Outfile, SaveTemp):
     and operates gtltsum on them.'''
 
     if len(filenames) <= 1:
-        subprocess.call(["cp", filenames[0], Outfile])
+        shutil.copyfile(filenames[0], Outfile)
     else:
         fileListfile = tempfile.NamedTemporaryFile()
         for filename in filenames:
             fileListfile.file.write(filename + "\n")
         fileListfile.flush()
-        subprocess.call(["gtltsum", 
-                         "infile1=@"+fileListfile.name, 
-                         "outfile="+Outfile])
+        subprocess.check_call(["gtltsum", 
+                               "infile1=@"+fileListfile.name, 
+                               "outfile="+Outfile,
+                               "clobber=yes"])
 
     if SaveTemp:
         print "Did not delete the following temporary files:"
@@ -85,81 +96,103 @@ def ltsum(filenames, Outfile, SaveTemp):
             os.remove(filename)
 
 
-def gtltcube_mp(bins, SCFile, EVFile, OutFile, SaveTemp, zmax):
+def good_time_before(t, gti_start, gti_stop):
 
-    '''This functions looks at a spacecraft file and splits the time into
-    chunks that match the bin edges in the spacecraft file.  It then
-    submits jobs based upon those start and stop times.  This is to
-    make the resulting files as close to the original as possible.
-    Note that this assumes you are using the full time period in your
-    spacecraft file.'''
+    '''This function returns the total good time before each of the times
+    in t, for sorted and non-overlapping GTIs.'''
+
+    t = np.asarray(t, dtype=float)
+    lengths = gti_stop - gti_start
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+
+    #Number of GTIs starting before t: all of them but the last one are
+    #completely before t
+    n = np.searchsorted(gti_start, t, side='right')
+    last = np.maximum(n - 1, 0)
+    partial = np.clip(t - gti_start[last], 0, lengths[last])
+
+    return np.where(n > 0, cumulative[last] + partial, 0.0)
+
+
+def split_on_good_time(bins, scstart, scstop, tstart, tstop, gti_start, gti_stop):
+
+    '''This function splits the interval tstart-tstop in (at most) bins
+    slices with about the same amount of good time.  The slices start
+    and stop on the boundaries of the rows of the spacecraft file, so
+    that each row is entirely contained in one slice, and the sum of the
+    livetime cubes of the slices is the same as the livetime cube of the
+    whole interval.  Slices without good times are dropped.  Returns
+    two arrays with the starts and the stops of the slices.'''
+
+    order = np.argsort(gti_start)
+    gti_start = np.asarray(gti_start, dtype=float)[order]
+    gti_stop = np.asarray(gti_stop, dtype=float)[order]
+
+    #Possible boundaries
+    edges = np.union1d(scstart, scstop)
+    edges = edges[(edges > tstart) & (edges < tstop)]
+
+    good_start, good_stop = good_time_before([tstart, tstop], gti_start, gti_stop)
+    total = good_stop - good_start
 
-    verbose = False
+    if total <= 0:
+        return np.array([]), np.array([])
+
+    #First boundary after each fraction of the total good time
+    targets = good_start + total * np.arange(1, bins) / float(bins)
+    idx = np.searchsorted(good_time_before(edges, gti_start, gti_stop), targets)
+    boundaries = np.unique(edges[idx[idx < edges.shape[0]]])
+
+    starts = np.concatenate([[tstart], boundaries])
+    stops = np.concatenate([boundaries, [tstop]])
+
+    good = (good_time_before(stops, gti_start, gti_stop) -
+            good_time_before(starts, gti_start, gti_stop)) > 0
+
+    return starts[good], stops[good]
+
+
+def gtltcube_mp(bins, SCFile, EVFile, OutFile, SaveTemp, zmax, ltcubePars=None):
+
+    '''This functions looks at a spacecraft file and splits the time into
+    chunks that match the bin edges in the spacecraft file, with about
+    the same amount of good time in each chunk.  It then submits jobs
+    based upon those start and stop times and sums the resulting
+    livetime cubes.  Since no row of the spacecraft file is split, the
+    result is the same as running gtltcube on the whole event file.
+    ltcubePars is a dictionary with the other parameters for gtltcube
+    (dcostheta, binsz...), which should be the same as the ones of the
+    single process run.'''
 
     print "Opening event file to determine start and stop times..."
-    evfile = pyfits.open(EVFile, mode='readonly')
-    tstart = evfile[0].header['TSTART']
-    tstop = evfile[0].header['TSTOP']
-    gti_data = evfile[2].data
+    with pyfits.open(EVFile, mode='readonly') as evfile:
+        tstart = evfile[0].header['TSTART']
+        tstop = evfile[0].header['TSTOP']
+        gti_start = np.array(evfile['GTI'].data.field('START'), dtype=float)
+        gti_stop = np.array(evfile['GTI'].data.field('STOP'), dtype=float)
 
     print "Opening SC file to determine break points..."
-    hdulist = pyfits.open(SCFile, mode='readonly')
-    scdata = hdulist[1].data
-    hdulist.close()
-    scstart = scdata.field('START')
-    scstop = scdata.field('STOP')
-
-    time_filter = (tstart <= scstart) & (scstop <= tstop)
+    with pyfits.open(SCFile, mode='readonly') as hdulist:
+        scstart = np.array(hdulist[1].data.field('START'), dtype=float)
+        scstop = np.array(hdulist[1].data.field('STOP'), dtype=float)
 
-    redo = True
     print "Checking for good times in the event file..."
-    while redo:
-        redo = False
-        scstartssplit = np.array_split(scstart[time_filter],int(bins))
-        scstopssplit = np.array_split(scstop[time_filter],bins) 
-    
-        #Explicitly set the first and last point to the values in the evfile header
-        scstartssplit[0][0] = tstart
-        scstopssplit[-1][-1] = tstop
-
-        starts = [st[0] for st in scstartssplit]
-        stops = [st[-1] for st in scstopssplit]
-
-        for interval in zip(starts,stops):
-            if verbose: print "Looking at interval",interval[0],"to",interval[1]
-            good_times = False
-            #grrrr.  some bug in pyfits doesn't let me do this the python way...
-            for gti_i in range(len(gti_data)):
-                if(not good_times):
-                    if verbose: print "   Checking gti",gti_data[gti_i]['START'],"to",gti_data[gti_i]['STOP']
-                    gti_starts = interval[0] <= gti_data[gti_i]['START'] <= interval[1]
-                    gti_stops = interval[0] < gti_data[gti_i]['STOP'] <= interval[1]
-                    if verbose: print "   Does this gti start inside this interval? ", gti_starts
-                    if verbose: print "   Does this gti stop inside this interval? ", gti_stops
-                    good_times = gti_starts or gti_stops
-                    if verbose: print
-        
-            if verbose: print "  Are there good times inside this interval? ", good_times
-            if not good_times:
-                redo = True
-            if verbose: print
-
-        if redo:
-            if bins <= 1:
-                print "No good time intervals found.  Bailing..."
-                sys.exit(1)
-            print "One (or more) of the slices doesn't have a GTI."
-            print "Reducing the number of threads from ",bins,"to",bins-1
-            bins -= 1
-        
-    scfiles = [SCFile for st in scstartssplit]
-    evfiles = [EVFile for st in scstartssplit]
-    zmaxes =  [zmax for st in scstartssplit]
-
-    pool = Pool(processes=bins)      
-    times = np.array([starts,stops,scfiles,evfiles,zmaxes])
+    starts, stops = split_on_good_time(int(bins), scstart, scstop, tstart, tstop,
+                                       gti_start, gti_stop)
+
+    if len(starts) == 0:
+        raise RuntimeError("No good time intervals found in %s" % EVFile)
+
+    bins = len(starts)
+
+    times = [(st, sp, SCFile, EVFile, zmax, ltcubePars) for st, sp in zip(starts, stops)]
     print "Spawning {} jobs...".format(bins)
-    tempfilenames = pool.map(ltcube,times.transpose())
+    pool = Pool(processes=bins)
+    try:
+        tempfilenames = pool.map(ltcube,times)
+    finally:
+        pool.close()
+        pool.join()
     print "Combining temporary files..."
     ltsum(tempfilenames, OutFile, SaveTemp)
 
@@ -2,12 +2,10 @@
 
 from multiprocessing import Pool
 import os
-import subprocess
 
 from GtBurst.my_fits_io import pyfits
 
 import sys
-import pickle
 import argparse
 
 import pyLikelihood as pyLike
@@ -20,9 +18,8 @@ which was written by J. Chiang """
 
 def resolve_fits_files(infile):
 
-    '''This function returns a properly formatted infile loaation since
-    most of the analysis is done in subdirectories and the actual support
-    files are in ../.'''
+    '''This function returns a properly formatted infile location, i.e.
+    a list of files if infile is a list (@file).'''
 
     infile = os.path.abspath(infile)
     foo = infile.strip('@')
@@ -50,139 +47,61 @@ def getPointSource(like):
     test_src.setSpectrum(pl)
     return test_src
 
-def runLikelihood(subdir, tpl_file):
-
-    '''This runction runs the likelihood code on a set of pixels in a
-    subdirectory.  It takes as input the subdirectory to work on and a
-    template counts map.  It reads it's configuration from a pickle
-    file (par.pck) that should be located in the subdirectory and the
-    pixel locations from another pickle file (pixel.pck).  It then
-    creats an overall likelihood object, does a quick global fit and
-    then loops over the pixels.  At each pixel, it creats a test
-    source, fits that source, calculates the TS of the source and
-    writes the results to an output file in the subdirectory called
-    ts_results.dat.'''
-
-
-    parfile = open("par.pck", "r")
-    pars = pickle.load(parfile)
-
-    pixelfile = open("pixel.pck", "r")
-    pixels = pickle.load(pixelfile)
-
-    pixel_coords = PixelCoords(tpl_file)
-
-    obs = UnbinnedObs(resolve_fits_files(pars['evfile']),
-                      resolve_fits_files(pars['scfile']),
-                      expMap='../'+pars['expmap'],
-                      expCube='../'+pars['expcube'],
-                      irfs=pars['irfs'])
-
-    like = UnbinnedAnalysis(obs, '../'+pars['srcmdl'], pars['optimizer'])
-    like.setFitTolType(pars['toltype'])
-    like.optimize(0)
-    loglike0 = like()
-    test_src = getPointSource(like)
-    target_name = 'testSource'
-    test_src.setName(target_name)
-    outfile = 'ts_results.dat'
-    finished_pixels = []
-    if os.path.isfile(outfile):
-        input = open(outfile, 'r')
-        for line in input:
-            tokens = line.strip().split()
-            ij = int(tokens[0]), int(tokens[1])
-            finished_pixels.append(ij)
-        input.close()
-    output = open(outfile, 'a')
-    for indx, i, j in pixels:
-        if (i, j) in finished_pixels:
-            continue
-        ra, dec = pixel_coords(i, j)
-        test_src.setDir(ra, dec, True, False)
-        like.addSource(test_src)
-        like.optimize(0)
-        ts = -2*(like() - loglike0)
-        output.write("%3i  %3i %.3f  %.3f  %.5f\n" % (i, j, ra, dec, ts))
-        output.flush()
-        like.deleteSource(target_name)
-    output.close()
-
-def launchJobs(SQ):
-
-    '''This function actually launches a job.  It takes the configuration
-    square as input, creates the subdirectories, writes the par and
-    pixel pickle files and then launches the code again with the
-    subdirectory and template file as options with the number of jobs
-    requested.'''
-
-    subdir = SQ[0]
-    pars = SQ[1]
-    pixels = SQ[2]
-    tpl_file = SQ[3]
-
-    os.chdir(subdir)
-    
-    parfile = open("par.pck", "w")
-    pickle.dump(pars, parfile)
-    parfile.close()
-
-    pixelfile = open("pixel.pck", "w")
-    pickle.dump(pixels, pixelfile)
-    pixelfile.close()
-
-    if sys.argv[0][0] == '/':
-        this_arg = sys.argv[0]
-    else:
-        this_arg = '../'+sys.argv[0]
-    
-    command = ("python %s runLike %s %s"
-               % (this_arg,subdir, tpl_file))
-    sys.stdout.write("partition %s: " % subdir)
-    print command
-    sys.stdout.flush()
-    subprocess.call(command.split())
-    
-def _readlines(fileobj, comment=''):
-
-    '''This function read a line in the saved data in the
-    subdirectories.'''
-
-    lines = []
-    for line in fileobj:
-        if ((comment != '' and line.find(comment) == 0)
-            or len(line.strip()) == 0):
-            continue
-        if comment != '':
-            line = line.split(comment)[0].strip()
-        lines.append(line)
-    return lines
-
-def read_data(file, delimiter=None, nskip=0, ncols=0, nmax=0, comment="#"):
-
-    '''This function reads in the saved data in the subdirectories.'''
-
-    data = _readlines(open(file), comment=comment)
-    if nmax == 0:
-        nmax = len(data) - nskip
-    data = data[nskip:nskip+nmax]
-    if ncols == 0:
-        ncols = len(data[0].split(delimiter))
-    columns = []
-    for i in range(ncols):
-        columns.append([])
-    for line in data:
-        datum = line.split(delimiter)
-        for i in range(ncols):
-            if (datum[i].find('.') == -1 and datum[i].find('e') == -1
-                and datum[i].find('E') == -1):
-#                columns[i].append(int(datum[i]))
-                columns[i].append(float(datum[i]))
-            else:
-                columns[i].append(float(datum[i]))
-    for i in range(ncols):
-        columns[i] = num.array(columns[i])
-    return tuple(columns)
+class TsMapEngine(object):
+
+    '''This class holds the likelihood object used to compute the TS
+    in each pixel.  The observation (event file, exposure map and
+    livetime cube) is read and the global fit is done only once, in
+    the constructor.  The worker processes are forked after the engine
+    is created, so each of them gets its own copy without reading the
+    files again.'''
+
+    def __init__(self, pars, tpl_file):
+
+        self.pixel_coords = PixelCoords(tpl_file)
+
+        obs = UnbinnedObs(resolve_fits_files(pars['evfile']),
+                          resolve_fits_files(pars['scfile']),
+                          expMap=pars['expmap'],
+                          expCube=pars['expcube'],
+                          irfs=pars['irfs'])
+
+        self.like = UnbinnedAnalysis(obs, pars['srcmdl'], pars['optimizer'])
+        self.like.setFitTolType(pars['toltype'])
+        self.like.optimize(0)
+        self.loglike0 = self.like()
+
+        # Best fit parameters without the test source, restored after each
+        # pixel so that the result does not depend on the order of the pixels
+        self.null_pars = pyLike.DoubleVector()
+        self.like.logLike.getFreeParamValues(self.null_pars)
+
+        self.target_name = 'testSource'
+        self.test_src = getPointSource(self.like)
+        self.test_src.setName(self.target_name)
+
+    def __call__(self, i, j):
+
+        '''Fit the test source in pixel (i, j) and return its TS.'''
+
+        ra, dec = self.pixel_coords(i, j)
+        self.test_src.setDir(ra, dec, True, False)
+        self.like.addSource(self.test_src)
+        self.like.optimize(0)
+        ts = -2*(self.like() - self.loglike0)
+        self.like.deleteSource(self.target_name)
+        self.like.logLike.setFreeParamValues(self.null_pars)
+        return ts
+
+# Engine of this process (inherited by the worker processes)
+_engine = None
+
+def _computePixelTs(pixel):
+
+    '''Compute the TS for a pixel (i, j) with the engine of this process.'''
+
+    i, j = pixel
+    return i, j, _engine(i, j)
 
 class PixelCoords():
 
@@ -203,7 +122,7 @@ class BatchTsMap(object):
 
     def __init__(self, pars, num_queues=40, tpl_file='cmap_tpl.fits',savetmp=True):
 
-        '''Initializes the object and sets up the number of queues and stores
+        '''Initializes the object and sets up the number of processes and stores
         all the parameters.'''
 
         self.num_queues = num_queues
@@ -213,8 +132,8 @@ class BatchTsMap(object):
 
         self._createTemplate()
         self.pixel_coords = PixelCoords(self.tpl_file)
-        self.njobs = min(self.num_queues, self.pixel_coords.ny)
-        self.subdirs = [("%03i" % i) for i in range(self.njobs)]
+        self.njobs = max(1, min(self.num_queues,
+                                self.pixel_coords.nx*self.pixel_coords.ny))
         
     def _createTemplate(self):
         pars = self.pars
@@ -226,78 +145,79 @@ class BatchTsMap(object):
                   xref=pars['xref'], yref=pars['yref'], axisrot=0,
                   proj=pars['proj'], chatter=0, clobber='yes')
 
-    def getPixels(self, partition):
+    def getPixels(self):
         nx, ny = self.pixel_coords.nx, self.pixel_coords.ny
-        nsize = nx*ny/self.njobs
-        if nx*ny % self.njobs != 0:
-            nsize += 1
-        pixels = []
-        indx = 0
-        for i in range(nx):
-            for j in range(ny):
-                if indx >= nsize*partition and indx < nsize*(partition + 1):
-                    pixels.append((indx, i, j))
-                indx += 1
-        return pixels
-
-    def prepareSubdirs(self):
-        for subdir in self.subdirs:
-            try:
-                os.mkdir(subdir)
-            except OSError:
-                pass
-
-    def merge_results(self):
+        return [(i, j) for i in range(nx) for j in range(ny)]
+
+    def run(self):
+
+        '''Compute the TS in all the pixels and return the map as an array
+        (with the same shape as the template, i.e. ts[j][i] for the pixel
+        (i, j)).  The pixels are handed out one at the time to the worker
+        processes, so that a slow fit does not hold up the others.'''
+
+        global _engine
+
+        pixels = self.getPixels()
+        ts = num.zeros((self.pixel_coords.ny, self.pixel_coords.nx), dtype=num.float)
+
+        print("Computing the TS in %i pixels using %i processes" % (len(pixels), self.njobs))
+        sys.stdout.flush()
+
+        _engine = TsMapEngine(self.pars, self.tpl_file)
+
+        try:
+            if self.njobs > 1:
+                pool = Pool(processes=self.njobs)
+                try:
+                    for i, j, value in pool.imap_unordered(_computePixelTs, pixels):
+                        ts[j][i] = value
+                finally:
+                    pool.close()
+                    pool.join()
+            else:
+                for i, j, value in map(_computePixelTs, pixels):
+                    ts[j][i] = value
+        finally:
+            _engine = None
+
+        return ts
+
+    def writeMap(self, ts):
         tsmap = pyfits.open(self.tpl_file)
-        tsmap[0].data = num.zeros(tsmap[0].data.shape, dtype=num.float)
-        for subdir in self.subdirs:
-            result_file = os.path.join(subdir, 'ts_results.dat')
-            try:
-                ii, jj, ra, dec, ts_vals = read_data(result_file)
-            except:
-                continue
-            for i, j, ts in zip(ii, jj, ts_vals):
-                tsmap[0].data[int(j)][int(i)] = ts
+        tsmap[0].data = ts
         tsmap.writeto(self.pars['outfile'], clobber=True)
+        tsmap.close()
                 
     def remove_tempfiles(self):
 
-        for subdir in self.subdirs:
-            os.remove(subdir+"/par.pck")
-            os.remove(subdir+"/pixel.pck")
-            os.remove(subdir+"/ts_results.dat")
-            os.removedirs(subdir)
         os.remove(self.tpl_file)
 
 
 def gttsmap_mp(pars,num_queues,savetmp):
 
     tsmap = BatchTsMap(pars,num_queues,savetmp=savetmp)
-    tsmap.prepareSubdirs()
     
-    SQ = [(subdir,tsmap.pars,tsmap.getPixels(int(subdir)),tsmap.tpl_file) for subdir in tsmap.subdirs]
-    pool = Pool(processes=tsmap.njobs)
-    pool.map(launchJobs,SQ)
+    tsmap.writeMap(tsmap.run())
     
-    tsmap.merge_results()
     if not savetmp:
         print "Deleting temporary files."
         tsmap.remove_tempfiles()
 
+    return pars['outfile']
+
 
 def cli():
 
-    helpString = "Generates a TS Map by running seperate pixels on seperate threads.\
+    helpString = "Generates a TS Map by running seperate pixels on seperate processes.\
                   It creates a template counts map to determine the location of the \
                   pixels and the calculates the TS of a test source at each pixel on \
-                  that map.  It then merges the results at the end.  The map is divided\
-                  into seperate regions (called 000,001,002...) depending on the number\
-                  of jobs the user requests.  It creates subdirectories for each region\
-                  and operates on them within the subdirectory.  For more details on\
+                  that map.  The observation is read and the global fit is done only\
+                  once, then the pixels are distributed one at the time among the\
+                  number of jobs the user requests, and the results are written to\
+                  a single FITS image.  For more details on\
                   the parameters see the gttsmap help file.  NOTE:  ONLY DOES AN \
-                  UNBINNED ANALYSIS.  NOTE2:  Any files referenced in the model XML file\
-                  must be referenced by abosolute and not relative directories \
-                  (ie. not ./ or ../)"
+                  UNBINNED ANALYSIS."
 
     parser = argparse.ArgumentParser(description=helpString)
     parser.add_argument("nxpix", type=int, help="Number of pixels along x-axis.  See gttsmap help for more information.")
@@ -320,7 +240,7 @@ def cli():
     parser.add_argument("proj", help="Coordinate projection. See gttsmap help for more information.")
     parser.add_argument("outfile", help="Output file name.")
 
-    parser.add_argument("--savetmp", default = False, help="Save the temporary files (default is False).")
+    parser.add_argument("--savetmp", default = False, help="Save the template counts map (default is False).")
     
     args = parser.parse_args()
 
@@ -346,29 +266,6 @@ def cli():
 
     gttsmap_mp(pars,num_queues=args.jobs,savetmp=args.savetmp)
 
-def cli_runLike():
-
-    helpString = "This is a helper function that runs each individual partition.\
-                  Don't use it manually."
-
-    parser = argparse.ArgumentParser(description=helpString)
-    parser.add_argument("runLike", help="Flag to indicate that you are running on a partition.")
-    parser.add_argument("subdir", help="Subdirectory to run under.")
-    parser.add_argument("tpl_file", help="File name of the template CMAP.")
-
-    args = parser.parse_args()
-
-    runLikelihood(args.subdir, "../"+args.tpl_file)
-
-
-
 if __name__ == '__main__':
 
-    if len(sys.argv) > 1:
-        if sys.argv[1] == 'runLike':
-            cli_runLike()
-        else:
-            cli()
-    else:
-        cli()
-
+    cli()
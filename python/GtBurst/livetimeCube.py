@@ -0,0 +1,696 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Livetime cubes assembled from the contributions of the single rows of the FT2 file.
+#
+# The livetime cube produced by gtltcube is a sum over the rows of the FT2 file:
+# each row adds its livetime, multiplied by the fraction of the row inside the
+# Good Time Intervals, to the cos(theta) bin of every HEALPix pixel (theta being
+# the angle between the pixel and the LAT boresight at that time). The
+# distribution of one row over the (pixel, cos(theta)) bins does not depend on the
+# interval being analyzed, so in a time-resolved analysis it can be computed once
+# and the cube for any interval assembled as a weighted sum.
+#
+# LivetimeCube computes the cube directly from the FT2 file, without running
+# gtltcube (which for intervals of a few seconds takes much longer to start than
+# to do the actual work). IncrementalLivetimeCube takes the format of the cube
+# (HEALPix resolution and ordering, cos(theta) binning) from a cube made by
+# gtltcube for one of the intervals (the template), which is also used to verify
+# that the assembled cube matches the one from gtltcube.
+#
+# Usage as a validation harness against a reference cube made by gtltcube:
+#
+#   python livetimeCube.py [ft2file] [eventfile] [reference cube] [zmax]
+
+import collections
+import math
+import os
+import sys
+import time
+
+import numpy
+
+from GtBurst.eventSelection import mergeIntervals
+from GtBurst.my_fits_io import pyfits
+from GtBurst.spacecraftFile import SpacecraftFile
+
+# Maximum relative difference between the assembled cube and the template
+tolerance = 1e-4
+
+# Maximum number of IncrementalLivetimeCube kept by each process
+maxIncrementalCubes = 2
+
+# Maximum memory (bytes) used by each cube to keep the distribution of the FT2 rows
+# over the bins. Rows beyond this are computed again when needed
+maxRowBinsMemory = 128 * 1024 * 1024
+
+# Cubes already set up, by (FT2 file, zenith cut), from the least to the most
+# recently used
+_incrementalCubes = collections.OrderedDict()
+
+
+def getIncrementalCube(ft2File, zmax=180.0):
+    '''
+    Return the IncrementalLivetimeCube for this FT2 file and zenith cut, creating it
+    the first time. The rows of the FT2 file are processed only once in this process
+    (as long as they fit in maxRowBinsMemory), no matter how many intervals are
+    analyzed. Only the maxIncrementalCubes most recently used cubes are kept.
+    '''
+
+    key = (os.path.abspath(ft2File), float(zmax))
+
+    if (key in _incrementalCubes):
+        cube = _incrementalCubes.pop(key)
+    else:
+        cube = IncrementalLivetimeCube(ft2File, zmax)
+    pass
+
+    _incrementalCubes[key] = cube
+
+    while (len(_incrementalCubes) > maxIncrementalCubes):
+        _incrementalCubes.popitem(last=False)
+    pass
+
+    return cube
+
+
+pass
+
+
+def _toCartesian(ra, dec):
+    ra = numpy.deg2rad(numpy.asarray(ra, dtype=float))
+    dec = numpy.deg2rad(numpy.asarray(dec, dtype=float))
+
+    return numpy.vstack([numpy.cos(dec) * numpy.cos(ra),
+                         numpy.cos(dec) * numpy.sin(ra),
+                         numpy.sin(dec)]).T
+
+
+pass
+
+
+def healpixDirections(nside, nested):
+    '''
+    Return the unit vectors (npix, 3) of the centers of the HEALPix pixels, in the NESTED
+    or RING ordering scheme (theta is the colatitude and phi the R.A.)
+    '''
+
+    nside = int(nside)
+    npface = nside * nside
+    npix = 12 * npface
+    pix = numpy.arange(npix, dtype=numpy.int64)
+
+    if (nested):
+
+        face = pix // npface
+        ipf = pix % npface
+
+        # De-interleave the bits of the index within the face
+        ix = numpy.zeros(npix, dtype=numpy.int64)
+        iy = numpy.zeros(npix, dtype=numpy.int64)
+
+        for bit in range(int(numpy.log2(nside)) + 1):
+            ix |= ((ipf >> (2 * bit)) & 1) << bit
+            iy |= ((ipf >> (2 * bit + 1)) & 1) << bit
+        pass
+
+        jrll = numpy.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+        jpll = numpy.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+
+        jr = jrll[face] * nside - ix - iy - 1
+
+        nr = numpy.where(jr < nside, jr, numpy.where(jr > 3 * nside, 4 * nside - jr, nside))
+
+        z = numpy.where(jr < nside, 1.0 - nr ** 2 / (3.0 * npface),
+                        numpy.where(jr > 3 * nside, -1.0 + nr ** 2 / (3.0 * npface),
+                                    (2 * nside - jr) * 2.0 / (3.0 * nside)))
+
+        kshift = numpy.where((jr >= nside) & (jr <= 3 * nside), (jr - nside) & 1, 0)
+
+        jp = (jpll[face] * nr + ix - iy + 1 + kshift) // 2
+        jp = numpy.where(jp > 4 * nside, jp - 4 * nside, jp)
+        jp = numpy.where(jp < 1, jp + 4 * nside, jp)
+
+        phi = (jp - (kshift + 1) * 0.5) * (numpy.pi / 2.0 / nr)
+
+    else:
+
+        ncap = 2 * nside * (nside - 1)
+
+        z = numpy.zeros(npix)
+        phi = numpy.zeros(npix)
+
+        # North polar cap
+        north = pix < ncap
+        iring = (1 + numpy.sqrt(1 + 2 * pix[north]).astype(numpy.int64)) >> 1
+        iphi = pix[north] + 1 - 2 * iring * (iring - 1)
+        z[north] = 1.0 - iring ** 2 / (3.0 * npface)
+        phi[north] = (iphi - 0.5) * numpy.pi / (2.0 * iring)
+
+        # Equatorial belt
+        belt = (pix >= ncap) & (pix < npix - ncap)
+        ip = pix[belt] - ncap
+        iring = ip // (4 * nside) + nside
+        iphi = ip % (4 * nside) + 1
+        fodd = 0.5 * (1 + ((iring + nside) & 1))
+        z[belt] = (2 * nside - iring) * 2.0 / (3.0 * nside)
+        phi[belt] = (iphi - fodd) * numpy.pi / (2.0 * nside)
+
+        # South polar cap
+        south = pix >= npix - ncap
+        ip = npix - pix[south]
+        iring = (1 + numpy.sqrt(2 * ip - 1).astype(numpy.int64)) >> 1
+        iphi = 4 * iring + 1 - (ip - 2 * iring * (iring - 1))
+        z[south] = -1.0 + iring ** 2 / (3.0 * npface)
+        phi[south] = (iphi - 0.5) * numpy.pi / (2.0 * iring)
+
+    pass
+
+    sintheta = numpy.sqrt(numpy.maximum(0.0, 1.0 - z ** 2))
+
+    return numpy.vstack([sintheta * numpy.cos(phi), sintheta * numpy.sin(phi), z]).T
+
+
+pass
+
+
+def readCubeFormat(hdulist):
+    '''
+    Return (nside, nested, nbins, cosmin, sqrtWeight, phibins) for the livetime cube
+    in hdulist (raises KeyError if the format is not known)
+    '''
+
+    header = hdulist['EXPOSURE'].header
+
+    nbins = int(header['NBRBINS'])
+
+    # The columns after the first nbins contain the distribution in phi
+    phibins = hdulist['EXPOSURE'].data.field("COSBINS").shape[1] // nbins - 1
+
+    return (int(header['NSIDE']),
+            str(header['ORDERING']).strip().upper() == 'NESTED',
+            nbins,
+            float(header['COSMIN']),
+            str(header['THETABIN']).strip().upper().find('SQRT') >= 0,
+            phibins)
+
+
+pass
+
+
+def getOntimeBefore(t, gtiStart, gtiStop):
+    '''
+    Return the time within the GTIs (sorted and not overlapping) before each time in t
+    '''
+
+    t = numpy.asarray(t, dtype=float)
+
+    lengths = gtiStop - gtiStart
+    cumulative = numpy.concatenate([[0], numpy.cumsum(lengths)])
+
+    idx = numpy.searchsorted(gtiStart, t, 'right') - 1
+    inRange = (idx >= 0)
+    idx = numpy.maximum(idx, 0)
+
+    partial = numpy.clip(t - gtiStart[idx], 0, lengths[idx])
+
+    return numpy.where(inRange, cumulative[idx] + partial, 0)
+
+
+pass
+
+
+def readGTIs(eventFile):
+    with pyfits.open(eventFile) as f:
+        gtiStart = numpy.array(f['GTI'].data.field("START"), dtype=float)
+        gtiStop = numpy.array(f['GTI'].data.field("STOP"), dtype=float)
+    pass
+
+    return gtiStart, gtiStop
+
+
+pass
+
+
+class LivetimeCube(object):
+    def __init__(self, ft2File, zmax=180.0, binsz=1.0, dcostheta=0.025, tstart=None, tstop=None, phibins=0):
+        '''
+        ft2File: spacecraft file
+        zmax: zenith cut applied in the livetime cube (180 means no cut)
+        binsz: size of the HEALPix pixels (deg). The resolution used is the coarsest one
+               with pixels not larger than this (NSIDE = 64 for 1 deg, as gtltcube)
+        dcostheta: size of the cos(theta) bins (which are uniform in sqrt(1 - cos(theta)),
+                   as in gtltcube)
+        tstart, tstop: if given, only the rows of the FT2 file overlapping this interval are read
+                       (the cubes can then be made only for Good Time Intervals within it)
+        phibins: number of bins in phi, 0 or 1 (as the phibins parameter of gtltcube)
+        '''
+
+        if (int(phibins) not in [0, 1]):
+            raise ValueError("Only 0 or 1 phi bins are supported")
+        pass
+
+        self.ft2File = os.path.abspath(ft2File)
+        self.zmax = float(zmax)
+
+        with SpacecraftFile(self.ft2File) as spacecraft:
+
+            if (tstart is None or tstop is None):
+                data = spacecraft.data
+            else:
+                data = spacecraft.getSlice(tstart, tstop)
+            pass
+
+            self.start = numpy.array(data.field("START"), dtype=float)
+            self.stop = numpy.array(data.field("STOP"), dtype=float)
+            self.livetime = numpy.array(data.field("LIVETIME"), dtype=float)
+
+            self.scz = _toCartesian(data.field("RA_SCZ"), data.field("DEC_SCZ"))
+            self.zenith = _toCartesian(data.field("RA_ZENITH"), data.field("DEC_ZENITH"))
+        pass
+
+        # Pixel size of a HEALPix map is sqrt(4 pi / (12 nside^2))
+        nside = 1
+        while (math.degrees(math.sqrt(math.pi / 3.0)) / nside > float(binsz)):
+            nside *= 2
+        pass
+
+        self._setFormat(nside, True, int(round(1.0 / float(dcostheta))), 0.0, True, phibins)
+
+    pass
+
+    def _setFormat(self, nside, nested, nbins, cosmin, sqrtWeight, phibins):
+
+        self.nside = int(nside)
+        self.nested = bool(nested)
+        self.nbins = int(nbins)
+        self.cosmin = float(cosmin)
+        self.sqrtWeight = bool(sqrtWeight)
+
+        # Only the distribution in cos(theta) is computed. With one phi bin the distribution
+        # in phi is a copy of it (more phi bins are not supported)
+        self.phibins = int(phibins)
+        self.nColumns = self.nbins * (1 + self.phibins)
+
+        self.pixels = healpixDirections(self.nside, self.nested)
+        self._binType = numpy.uint8 if self.nbins < 255 else numpy.uint16
+
+        # Distribution of each row over the bins, by row index, from the least to the
+        # most recently used. At most maxRowBinsMemory bytes are kept
+        self._rowBins = collections.OrderedDict()
+        self._maxRows = max(1, maxRowBinsMemory // (self.pixels.shape[0] * numpy.dtype(self._binType).itemsize))
+
+    pass
+
+    def writeCube(self, eventFile, outfile):
+        '''
+        Write in outfile a livetime cube in the same format as gtltcube, for the Good Time
+        Intervals of eventFile
+        '''
+
+        # Imported here because dataHandling imports this module
+        from GtBurst.dataHandling import create_from_columns
+
+        exposure, weighted = self._assemble(eventFile)
+
+        npix = self.pixels.shape[0]
+
+        with pyfits.open(eventFile) as ev:
+            gti = ev['GTI'].copy()
+        pass
+
+        tstart = float(min(gti.data.field("START")))
+        tstop = float(max(gti.data.field("STOP")))
+
+        hdus = [pyfits.PrimaryHDU()]
+
+        for extname, cube in [('EXPOSURE', exposure), ('WEIGHTED_EXPOSURE', weighted)]:
+
+            column = pyfits.Column(name="COSBINS", format="%iE" % self.nColumns, array=self._expand(cube))
+
+            hdu = create_from_columns(pyfits.ColDefs([column]))
+            hdu.header.set("EXTNAME", extname)
+            hdu.header.set("PIXTYPE", "HEALPIX")
+            hdu.header.set("ORDERING", "NESTED" if self.nested else "RING")
+            hdu.header.set("COORDSYS", "EQU")
+            hdu.header.set("NSIDE", self.nside)
+            hdu.header.set("FIRSTPIX", 0)
+            hdu.header.set("LASTPIX", npix - 1)
+            hdu.header.set("THETABIN", "SQRT(1-COSTHETA)" if self.sqrtWeight else "COSTHETA")
+            hdu.header.set("NBRBINS", self.nbins)
+            hdu.header.set("COSMIN", self.cosmin)
+            hdu.header.set("PHIBINS", self.phibins)
+
+            hdus.append(hdu)
+
+        pass
+
+        # Boundaries of the cos(theta) bins
+        edges = numpy.arange(self.nbins + 1) / float(self.nbins)
+
+        if (self.sqrtWeight):
+            edges = edges ** 2
+        pass
+
+        costheta = 1.0 - (1.0 - self.cosmin) * edges
+
+        bounds = create_from_columns(pyfits.ColDefs([pyfits.Column(name="CTHETA_MIN", format="E", array=costheta[1:]),
+                                                     pyfits.Column(name="CTHETA_MAX", format="E", array=costheta[:-1])]))
+        bounds.header.set("EXTNAME", "CTHETABOUNDS")
+        hdus.append(bounds)
+
+        hdus.append(gti)
+
+        hdulist = pyfits.HDUList(hdus)
+
+        for hdu in hdulist:
+            hdu.header.set("TELESCOP", "GLAST")
+            hdu.header.set("INSTRUME", "LAT")
+            hdu.header.set("TSTART", tstart)
+            hdu.header.set("TSTOP", tstop)
+        pass
+
+        hdulist.writeto(outfile, clobber=True)
+
+    pass
+
+    def _expand(self, cube):
+
+        return numpy.hstack([cube] * (1 + self.phibins))
+
+    pass
+
+    def _getFractions(self, gtiStart, gtiStop):
+        '''
+        Return the indexes of the rows overlapping the GTIs, and the fraction of each of them
+        inside the GTIs
+        '''
+
+        order = numpy.argsort(gtiStart, kind='mergesort')
+        gtiStart, gtiStop = mergeIntervals(gtiStart[order], gtiStop[order])
+
+        duration = self.stop - self.start
+
+        rows = numpy.nonzero((self.stop > gtiStart[0]) & (self.start < gtiStop[-1]) & (duration > 0))[0]
+
+        # Time of each row within the GTIs, from the cumulative time in the GTIs (without
+        # a rows x GTIs matrix, which can be very large for long intervals)
+        ontime = getOntimeBefore(self.stop[rows], gtiStart, gtiStop) - \
+                 getOntimeBefore(self.start[rows], gtiStart, gtiStop)
+
+        fractions = ontime / duration[rows]
+
+        used = fractions > 0
+
+        return rows[used], fractions[used]
+
+    pass
+
+    def _getRowBins(self, row):
+        '''
+        Return the cos(theta) bin of each pixel for this row (nbins for the pixels which do not
+        receive livetime)
+        '''
+
+        if (row in self._rowBins):
+
+            bins = self._rowBins.pop(row)
+
+        else:
+
+            costheta = self.pixels.dot(self.scz[row])
+
+            accepted = costheta > self.cosmin
+
+            if (self.zmax < 180):
+                accepted &= self.pixels.dot(self.zenith[row]) >= numpy.cos(numpy.deg2rad(self.zmax))
+            pass
+
+            f = (1.0 - costheta[accepted]) / (1.0 - self.cosmin)
+
+            if (self.sqrtWeight):
+                f = numpy.sqrt(f)
+            pass
+
+            bins = numpy.zeros(self.pixels.shape[0], dtype=self._binType) + self.nbins
+            bins[accepted] = numpy.minimum((f * self.nbins).astype(int), self.nbins - 1)
+
+        pass
+
+        self._rowBins[row] = bins
+
+        while (len(self._rowBins) > self._maxRows):
+            self._rowBins.popitem(last=False)
+        pass
+
+        return bins
+
+    pass
+
+    def _assemble(self, eventFile):
+        '''
+        Return the (npix, nbins) arrays of the exposure and of the exposure weighted by
+        the livetime fraction, for the GTIs of eventFile
+        '''
+
+        gtiStart, gtiStop = readGTIs(eventFile)
+
+        rows, fractions = self._getFractions(gtiStart, gtiStop)
+
+        npix = self.pixels.shape[0]
+        nCells = npix * (self.nbins + 1)
+
+        exposure = numpy.zeros(nCells)
+        weighted = numpy.zeros(nCells)
+
+        # Cell (pixel, bin) has index pixel * (nbins + 1) + bin, where bin = nbins is
+        # a dummy bin for the pixels outside of the field of view
+        offsets = numpy.arange(npix) * (self.nbins + 1)
+
+        # Process the rows in chunks to limit the memory
+        chunkSize = 256
+
+        for i in range(0, rows.shape[0], chunkSize):
+
+            theseRows = rows[i:i + chunkSize]
+
+            cells = numpy.concatenate([offsets + self._getRowBins(row) for row in theseRows])
+
+            values = self.livetime[theseRows] * fractions[i:i + chunkSize]
+
+            # Exposure weighted by the livetime fraction of the row
+            weights = values * self.livetime[theseRows] / (self.stop[theseRows] - self.start[theseRows])
+
+            exposure += numpy.bincount(cells, numpy.repeat(values, npix), nCells)
+            weighted += numpy.bincount(cells, numpy.repeat(weights, npix), nCells)
+
+        pass
+
+        exposure = exposure.reshape((npix, self.nbins + 1))[:, :self.nbins]
+        weighted = weighted.reshape((npix, self.nbins + 1))[:, :self.nbins]
+
+        return exposure, weighted
+
+    pass
+
+
+pass
+
+
+class IncrementalLivetimeCube(LivetimeCube):
+    def __init__(self, ft2File, zmax=180.0):
+        '''
+        ft2File: spacecraft file
+        zmax: zenith cut applied in the livetime cube (180 means no cut)
+
+        The format of the cube is set by setTemplate
+        '''
+
+        LivetimeCube.__init__(self, ft2File, zmax)
+
+        self.template = None
+
+        # This becomes False if the cube assembled for the template interval does not
+        # match the one made by gtltcube. The caller should then use gtltcube
+        self.enabled = True
+
+    pass
+
+    def hasTemplate(self):
+
+        return self.template is not None
+
+    pass
+
+    def setTemplate(self, templateFile, eventFile):
+        '''
+        Use the cube made by gtltcube for eventFile as template for the format of the cubes,
+        and verify that the cube assembled for the same event file matches it.
+
+        Returns True if the cubes match, otherwise disables this object and returns False.
+        '''
+
+        with pyfits.open(templateFile) as f:
+
+            try:
+                cubeFormat = readCubeFormat(f)
+            except KeyError as e:
+                return self._disable("unknown format of livetime cube %s (%s)" % (templateFile, e))
+            pass
+
+            references = [numpy.array(f[ext].data.field("COSBINS"), dtype=float)
+                          for ext in ['EXPOSURE', 'WEIGHTED_EXPOSURE'] if ext in f]
+
+        pass
+
+        if (cubeFormat[-1] > 1):
+            return self._disable("more than one phi bin in livetime cube %s" % (templateFile))
+
+        self._setFormat(*cubeFormat)
+
+        self.template = os.path.abspath(templateFile)
+
+        cubes = self._assemble(eventFile)
+
+        for cube, reference in zip(cubes, references):
+
+            scale = max(numpy.abs(reference).max(), 1e-10)
+
+            if (not numpy.allclose(self._expand(cube), reference, rtol=tolerance, atol=tolerance * scale)):
+                return self._disable("the assembled livetime cube does not match the one from gtltcube")
+
+        pass
+
+        return True
+
+    pass
+
+    def makeCube(self, eventFile, outfile):
+        '''
+        Write in outfile the livetime cube for the Good Time Intervals of eventFile.
+
+        Returns False (without writing anything) if the template has not been set yet or the
+        cubes cannot be assembled, in which case the caller should use gtltcube.
+        '''
+
+        if (not self.enabled or self.template is None):
+            return False
+
+        exposure, weighted = self._assemble(eventFile)
+
+        with pyfits.open(eventFile) as ev:
+
+            gti = ev['GTI'].data
+            tstart = float(min(gti.field("START")))
+            tstop = float(max(gti.field("STOP")))
+
+            with pyfits.open(self.template) as f:
+
+                f['EXPOSURE'].data.field("COSBINS")[:] = self._expand(exposure)
+
+                if ('WEIGHTED_EXPOSURE' in f):
+                    f['WEIGHTED_EXPOSURE'].data.field("COSBINS")[:] = self._expand(weighted)
+                pass
+
+                f['GTI'].data = gti
+
+                for hdu in f:
+                    if ('TSTART' in hdu.header):
+                        hdu.header.set("TSTART", tstart)
+                        hdu.header.set("TSTOP", tstop)
+                    pass
+                pass
+
+                f.writeto(outfile, clobber=True)
+
+            pass
+
+        pass
+
+        return True
+
+    pass
+
+    def _disable(self, reason):
+
+        print("\nWARNING: %s. Using gtltcube for all intervals.\n" % (reason))
+
+        self.enabled = False
+
+        return False
+
+    pass
+
+
+pass
+
+
+if __name__ == "__main__":
+
+    if (len(sys.argv) < 4):
+        print("Usage: %s [ft2file] [eventfile] [reference cube] [zmax (default: 180)]" % (sys.argv[0]))
+        sys.exit(1)
+    pass
+
+    ft2File, eventFile, referenceFile = sys.argv[1:4]
+    zmax = float(sys.argv[4]) if len(sys.argv) > 4 else 180.0
+
+    with pyfits.open(referenceFile) as f:
+
+        referenceFormat = readCubeFormat(f)
+
+        references = dict((ext, numpy.array(f[ext].data.field("COSBINS"), dtype=float))
+                          for ext in ['EXPOSURE', 'WEIGHTED_EXPOSURE'] if ext in f)
+
+    pass
+
+    cube = LivetimeCube(ft2File, zmax)
+
+    defaultFormat = (cube.nside, cube.nested, cube.nbins, cube.cosmin, cube.sqrtWeight, cube.phibins)
+
+    names = ['NSIDE', 'nested', 'NBRBINS', 'COSMIN', 'sqrt(1-cos) bins', 'PHIBINS']
+
+    print("\n%-20s %-15s %-15s" % ('', 'reference', 'default'))
+
+    for name, ref, default in zip(names, referenceFormat, defaultFormat):
+        print("%-20s %-15s %-15s" % (name, ref, default))
+    pass
+
+    # Compute the cube in the same format as the reference
+    cube._setFormat(*referenceFormat)
+
+    outfile = '__ltcube_validation.fits'
+
+    t0 = time.time()
+    cube.writeCube(eventFile, outfile)
+    elapsed = time.time() - t0
+
+    print("\nCube computed in %.2f s" % (elapsed))
+
+    passed = True
+
+    with pyfits.open(outfile) as f:
+
+        for ext, reference in references.items():
+
+            computed = numpy.array(f[ext].data.field("COSBINS"), dtype=float)
+
+            scale = max(numpy.abs(reference).max(), 1e-10)
+
+            maxDifference = numpy.abs(computed - reference).max() / scale
+            totalDifference = abs(computed.sum() - reference.sum()) / max(reference.sum(), 1e-10)
+
+            print("%-20s max. relative difference %.3g, relative difference of the total %.3g" % (ext, maxDifference,
+                                                                                                 totalDifference))
+
+            passed &= maxDifference <= tolerance
+
+        pass
+
+    pass
+
+    os.remove(outfile)
+
+    print("\nValidation %s\n" % ("PASSED" if passed else "FAILED"))
+
+    sys.exit(0 if passed else 1)
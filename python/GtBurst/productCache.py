@@ -0,0 +1,536 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Content-addressed cache for the products of the Science Tools.
+#
+# The products of a tool (livetime cubes, exposure maps, ...) depend only on
+# the tool, its parameters and the content of its input files. The cache
+# stores them under a key computed from these, so that running again the same
+# step (for example when the same interval is analyzed with a different model,
+# or the same data are re-analyzed) costs only a copy or a hard link.
+#
+# The cache is disabled unless the environment variable GTBURSTPRODUCTCACHE
+# points to the directory to use. The maximum size (in MB, default 2048) can be
+# set with GTBURSTPRODUCTCACHESIZE. The least recently used products are
+# removed when the cache grows above this size.
+#
+# Several processes can share the same cache: the index and the entries are
+# only changed while holding a lock on the lock file in the cache directory.
+
+import contextlib
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import tempfile
+import time
+
+cacheDirEnvVariable = 'GTBURSTPRODUCTCACHE'
+cacheSizeEnvVariable = 'GTBURSTPRODUCTCACHESIZE'
+
+defaultCacheSize = 2048  # MB
+
+# Parameters which do not change the products
+ignoredParameters = ['clobber', 'chatter', 'debug', 'gui', 'mode']
+
+# Environment variables which identify the version of the Science Tools and of the CALDB.
+# They are part of the key, so that an update does not return stale products
+environmentVariables = ['INST_DIR', 'FERMI_DIR', 'CALDB', 'CALDBCONFIG']
+
+indexFileName = 'index.json'
+lockFileName = 'index.lock'
+
+# Names of the entries (SHA1 of the description) and of the temporary files
+entryNameRegex = re.compile(r'^[0-9a-f]{40}$')
+tempPrefix = '__tmp_'
+
+
+class ProductCache(object):
+    def __init__(self, directory=None, maxSize=None):
+        '''
+        directory: directory of the cache (default: the value of the GTBURSTPRODUCTCACHE
+                   environment variable. If it is not set, the cache is disabled and run()
+                   just runs the tool)
+        maxSize: maximum size of the cache in MB (default: GTBURSTPRODUCTCACHESIZE, or 2048)
+        '''
+
+        if (directory is None):
+            directory = os.environ.get(cacheDirEnvVariable)
+        pass
+
+        if (maxSize is None):
+            maxSize = float(os.environ.get(cacheSizeEnvVariable, defaultCacheSize))
+        pass
+
+        self.enabled = bool(directory)
+
+        if (not self.enabled):
+            return
+
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.maxSize = int(float(maxSize) * 1024 * 1024)
+        self.indexFile = os.path.join(self.directory, indexFileName)
+        self.lockFile = os.path.join(self.directory, lockFileName)
+
+        try:
+            os.makedirs(self.directory)
+        except OSError as exception:
+            if (exception.errno != errno.EEXIST or not os.path.isdir(self.directory)):
+                raise IOError("Cannot create the product cache directory %s: %s" % (self.directory, exception))
+            pass
+        pass
+
+    pass
+
+    def run(self, tool, name, outputs, updated=(), copy=False):
+        '''
+        Run the tool, or restore its products from the cache if the tool has been already
+        run with the same parameters on the same input files.
+
+        tool: a GtApp (or an object behaving like it, such as multiprocessScienceTools)
+        name: name of the tool (it is part of the key)
+        outputs: names of the parameters containing the files written by the tool
+        updated: names of the parameters containing input files which are modified in place
+                 by the tool (like the event file for gtdiffrsp)
+        copy: if True, the products are always copied from the cache. Otherwise they are
+              hard-linked when possible, and they are read-only (use copy=True for products
+              which are modified afterwards)
+
+        Returns True if the products have been restored from the cache, False otherwise.
+        '''
+
+        if (not self.enabled):
+            tool.run()
+            return False
+
+        # The key is computed without holding the lock, since it might need to read
+        # the input files. The index is used here only for the known digests
+        digests = self._readIndex()['digests']
+
+        key = self._getKey(tool, name, outputs, updated, {'digests': digests})
+
+        products = [str(tool[parName]) for parName in list(outputs) + list(updated)]
+
+        with self._locked():
+
+            index = self._readIndex()
+            index['digests'].update(digests)
+
+            restored = (key in index['entries'] and self._restore(key, index['entries'][key], products, copy))
+
+            if (restored):
+                index['entries'][key]['lastUsed'] = time.time()
+                index['hits'] += 1
+                self._writeIndex(index)
+            pass
+
+        pass
+
+        if (restored):
+            print("\n%s: products restored from the cache (%s)\n" % (name, ", ".join(products)))
+
+            return True
+
+        pass
+
+        with self._locked():
+            self._detach(products[:len(outputs)], products[len(outputs):])
+        pass
+
+        tool.run()
+
+        with self._locked():
+
+            # Read again the index, as other processes might have changed it in the meantime
+            index = self._readIndex()
+            index['digests'].update(digests)
+            index['misses'] += 1
+
+            try:
+                index['entries'][key] = self._store(key, name, products)
+            except (IOError, OSError) as e:
+                # Failing to store the products is not fatal, the tool has run anyway
+                print("\nWARNING: could not store the products of %s in the cache: %s\n" % (name, e))
+            else:
+                self._evict(index)
+            pass
+
+            self._writeIndex(index)
+
+        pass
+
+        return False
+
+    pass
+
+    def statistics(self):
+        '''
+        Return a dictionary with the number of hits, misses, entries, and the size of the
+        cache in bytes
+        '''
+
+        if (not self.enabled):
+            return {'hits': 0, 'misses': 0, 'entries': 0, 'size': 0}
+
+        index = self._readIndex()
+
+        return {'hits': index['hits'],
+                'misses': index['misses'],
+                'entries': len(index['entries']),
+                'size': sum(entry['size'] for entry in index['entries'].values())}
+
+    pass
+
+    def purge(self):
+        '''
+        Remove all the products from the cache, and reset the statistics
+        '''
+
+        if (not self.enabled):
+            return
+
+        with self._locked():
+
+            index = self._readIndex()
+
+            for key in index['entries'].keys():
+                self._removeEntry(key)
+            pass
+
+            self._removeOrphans(index)
+
+            self._writeIndex(self._emptyIndex())
+
+        pass
+
+    pass
+
+    def _getKey(self, tool, name, outputs, updated, index):
+
+        description = [('tool', name)]
+
+        for var in environmentVariables:
+            description.append(('env:%s' % var, os.environ.get(var, '')))
+        pass
+
+        for parName in sorted(tool.keys()):
+
+            if (parName in ignoredParameters or parName in outputs):
+                continue
+
+            value = str(tool[parName]).strip()
+
+            if (parName in updated or os.path.isfile(value)):
+                description.append((parName, 'file:%s' % self._getDigest(value, index)))
+            elif (value.startswith('@') and os.path.isfile(value[1:])):
+                # List of files
+                digests = [self._getDigest(x, index) for x in self._readFileList(value[1:])]
+                description.append((parName, 'list:%s' % ",".join(digests)))
+            else:
+                description.append((parName, value))
+            pass
+        pass
+
+        return hashlib.sha1(json.dumps(description)).hexdigest()
+
+    pass
+
+    @staticmethod
+    def _readFileList(filename):
+
+        with open(filename) as f:
+            return [line.strip() for line in f if line.strip() != '']
+
+    pass
+
+    def _getDigest(self, filename, index):
+        '''
+        Return the SHA1 of the content of the file. The digests are remembered in the index by
+        (path, size, modification time, inode), so that unchanged input files are read only once
+        '''
+
+        path = os.path.abspath(filename)
+        info = os.stat(path)
+        signature = [info.st_size, info.st_mtime, info.st_ino]
+
+        known = index['digests'].get(path)
+
+        if (known is not None and known[:3] == signature):
+            return known[3]
+
+        sha = hashlib.sha1()
+
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(1024 * 1024)
+                if (chunk == ''):
+                    break
+                sha.update(chunk)
+            pass
+        pass
+
+        digest = sha.hexdigest()
+        index['digests'][path] = signature + [digest]
+
+        return digest
+
+    pass
+
+    def _store(self, key, name, products):
+
+        # Copy the products in a temporary directory first, then move it in place,
+        # so that a partial entry is never visible to other processes
+        tempDir = tempfile.mkdtemp(prefix=tempPrefix, dir=self.directory)
+
+        try:
+            files = []
+            size = 0
+
+            for i, product in enumerate(products):
+                cachedName = "%i_%s" % (i, os.path.basename(product))
+                cachedFile = os.path.join(tempDir, cachedName)
+                shutil.copyfile(product, cachedFile)
+
+                # Cached products are read-only, so that a hard link to them
+                # cannot be used to modify them
+                os.chmod(cachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+                files.append(cachedName)
+                size += os.path.getsize(cachedFile)
+            pass
+
+            entryDir = os.path.join(self.directory, key)
+
+            if (os.path.exists(entryDir)):
+                shutil.rmtree(entryDir)
+            pass
+
+            os.rename(tempDir, entryDir)
+
+        except:
+            shutil.rmtree(tempDir, ignore_errors=True)
+            raise
+        pass
+
+        return {'tool': name, 'files': files, 'size': size, 'lastUsed': time.time()}
+
+    pass
+
+    def _restore(self, key, entry, products, copy):
+
+        entryDir = os.path.join(self.directory, key)
+
+        cachedFiles = [os.path.join(entryDir, cachedName) for cachedName in entry['files']]
+
+        if (len(cachedFiles) != len(products) or not all(map(os.path.isfile, cachedFiles))):
+            # Entry removed or damaged
+            return False
+
+        for cachedFile, product in zip(cachedFiles, products):
+
+            if (os.path.lexists(product)):
+                os.remove(product)
+            pass
+
+            if (not copy):
+                try:
+                    os.link(cachedFile, product)
+                    continue
+                except (OSError, AttributeError):
+                    # Different file system, or no hard links on this platform
+                    pass
+                pass
+            pass
+
+            shutil.copyfile(cachedFile, product)
+
+        pass
+
+        return True
+
+    pass
+
+    def _detach(self, outputs, updated):
+        '''
+        Make sure that the tool cannot write into the cache through a hard link left by a
+        previous restore: remove the outputs which are links to cached products, and replace
+        the updated files which are with a private copy (must be called holding the lock)
+        '''
+
+        linked = [product for product in outputs + updated
+                  if os.path.isfile(product) and os.stat(product).st_nlink > 1]
+
+        if (len(linked) == 0):
+            return
+
+        cached = set()
+
+        for name in os.listdir(self.directory):
+
+            entryDir = os.path.join(self.directory, name)
+
+            if (entryNameRegex.match(name) and os.path.isdir(entryDir)):
+
+                for cachedName in os.listdir(entryDir):
+                    info = os.stat(os.path.join(entryDir, cachedName))
+                    cached.add((info.st_dev, info.st_ino))
+                pass
+
+            pass
+
+        pass
+
+        for product in linked:
+
+            info = os.stat(product)
+
+            if ((info.st_dev, info.st_ino) not in cached):
+                continue
+
+            if (product in outputs):
+
+                os.remove(product)
+
+            else:
+
+                handle, tempFile = tempfile.mkstemp(prefix=tempPrefix, dir=os.path.dirname(os.path.abspath(product)))
+                os.close(handle)
+
+                shutil.copyfile(product, tempFile)
+                os.chmod(tempFile, stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.rename(tempFile, product)
+
+            pass
+
+        pass
+
+    pass
+
+    def _evict(self, index):
+        '''
+        Remove the least recently used entries until the cache is smaller than the maximum size
+        '''
+
+        # Entries on disk but not in the index (for example after a corrupted index has
+        # been reset) cannot be restored anymore, but they take space
+        self._removeOrphans(index)
+
+        entries = index['entries']
+
+        totalSize = sum(entry['size'] for entry in entries.values())
+
+        for key in sorted(entries.keys(), key=lambda k: entries[k]['lastUsed']):
+
+            if (totalSize <= self.maxSize):
+                break
+
+            totalSize -= entries[key]['size']
+            self._removeEntry(key)
+            entries.pop(key)
+
+        pass
+
+        # Forget the digests of the files which do not exist anymore
+        for path in index['digests'].keys():
+            if (not os.path.exists(path)):
+                index['digests'].pop(path)
+            pass
+        pass
+
+    pass
+
+    def _removeEntry(self, key):
+
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    pass
+
+    def _removeOrphans(self, index):
+        '''
+        Remove the entries which are not in the index, and the temporary files left by
+        processes which died while storing an entry or writing the index (must be called
+        holding the lock)
+        '''
+
+        for name in os.listdir(self.directory):
+
+            path = os.path.join(self.directory, name)
+
+            if (name.startswith(tempPrefix)):
+
+                if (os.path.isdir(path)):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+                pass
+
+            elif (entryNameRegex.match(name) and name not in index['entries'] and os.path.isdir(path)):
+
+                self._removeEntry(name)
+
+            pass
+
+        pass
+
+    pass
+
+    @contextlib.contextmanager
+    def _locked(self):
+        '''
+        Hold an exclusive lock on the cache (the lock is released also if the process dies)
+        '''
+
+        with open(self.lockFile, 'a') as f:
+
+            fcntl.lockf(f, fcntl.LOCK_EX)
+
+            try:
+                yield
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+            pass
+
+        pass
+
+    pass
+
+    @staticmethod
+    def _emptyIndex():
+
+        return {'hits': 0, 'misses': 0, 'entries': {}, 'digests': {}}
+
+    pass
+
+    def _readIndex(self):
+
+        try:
+            with open(self.indexFile) as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            # First time, or corrupted index (the entries will be recreated)
+            return self._emptyIndex()
+        pass
+
+        return index
+
+    pass
+
+    def _writeIndex(self, index):
+
+        # Write and rename, so that the index is never seen half-written
+        handle, tempFile = tempfile.mkstemp(prefix=tempPrefix, suffix='.json', dir=self.directory)
+
+        with os.fdopen(handle, 'w') as f:
+            json.dump(index, f)
+        pass
+
+        os.rename(tempFile, self.indexFile)
+
+    pass
+
+
+pass
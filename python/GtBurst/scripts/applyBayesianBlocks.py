@@ -6,6 +6,7 @@ import logging
 import numpy
 
 from GtBurst import BayesianBlocks
+from GtBurst.eventFile import EventFile
 
 from GtBurst.my_fits_io import pyfits
 
@@ -13,7 +14,7 @@ from GtBurst.my_fits_io import pyfits
 parser                        = argparse.ArgumentParser("Apply the Bayesian Blocks algorithm on the input data")
 
 parser.add_argument("--infile", 
-                     help="FT1 or TTE data",
+                     help="FT1 or TTE data (or CSPEC, CTIME or LLE PHA2 file with --binned)",
                      type=str,required=True)
 
 parser.add_argument("--probability",
@@ -24,6 +25,10 @@ parser.add_argument("--outfile",
                      help="File for the results (will be overwritten)",
                      type=str,required=True)
 
+parser.add_argument("--binned",
+                     help="Use the binned light curve in the SPECTRUM extension of a PHA2 file (summed over the channels) instead of the events",
+                     action="store_true",default=False)
+
 #Main code
 if __name__=="__main__":
   args                        = parser.parse_args()
@@ -31,43 +36,80 @@ if __name__=="__main__":
   if( not os.path.exists(args.infile)):
     raise RuntimeError("File %s does not exist" %(args.infile))
     
+  BayesianBlocks.logger.setLevel(logging.DEBUG)
+
   #Read input file
-  with pyfits.open(args.infile) as f:
-    
-    data = f['EVENTS'].data
-    
-    tstart = f['EVENTS'].header.get("TSTART")
-    tstop = f['EVENTS'].header.get("TSTOP")
-    
-    time = data.field("TIME")
-    
-    #This is probably useless, but sometimes input files
-    #are not time ordered and the BB algorithm would 
-    #crash
-    
-    time.sort()
-    
-    BayesianBlocks.logger.setLevel(logging.DEBUG)
-    
+  if(args.binned):
+
+    with pyfits.open(args.infile) as f:
+
+      data = f['SPECTRUM'].data
+
+      binStart = data.field("TIME")
+      binStop = data.field("ENDTIME")
+
+      #Light curve summed over all the channels
+      binCounts = numpy.sum(data.field("COUNTS"),axis=1)
+      exposure = data.field("EXPOSURE")
+
+      if("QUALITY" in data.names):
+        quality = data.field("QUALITY")
+      else:
+        quality = None
+      pass
+    pass
+
+    idx = numpy.argsort(binStart)
+    binStart = binStart[idx]
+    binStop = binStop[idx]
+    binCounts = binCounts[idx]
+    exposure = exposure[idx]
+
+    if(quality is not None):
+      quality = quality[idx]
+    pass
+
+    bb = BayesianBlocks.bayesian_blocks_binned(binStart, binStop, binCounts, exposure,
+                                               args.probability, quality=quality)
+
+    #Make the light curve, using only the bins which entered the analysis
+    good = (exposure > 0)
+
+    if(quality is not None):
+      good &= (quality == 0)
+    pass
+
+    blockIdx = numpy.searchsorted(bb, binStart[good], side='right') - 1
+
+    counts = numpy.bincount(numpy.clip(blockIdx, 0, bb.shape[0]-2),
+                            weights=binCounts[good], minlength=bb.shape[0]-1)
+
+  else:
+
+    events = EventFile(args.infile)
+
+    tstart = events.header.get("TSTART")
+    tstop = events.header.get("TSTOP")
+
+    #Input files are usually time ordered, in which case this is a view
+    #on the memory-mapped file. Otherwise, this is a sorted copy (sorting
+    #in place would touch, and copy, every page of the file)
+
+    time = events.getColumn("TIME", sort=True)
+
     bb = BayesianBlocks.bayesian_blocks(time, tstart, tstop,
                                         args.probability)
-    
-    #Make the light curve
-    
-    counts = numpy.zeros(bb.shape[0]-1)
-    
-    _time = time[ time > bb[0]]
-    
-    for i,(t1,t2) in enumerate(zip(bb[:-1],bb[1:])):
-      
-      idx = (_time > t1) & (_time <= t2)
-      counts[i] = numpy.sum(idx)
-      _time = _time[~idx]
-    
-    with open(args.outfile,"w+") as f:
-      
-      f.write("#Tstart Tstop counts\n")
-      
-      for t1,t2,c in zip(bb[:-1],bb[1:],counts):
-        
-        f.write("%s %s %s\n" %(t1,t2,c))
+
+    #Make the light curve (events in ]t1,t2] for each block)
+
+    counts = numpy.diff(numpy.searchsorted(time, bb, side='right')).astype(float)
+
+  pass
+
+  with open(args.outfile,"w+") as f:
+
+    f.write("#Tstart Tstop counts\n")
+
+    for t1,t2,c in zip(bb[:-1],bb[1:],counts):
+
+      f.write("%s %s %s\n" %(t1,t2,c))
@@ -9,10 +9,15 @@ from GtBurst.commands import gtdocountsmap
 from GtBurst.commands import gtbuildxmlmodel
 from GtBurst.commands import gtdolike
 from GtBurst import dataHandling
+from GtBurst.LikelihoodComponent import SourceStruct
 from GtBurst.fast_ts_map import FastTSMap
 import os, subprocess, glob, shutil
 import numpy,pyfits
 import collections
+import itertools
+import multiprocessing, multiprocessing.pool
+import traceback
+import hashlib, json
 
 import xml.etree.ElementTree as ET
 
@@ -46,6 +51,335 @@ def writeSourceListToFile(sources,outfile):
 pass
 
 
+def analyzeInterval(i,t1,t2,args,dataset,initialWorkdir,tsmap_ncpus):
+  #Analyze one interval, writing all the files in its own directory.
+  #Returns the results for the GRB, or None if the analysis failed
+  print("\nInterval # %s (%s-%s):" %(i,t1,t2))
+  print("-----------------------\n")
+  if(args.irf.lower().find('auto')>=0):
+    if(t2-t1 <= 100.0):
+      irf                      = 'p7rep_transient'
+      particle_model           = 'bkge'        
+    else:
+      irf                      = 'p7rep_source'
+      particle_model           = 'isotr template'
+    pass
+  else:
+    particle_model             = args.particle_model
+    irf                        = args.irf
+  pass
+  
+  #Create a work dir. All the commands write their files there
+  dirname                      = os.path.abspath(os.path.join(initialWorkdir,"interval%s-%s" %(t1,t2)))
+  
+  try:
+    os.makedirs(dirname)
+  except:
+    pass
+  pass
+  
+  if(not os.path.isdir(dirname)):
+    raise RuntimeError("Could not create/access directory %s" %(dirname))
+  pass
+  
+  #Select data
+  targs                        = {}
+  targs['rad']                 = args.roi
+  targs['eventfile']           = dataset['eventfile']
+  targs['zmax']                = args.zmax
+  targs['thetamax']            = args.thetamax
+  targs['emin']                = args.emin
+  targs['emax']                = args.emax
+  targs['skymap']              = '%s_LAT_skymap_%s-%s.fit' %(args.triggername,t1,t2)
+  targs['rspfile']             = dataset['rspfile']
+  targs['strategy']            = args.strategy
+  targs['selection']           = args.selection
+  targs['ft2file']             = dataset['ft2file']
+  targs['tstart']              = t1
+  targs['tstop']               = t2
+  targs['ra']                  = args.ra
+  targs['dec']                 = args.dec
+  targs['irf']                 = irf
+  targs['allowEmpty']          = 'no'
+  targs['workdir']             = dirname
+  
+  printCommand("gtdocountsmap.py",targs)
+  try:
+    _, skymap, _, filteredeventfile, _, _, _, _ = gtdocountsmap.run(**targs)
+  except:
+    print("\nERROR: could not complete selection of data for this interval.")
+    return None
+  
+  skymap                       = os.path.join(dirname,skymap)
+  filteredeventfile            = os.path.join(dirname,filteredeventfile)
+  
+  #Build XML file
+  targs                        = {}
+  targs['xmlmodel']            = '%s_LAT_xmlmodel_%s-%s.xml' %(args.triggername,t1,t2)
+  targs['filteredeventfile']   = filteredeventfile
+  targs['galactic_model']      = args.galactic_model
+  targs['particle_model']      = particle_model
+  targs['ra']                  = args.ra
+  targs['dec']                 = args.dec
+  targs['fgl_mode']            = args.fgl_mode
+  targs['ft2file']             = dataset['ft2file']
+  targs['source_model']        = 'powerlaw2'
+  targs['workdir']             = dirname
+  printCommand("gtbuildxmlmodel",targs)
+  _,xmlmodel                   = gtbuildxmlmodel.run(**targs)
+  xmlmodel                     = os.path.join(dirname,xmlmodel)
+  
+  # Now if the user has specified a specific photon index for upper limits,
+  # change the photon index in the XML file
+  
+  # Save parameters in comments (ET will strip them out)
+  
+  pars_in_comments = {}
+  
+  for key in ['OBJECT','RA','DEC','IRF']:
+      
+      pars_in_comments[key] = dataHandling._getParamFromXML(xmlmodel,key)
+  
+  # Now change the photon index in the XML file
+      
+  tree = ET.parse(xmlmodel)
+  root = tree.getroot()
+  index = root.findall("./source[@name='%s']/spectrum/parameter[@name='Index']" % 'GRB')[0]
+  
+  if args.ulphindex==-1.0:
+      
+      args.ulphindex += 0.01
+  
+  index.set('value', str(args.ulphindex))
+  
+  tree.write(xmlmodel)
+  
+  # Add the parameters in comments back
+  
+  dataHandling._writeParamIntoXML(xmlmodel,**pars_in_comments)
+  
+  targs                        = {}
+  targs['spectralfiles']       = args.spectralfiles
+  targs['xmlmodel']            = xmlmodel
+  targs['liketype']            = args.liketype
+  targs['filteredeventfile']   = filteredeventfile
+  targs['rspfile']             = dataset['rspfile']
+  targs['showmodelimage']      = 'no'
+  targs['tsmin']               = args.tsmin
+  targs['optimizeposition']    = 'no'
+  targs['ft2file']             = dataset['ft2file']
+  targs['skymap']              = skymap
+  targs['flemin']              = args.flemin
+  targs['flemax']              = args.flemax
+  targs['ltcubemode']          = args.ltcube_mode
+  targs['workdir']             = dirname
+  
+  if args.ltcube!='':
+    
+    targs['ltcube']              = args.ltcube
+    
+  if args.expomap!='':
+    
+    targs['expomap']              = args.expomap
+  
+  printCommand("gtdolike.py",targs)
+  (_, outfilelike, _, grb_TS, 
+   _, bestra, _, bestdec, 
+   _, poserr, _, distance, 
+   _, sources)                 = gtdolike.run(**targs)
+  
+  # If the TS map is required, let's do it
+  
+  if args.tsmap_spec is not None:
+      
+      half_size,n_side = args.tsmap_spec.replace(" ","").split(",")
+      
+      # Get root of the name
+      root_name = os.path.splitext(os.path.basename(filteredeventfile))[0]
+      
+      # Find ltcube
+      
+      ltcubes = glob.glob(os.path.join(dirname, "%s_ltcube.fit*" % root_name))
+      
+      assert len(ltcubes) == 1, "Couldn't find ltcube"
+      
+      ltcube = ltcubes[0]
+      
+      # Find expomap
+      
+      expmaps = glob.glob(os.path.join(dirname, "%s_expomap.fit*" % root_name))
+      
+      assert len(expmaps) == 1, "Couldn't find exopmap"
+      
+      expmap = expmaps[0]
+      
+      # Find XML model output of gtdolike
+      xmls = glob.glob(os.path.join(dirname, "%s_likeRes.xml" % root_name))
+      
+      assert len(xmls) == 1, "Couldn't find XML"
+      
+      xml_res = xmls[0]
+      
+      obs = UnbinnedAnalysis.UnbinnedObs(filteredeventfile, dataset['ft2file'], expMap=expmap, expCube=ltcube)
+      like = UnbinnedAnalysis.UnbinnedAnalysis(obs, xml_res, 'MINUIT')
+      
+      ftm = FastTSMap(like)
+      ts_map, wcs = ftm.compute_ts_map(args.ra, args.dec, float(half_size), int(n_side), verbose=False,
+                                       ncpus=tsmap_ncpus)
+      
+      # Save the full TS map
+      
+      pyfits.PrimaryHDU(ts_map, header=wcs.to_header()).writeto(os.path.join(dirname, "%s_tsmap.fit" % root_name), clobber=True)
+      
+      # Find the maximum and its position
+      
+      j, i = numpy.unravel_index(numpy.argmax(ts_map), ts_map.shape)
+      
+      maxTS = ts_map[j, i]
+      bestra, bestdec = wcs.wcs_pix2world(i, j, 0)
+      
+  
+  #Now append the results for this interval
+  grb                          = filter(lambda x:x.name.find("GRB")>=0,sources)[0]
+  
+  if args.tsmap_spec is not None:
+      
+      if maxTS > grb.TS:
+          
+          print("\n\n=========================================")
+          print(" Fast TS Map has found a better position")
+          print("=========================================\n\n")
+          
+          #grb.ra                   = float(bestra)
+          #grb.dec                  = float(bestdec)
+          grb.TS                   = float(maxTS)
+          
+          print("(R.A., Dec.) = (%.3f, %3f) with TS = %.2f\n" % (grb.ra, grb.dec, grb.TS))
+               
+  else:
+      
+      # Do nothing, so that grb.ra and grb.dec will stay what they are already
+      pass
+  
+  grb.name                     = args.triggername
+  grb.tstart                   = t1
+  grb.tstop                    = t2
+  grb.roi                      = args.roi
+  grb.irf                      = irf
+  grb.zmax                     = args.zmax
+  grb.thetamax                 = args.thetamax
+  grb.strategy                 = args.strategy
+  
+  return grb
+pass
+
+
+def _analyzeIntervalSafely(arguments):
+  #Failures are reported, but do not stop the analysis of the other intervals.
+  #Returns the number of the interval and its results
+  try:
+    return arguments[0], analyzeInterval(*arguments)
+  except Exception:
+    print("\nERROR: analysis of interval # %s (%s-%s) failed:\n" %(arguments[0],arguments[1],arguments[2]))
+    traceback.print_exc()
+    return arguments[0], None
+  pass
+pass
+
+#The journal of a run is a file with one JSON line for each interval completed. It is
+#written as soon as an interval is done, so that a run which is interrupted can be resumed
+#(with --resume) recomputing only the intervals which were not completed
+
+#Options which do not change the results of an interval
+_notInJournalKey                = ['outfile','jobs','resume','tsmap_ncpus']
+
+def getIntervalKey(args,t1,t2):
+  description                   = [(k,v) for k,v in sorted(vars(args).items()) if k not in _notInJournalKey]
+  description.append(('interval',(repr(float(t1)),repr(float(t2)))))
+  
+  return hashlib.sha1(json.dumps(description)).hexdigest()
+pass
+
+def _toJSON(value):
+  try:
+    json.dumps(value)
+    return value
+  except TypeError:
+    pass
+  
+  try:
+    return float(value)
+  except (TypeError,ValueError):
+    return str(value)
+  pass
+pass
+
+def appendToJournal(journalFile,key,i,t1,t2,grb):
+  entry                         = {'key': key, 'interval': i, 'tstart': float(t1), 'tstop': float(t2),
+                                   'result': dict((k,_toJSON(v)) for k,v in vars(grb).items())}
+  
+  with open(journalFile,'a+') as f:
+    #A line torn by an interruption has no newline at the end: terminate it, so that
+    #this entry is not glued to it
+    f.seek(0,os.SEEK_END)
+    
+    if(f.tell() > 0):
+      f.seek(-1,os.SEEK_END)
+      
+      if(f.read(1)!='\n'):
+        f.seek(0,os.SEEK_END)
+        f.write("\n")
+      pass
+    pass
+    
+    f.seek(0,os.SEEK_END)
+    f.write("%s\n" %(json.dumps(entry)))
+    f.flush()
+    os.fsync(f.fileno())
+  pass
+pass
+
+def readJournal(journalFile):
+  #Returns a dictionary with the results of the completed intervals, by key
+  completed                     = {}
+  
+  if(not os.path.exists(journalFile)):
+    return completed
+  
+  with open(journalFile) as f:
+    for line in f:
+      try:
+        entry                   = json.loads(line)
+      except ValueError:
+        #Line truncated by an interruption
+        continue
+      pass
+      
+      grb                       = SourceStruct.__new__(SourceStruct)
+      grb.__dict__.update(entry['result'])
+      completed[entry['key']]   = grb
+    pass
+  pass
+  
+  return completed
+pass
+
+class _NonDaemonicProcess(multiprocessing.Process):
+  #The analysis of an interval uses multiprocessing itself (gtltcube, TS maps...),
+  #which is not possible from the daemonic processes of a standard Pool
+  def _getDaemon(self):
+    return False
+  
+  def _setDaemon(self,value):
+    pass
+  
+  daemon                        = property(_getDaemon,_setDaemon)
+pass
+
+class _IntervalPool(multiprocessing.pool.Pool):
+  Process                       = _NonDaemonicProcess
+pass
+
 configuration                 = Configuration()
 irfs                          = IRFS.IRFS.keys()
 irfs.append('auto')
@@ -72,12 +406,17 @@ parser.add_argument("--liketype",help="Likelihood type (binned or unbinned)",typ
 parser.add_argument("--optimizeposition",help="Optimize position with gtfindsrc?",type=str,default="no",choices=['yes','no'])
 parser.add_argument("--datarepository",help="Directory where data are stored",default=configuration.get('dataRepository'))
 parser.add_argument("--ltcube",help="Pre-computed livetime cube",default='',type=str)
+parser.add_argument("--ltcube_mode",help="How to make the livetime cubes: run gtltcube for each interval, compute them without gtltcube (native), or assemble them from the FT2 rows (computed once for all intervals)",type=str,choices=['gtltcube','native','incremental'],default='gtltcube')
+parser.add_argument("--selection",help="How to select the events: run gtmktime and gtselect for each interval, or read the data only once for all intervals (native)",type=str,choices=['gtselect','native'],default='gtselect')
 parser.add_argument("--expomap",help="pre-computed exposure map",default='', type=str)
 parser.add_argument('--ulphindex',help="Photon index for upper limits",default=-2,type=float)
 parser.add_argument('--flemin',help="Lower bound energy for flux/upper limit computation",default=None)
 parser.add_argument('--flemax',help="Upper bound energy for flux/upper limit computation",default=None)
 parser.add_argument('--fgl_mode',help="Set 'complete' to use all FGL sources, set 'fast' to use only bright sources",default='fast')
 parser.add_argument("--tsmap_spec", help="A TS map specification of the type half_size,n_side. For example: '--tsmap_spec 0.5,8' makes a TS map 1 deg x 1 deg with 64 points", default=None)
+parser.add_argument("--tsmap_ncpus", help="Number of processes to use for the TS map", type=int, default=int(float(configuration.get('maxNumberOfCPUs'))))
+parser.add_argument("--jobs", help="Number of intervals to analyze in parallel (each one in its own process: the analysis changes the current directory with os.chdir, so intervals cannot run in threads of the same process)", type=int, default=1)
+parser.add_argument("--resume", help="Resume an interrupted run, skipping the intervals already completed (as recorded in the journal, [outfile].journal)", action="store_true", default=False)
 
 #Main code
 if __name__=="__main__":
@@ -91,6 +430,22 @@ if __name__=="__main__":
       
       args.expomap = os.path.abspath(os.path.expanduser(os.path.expandvars(args.expomap)))
   
+  if args.ltcube!='' and not os.path.exists(args.ltcube):
+      
+      raise IOError("Livetime cube %s does not exists!" %(args.ltcube))
+  
+  if args.expomap!='' and not os.path.exists(args.expomap):
+      
+      raise IOError("Exposure map %s does not exists!" %(args.expomap))
+  
+  if args.jobs < 1:
+      
+      raise ValueError("The number of jobs must be at least 1")
+  
+  # Share the processors for the TS maps among the intervals analyzed in parallel
+  
+  tsmap_ncpus                 = max(1, args.tsmap_ncpus // args.jobs)
+  
   #Determine time intervals
   tstarts                     = numpy.array(map(lambda x:float(x.replace('\\',"")),args.tstarts.split(",")))
   tstops                      = numpy.array(map(lambda x:float(x.replace('\\',"")),args.tstops.split(",")))
@@ -140,219 +495,58 @@ if __name__=="__main__":
   print("%-20s %s" %('Dec.',dec))
   print("%-20s %s" %('Radius',args.roi))
   
-  results                        = []
   initialWorkdir                 = os.getcwd()
   
-  for i,t1,t2 in zip(range(1,len(tstarts)+1),tstarts,tstops):
-    print("\nInterval # %s (%s-%s):" %(i,t1,t2))
-    print("-----------------------\n")
-    if(args.irf.lower().find('auto')>=0):
-      if(t2-t1 <= 100.0):
-        irf                      = 'p7rep_transient'
-        particle_model           = 'bkge'        
-      else:
-        irf                      = 'p7rep_source'
-        particle_model           = 'isotr template'
-      pass
-    else:
-      particle_model             = args.particle_model
-      irf                        = args.irf
-    pass
-    
-    #Create a work dir and move there
-    dirname                      = os.path.abspath("interval%s-%s" %(t1,t2))
+  journalFile                    = "%s.journal" %(os.path.abspath(args.outfile))
+  
+  if(args.resume):
+    completed                    = readJournal(journalFile)
+  else:
+    #New run: start a new journal
+    completed                    = {}
     
-    try:
-      os.makedirs(dirname)
-    except:
+    with open(journalFile,'w') as f:
+      pass
+  pass
+  
+  keys                           = [getIntervalKey(args,t1,t2) for t1,t2 in zip(tstarts,tstops)]
+  results                        = [completed.get(key) for key in keys]
+  
+  intervals                      = [(i,t1,t2,args,dataset,initialWorkdir,tsmap_ncpus)
+                                    for i,t1,t2 in zip(range(1,len(tstarts)+1),tstarts,tstops)
+                                    if results[i-1] is None]
+  
+  if(args.resume):
+    print("\nResuming: %s intervals already completed, %s to do" %(len(tstarts)-len(intervals),len(intervals)))
+  pass
+  
+  if(args.jobs > 1 and len(intervals) > 1):
+    #Each interval is analyzed in its own process
+    pool                         = _IntervalPool(min(args.jobs,len(intervals)))
+    outputs                      = pool.imap_unordered(_analyzeIntervalSafely,intervals,1)
+  else:
+    pool                         = None
+    outputs                      = itertools.imap(_analyzeIntervalSafely,intervals)
+  pass
+  
+  try:
+    #Record each interval in the journal as soon as it is completed. The results
+    #are kept in the same order as the intervals
+    for i,grb in outputs:
+      if(grb is not None):
+        appendToJournal(journalFile,keys[i-1],i,tstarts[i-1],tstops[i-1],grb)
+        results[i-1]             = grb
       pass
     pass
-    
-    try:
-      os.chdir(dirname)
-    except:
-      raise RuntimeError("Could not create/access directory %s" %(dirname))
+  finally:
+    if(pool is not None):
+      pool.close()
+      pool.join()
     pass
-    
-    #Select data
-    targs                        = {}
-    targs['rad']                 = args.roi
-    targs['eventfile']           = dataset['eventfile']
-    targs['zmax']                = args.zmax
-    targs['thetamax']            = args.thetamax
-    targs['emin']                = args.emin
-    targs['emax']                = args.emax
-    targs['skymap']              = '%s_LAT_skymap_%s-%s.fit' %(args.triggername,t1,t2)
-    targs['rspfile']             = dataset['rspfile']
-    targs['strategy']            = args.strategy
-    targs['ft2file']             = dataset['ft2file']
-    targs['tstart']              = t1
-    targs['tstop']               = t2
-    targs['ra']                  = args.ra
-    targs['dec']                 = args.dec
-    targs['irf']                 = irf
-    targs['allowEmpty']          = 'no'
-    
-    printCommand("gtdocountsmap.py",targs)
-    try:
-      _, skymap, _, filteredeventfile, _, _, _, _ = gtdocountsmap.run(**targs)
-    except:
-      print("\nERROR: could not complete selection of data for this interval.")
-      continue
-    
-    #Build XML file
-    targs                        = {}
-    targs['xmlmodel']            = '%s_LAT_xmlmodel_%s-%s.xml' %(args.triggername,t1,t2)
-    targs['filteredeventfile']   = filteredeventfile
-    targs['galactic_model']      = args.galactic_model
-    targs['particle_model']      = particle_model
-    targs['ra']                  = args.ra
-    targs['dec']                 = args.dec
-    targs['fgl_mode']            = args.fgl_mode
-    targs['ft2file']             = dataset['ft2file']
-    targs['source_model']        = 'powerlaw2'
-    printCommand("gtbuildxmlmodel",targs)
-    _,xmlmodel                   = gtbuildxmlmodel.run(**targs)
-    
-    # Now if the user has specified a specific photon index for upper limits,
-    # change the photon index in the XML file
-    
-    # Save parameters in comments (ET will strip them out)
-    
-    pars_in_comments = {}
-    
-    for key in ['OBJECT','RA','DEC','IRF']:
-        
-        pars_in_comments[key] = dataHandling._getParamFromXML(xmlmodel,key)
-    
-    # Now change the photon index in the XML file
-        
-    tree = ET.parse(xmlmodel)
-    root = tree.getroot()
-    index = root.findall("./source[@name='%s']/spectrum/parameter[@name='Index']" % 'GRB')[0]
-    
-    if args.ulphindex==-1.0:
-        
-        args.ulphindex += 0.01
-    
-    index.set('value', str(args.ulphindex))
-    
-    tree.write(xmlmodel)
-    
-    # Add the parameters in comments back
-    
-    dataHandling._writeParamIntoXML(xmlmodel,**pars_in_comments)
-    
-    targs                        = {}
-    targs['spectralfiles']       = args.spectralfiles
-    targs['xmlmodel']            = xmlmodel
-    targs['liketype']            = args.liketype
-    targs['filteredeventfile']   = filteredeventfile
-    targs['rspfile']             = dataset['rspfile']
-    targs['showmodelimage']      = 'no'
-    targs['tsmin']               = args.tsmin
-    targs['optimizeposition']    = 'no'
-    targs['ft2file']             = dataset['ft2file']
-    targs['skymap']              = skymap
-    targs['flemin']              = args.flemin
-    targs['flemax']              = args.flemax
-    
-    if args.ltcube!='':
-            
-      if not os.path.exists(args.ltcube):
-           
-           raise IOError("Livetime cube %s does not exists!" %(args.ltcube))
-      
-      targs['ltcube']              = args.ltcube
-      
-    if args.expomap!='':
-            
-      if not os.path.exists(args.expomap):
-           
-           raise IOError("Exposure map %s does not exists!" %(args.expomap))
-      
-      targs['expomap']              = args.expomap
-    
-    printCommand("gtdolike.py",targs)
-    (_, outfilelike, _, grb_TS, 
-     _, bestra, _, bestdec, 
-     _, poserr, _, distance, 
-     _, sources)                 = gtdolike.run(**targs)
-    
-    # If the TS map is required, let's do it
-    
-    if args.tsmap_spec is not None:
-        
-        half_size,n_side = args.tsmap_spec.replace(" ","").split(",")
-        
-        # Get root of the name
-        root_name = os.path.splitext(os.path.basename(filteredeventfile))[0]
-        
-        # Find ltcube
-        
-        ltcubes = glob.glob("%s_ltcube.fit*" % root_name)
-        
-        assert len(ltcubes) == 1, "Couldn't find ltcube"
-        
-        ltcube = ltcubes[0]
-        
-        # Find expomap
-        
-        expmaps = glob.glob("%s_expomap.fit*" % root_name)
-        
-        assert len(expmaps) == 1, "Couldn't find exopmap"
-        
-        expmap = expmaps[0]
-        
-        # Find XML model output of gtdolike
-        xmls = glob.glob("%s_likeRes.xml" % root_name)
-        
-        assert len(xmls) == 1, "Couldn't find XML"
-        
-        xml_res = xmls[0]
-        
-        obs = UnbinnedAnalysis.UnbinnedObs(filteredeventfile, dataset['ft2file'], expMap=expmap, expCube=ltcube)
-        like = UnbinnedAnalysis.UnbinnedAnalysis(obs, xml_res, 'MINUIT')
-        
-        ftm = FastTSMap(like)
-        (bestra, bestdec), maxTS = ftm.search_for_maximum(args.ra, args.dec, float(half_size), int(n_side), verbose=False)
-        
-    
-    #Now append the results for this interval
-    grb                          = filter(lambda x:x.name.find("GRB")>=0,sources)[0]
-    
-    if args.tsmap_spec is not None:
-        
-        if maxTS > grb.TS:
-            
-            print("\n\n=========================================")
-            print(" Fast TS Map has found a better position")
-            print("=========================================\n\n")
-            
-            #grb.ra                   = float(bestra)
-            #grb.dec                  = float(bestdec)
-            grb.TS                   = float(maxTS)
-            
-            print("(R.A., Dec.) = (%.3f, %3f) with TS = %.2f\n" % (grb.ra, grb.dec, grb.TS))
-                 
-    else:
-        
-        # Do nothing, so that grb.ra and grb.dec will stay what they are already
-        pass
-    
-    grb.name                     = args.triggername
-    grb.tstart                   = t1
-    grb.tstop                    = t2
-    grb.roi                      = args.roi
-    grb.irf                      = irf
-    grb.zmax                     = args.zmax
-    grb.thetamax                 = args.thetamax
-    grb.strategy                 = args.strategy
-    results.append(grb)
-    
-    os.chdir(initialWorkdir)
   pass
   
+  results                        = filter(lambda x:x is not None,results)
+  
   try:
   
       writeSourceListToFile(results,args.outfile)
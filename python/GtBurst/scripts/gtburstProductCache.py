@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import argparse
+
+from GtBurst import productCache
+
+
+parser                        = argparse.ArgumentParser("Show the statistics of the cache for the products of the Science Tools, or empty it")
+
+parser.add_argument("--cachedir",
+                     help="Directory of the cache (default: value of the %s environment variable)" %(productCache.cacheDirEnvVariable),
+                     type=str,required=False,default=None)
+
+parser.add_argument("--stats",
+                     help="Print the number of hits and misses and the size of the cache",
+                     action="store_true",default=False)
+
+parser.add_argument("--purge",
+                     help="Remove all the products from the cache",
+                     action="store_true",default=False)
+
+#Main code
+if __name__=="__main__":
+  args                        = parser.parse_args()
+  
+  cache                       = productCache.ProductCache(args.cachedir)
+  
+  if(not cache.enabled):
+    raise RuntimeError("The cache is disabled. Use --cachedir or set the environment variable %s" %(productCache.cacheDirEnvVariable))
+  
+  if(args.purge):
+    cache.purge()
+    print("\nCache in %s purged\n" %(cache.directory))
+  pass
+  
+  if(args.stats or not args.purge):
+    stats                     = cache.statistics()
+    
+    nRuns                     = stats['hits'] + stats['misses']
+    
+    print("\nCache directory: %s" %(cache.directory))
+    print("Entries:         %i" %(stats['entries']))
+    print("Size:            %.1f MB (maximum %.1f MB)" %(stats['size'] / 1024.0**2, cache.maxSize / 1024.0**2))
+    print("Hits:            %i" %(stats['hits']))
+    print("Misses:          %i" %(stats['misses']))
+    
+    if(nRuns > 0):
+      print("Hit rate:        %.1f %%" %(stats['hits'] * 100.0 / nRuns))
+    pass
+    
+    print("")
+  pass
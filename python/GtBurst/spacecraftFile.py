@@ -0,0 +1,314 @@
+# Author:
+# G.Vianello (giacomov@slac.stanford.edu, giacomo.slac@gmail.com)
+
+# Access to the spacecraft (FT2) file by time.
+#
+# FT2 files of the extended mission are hundreds of MB, while most of the
+# analysis needs only a few rows around the interval of interest. The SC_DATA
+# extension is memory-mapped, and the START and STOP columns (sorted) are saved
+# in an index next to the file (<ft2 file>.tidx), so that after the first time
+# the rows covering an interval are found with a binary search without reading
+# the file. Sliced FT2 files are written by copying only the bytes of the rows
+# needed.
+
+import os
+import tempfile
+
+import numpy
+
+from GtBurst.my_fits_io import pyfits
+
+indexExtension = '.tidx'
+
+# Increase this if the content of the index changes
+indexVersion = 1
+
+
+class SpacecraftFile(object):
+    def __init__(self, filename):
+
+        self.filename = os.path.abspath(filename)
+
+        self._fits = pyfits.open(self.filename, memmap=True)
+
+        self.hduIndex = self._fits.index_of('SC_DATA')
+        self.data = self._fits[self.hduIndex].data
+
+        self._loadIndex()
+
+    pass
+
+    def close(self):
+
+        self.data = None
+        self._fits.close()
+
+    pass
+
+    def __enter__(self):
+
+        return self
+
+    pass
+
+    def __exit__(self, *args):
+
+        self.close()
+
+    pass
+
+    def getCoverage(self):
+        '''
+        Return the (start, stop) of the time covered by the file
+        '''
+
+        return self.start[0], self.stop[-1]
+
+    pass
+
+    def covers(self, tstart, tstop):
+
+        start, stop = self.getCoverage()
+
+        return start <= tstart and stop >= tstop
+
+    pass
+
+    def getRowRange(self, tstart, tstop, contained=False):
+        '''
+        Return the range (first, last + 1) in time order of the rows overlapping the interval
+        (or completely contained in it, if contained=True)
+        '''
+
+        if (contained):
+            first = numpy.searchsorted(self.start, tstart, 'right')
+            last = numpy.searchsorted(self.stop, tstop, 'left')
+        else:
+            first = numpy.searchsorted(self.stop, tstart, 'right')
+            last = numpy.searchsorted(self.start, tstop, 'left')
+        pass
+
+        return int(first), int(max(first, last))
+
+    pass
+
+    def getSlice(self, tstart, tstop, contained=False):
+        '''
+        Return the rows of SC_DATA overlapping the interval (or completely contained in it),
+        in time order. When the file is sorted (as always for real FT2 files) this is a view
+        of the memory-mapped file, and only the columns actually used are read
+        '''
+
+        first, last = self.getRowRange(tstart, tstop, contained)
+
+        if (self.order is None):
+            return self.data[first:last]
+        else:
+            return self.data[self.order[first:last]]
+
+    pass
+
+    def getPointing(self, time, bothAxes=False):
+        '''
+        Return the (R.A., Dec.) of the Z axis of the LAT at the given time (and of the X axis, if
+        bothAxes is True), interpolating linearly between the rows before and after it
+        '''
+
+        # Find first element after the time
+        idx_after = numpy.searchsorted(self.start, time)
+        idx_before = idx_after - 1
+
+        if (idx_after == self.start.shape[0] or idx_before < 0):
+            raise RuntimeError("Provided FT2 file do not cover enough time")
+
+        if (self.order is None):
+            rows = [idx_before, idx_after]
+        else:
+            rows = [self.order[idx_before], self.order[idx_after]]
+        pass
+
+        times = [self.start[idx_before] - time, self.start[idx_after] - time]
+
+        columns = ['RA_SCZ', 'DEC_SCZ']
+
+        if (bothAxes):
+            columns += ['RA_SCX', 'DEC_SCX']
+        pass
+
+        return tuple(numpy.interp(0, times, self.data.field(column)[rows]) for column in columns)
+
+    pass
+
+    def writeSlice(self, tstart, tstop, outfile):
+        '''
+        Write in outfile a FT2 file with the rows completely contained in the interval. The header
+        keywords TSTART and TSTOP of SC_DATA are set to tstart and tstop
+        '''
+
+        first, last = self.getRowRange(tstart, tstop, contained=True)
+
+        header = self._fits[self.hduIndex].header.copy()
+
+        if (self.order is not None or int(header.get('PCOUNT', 0)) != 0):
+            # Rows not in time order, or variable-length columns: let pyfits do the job
+            self._writeRows(self.getSlice(tstart, tstop, contained=True), tstart, tstop, outfile)
+            return
+        pass
+
+        header.set("NAXIS2", last - first)
+        header.set("TSTART", tstart)
+        header.set("TSTOP", tstop)
+
+        # The checksums would be wrong
+        for keyword in ['CHECKSUM', 'DATASUM']:
+            if (keyword in header):
+                del header[keyword]
+            pass
+        pass
+
+        info = self._fits.fileinfo(self.hduIndex)
+
+        chunkSize = 16 * 1024 * 1024
+
+        with open(self.filename, 'rb') as source:
+
+            with open(outfile, 'wb') as destination:
+
+                # All the HDUs before SC_DATA are copied as they are
+                size = info['hdrLoc']
+
+                while size > 0:
+                    chunk = source.read(min(size, chunkSize))
+                    destination.write(chunk)
+                    size -= len(chunk)
+                pass
+
+                destination.write(header.tostring())
+
+                # Now the rows
+                source.seek(info['datLoc'] + first * self.rowLength)
+                size = (last - first) * self.rowLength
+
+                while size > 0:
+                    chunk = source.read(min(size, chunkSize))
+                    destination.write(chunk)
+                    size -= len(chunk)
+                pass
+
+                # Pad the data to a multiple of the FITS block size
+                padding = (-(last - first) * self.rowLength) % 2880
+                destination.write('\0' * padding)
+
+            pass
+
+        pass
+
+    pass
+
+    def _writeRows(self, rows, tstart, tstop, outfile):
+
+        hdulist = pyfits.HDUList([hdu.copy() for hdu in self._fits[:self.hduIndex]])
+
+        table = pyfits.BinTableHDU(rows, header=self._fits[self.hduIndex].header.copy())
+        table.header.set("TSTART", tstart)
+        table.header.set("TSTOP", tstop)
+
+        hdulist.append(table)
+        hdulist.writeto(outfile, clobber=True)
+
+    pass
+
+    def _loadIndex(self):
+        '''
+        Load the index from the sidecar file, or build it (and save it, if possible) if it does
+        not exist or if the FT2 file has changed
+        '''
+
+        info = os.stat(self.filename)
+        signature = numpy.array([indexVersion, info.st_size, info.st_mtime])
+
+        self.indexFile = self.filename + indexExtension
+
+        try:
+
+            with numpy.load(self.indexFile) as index:
+
+                if (not numpy.array_equal(index['signature'], signature)):
+                    raise IOError("Index is out of date")
+                pass
+
+                self.start = index['start']
+                self.stop = index['stop']
+                self.order = index['order'] if index['order'].shape[0] > 0 else None
+                self.rowLength = int(index['rowLength'])
+
+            pass
+
+        except Exception:
+
+            # Missing, out of date or damaged (for example truncated) index
+            self._buildIndex()
+
+            self._saveIndex(signature)
+
+        pass
+
+    pass
+
+    def _saveIndex(self, signature):
+
+        # Write and rename, so that other processes never see a half-written index
+        try:
+            handle, tempFile = tempfile.mkstemp(prefix='__tmp_', suffix=indexExtension,
+                                                dir=os.path.dirname(self.indexFile))
+        except (IOError, OSError):
+            # Read-only directory, the index will be rebuilt next time
+            return
+        pass
+
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                numpy.savez(f, signature=signature, start=self.start, stop=self.stop,
+                            order=self.order if self.order is not None else numpy.zeros(0, dtype=int),
+                            rowLength=self.rowLength)
+            pass
+
+            # (mkstemp creates files readable only by the owner)
+            os.chmod(tempFile, 0644)
+            os.rename(tempFile, self.indexFile)
+
+        except (IOError, OSError):
+            # Full disk, or the index cannot be replaced: it will be rebuilt next time
+            try:
+                os.remove(tempFile)
+            except OSError:
+                pass
+            pass
+        pass
+
+    pass
+
+    def _buildIndex(self):
+
+        start = numpy.array(self.data.field("START"), dtype=float)
+        stop = numpy.array(self.data.field("STOP"), dtype=float)
+
+        if (numpy.all(numpy.diff(start) >= 0)):
+            self.order = None
+        else:
+            self.order = numpy.argsort(start, kind='mergesort')
+            start = start[self.order]
+            stop = stop[self.order]
+        pass
+
+        self.start = start
+
+        # Running maximum, so that it is sorted even if rows overlap
+        self.stop = numpy.maximum.accumulate(stop)
+
+        self.rowLength = int(self._fits[self.hduIndex].header['NAXIS1'])
+
+    pass
+
+
+pass
@@ -0,0 +1,106 @@
+import numpy as np
+
+from GtBurst.BayesianBlocks import bayesian_blocks, bayesian_blocks_binned, bayesian_blocks_legacy, BayesianBlocksStream
+
+
+def _reference_binned(bin_start, bin_stop, counts, exposure, p0):
+    # Plain O(N^2) dynamic program of Scargle et al. (2012), without pruning
+    N = len(counts)
+    prior = 4 - np.log(73.53 * p0 * (N ** -0.478))
+
+    best = np.zeros(N)
+    last = np.zeros(N, dtype=int)
+
+    for R in range(N):
+        fitness = np.zeros(R + 1)
+        for r in range(R + 1):
+            n = np.sum(counts[r:R + 1])
+            t = np.sum(exposure[r:R + 1])
+            fitness[r] = (n * np.log(n / t) if n > 0 else 0.0) - prior + (best[r - 1] if r > 0 else 0.0)
+        last[R] = fitness.argmax()
+        best[R] = fitness[last[R]]
+
+    change_points = [N]
+    ind = N
+    while ind > 0:
+        ind = last[ind - 1]
+        change_points.append(ind)
+
+    return np.append(bin_start, bin_stop[-1])[change_points[::-1]]
+
+
+def _random_events(rng):
+    # A constant background with a few bursts of random width
+    n_events = rng.randint(2, 1500)
+    n_burst = rng.randint(0, n_events // 2 + 1)
+
+    tt = np.concatenate([rng.uniform(0, 100, n_events - n_burst),
+                         rng.normal(rng.uniform(20, 80), rng.uniform(0.1, 5), n_burst)])
+
+    return np.unique(tt[(tt > 0) & (tt < 100)])
+
+
+def test_every_bin_is_a_block():
+    edges = bayesian_blocks_binned(np.arange(6.0), np.arange(1.0, 7.0),
+                                   [10, 1000, 10, 1000, 10, 1000], np.ones(6), 0.05)
+
+    assert np.allclose(edges, np.arange(7.0))
+    assert np.allclose(edges, _reference_binned(np.arange(6.0), np.arange(1.0, 7.0),
+                                                np.array([10, 1000, 10, 1000, 10, 1000.0]), np.ones(6), 0.05))
+
+
+def test_single_bin():
+    assert np.allclose(bayesian_blocks_binned([0.0], [1.0], [5], [1.0], 0.05), [0.0, 1.0])
+
+
+def test_single_event():
+    assert np.allclose(bayesian_blocks(np.array([0.5]), 0.0, 1.0, 0.05), [0.0, 1.0])
+
+
+def test_binned_against_reference():
+    rng = np.random.RandomState(12345)
+
+    for i in range(300):
+        N = rng.randint(1, 40)
+        rates = rng.choice([1.0, 5.0, 50.0, 500.0], size=N)
+        exposure = rng.uniform(0.5, 2.0, size=N)
+        counts = rng.poisson(rates * exposure).astype(float)
+        bin_start = np.cumsum(np.concatenate([[0.0], exposure[:-1]]))
+        bin_stop = bin_start + exposure
+
+        edges = bayesian_blocks_binned(bin_start, bin_stop, counts, exposure, 0.05)
+
+        assert np.allclose(edges, _reference_binned(bin_start, bin_stop, counts, exposure, 0.05))
+
+
+def test_unbinned_against_legacy():
+    rng = np.random.RandomState(54321)
+
+    for i in range(40):
+        tt = _random_events(rng)
+        p0 = rng.choice([1e-3, 0.05])
+
+        assert np.array_equal(bayesian_blocks(tt, 0, 100, p0), bayesian_blocks_legacy(tt, 0, 100, p0))
+
+
+def test_stream_gives_the_same_edges():
+    rng = np.random.RandomState(2468)
+
+    for i in range(40):
+        tt = _random_events(rng)
+        p0 = rng.choice([1e-3, 0.05])
+
+        # Batches of random size (also empty or with one event), and small buffers to be grown
+        stream = BayesianBlocksStream(0, p0, tt.shape[0], initial_capacity=rng.randint(2, 64))
+        splits = np.sort(rng.randint(0, tt.shape[0] + 1, rng.randint(0, 20)))
+
+        for batch in np.split(tt, splits):
+            edges = stream.add(batch)
+
+            if stream.n_events > 0:
+                assert edges[-1] == tt[stream.n_events - 1]
+            else:
+                assert edges.shape[0] == 0
+
+        assert stream.n_events == tt.shape[0]
+        assert np.array_equal(stream.get_edges(100), bayesian_blocks(tt, 0, 100, p0))
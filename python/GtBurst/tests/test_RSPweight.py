@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+pytest.importorskip("GtBurst.dataHandling")
+
+from GtBurst import RSPweight
+from GtBurst.my_fits_io import pyfits
+
+nChannels = 8
+nEnergies = 10
+
+# Three matrices, covering 0-50, 50-150 and 150-300 (the last one until its TSTOP)
+matrixStarts = [0.0, 100.0, 200.0]
+matrixStops = [100.0, 200.0, 300.0]
+
+# One, two and three matrices, no counts across the boundary at 150, and beyond
+# the end of the last matrix
+tstarts = np.array([10.0, 30.0, 40.0, 120.0, 145.0, 155.0, 250.0, 140.0])
+tstops = np.array([40.0, 120.0, 260.0, 280.0, 160.0, 170.0, 350.0, 340.0])
+
+# No counts in this period
+gapStart = 139.0
+gapStop = 166.0
+
+
+def _makeRSP2(filename, rng):
+    ebounds = pyfits.BinTableHDU.from_columns([
+        pyfits.Column(name='CHANNEL', format='I', array=np.arange(1, nChannels + 1)),
+        pyfits.Column(name='E_MIN', format='E', array=np.arange(nChannels) * 10.0),
+        pyfits.Column(name='E_MAX', format='E', array=np.arange(1, nChannels + 1) * 10.0)])
+    ebounds.name = 'EBOUNDS'
+
+    hdus = [pyfits.PrimaryHDU(), ebounds]
+
+    for start, stop in zip(matrixStarts, matrixStops):
+        columns = [pyfits.Column(name='ENERG_LO', format='E', array=np.arange(nEnergies) * 10.0),
+                   pyfits.Column(name='ENERG_HI', format='E', array=np.arange(1, nEnergies + 1) * 10.0),
+                   pyfits.Column(name='N_GRP', format='I', array=np.ones(nEnergies)),
+                   pyfits.Column(name='F_CHAN', format='I', array=np.ones(nEnergies)),
+                   pyfits.Column(name='N_CHAN', format='I', array=np.ones(nEnergies) * nChannels),
+                   pyfits.Column(name='MATRIX', format='%sE' % nChannels,
+                                 array=rng.uniform(0, 1, (nEnergies, nChannels)))]
+
+        matrix = pyfits.BinTableHDU.from_columns(columns)
+        matrix.name = 'SPECRESP MATRIX'
+        matrix.header.set('INSTRUME', 'BGO_00')
+        matrix.header.set('TSTART', start)
+        matrix.header.set('TSTOP', stop)
+        hdus.append(matrix)
+
+    pyfits.HDUList(hdus).writeto(filename)
+
+
+def _makeTTE(filename, rng):
+    times = rng.uniform(0, 360, 20000)
+    times = np.concatenate([[0.0, 360.0], times[(times < gapStart) | (times > gapStop)]])
+
+    events = pyfits.BinTableHDU.from_columns([pyfits.Column(name='TIME', format='D', array=times)])
+    events.name = 'EVENTS'
+    events.header.set('INSTRUME', 'BGO_00')
+
+    primary = pyfits.PrimaryHDU()
+    primary.header.set('DATATYPE', 'TTE')
+
+    pyfits.HDUList([primary, events]).writeto(filename)
+
+
+def _makeCSPEC(filename, rng):
+    starts = np.arange(0, 360, 1.024)
+    stops = starts + 1.024
+
+    counts = rng.poisson(5, (starts.shape[0], nChannels))
+    counts[(stops > gapStart) & (starts < gapStop)] = 0
+
+    quality = np.zeros(starts.shape[0], dtype=int)
+    quality[::17] = 1
+
+    spectrum = pyfits.BinTableHDU.from_columns([
+        pyfits.Column(name='COUNTS', format='%sI' % nChannels, array=counts),
+        pyfits.Column(name='QUALITY', format='I', array=quality),
+        pyfits.Column(name='TIME', format='D', array=starts),
+        pyfits.Column(name='ENDTIME', format='D', array=stops)])
+    spectrum.name = 'SPECTRUM'
+    spectrum.header.set('INSTRUME', 'BGO_00')
+
+    primary = pyfits.PrimaryHDU()
+    primary.header.set('DATATYPE', 'CSPEC')
+
+    pyfits.HDUList([primary, spectrum]).writeto(filename)
+
+
+def _legacyWeights(rsp2file, tstart, tstop, nEvents, eventsCounter):
+    # The loop on the matrices of RSPweight before the weights were computed with
+    # array operations: return the extensions used, the part of the interval covered
+    # by each of them and their weights
+    rsp2File = pyfits.open(rsp2file)
+    nMatrix = len(rsp2File)
+
+    extensions = []
+    rspStarts = []
+    rspStops = []
+    firstResponse = True
+
+    for extNumber in range(nMatrix):
+
+        if rsp2File[extNumber].name not in ("SPECRESP MATRIX", "MATRIX"):
+            continue
+
+        headerStart = rsp2File[extNumber].header["TSTART"]
+        headerStop = rsp2File[extNumber].header["TSTOP"]
+
+        if firstResponse:
+            rspStart = headerStart
+
+            if extNumber == nMatrix - 1:
+                rspStop = headerStop
+            else:
+                rspStop = (headerStart + headerStop) / 2.0
+                firstResponse = False
+        elif extNumber == nMatrix - 1:
+            rspStart = prevRspStop
+            rspStop = headerStop
+        else:
+            rspStart = prevRspStop
+            rspStop = (headerStart + headerStop) / 2.0
+
+        prevRspStop = rspStop
+
+        if rspStop >= tstart and rspStart <= tstop:
+            extensions.append(extNumber)
+            rspStarts.append(max(rspStart, tstart))
+
+            if extNumber == nMatrix - 1:
+                rspStops.append(tstop)
+            else:
+                rspStops.append(min(rspStop, tstop))
+
+            if rspStop >= tstop:
+                break
+
+    rsp2File.close()
+
+    weight = []
+
+    if len(extensions) > 1:
+
+        if nEvents <= 0:
+            for rspStart, rspStop in zip(rspStarts, rspStops):
+                weight.append((rspStop - rspStart) / (tstop - tstart))
+        else:
+            for rspStart, rspStop in zip(rspStarts, rspStops):
+                nThisRspEvt = eventsCounter.getNevents(rspStart, rspStop)
+
+                if nThisRspEvt > 0:
+                    weight.append(float(nThisRspEvt) / float(nEvents))
+                else:
+                    weight.append(0)
+
+        if sum(weight) != 1:
+            lackingWeight = 1.0 - sum(weight)
+
+            for index, (rspStart, rspStop) in enumerate(zip(rspStarts, rspStops)):
+                weight[index] += (rspStop - rspStart) / (tstop - tstart) * lackingWeight
+    else:
+        weight = [1]
+
+    return extensions, rspStarts, rspStops, weight
+
+
+@pytest.fixture
+def workDir():
+    directory = tempfile.mkdtemp()
+
+    yield directory
+
+    shutil.rmtree(directory)
+
+
+@pytest.mark.parametrize('makeEventFile', [_makeTTE, _makeCSPEC])
+def test_weights_match_the_legacy_algorithm(workDir, makeEventFile, capsys):
+    rng = np.random.RandomState(19)
+
+    rsp2file = os.path.join(workDir, 'response.rsp2')
+    eventFile = os.path.join(workDir, 'events.fits')
+    _makeRSP2(rsp2file, rng)
+    makeEventFile(eventFile, rng)
+
+    eventsCounter = RSPweight.EventsCounter(eventfile=eventFile)
+    counts = eventsCounter.getNevents(tstarts, tstops)
+
+    weighter = RSPweight.ResponseWeighter(rsp2file, 'BGO_00')
+    weights, selected, trueStarts, trueStops = weighter.getWeights(tstarts, tstops, eventsCounter, counts)
+
+    for i in range(tstarts.shape[0]):
+        extensions, rspStarts, rspStops, weight = _legacyWeights(rsp2file, tstarts[i], tstops[i],
+                                                                 counts[i], eventsCounter)
+
+        assert list(weighter.extensions[selected[i]]) == extensions
+        assert np.allclose(trueStarts[i, selected[i]], rspStarts)
+        assert np.allclose(trueStops[i, selected[i]], rspStops)
+        assert np.allclose(weights[i, selected[i]], weight, rtol=1e-12)
+        assert np.all(weights[i, ~selected[i]] == 0)
+
+    # All the cases are covered: one, two and three matrices, and no counts
+    assert sorted(set(selected.sum(axis=1))) == [1, 2, 3]
+    assert counts[4] == 0 and selected[4].sum() == 2
+
+    # The two intervals beyond the end of the last matrix are reported
+    assert capsys.readouterr()[0].count('does not cover the required time interval') == 2
@@ -0,0 +1,83 @@
+import imp
+import os
+import shelve
+
+import pytest
+
+from GtBurst.Configuration import configDirEnvVariable
+
+
+@pytest.fixture
+def script(tmpdir, monkeypatch):
+    # The script needs the Science Tools
+    for module in ['UnbinnedAnalysis', 'pyfits', 'GtBurst.dataHandling']:
+        pytest.importorskip(module)
+
+    # Configuration in a temporary directory
+    monkeypatch.setenv(configDirEnvVariable, str(tmpdir.mkdir('conf')))
+
+    configuration = shelve.open(str(tmpdir.join('conf', 'gtburstGUI.conf')))
+    configuration['dataRepository'] = str(tmpdir.mkdir('data'))
+    configuration['ftpWebsite'] = 'ftp://legacy.gsfc.nasa.gov/fermi/data'
+    configuration['maxNumberOfCPUs'] = 2
+    configuration.close()
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'doTimeResolvedLike.py')
+
+    return imp.load_source('doTimeResolvedLike', path)
+
+
+def _parse(script, *options):
+    return script.parser.parse_args(['100724029', '--outfile', 'res.txt', '--roi', '12',
+                                     '--tstarts', '0,10', '--tstops', '10,20',
+                                     '--irf', script.irfs[0], '--galactic_model', 'template',
+                                     '--particle_model', 'isotr template'] + list(options))
+
+
+def test_interval_key(script):
+    key = script.getIntervalKey(_parse(script), 0, 10)
+
+    # Options which do not change the results
+    for options in [['--outfile', 'other.txt'], ['--jobs', '4'], ['--resume'], ['--tsmap_ncpus', '3']]:
+        assert script.getIntervalKey(_parse(script, *options), 0, 10) == key
+
+    assert script.getIntervalKey(_parse(script, '--roi', '10'), 0, 10) != key
+    assert script.getIntervalKey(_parse(script, '--zmax', '105'), 0, 10) != key
+    assert script.getIntervalKey(_parse(script), 0, 10.5) != key
+    assert script.getIntervalKey(_parse(script), 0.0, 10.0) == key
+
+
+class Result(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def test_journal_round_trip(script, tmpdir):
+    journal = str(tmpdir.join('res.txt.journal'))
+
+    script.appendToJournal(journal, 'a', 1, 0, 10, Result(TS=25.3, name='GRB', flux='n.a.'))
+    script.appendToJournal(journal, 'b', 2, 10, 20, Result(TS=3.1, name='GRB', flux=1.5e-6))
+
+    completed = script.readJournal(journal)
+
+    assert sorted(completed.keys()) == ['a', 'b']
+    assert completed['a'].TS == 25.3 and completed['a'].flux == 'n.a.'
+    assert completed['b'].flux == 1.5e-6
+
+
+def test_journal_with_torn_line(script, tmpdir):
+    journal = str(tmpdir.join('res.txt.journal'))
+
+    script.appendToJournal(journal, 'a', 1, 0, 10, Result(TS=25.3))
+
+    # Run killed while writing the second entry
+    with open(journal, 'a') as f:
+        f.write('{"key": "b", "interval": 2, "tst')
+
+    assert sorted(script.readJournal(journal).keys()) == ['a']
+
+    # The resumed run appends after the torn line
+    script.appendToJournal(journal, 'b', 2, 10, 20, Result(TS=3.1))
+    script.appendToJournal(journal, 'c', 3, 20, 30, Result(TS=0.5))
+
+    assert sorted(script.readJournal(journal).keys()) == ['a', 'b', 'c']
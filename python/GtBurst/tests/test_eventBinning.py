@@ -0,0 +1,204 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from GtBurst.eventBinning import EventBinner
+from GtBurst.my_fits_io import pyfits
+
+# GTIs, not sorted, with a gap between each other and two adjacent ones
+gtiStarts = np.array([40.0, 0.0, 75.0, 60.0])
+gtiStops = np.array([60.0, 30.0, 100.0, 70.0])
+
+
+def _makeEventFile(filename, times, energies=None, pha=None):
+    if energies is not None:
+        columns = [pyfits.Column(name='TIME', format='D', unit='s', array=times),
+                   pyfits.Column(name='ENERGY', format='E', unit='MeV', array=energies)]
+    else:
+        columns = [pyfits.Column(name='TIME', format='D', unit='s', array=times),
+                   pyfits.Column(name='PHA', format='I', array=pha)]
+
+    events = pyfits.BinTableHDU.from_columns(columns)
+    events.name = 'EVENTS'
+    events.header.set('TELESCOP', 'GLAST')
+    events.header.set('INSTRUME', 'LAT')
+    events.header.set('TSTART', -10.0)
+    events.header.set('TSTOP', 110.0)
+
+    if pha is not None:
+        events.header.set('TLMIN2', 1)
+
+    gti = pyfits.BinTableHDU.from_columns([pyfits.Column(name='START', format='D', array=gtiStarts),
+                                           pyfits.Column(name='STOP', format='D', array=gtiStops)])
+    gti.name = 'GTI'
+
+    pyfits.HDUList([pyfits.PrimaryHDU(), events, gti]).writeto(filename)
+
+
+def _makeFT2(filename, rng):
+    # Rows of 1 s, with a varying livetime fraction and a gap
+    starts = np.arange(-10.0, 110.0, 1.0)
+    starts = starts[(starts < 20) | (starts >= 22)]
+    livetime = rng.uniform(0.5, 1.0, starts.shape[0])
+
+    columns = [pyfits.Column(name='START', format='D', array=starts),
+               pyfits.Column(name='STOP', format='D', array=starts + 1.0),
+               pyfits.Column(name='LIVETIME', format='D', array=livetime)]
+
+    table = pyfits.BinTableHDU.from_columns(columns)
+    table.name = 'SC_DATA'
+    pyfits.HDUList([pyfits.PrimaryHDU(), table]).writeto(filename)
+
+    return starts, starts + 1.0, livetime
+
+
+def _inGTIs(t):
+    return np.any((t[:, np.newaxis] >= gtiStarts) & (t[:, np.newaxis] < gtiStops), axis=1)
+
+
+def _overlap(start1, stop1, start2, stop2):
+    return max(0.0, min(stop1, stop2) - max(start1, start2))
+
+
+@pytest.fixture
+def workDir():
+    directory = tempfile.mkdtemp()
+
+    yield directory
+
+    shutil.rmtree(directory)
+
+
+@pytest.fixture
+def rng():
+    return np.random.RandomState(11)
+
+
+# Time bins: not sorted, with gaps, partially outside the data, across GTI boundaries
+tstarts = np.array([-5.0, 10.0, 25.0, 55.0, 5.0, 62.5, 90.0])
+tstops = np.array([5.0, 25.0, 50.0, 62.5, 10.0, 80.0, 120.0])
+
+
+def test_counts_of_energy_events(workDir, rng):
+    # Events also outside of the GTIs, not sorted by time, with energies in MeV
+    times = rng.uniform(-10, 110, 5000)
+    energies = 10 ** rng.uniform(1, 5, 5000)
+
+    eventFile = os.path.join(workDir, 'lle.fits')
+    _makeEventFile(eventFile, times, energies=energies)
+
+    # Channels in keV, with a gap between the third and the fourth
+    emin = np.array([1e4, 3e4, 1e5, 5e5, 2e6, 1e7])
+    emax = np.array([3e4, 1e5, 3e5, 2e6, 1e7, 5e7])
+
+    counts = EventBinner(eventFile).getCounts(tstarts, tstops, emin, emax)
+
+    energiesKeV = energies * 1e3
+    good = _inGTIs(times)
+
+    expected = np.zeros((tstarts.shape[0], emin.shape[0]), dtype=int)
+
+    for i in range(tstarts.shape[0]):
+        for j in range(emin.shape[0]):
+            expected[i, j] = np.sum(good & (times >= tstarts[i]) & (times < tstops[i]) &
+                                    (energiesKeV >= emin[j]) & (energiesKeV < emax[j]))
+
+    assert np.array_equal(counts, expected)
+    assert counts.sum() > 0
+
+
+def test_overlapping_time_bins_are_rejected(workDir, rng):
+    eventFile = os.path.join(workDir, 'lle.fits')
+    _makeEventFile(eventFile, rng.uniform(-10, 110, 100), energies=np.ones(100) * 100.0)
+
+    with pytest.raises(ValueError):
+        EventBinner(eventFile).getCounts([0.0, 50.0, 9.5], [10.0, 60.0, 20.0], [1e4], [1e6])
+
+
+def test_counts_of_pha_events(workDir, rng):
+    times = np.sort(rng.uniform(-10, 110, 5000))
+    pha = rng.randint(1, 130, 5000)
+
+    eventFile = os.path.join(workDir, 'tte.fits')
+    _makeEventFile(eventFile, times, pha=pha)
+
+    # 128 channels starting from TLMIN = 1, events in channel 129 are discarded
+    emin = np.arange(128.0)
+    emax = emin + 1
+
+    counts = EventBinner(eventFile).getCounts(tstarts, tstops, emin, emax)
+
+    good = _inGTIs(times)
+
+    for i in range(tstarts.shape[0]):
+        inBin = good & (times >= tstarts[i]) & (times < tstops[i]) & (pha <= 128)
+        assert np.array_equal(counts[i], np.bincount(pha[inBin] - 1, minlength=128))
+
+
+def test_exposure(workDir, rng):
+    eventFile = os.path.join(workDir, 'lle.fits')
+    _makeEventFile(eventFile, rng.uniform(-10, 110, 100), energies=np.ones(100) * 100.0)
+
+    ft2File = os.path.join(workDir, 'ft2.fits')
+    rowStarts, rowStops, livetime = _makeFT2(ft2File, rng)
+
+    withoutFT2 = EventBinner(eventFile).getExposure(tstarts, tstops)
+    withFT2 = EventBinner(eventFile, ft2File).getExposure(tstarts, tstops)
+
+    for i in range(tstarts.shape[0]):
+
+        ontime = sum(_overlap(tstarts[i], tstops[i], start, stop) for start, stop in zip(gtiStarts, gtiStops))
+
+        live = 0.0
+
+        for rowStart, rowStop, rowLivetime in zip(rowStarts, rowStops, livetime):
+            for start, stop in zip(gtiStarts, gtiStops):
+                live += _overlap(max(tstarts[i], rowStart), min(tstops[i], rowStop), start, stop) * \
+                        rowLivetime / (rowStop - rowStart)
+
+        assert abs(withoutFT2[i] - ontime) < 1e-9
+        assert abs(withFT2[i] - live) < 1e-9
+
+    # The gap in the FT2 file and the deadtime reduce the exposure
+    assert np.all(withFT2 <= withoutFT2)
+    assert withFT2[1] < withoutFT2[1]
+
+
+def test_pha2_can_be_read_back(workDir, rng):
+    dataHandling = pytest.importorskip("GtBurst.dataHandling")
+
+    times = rng.uniform(-10, 110, 2000)
+    energies = 10 ** rng.uniform(1, 5, 2000)
+
+    eventFile = os.path.join(workDir, 'lle.fits')
+    _makeEventFile(eventFile, times, energies=energies)
+
+    emin = np.array([1e4, 1e5, 1e6, 1e7])
+    emax = np.array([1e5, 1e6, 1e7, 1e8])
+
+    binner = EventBinner(eventFile)
+    outfile = os.path.join(workDir, 'out.pha2')
+    binner.writePHA2(tstarts, tstops, emin, emax, outfile)
+
+    spectra = dataHandling.Spectra(outfile)
+
+    assert len(spectra) == tstarts.shape[0]
+    assert np.allclose(spectra.tstart, tstarts)
+    assert np.allclose(spectra.tstop, tstops)
+    assert np.allclose(spectra.exposure, binner.getExposure(tstarts, tstops))
+    assert np.array_equal(spectra.channel, np.zeros((tstarts.shape[0], 4)) + np.arange(1, 5))
+
+    counts = spectra.rate * (tstops - tstarts)[:, np.newaxis]
+    assert np.allclose(counts, binner.getCounts(tstarts, tstops, emin, emax))
+
+    with pyfits.open(outfile) as f:
+        assert f['SPECTRUM'].header['HDUCLAS4'] == 'TYPE:II'
+        assert np.allclose(f['EBOUNDS'].data.field('E_MIN'), emin)
+        assert np.allclose(f['EBOUNDS'].data.field('E_MAX'), emax)
+
+        # GTIs merged and cut to the span of the time bins
+        assert np.allclose(f['GTI'].data.field('START'), [0.0, 40.0, 75.0])
+        assert np.allclose(f['GTI'].data.field('STOP'), [30.0, 70.0, 100.0])
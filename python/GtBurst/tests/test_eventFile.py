@@ -0,0 +1,74 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+from GtBurst.my_fits_io import pyfits
+
+nEvents = 10 ** 7
+
+# Run in a new process, so that the peak memory is not the one of the test runner
+_measure = '''
+import resource, sys
+from GtBurst.RSPweight import EventsCounter
+
+def maxrss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+before = maxrss()
+counter = EventsCounter(eventfile=sys.argv[1])
+print("%s %s" % (maxrss() - before, counter.getNevents(10.0, 20.0)))
+'''
+
+
+def _makeTTE(filename):
+    rng = np.random.RandomState(0)
+    time = np.cumsum(rng.exponential(1e-4, size=nEvents))
+
+    columns = [pyfits.Column(name='TIME', format='D', array=time),
+               pyfits.Column(name='PHA', format='I', array=rng.randint(0, 128, size=nEvents).astype('i2')),
+               pyfits.Column(name='ENERGY', format='E', array=rng.uniform(10, 1e4, size=nEvents).astype('f4'))]
+
+    events = pyfits.BinTableHDU.from_columns(columns)
+    events.name = 'EVENTS'
+
+    primary = pyfits.PrimaryHDU()
+    primary.header['DATATYPE'] = 'TTE'
+
+    pyfits.HDUList([primary, events]).writeto(filename)
+
+    return time
+
+
+def test_peak_memory_of_events_counter():
+    pytest.importorskip("GtBurst.dataHandling")
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        tte = os.path.join(directory, 'tte.fits')
+        time = _makeTTE(tte)
+        expected = np.sum((time >= 10.0) & (time <= 20.0))
+        del time
+
+        # Make sure the new process imports this same GtBurst
+        packageDir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([packageDir] + [x for x in [env.get('PYTHONPATH')] if x])
+
+        output = subprocess.check_output([sys.executable, '-c', _measure, tte], env=env)
+        peakIncrease, nEventsInInterval = map(int, output.split()[-2:])
+
+        # Reading the TIME column through the memory-mapped file pages in at most the
+        # file itself. A copy of the column (as with the old code, which also sorted it)
+        # would add at least the size of the column (8 bytes per event)
+        assert peakIncrease < os.path.getsize(tte) + 4 * nEvents
+        assert nEventsInInterval == expected
+
+    finally:
+        shutil.rmtree(directory)
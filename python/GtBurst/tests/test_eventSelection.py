@@ -0,0 +1,310 @@
+import collections
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from GtBurst import eventSelection
+from GtBurst.eventSelection import evaluateFilter, mergeIntervals, intersectIntervals
+from GtBurst.my_fits_io import pyfits
+
+# Filters made by LATData._getGtmktimeFilter for ra=120.5, dec=-45.2, rad=12 with the
+# 'time' strategy and a zenith cut of 100, then with a theta cut of 65 as well, and with
+# the 'events' strategy
+ra, dec, rad = 120.5, -45.2, 12.0
+
+timeFilter = "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T && LIVETIME>0" \
+             " && (ANGSEP(RA_ZENITH,DEC_ZENITH,120.5,-45.2)<=(100.0-12.0))"
+thetaFilter = timeFilter + " && (ANGSEP(RA_SCZ,DEC_SCZ,120.5,-45.2)<=65.0 - 12.0)"
+eventsFilter = "(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1 && IN_SAA!=T && LIVETIME>0"
+
+
+def _angsep(ra1, dec1, ra2, dec2):
+    ra1, dec1, ra2, dec2 = map(np.deg2rad, [ra1, dec1, ra2, dec2])
+
+    cosine = np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(ra1 - ra2)
+
+    return np.rad2deg(np.arccos(np.clip(cosine, -1, 1)))
+
+
+def _makeFT2Table(rng, starts):
+    n = starts.shape[0]
+
+    columns = [pyfits.Column(name='START', format='D', array=starts),
+               pyfits.Column(name='STOP', format='D', array=starts + 30.0),
+               pyfits.Column(name='LIVETIME', format='D', array=np.where(rng.uniform(size=n) < 0.1, 0.0, 25.0)),
+               pyfits.Column(name='DATA_QUAL', format='I', array=rng.choice([-1, 0, 1, 2], n)),
+               pyfits.Column(name='LAT_CONFIG', format='I', array=np.where(rng.uniform(size=n) < 0.1, 0, 1)),
+               pyfits.Column(name='IN_SAA', format='L', array=rng.uniform(size=n) < 0.2),
+               pyfits.Column(name='RA_ZENITH', format='D', array=rng.uniform(0, 360, n)),
+               pyfits.Column(name='DEC_ZENITH', format='D', array=rng.uniform(-90, 90, n)),
+               pyfits.Column(name='RA_SCZ', format='D', array=rng.uniform(0, 360, n)),
+               pyfits.Column(name='DEC_SCZ', format='D', array=rng.uniform(-90, 90, n))]
+
+    table = pyfits.BinTableHDU.from_columns(columns)
+    table.name = 'SC_DATA'
+
+    return table
+
+
+def _expectedGoodRows(data, zenithCut=None, thetaCut=None):
+    qual = data.field('DATA_QUAL')
+
+    good = ((qual > 0) | (qual == -1)) & (data.field('LAT_CONFIG') == 1) & \
+           (~data.field('IN_SAA')) & (data.field('LIVETIME') > 0)
+
+    if zenithCut is not None:
+        good &= _angsep(data.field('RA_ZENITH'), data.field('DEC_ZENITH'), ra, dec) <= zenithCut - rad
+
+    if thetaCut is not None:
+        good &= _angsep(data.field('RA_SCZ'), data.field('DEC_SCZ'), ra, dec) <= thetaCut - rad
+
+    return good
+
+
+def test_gtmktime_filters():
+    rng = np.random.RandomState(5)
+    data = _makeFT2Table(rng, np.arange(2000) * 30.0).data
+
+    for expression, expected in [(eventsFilter, _expectedGoodRows(data)),
+                                 (timeFilter, _expectedGoodRows(data, 100.0)),
+                                 (thetaFilter, _expectedGoodRows(data, 100.0, 65.0))]:
+        result = evaluateFilter(expression, data)
+
+        assert result.dtype == bool
+        assert np.array_equal(result, expected)
+        assert 0 < result.sum() < data.shape[0]
+
+
+def test_filters_match_LATData():
+    dataHandling = pytest.importorskip("GtBurst.dataHandling")
+
+    getFilter = dataHandling.LATData._getGtmktimeFilter.im_func
+
+    class Strategy(object):
+        def __init__(self, strategy):
+            self.strategy = strategy
+
+    assert getFilter(Strategy('time'), ra, dec, rad, 100.0, 180.0) == timeFilter
+    assert getFilter(Strategy('time'), ra, dec, rad, 100.0, 65.0) == thetaFilter
+    assert getFilter(Strategy('events'), ra, dec, rad, 100.0, 180.0) == eventsFilter
+
+
+def test_filter_operators():
+    rng = np.random.RandomState(6)
+    data = _makeFT2Table(rng, np.arange(500) * 30.0).data
+
+    qual = data.field('DATA_QUAL')
+    config = data.field('LAT_CONFIG')
+    saa = data.field('IN_SAA')
+
+    # && binds more than ||, as in C
+    assert np.array_equal(evaluateFilter("DATA_QUAL>0 || DATA_QUAL==-1 && LAT_CONFIG==1", data),
+                          (qual > 0) | ((qual == -1) & (config == 1)))
+    assert np.array_equal(evaluateFilter("DATA_QUAL==-1 && LAT_CONFIG==1 || DATA_QUAL>1", data),
+                          ((qual == -1) & (config == 1)) | (qual > 1))
+    assert np.array_equal(evaluateFilter("(DATA_QUAL>0 || DATA_QUAL==-1) && LAT_CONFIG==1", data),
+                          ((qual > 0) | (qual == -1)) & (config == 1))
+
+    # ! is a negation, != a comparison
+    assert np.array_equal(evaluateFilter("!(DATA_QUAL>0) && IN_SAA!=T", data), (qual <= 0) & ~saa)
+    assert np.array_equal(evaluateFilter("IN_SAA==F", data), ~saa)
+
+    # A constant expression is true (or false) for all the rows
+    assert np.array_equal(evaluateFilter("1>0", data), np.ones(data.shape[0], dtype=bool))
+
+
+def test_merge_intervals():
+    starts, stops = mergeIntervals([0.0, 5.0, 10.0, 11.0, 20.0, 30.0], [5.0, 8.0, 15.0, 12.0, 25.0, 31.0])
+
+    assert np.array_equal(starts, [0.0, 10.0, 20.0, 30.0])
+    assert np.array_equal(stops, [8.0, 15.0, 25.0, 31.0])
+
+    starts, stops = mergeIntervals([], [])
+    assert starts.shape == (0,) and stops.shape == (0,)
+
+
+def _onGrid(starts, stops, grid):
+    inside = np.zeros(grid.shape[0], dtype=bool)
+
+    for start, stop in zip(starts, stops):
+        inside |= (grid >= start) & (grid < stop)
+
+    return inside
+
+
+def test_intersect_intervals():
+    rng = np.random.RandomState(7)
+    grid = np.arange(0, 1000, 0.5) + 0.25
+
+    for trial in range(50):
+        edges1 = np.sort(rng.choice(np.arange(0, 1000, 1.0), 20, replace=False))
+        edges2 = np.sort(rng.choice(np.arange(0, 1000, 1.0), 10, replace=False))
+
+        starts1, stops1 = edges1[::2], edges1[1::2]
+        starts2, stops2 = edges2[::2], edges2[1::2]
+
+        starts, stops = intersectIntervals(starts1, stops1, starts2, stops2)
+
+        assert np.all(np.diff(starts) > 0)
+        assert np.all(stops > starts)
+        assert np.array_equal(_onGrid(starts, stops, grid),
+                              _onGrid(starts1, stops1, grid) & _onGrid(starts2, stops2, grid))
+
+    starts, stops = intersectIntervals(np.array([0.0]), np.array([10.0]), [], [])
+    assert starts.shape == (0,) and stops.shape == (0,)
+
+
+def _bitArray(values):
+    # 32X column: most significant bit first
+    return ((values[:, np.newaxis] >> np.arange(31, -1, -1)) & 1).astype(bool)
+
+
+def _makeFiles(directory, rng, nEvents=3000):
+    times = np.sort(rng.uniform(0, 3000, nEvents))
+    eventClass = rng.choice([0, 128, 1024, 128 | 1024, 2048], nEvents)
+    eventType = rng.choice([1, 2, 4, 8], nEvents)
+
+    columns = [pyfits.Column(name='ENERGY', format='E', unit='MeV', array=10 ** rng.uniform(1, 6, nEvents)),
+               pyfits.Column(name='RA', format='E', unit='deg', array=rng.uniform(100, 140, nEvents)),
+               pyfits.Column(name='DEC', format='E', unit='deg', array=rng.uniform(-65, -25, nEvents)),
+               pyfits.Column(name='ZENITH_ANGLE', format='E', unit='deg', array=rng.uniform(0, 130, nEvents)),
+               pyfits.Column(name='TIME', format='D', unit='s', array=times),
+               pyfits.Column(name='EVENT_CLASS', format='32X', array=_bitArray(eventClass)),
+               pyfits.Column(name='EVENT_TYPE', format='32X', array=_bitArray(eventType))]
+
+    events = pyfits.BinTableHDU.from_columns(columns)
+    events.name = 'EVENTS'
+    events.header.set('TSTART', 0.0)
+    events.header.set('TSTOP', 3000.0)
+    events.header.set('NDSKEYS', 3)
+    events.header.set('DSTYP1', 'BIT_MASK(EVENT_CLASS,128,P8R2)')
+    events.header.set('DSUNI1', 'DIMENSIONLESS')
+    events.header.set('DSVAL1', '1:1')
+    events.header.set('DSTYP2', 'TIME')
+    events.header.set('DSUNI2', 's')
+    events.header.set('DSVAL2', 'TABLE')
+    events.header.set('DSREF2', ':GTI')
+    events.header.set('DSTYP3', 'ENERGY')
+    events.header.set('DSUNI3', 'MeV')
+    events.header.set('DSVAL3', '30:300000')
+
+    gtiStarts = np.array([0.0, 1500.0])
+    gtiStops = np.array([1400.0, 3000.0])
+
+    gti = pyfits.BinTableHDU.from_columns([pyfits.Column(name='START', format='D', array=gtiStarts),
+                                           pyfits.Column(name='STOP', format='D', array=gtiStops)])
+    gti.name = 'GTI'
+    gti.header.set('TSTART', 0.0)
+    gti.header.set('TSTOP', 3000.0)
+
+    ft1 = os.path.join(directory, 'ft1.fits')
+    pyfits.HDUList([pyfits.PrimaryHDU(), events, gti]).writeto(ft1)
+
+    ft2Table = _makeFT2Table(rng, np.arange(-300, 3300, 30.0))
+    ft2 = os.path.join(directory, 'ft2.fits')
+    pyfits.HDUList([pyfits.PrimaryHDU(), ft2Table]).writeto(ft2)
+
+    return ft1, ft2, events.data, (gtiStarts, gtiStops), ft2Table.data
+
+
+def test_select(tmpdir):
+    pytest.importorskip("GtBurst.dataHandling")
+
+    rng = np.random.RandomState(8)
+    directory = str(tmpdir)
+
+    ft1, ft2, events, (gtiStarts, gtiStops), ft2Data = _makeFiles(directory, rng)
+
+    selector = eventSelection.EventSelector(ft1, ft2, timeFilter)
+    selector.setCuts(ra, dec, rad, 100.0, 1e5, 100.0, evclass=128, evtype=3, passTag='P8R2')
+
+    tmin, tmax = 700.0, 2500.0
+    outfile = os.path.join(directory, 'selected.fits')
+    nSelected = selector.select(tmin, tmax, outfile)
+
+    # Good Time Intervals: the ones of the FT1 file, within the good FT2 rows and [tmin, tmax]
+    grid = np.arange(0, 3000, 0.5) + 0.25
+    good = _expectedGoodRows(ft2Data, 100.0)
+    expectedGTI = _onGrid(gtiStarts, gtiStops, grid) & \
+                  _onGrid(ft2Data.field('START')[good], ft2Data.field('STOP')[good], grid) & \
+                  (grid >= tmin) & (grid < tmax)
+
+    time = events.field('TIME')
+    eventClass = eventSelection._bitMask(events, 'EVENT_CLASS')
+    eventType = eventSelection._bitMask(events, 'EVENT_TYPE')
+
+    expectedRows = np.flatnonzero(_onGrid(*_intervalsOf(expectedGTI, grid), grid=time) &
+                                  (events.field('ENERGY') >= 100.0) & (events.field('ENERGY') <= 1e5) &
+                                  (events.field('ZENITH_ANGLE') <= 100.0) &
+                                  (_angsep(events.field('RA'), events.field('DEC'), ra, dec) <= rad) &
+                                  (eventClass & 128 != 0) & (eventType & 3 != 0))
+
+    assert nSelected == expectedRows.shape[0] > 0
+
+    with pyfits.open(outfile) as f:
+
+        assert np.array_equal(f['EVENTS'].data.field('TIME'), time[expectedRows])
+        assert np.array_equal(_onGrid(f['GTI'].data.field('START'), f['GTI'].data.field('STOP'), grid),
+                              expectedGTI)
+
+        header = f['EVENTS'].header
+
+        assert header['TSTART'] == tmin and header['TSTOP'] == tmax
+
+        dss = dict((header['DSTYP%i' % i], (header['DSUNI%i' % i], header['DSVAL%i' % i]))
+                   for i in range(1, header['NDSKEYS'] + 1))
+
+    assert dss == {'POS(RA,DEC)': ('deg', 'CIRCLE(%s,%s,%s)' % (ra, dec, rad)),
+                   'TIME': ('s', 'TABLE'),
+                   'ENERGY': ('MeV', '100.0:100000.0'),
+                   'ZENITH_ANGLE': ('deg', '0:100.0'),
+                   'BIT_MASK(EVENT_CLASS,128,P8R2)': ('DIMENSIONLESS', '1:1'),
+                   'BIT_MASK(EVENT_TYPE,3,P8R2)': ('DIMENSIONLESS', '1:1')}
+
+    selector.close()
+
+
+def _intervalsOf(inside, grid):
+    # Intervals of a boolean array defined on a regular grid
+    step = grid[1] - grid[0]
+    edges = np.diff(np.concatenate([[0], inside.astype(int), [0]]))
+
+    return grid[edges[:-1] == 1] - step / 2, grid[np.flatnonzero(edges[1:] == -1)] + step / 2
+
+
+def test_selectors_are_bounded(tmpdir, monkeypatch):
+    rng = np.random.RandomState(9)
+    ft1, ft2 = _makeFiles(str(tmpdir), rng, 100)[:2]
+
+    monkeypatch.setattr(eventSelection, '_selectors', collections.OrderedDict())
+    monkeypatch.setattr(eventSelection, 'maxSelectors', 2)
+
+    first = eventSelection.getEventSelector(ft1, ft2, eventsFilter)
+    second = eventSelection.getEventSelector(ft1, ft2, timeFilter)
+
+    assert eventSelection.getEventSelector(ft1, ft2, eventsFilter) is first
+
+    eventSelection.getEventSelector(ft1)
+
+    assert len(eventSelection._selectors) == 2
+    assert eventSelection.getEventSelector(ft1, ft2, eventsFilter) is first
+    assert eventSelection.getEventSelector(ft1, ft2, timeFilter) is not second
+
+
+def test_masks_are_bounded(tmpdir, monkeypatch):
+    rng = np.random.RandomState(10)
+    ft1 = _makeFiles(str(tmpdir), rng, 100)[0]
+
+    monkeypatch.setattr(eventSelection, 'maxMasks', 2)
+
+    selector = eventSelection.EventSelector(ft1)
+
+    for emin in [10.0, 20.0, 30.0, 10.0]:
+        selector.setCuts(ra, dec, rad, emin, 1e5, 100.0)
+
+    assert len(selector._masks) == 2
+
+    selector.close()
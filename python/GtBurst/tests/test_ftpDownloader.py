@@ -0,0 +1,315 @@
+import os
+import shutil
+import socket
+import SocketServer
+import tempfile
+import threading
+import time
+
+import pytest
+
+from GtBurst import ftpDownloader
+from GtBurst.GtBurstException import GtBurstException
+
+
+class ServerState(object):
+    def __init__(self, root):
+        self.root = root
+
+        # File name -> list of byte counts after which the connection is dropped,
+        # one for each transfer of the file
+        self.dropAfter = {}
+        self.noRest = False
+        self.noSize = False
+
+        # Seconds spent before each transfer, so that sessions overlap
+        self.delay = 0.0
+
+        # (file name, offset) of each transfer, and names in all the RETR commands
+        self.transfers = []
+        self.requested = []
+
+        self.lock = threading.Lock()
+        self.active = 0
+        self.maxActive = 0
+
+
+class FTPHandler(SocketServer.StreamRequestHandler):
+    # Minimal FTP server: anonymous login, passive mode, SIZE, REST, RETR, LIST
+
+    def reply(self, line):
+        self.wfile.write(line + '\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        state = self.server.state
+
+        with state.lock:
+            state.active += 1
+            state.maxActive = max(state.maxActive, state.active)
+
+        try:
+            self.session(state)
+        finally:
+            with state.lock:
+                state.active -= 1
+
+    def session(self, state):
+        self.reply('220 Ready')
+
+        directory = state.root
+        offset = 0
+        passive = None
+
+        while True:
+            line = self.rfile.readline()
+
+            if not line:
+                return
+
+            command, _, argument = line.strip().partition(' ')
+            command = command.upper()
+            path = os.path.join(directory, argument)
+
+            if command == 'USER':
+                self.reply('331 Password required')
+            elif command == 'PASS':
+                self.reply('230 Logged in')
+            elif command == 'TYPE':
+                self.reply('200 Type set')
+            elif command == 'CWD':
+                if os.path.isdir(state.root + argument):
+                    directory = state.root + argument
+                    self.reply('250 Directory changed')
+                else:
+                    self.reply('550 No such directory')
+            elif command == 'SIZE' and not state.noSize:
+                if os.path.isfile(path):
+                    self.reply('213 %d' % os.path.getsize(path))
+                else:
+                    self.reply('550 No such file')
+            elif command == 'REST' and not state.noRest:
+                offset = int(argument)
+                self.reply('350 Restarting at %d' % offset)
+            elif command == 'PASV':
+                passive = socket.socket()
+                passive.bind(('127.0.0.1', 0))
+                passive.listen(1)
+                port = passive.getsockname()[1]
+                self.reply('227 Entering Passive Mode (127,0,0,1,%d,%d)' % (port >> 8, port & 255))
+            elif command in ('LIST', 'RETR'):
+                connection, _ = passive.accept()
+                passive.close()
+
+                if command == 'RETR':
+                    state.requested.append(argument)
+
+                if not os.path.isfile(path):
+                    connection.close()
+                    self.reply('550 No such file')
+                    continue
+
+                if command == 'LIST':
+                    self.reply('150 Listing')
+                    connection.sendall('-rw-r--r-- 1 ftp ftp %d Jan 1 2000 %s\r\n' % (os.path.getsize(path), argument))
+                    connection.close()
+                    self.reply('226 Done')
+                    continue
+
+                with open(path, 'rb') as f:
+                    data = f.read()[offset:]
+
+                with state.lock:
+                    state.transfers.append((argument, offset))
+                    drops = state.dropAfter.get(argument, [])
+                    drop = drops.pop(0) if drops else None
+
+                time.sleep(state.delay)
+                self.reply('150 Sending')
+
+                if drop is not None:
+                    # Connection lost in the middle of the transfer
+                    connection.sendall(data[:drop])
+                    connection.close()
+                    return
+
+                connection.sendall(data)
+                connection.close()
+                offset = 0
+                self.reply('226 Done')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class FTPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def server():
+    root = tempfile.mkdtemp()
+    local = tempfile.mkdtemp()
+
+    remoteDirectory = os.path.join(root, 'data')
+    os.mkdir(remoteDirectory)
+
+    names = ['file_%02d.fit' % i for i in range(8)]
+
+    for i, name in enumerate(names):
+        with open(os.path.join(remoteDirectory, name), 'wb') as f:
+            f.write(os.urandom(100000 + i * 1000))
+
+    ftpServer = FTPServer(('127.0.0.1', 0), FTPHandler)
+    ftpServer.state = ServerState(root)
+    ftpServer.names = names
+    ftpServer.remoteDirectory = remoteDirectory
+    ftpServer.local = local
+    ftpServer.address = '127.0.0.1:%d/data' % ftpServer.server_address[1]
+
+    thread = threading.Thread(target=ftpServer.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield ftpServer
+
+    ftpServer.shutdown()
+    ftpServer.server_close()
+    shutil.rmtree(root)
+    shutil.rmtree(local)
+
+
+def _downloader(server, **kwargs):
+    address, port, directory = ftpDownloader.parseAddress(server.address)
+
+    kwargs.setdefault('backoff', 0.01)
+
+    return ftpDownloader.FTPDownloader(address, directory, port, **kwargs)
+
+
+def _isCopy(server, name):
+    with open(os.path.join(server.remoteDirectory, name), 'rb') as f:
+        remote = f.read()
+
+    localFile = os.path.join(server.local, name)
+
+    if not os.path.exists(localFile):
+        return False
+
+    with open(localFile, 'rb') as f:
+        return f.read() == remote
+
+
+def _partFiles(server):
+    return [name for name in os.listdir(server.local) if name.endswith('.part')]
+
+
+def test_parse_address():
+    assert ftpDownloader.parseAddress('ftp://127.0.0.1:2121/a/b') == ('127.0.0.1', 2121, '/a/b')
+    assert ftpDownloader.parseAddress('legacy.gsfc.nasa.gov/fermi/data') == ('legacy.gsfc.nasa.gov', 21, '/fermi/data')
+
+
+def test_parallel_sessions(server):
+    server.state.delay = 0.1
+
+    progress = []
+    downloader = _downloader(server, nConnections=4)
+
+    localFiles = downloader.download(server.names, server.local, lambda *args: progress.append(args))
+
+    assert localFiles == [os.path.join(server.local, name) for name in server.names]
+    assert all(_isCopy(server, name) for name in server.names)
+    assert _partFiles(server) == []
+
+    # More than one session, but not more than nConnections (one control connection each)
+    assert 1 < server.state.maxActive <= 4
+
+    totalSize = sum(os.path.getsize(localFile) for localFile in localFiles)
+    assert progress[-1] == (totalSize, totalSize, len(server.names), len(server.names))
+    assert all(previous[0] <= following[0] for previous, following in zip(progress, progress[1:]))
+
+
+def test_resume_after_drop(server):
+    server.state.dropAfter = {server.names[0]: [50000, 30000], server.names[3]: [1000]}
+
+    _downloader(server, nConnections=3).download(server.names, server.local)
+
+    assert all(_isCopy(server, name) for name in server.names)
+    assert _partFiles(server) == []
+
+    # The transfers restarted where they stopped
+    transfers = server.state.transfers
+    assert [offset for name, offset in transfers if name == server.names[0]] == [0, 50000, 80000]
+    assert [offset for name, offset in transfers if name == server.names[3]] == [0, 1000]
+
+
+def test_part_file_from_previous_run_is_resumed(server):
+    name = server.names[5]
+
+    with open(os.path.join(server.remoteDirectory, name), 'rb') as f:
+        content = f.read()
+
+    with open(os.path.join(server.local, name + '.part'), 'wb') as f:
+        f.write(content[:12345])
+
+    _downloader(server).download([name], server.local)
+
+    assert _isCopy(server, name)
+    assert server.state.transfers == [(name, 12345)]
+
+
+def test_complete_files_are_skipped(server):
+    downloader = _downloader(server)
+
+    downloader.download(server.names, server.local)
+    assert len(server.state.transfers) == len(server.names)
+
+    # Replace one file with a truncated copy: only that one is downloaded again
+    with open(os.path.join(server.local, server.names[2]), 'r+b') as f:
+        f.truncate(10)
+
+    del server.state.transfers[:]
+
+    downloader.download(server.names, server.local)
+
+    assert server.state.transfers == [(server.names[2], 0)]
+    assert all(_isCopy(server, name) for name in server.names)
+
+
+def test_retries_are_bounded(server):
+    server.state.dropAfter = {server.names[1]: [10] * 100}
+
+    with pytest.raises(GtBurstException) as info:
+        _downloader(server, maxTrials=3).download(server.names[:3], server.local)
+
+    assert info.value.code == 11
+    assert len([name for name, offset in server.state.transfers if name == server.names[1]]) == 3
+
+
+def test_server_without_rest_and_size(server):
+    server.state.noRest = True
+    server.state.noSize = True
+    server.state.dropAfter = {server.names[2]: [5000]}
+
+    _downloader(server, nConnections=2).download(server.names[:4], server.local)
+
+    assert all(_isCopy(server, name) for name in server.names[:4])
+    assert _partFiles(server) == []
+
+    # Without REST the interrupted file starts again from the beginning
+    assert [offset for name, offset in server.state.transfers if name == server.names[2]] == [0, 0]
+
+
+def test_missing_file_is_a_permanent_error(server):
+    server.state.noSize = True
+
+    with pytest.raises(Exception) as info:
+        _downloader(server, maxTrials=5).download(['missing.fit'], server.local)
+
+    assert '550' in str(info.value)
+
+    # Not retried
+    assert server.state.requested == ['missing.fit']
@@ -0,0 +1,170 @@
+import os
+import shutil
+import sys
+import tempfile
+import types
+
+import numpy as np
+import pytest
+
+from GtBurst.my_fits_io import pyfits
+
+try:
+    from gt_apps import filter, expCube
+except ImportError:
+    # No Science Tools: the tools are replaced by the stand-ins below anyway
+    sys.modules['gt_apps'] = types.ModuleType('gt_apps')
+    sys.modules['gt_apps'].filter = None
+    sys.modules['gt_apps'].expCube = None
+
+from GtBurst.gtapps_mp import gtltcube_mp
+
+
+def _readGTIs(filename):
+    with pyfits.open(filename) as f:
+        return (np.array(f['GTI'].data.field('START'), dtype=float),
+                np.array(f['GTI'].data.field('STOP'), dtype=float))
+
+
+def _writeEventFile(filename, tstart, tstop, gtiStart, gtiStop):
+    primary = pyfits.PrimaryHDU()
+    primary.header['TSTART'] = tstart
+    primary.header['TSTOP'] = tstop
+
+    events = pyfits.BinTableHDU.from_columns([pyfits.Column(name='TIME', format='D', array=np.zeros(0))])
+    events.name = 'EVENTS'
+
+    gti = pyfits.BinTableHDU.from_columns([pyfits.Column(name='START', format='D', array=gtiStart),
+                                           pyfits.Column(name='STOP', format='D', array=gtiStop)])
+    gti.name = 'GTI'
+
+    pyfits.HDUList([primary, events, gti]).writeto(filename, clobber=True)
+
+
+def _livetime(scfile, gtiStart, gtiStop):
+    # Livetime in the GTIs, with each FT2 row weighted by the fraction of it in the GTIs
+    # (as gtltcube does)
+    with pyfits.open(scfile) as f:
+        start = f['SC_DATA'].data.field('START')
+        stop = f['SC_DATA'].data.field('STOP')
+        livetime = f['SC_DATA'].data.field('LIVETIME')
+
+    overlap = np.zeros(start.shape[0])
+    for t1, t2 in zip(gtiStart, gtiStop):
+        overlap += np.clip(np.minimum(stop, t2) - np.maximum(start, t1), 0, None)
+
+    return np.sum(livetime * overlap / (stop - start))
+
+
+class FakeTool(dict):
+    def __init__(self, action):
+        dict.__init__(self)
+        self.action = action
+
+    def run(self, print_command=False):
+        self.action(self)
+
+
+class SerialPool(object):
+    def __init__(self, processes=None):
+        pass
+
+    def map(self, function, arguments):
+        return map(function, arguments)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+@pytest.fixture
+def standIns(monkeypatch):
+    received = []
+
+    def gtselect(pars):
+        # Cut the GTIs of the input file to tmin-tmax
+        gtiStart, gtiStop = _readGTIs(pars['infile'])
+        tmin, tmax = float(pars['tmin']), float(pars['tmax'])
+        start = np.maximum(gtiStart, tmin)
+        stop = np.minimum(gtiStop, tmax)
+        good = stop > start
+        _writeEventFile(pars['outfile'], tmin, tmax, start[good], stop[good])
+
+    def gtltcube(pars):
+        with pyfits.open(pars['evfile']) as f:
+            tmin, tmax = f[0].header['TSTART'], f[0].header['TSTOP']
+        gtiStart, gtiStop = _readGTIs(pars['evfile'])
+        received.append((tmin, tmax, np.sum(gtiStop - gtiStart)))
+
+        with open(pars['outfile'], 'w') as f:
+            f.write(repr(_livetime(pars['scfile'], gtiStart, gtiStop)))
+
+    def gtltsum(filenames, outfile, saveTemp):
+        total = sum(float(open(filename).read()) for filename in filenames)
+        with open(outfile, 'w') as f:
+            f.write(repr(total))
+        for filename in filenames:
+            os.remove(filename)
+
+    monkeypatch.setattr(gtltcube_mp, 'filter', FakeTool(gtselect))
+    monkeypatch.setattr(gtltcube_mp, 'expCube', FakeTool(gtltcube))
+    monkeypatch.setattr(gtltcube_mp, 'ltsum', gtltsum)
+    monkeypatch.setattr(gtltcube_mp, 'Pool', SerialPool)
+
+    return received
+
+
+def test_split_on_ft2_rows_keeps_good_time(standIns):
+    directory = tempfile.mkdtemp()
+
+    try:
+        # FT2 with 30 s rows, and gaps (SAA passages) without rows
+        rowStart = np.arange(0, 20000, 30.0)
+        rowStart = rowStart[(rowStart % 5400) < 4200]
+        rowStop = rowStart + 30.0
+
+        table = pyfits.BinTableHDU.from_columns([pyfits.Column(name='START', format='D', array=rowStart),
+                                                 pyfits.Column(name='STOP', format='D', array=rowStop),
+                                                 pyfits.Column(name='LIVETIME', format='D',
+                                                               array=np.random.RandomState(0).uniform(20, 29, rowStart.shape[0]))])
+        table.name = 'SC_DATA'
+        scfile = os.path.join(directory, 'ft2.fits')
+        pyfits.HDUList([pyfits.PrimaryHDU(), table]).writeto(scfile)
+
+        # Event file with GTIs not aligned with the rows
+        tstart, tstop = 107.0, 19513.0
+        gtiStart = np.array([107.0, 1311.5, 5413.2, 11000.0])
+        gtiStop = np.array([1000.3, 4190.0, 9000.0, 19513.0])
+        evfile = os.path.join(directory, 'ev.fits')
+        _writeEventFile(evfile, tstart, tstop, gtiStart, gtiStop)
+
+        rowEdges = set(rowStart) | set(rowStop)
+        totalGoodTime = np.sum(gtiStop - gtiStart)
+        expected = _livetime(scfile, gtiStart, gtiStop)
+
+        for bins in [1, 2, 4, 7, 50]:
+            del standIns[:]
+            outfile = os.path.join(directory, 'ltcube_%s.txt' % bins)
+
+            gtltcube_mp.gtltcube_mp(bins, scfile, evfile, outfile, False, 180)
+
+            tmins = [x[0] for x in standIns]
+            tmaxs = [x[1] for x in standIns]
+
+            assert 1 <= len(standIns) <= bins
+
+            # Slices are in order, do not overlap, and only the first start and
+            # the last stop are not on the edges of the FT2 rows
+            assert np.all(np.array(tmins[1:]) >= np.array(tmaxs[:-1]))
+            assert tmins[0] == tstart and tmaxs[-1] == tstop
+            assert all(t in rowEdges for t in tmins[1:] + tmaxs[:-1])
+
+            # The good time and the livetime cube of the slices sum to the unsplit ones
+            assert np.isclose(sum(x[2] for x in standIns), totalGoodTime, rtol=0, atol=1e-6)
+            assert np.isclose(float(open(outfile).read()), expected, rtol=1e-12)
+        pass
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,156 @@
+import collections
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from GtBurst import livetimeCube
+from GtBurst.my_fits_io import pyfits
+
+
+def _makeFT2(filename, nRows=200):
+    rng = np.random.RandomState(3)
+    start = np.arange(nRows) * 30.0
+
+    columns = [pyfits.Column(name='START', format='D', array=start),
+               pyfits.Column(name='STOP', format='D', array=start + 30.0),
+               pyfits.Column(name='LIVETIME', format='D', array=np.ones(nRows) * 27.0),
+               pyfits.Column(name='RA_SCZ', format='D', array=rng.uniform(0, 360, nRows)),
+               pyfits.Column(name='DEC_SCZ', format='D', array=rng.uniform(-90, 90, nRows)),
+               pyfits.Column(name='RA_ZENITH', format='D', array=rng.uniform(0, 360, nRows)),
+               pyfits.Column(name='DEC_ZENITH', format='D', array=rng.uniform(-90, 90, nRows))]
+
+    table = pyfits.BinTableHDU.from_columns(columns)
+    table.name = 'SC_DATA'
+    pyfits.HDUList([pyfits.PrimaryHDU(), table]).writeto(filename)
+
+
+def _makeEvents(filename, start, stop):
+    gti = pyfits.BinTableHDU.from_columns([pyfits.Column(name='START', format='D', array=np.array([start])),
+                                           pyfits.Column(name='STOP', format='D', array=np.array([stop]))])
+    gti.name = 'GTI'
+    pyfits.HDUList([pyfits.PrimaryHDU(), gti]).writeto(filename)
+
+
+def test_row_cache_is_bounded(monkeypatch):
+    directory = tempfile.mkdtemp()
+
+    try:
+        ft2 = os.path.join(directory, 'ft2.fits')
+        _makeFT2(ft2)
+
+        events = os.path.join(directory, 'events.fits')
+        _makeEvents(events, 115.0, 5000.0)
+
+        reference = livetimeCube.LivetimeCube(ft2, zmax=100.0, binsz=5.0)
+        expected = reference._assemble(events)
+
+        # Room for the distributions of 10 rows only
+        npix = reference.pixels.shape[0]
+        monkeypatch.setattr(livetimeCube, 'maxRowBinsMemory', 10 * npix)
+
+        cube = livetimeCube.LivetimeCube(ft2, zmax=100.0, binsz=5.0)
+
+        for i in range(2):
+            assembled = cube._assemble(events)
+
+            assert len(cube._rowBins) == 10
+
+            for a, b in zip(assembled, expected):
+                assert np.array_equal(a, b)
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cubes_are_bounded(monkeypatch):
+    directory = tempfile.mkdtemp()
+
+    try:
+        ft2 = os.path.join(directory, 'ft2.fits')
+        _makeFT2(ft2, nRows=10)
+
+        monkeypatch.setattr(livetimeCube, '_incrementalCubes', collections.OrderedDict())
+        monkeypatch.setattr(livetimeCube, 'maxIncrementalCubes', 2)
+
+        first = livetimeCube.getIncrementalCube(ft2, 90.0)
+        second = livetimeCube.getIncrementalCube(ft2, 100.0)
+
+        # Using a cube makes it the most recently used one
+        assert livetimeCube.getIncrementalCube(ft2, 90.0) is first
+
+        livetimeCube.getIncrementalCube(ft2, 110.0)
+
+        assert len(livetimeCube._incrementalCubes) == livetimeCube.maxIncrementalCubes
+        assert livetimeCube.getIncrementalCube(ft2, 90.0) is first
+        assert livetimeCube.getIncrementalCube(ft2, 100.0) is not second
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_cube_with_one_phi_bin():
+    pytest.importorskip("GtBurst.dataHandling")
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        ft2 = os.path.join(directory, 'ft2.fits')
+        _makeFT2(ft2)
+
+        events = os.path.join(directory, 'events.fits')
+        _makeEvents(events, 115.0, 5000.0)
+
+        outfiles = []
+
+        for phibins in [0, 1]:
+            outfiles.append(os.path.join(directory, 'ltcube_%s.fits' % phibins))
+            livetimeCube.LivetimeCube(ft2, binsz=5.0, phibins=phibins).writeCube(events, outfiles[-1])
+
+        with pyfits.open(outfiles[0]) as withoutPhi, pyfits.open(outfiles[1]) as withPhi:
+
+            # Same format as gtltcube with phibins=1: the distribution in phi follows the one in cos(theta)
+            assert livetimeCube.readCubeFormat(withPhi)[-1] == 1
+            assert withPhi['EXPOSURE'].header['PHIBINS'] == 1
+
+            for ext in ['EXPOSURE', 'WEIGHTED_EXPOSURE']:
+                cosbins = withoutPhi[ext].data.field('COSBINS')
+                assert np.array_equal(withPhi[ext].data.field('COSBINS'), np.hstack([cosbins, cosbins]))
+
+        with pytest.raises(ValueError):
+            livetimeCube.LivetimeCube(ft2, binsz=5.0, phibins=2)
+
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_fractions_match_the_overlap_with_the_GTIs():
+    directory = tempfile.mkdtemp()
+
+    try:
+        ft2 = os.path.join(directory, 'ft2.fits')
+        _makeFT2(ft2, nRows=300)
+
+        cube = livetimeCube.LivetimeCube(ft2, binsz=10.0)
+
+        rng = np.random.RandomState(4)
+
+        for trial in range(20):
+            # Many short GTIs, not sorted, some within a single row
+            edges = np.sort(rng.uniform(-100, 9100, 400))
+            order = rng.permutation(200)
+            gtiStart, gtiStop = edges[::2][order], edges[1::2][order]
+
+            rows, fractions = cube._getFractions(gtiStart, gtiStop)
+
+            # Dense computation: overlap of each row with each GTI
+            overlap = np.minimum(cube.stop[:, np.newaxis], gtiStop) - np.maximum(cube.start[:, np.newaxis], gtiStart)
+            expected = np.maximum(overlap, 0).sum(axis=1) / (cube.stop - cube.start)
+
+            assert np.array_equal(rows, np.flatnonzero(expected > 0))
+            assert np.allclose(fractions, expected[rows], rtol=0, atol=1e-12)
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,236 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from GtBurst.productCache import ProductCache
+
+
+class FakeTool(dict):
+    # Behaves like a GtApp: parameters as items, run() writes the output file
+    def run(self):
+        with open(self['outfile'], 'w') as f:
+            f.write("product of %s\n" % self['value'] * 100)
+
+
+def _runMany(args):
+    cacheDir, workDir, worker, nRuns = args
+
+    cache = ProductCache(cacheDir, maxSize=100)
+
+    for i in range(nRuns):
+        tool = FakeTool(value='%s_%s' % (worker, i), outfile=os.path.join(workDir, 'out_%s_%s.txt' % (worker, i)))
+        cache.run(tool, 'fake', ['outfile'])
+    pass
+
+
+def _entriesOnDisk(cacheDir):
+    return [name for name in os.listdir(cacheDir) if os.path.isdir(os.path.join(cacheDir, name))]
+
+
+def test_parallel_runs_do_not_lose_entries():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        pool = multiprocessing.Pool(4)
+        pool.map(_runMany, [(cacheDir, workDir, worker, 10) for worker in range(8)])
+        pool.close()
+        pool.join()
+
+        stats = ProductCache(cacheDir).statistics()
+
+        assert stats['misses'] == 80
+        assert stats['entries'] == 80
+        assert len(_entriesOnDisk(cacheDir)) == 80
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+def test_orphans_are_removed():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        _runMany((cacheDir, workDir, 0, 3))
+
+        # Corrupted index: the entries on disk become orphans
+        with open(os.path.join(cacheDir, 'index.json'), 'w') as f:
+            f.write('{"hits": ')
+
+        os.mkdir(os.path.join(cacheDir, '__tmp_leftover'))
+
+        _runMany((cacheDir, workDir, 1, 1))
+
+        assert ProductCache(cacheDir).statistics()['entries'] == 1
+        assert len(_entriesOnDisk(cacheDir)) == 1
+
+        ProductCache(cacheDir).purge()
+
+        assert _entriesOnDisk(cacheDir) == []
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+def _read(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+class FakeInputTool(FakeTool):
+    # The product depends on the content of the input file
+    def run(self):
+        with open(self['outfile'], 'w') as f:
+            f.write("product of %s\n" % _read(self['infile']))
+
+
+def test_hit_restores_the_products():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        cache = ProductCache(cacheDir)
+        first = os.path.join(workDir, 'first.txt')
+        second = os.path.join(workDir, 'second.txt')
+
+        assert not cache.run(FakeTool(value='AAAA', outfile=first), 'fake', ['outfile'])
+
+        # Same parameters apart from the output
+        assert cache.run(FakeTool(value='AAAA', outfile=second), 'fake', ['outfile'])
+        assert _read(second) == _read(first)
+
+        stats = cache.statistics()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+def test_changed_input_is_a_miss():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        cache = ProductCache(cacheDir)
+        infile = os.path.join(workDir, 'input.txt')
+        outfile = os.path.join(workDir, 'out.txt')
+
+        with open(infile, 'w') as f:
+            f.write('first')
+
+        assert not cache.run(FakeInputTool(infile=infile, outfile=outfile), 'fake', ['outfile'])
+        assert cache.run(FakeInputTool(infile=infile, outfile=outfile), 'fake', ['outfile'])
+
+        # Same name and size, different content
+        with open(infile, 'w') as f:
+            f.write('other')
+
+        assert not cache.run(FakeInputTool(infile=infile, outfile=outfile), 'fake', ['outfile'])
+        assert _read(outfile) == "product of other\n"
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        outfile = os.path.join(workDir, 'out.txt')
+
+        FakeTool(value='A', outfile=outfile).run()
+        entrySize = os.path.getsize(outfile)
+
+        # Room for two entries
+        cache = ProductCache(cacheDir, maxSize=2.5 * entrySize / 1024.0 / 1024.0)
+
+        for value in ['A', 'B', 'A', 'C']:
+            cache.run(FakeTool(value=value, outfile=outfile), 'fake', ['outfile'])
+        pass
+
+        assert cache.statistics()['entries'] == 2
+        assert len(_entriesOnDisk(cacheDir)) == 2
+
+        # B was the least recently used one
+        assert cache.run(FakeTool(value='A', outfile=outfile), 'fake', ['outfile'])
+        assert cache.run(FakeTool(value='C', outfile=outfile), 'fake', ['outfile'])
+        assert not cache.run(FakeTool(value='B', outfile=outfile), 'fake', ['outfile'])
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+def test_miss_does_not_write_through_a_restored_link():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        cache = ProductCache(cacheDir)
+        outfile = os.path.join(workDir, 'out.txt')
+
+        cache.run(FakeTool(value='AAAA', outfile=outfile), 'fake', ['outfile'])
+        expected = _read(outfile)
+
+        # Restored as a hard link to the cached product
+        assert cache.run(FakeTool(value='AAAA', outfile=outfile), 'fake', ['outfile'])
+        assert os.stat(outfile).st_nlink > 1
+
+        assert not cache.run(FakeTool(value='BBBB', outfile=outfile), 'fake', ['outfile'])
+        assert 'BBBB' in _read(outfile)
+
+        assert cache.run(FakeTool(value='AAAA', outfile=outfile), 'fake', ['outfile'])
+        assert _read(outfile) == expected
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
+
+
+class FakeUpdatingTool(FakeTool):
+    # Modifies its input file in place, like gtdiffrsp
+    def run(self):
+        with open(self['evfile'], 'a') as f:
+            f.write("updated with %s\n" % self['value'])
+
+
+def test_updated_file_is_not_written_through_a_restored_link():
+    cacheDir = tempfile.mkdtemp()
+    workDir = tempfile.mkdtemp()
+
+    try:
+        cache = ProductCache(cacheDir)
+        evfile = os.path.join(workDir, 'events.txt')
+
+        with open(evfile, 'w') as f:
+            f.write('events\n')
+
+        cache.run(FakeUpdatingTool(value='A', evfile=evfile), 'fake', [], ['evfile'])
+        expected = _read(evfile)
+
+        # Restoring replaces the updated file with a link to the cached one
+        with open(evfile, 'w') as f:
+            f.write('events\n')
+
+        assert cache.run(FakeUpdatingTool(value='A', evfile=evfile), 'fake', [], ['evfile'])
+        assert os.stat(evfile).st_nlink > 1
+
+        assert not cache.run(FakeUpdatingTool(value='B', evfile=evfile), 'fake', [], ['evfile'])
+        assert _read(evfile) == expected + "updated with B\n"
+
+        with open(evfile, 'w') as f:
+            f.write('events\n')
+
+        assert cache.run(FakeUpdatingTool(value='A', evfile=evfile), 'fake', [], ['evfile'])
+        assert _read(evfile) == expected
+
+    finally:
+        shutil.rmtree(cacheDir)
+        shutil.rmtree(workDir)
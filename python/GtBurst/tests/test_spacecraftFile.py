@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from GtBurst.my_fits_io import pyfits
+from GtBurst.spacecraftFile import SpacecraftFile, indexExtension
+
+
+def _makeFT2(filename, nRows=1000):
+    start = np.arange(nRows) * 30.0
+    columns = [pyfits.Column(name='START', format='D', array=start),
+               pyfits.Column(name='STOP', format='D', array=start + 30.0),
+               pyfits.Column(name='LIVETIME', format='D', array=np.ones(nRows) * 27.0)]
+
+    table = pyfits.BinTableHDU.from_columns(columns)
+    table.name = 'SC_DATA'
+    pyfits.HDUList([pyfits.PrimaryHDU(), table]).writeto(filename)
+
+
+def test_damaged_index_is_rebuilt():
+    directory = tempfile.mkdtemp()
+
+    try:
+        ft2 = os.path.join(directory, 'ft2.fits')
+        _makeFT2(ft2)
+
+        with SpacecraftFile(ft2) as sc:
+            expected = sc.getRowRange(100.0, 1000.0)
+
+        indexFile = ft2 + indexExtension
+        assert os.path.exists(indexFile)
+
+        # Truncated index (like one written by an interrupted process)
+        with open(indexFile, 'rb') as f:
+            content = f.read()
+
+        with open(indexFile, 'wb') as f:
+            f.write(content[:len(content) // 2])
+
+        with SpacecraftFile(ft2) as sc:
+            assert sc.getRowRange(100.0, 1000.0) == expected
+
+        # The index has been replaced with a good one, and no temporary file is left
+        with SpacecraftFile(ft2) as sc:
+            assert sc.getRowRange(100.0, 1000.0) == expected
+
+        assert sorted(os.listdir(directory)) == ['ft2.fits', 'ft2.fits' + indexExtension]
+
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,28 @@
+import numpy as np
+import scipy.optimize
+
+from GtBurst.statMethods import LogLikelihood, Polynomial, PolynomialBatchFitter
+
+
+def test_batch_fit_of_sparse_light_curves():
+    # Low rate: most bins are empty, so a model going negative there must not be rewarded
+    x = np.linspace(-300, 300, 301)
+    exposure = np.ones_like(x) * 2.0
+
+    for seed in range(5):
+        y = np.random.RandomState(seed).poisson(0.02 * exposure).astype(float)
+
+        for grade in (0, 1, 2):
+            polynomials, cstats = PolynomialBatchFitter(x, y, exposure).fit(grade)
+            params = np.array(polynomials[0].getParams())
+
+            likelihood = LogLikelihood(x, y, Polynomial([0.0] * (grade + 1)), exposure=exposure)
+
+            # The reported statistic is the one of LogLikelihood
+            assert np.isclose(cstats[0], likelihood(params))
+
+            # ... and it is at the minimum
+            start = np.array([0.01] + [0.0] * grade)
+            res = scipy.optimize.minimize(likelihood, start, method='Nelder-Mead',
+                                          options={'xatol': 1e-12, 'fatol': 1e-12, 'maxiter': 20000})
+            assert cstats[0] <= res.fun + 1e-4